@@ -0,0 +1,128 @@
+"""
+portfolio.run_portfolio 與逐日逐檔 Python 迴圈 (直接照規則寫的對照版本) 的比對與計時
+
+* check_identical：隨機 panel (不同上市日、停牌 NaN)，比對每一筆成交 (日期、股票、方向、股數) 與每天的現金 / 權益
+* bench：1000 檔 x 10 年的執行時間
+
+執行：
+    python -m rpa_qt.backtest.bench_portfolio
+"""
+import math
+import time
+
+import numpy as np
+
+from rpa_qt.backtest.engine import TW_STOCK
+from rpa_qt.trading_swing.bench_swing import make_panel
+from rpa_qt.trading_swing.swing_portfolio import backtest_portfolio
+from rpa_qt.trading_swing.swing_vector import compute_indicators_panel, swing_signals
+
+
+def reference_portfolio(close, enter, exit_, stop_dist, score, init_cash, risk_per_trade, max_positions, lot_size,
+                        fees):
+    """每天、每檔逐一判斷的版本，回傳 (成交 list, 每天現金, 每天權益)。"""
+    T, M = close.shape
+    last_px = [0.0] * M
+    held = {}  # col -> [qty, entry_price]
+    cash = init_cash
+    trades, cash_curve, equity_curve = [], [], []
+    for t in range(T):
+        for m in range(M):
+            if not math.isnan(close[t, m]):
+                last_px[m] = close[t, m]
+        exited = set()
+        for m in sorted(held):
+            px = close[t, m]
+            if math.isnan(px):
+                continue
+            q, entry = held[m]
+            stopped = px < entry - stop_dist[t, m]
+            if stopped or exit_[t, m]:
+                notional = q * px
+                cash += notional - fees.commission(notional) - fees.tax(notional, True)
+                trades.append((t, m, "stop" if stopped else "exit", q))
+                del held[m]
+                exited.add(m)
+        if len(held) < max_positions:
+            equity = cash + sum(held[m][0] * last_px[m] for m in sorted(held))
+            cands = []
+            for m in range(M):
+                d = stop_dist[t, m]
+                if m in held or m in exited or not enter[t, m] or math.isnan(close[t, m]) or not d > 0:
+                    continue
+                q = math.floor(equity * risk_per_trade / d / lot_size) * lot_size
+                if q > 0:
+                    s = score[t, m]
+                    cands.append((-(s if not math.isnan(s) else -math.inf), m, q))
+            cands.sort(key=lambda c: (c[0], c[1]))
+            for _, m, q in cands[:max_positions - len(held)]:
+                notional = q * close[t, m]
+                cost = notional + fees.commission(notional)
+                if cost > cash:
+                    break
+                cash -= cost
+                held[m] = [q, close[t, m]]
+                trades.append((t, m, "entry", q))
+        cash_curve.append(cash)
+        equity_curve.append(cash + sum(q * last_px[m] for m, (q, _) in held.items()))
+    return trades, np.array(cash_curve), np.array(equity_curve)
+
+
+def check_identical(trials: int = 5):
+    n_trades = 0
+    for seed in range(trials):
+        _, fields = make_panel(60, 1500, seed=seed)
+        close = fields["Close"]
+        # 隨機停牌
+        rng = np.random.default_rng(seed)
+        close = close.mask(rng.random(close.shape) < 0.01)
+        fields["Close"] = close
+        result = backtest_portfolio(fields, max_positions=8)
+
+        ind = compute_indicators_panel(fields["High"], fields["Low"], close)
+        a = {k: v.to_numpy(dtype=float) for k, v in ind.items()}
+        c = close.to_numpy(dtype=float)
+        enter, exit_, stop_dist, _ = swing_signals(c, a["ATR"], a["EMA20"], a["EMA60"], a["RSI"], a["K"], a["D"],
+                                                   None, 0.01, 2)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            score = a["EMA20"] / a["EMA60"] - 1
+        ref_trades, ref_cash, ref_equity = reference_portfolio(c, enter, exit_, stop_dist, score, 1_000_000, 0.01, 8,
+                                                               1000, TW_STOCK)
+        tr = result.trades
+        mine = list(zip(close.index.get_indexer(tr["timestamp"]), close.columns.get_indexer(tr["ticker"]),
+                        tr["action"], tr["qty"]))
+        assert [(int(t), int(m), a_, float(q)) for t, m, a_, q in mine] == \
+               [(t, m, a_, float(q)) for t, m, a_, q in ref_trades], seed
+        # 同一天多筆成交的加總順序不同，只差在最後幾位數
+        np.testing.assert_allclose(result.equity["cash"].to_numpy(), ref_cash, rtol=0, atol=1e-6)
+        np.testing.assert_allclose(result.equity["equity"].to_numpy(), ref_equity, rtol=0, atol=1e-6)
+        assert (result.equity["positions"] <= 8).all()
+        assert (result.equity["cash"] >= 0).all()
+        assert (tr["qty"] % 1000 == 0).all()
+        n_trades += len(tr)
+    print(f"{trials} 組隨機 panel (60 檔 x 1500 天，{n_trades} 筆成交)：成交與逐日逐檔版本相同，"
+          f"現金 / 權益誤差 < 1e-6 元，持股數 <= 8、現金不為負、皆為整張")
+
+
+def bench(fn, *args, repeat: int = 3, **kwargs) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(*args, **kwargs)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+if __name__ == "__main__":
+    check_identical()
+
+    n_tickers, n = 1000, 2500  # 1000 檔 x 10 年
+    _, fields = make_panel(n_tickers, n, seed=3)
+    started = time.perf_counter()
+    panel = {**compute_indicators_panel(fields["High"], fields["Low"], fields["Close"]), "Close": fields["Close"]}
+    t_ind = time.perf_counter() - started
+    for max_positions in (5, 20):
+        t_run = bench(backtest_portfolio, panel, max_positions=max_positions)
+        result = backtest_portfolio(panel, max_positions=max_positions)
+        print(f"{n_tickers} 檔 x {n} 天 max_positions={max_positions}: 指標 {t_ind:.2f}s + 回測 {t_run:.2f}s "
+              f"({len(result.trades)} 筆成交，CAGR {result.metrics['CAGR']:.2%})")
@@ -0,0 +1,353 @@
+"""
+共用回測引擎 (Backtest engine)
+
+trading_swing / swing_01 / swing_02 / turtle_01 / turtle_02 / backtest_0050 原本各自有一套逐列迴圈
+(df.iloc[i]、iterrows)、手續費算法與權益紀錄，績效也各算各的，彼此無法比較。這裡統一成：
+* Bars：回測資料一次轉成 NumPy 陣列，策略在 prepare() 裡取出需要的欄位 (list of float)，之後只用索引讀值
+* Strategy：callback 介面，prepare(bars, broker) 一次算好指標與訊號，on_bar(i, broker) 每根 K 棒呼叫一次
+* Broker：現金、部位 (帶正負號，空單為負)、持倉成本都是累計值；下單經由 FeeModel 計算手續費與賣出稅
+* 權益曲線不在迴圈裡逐根計算：Broker 只在成交 / 入金時記下狀態，回測結束後以 searchsorted 一次展開到每根 K 棒
+* 輸出：BacktestResult (equity、trades、round_trips、metrics)，績效由 compute_metrics 統一計算
+
+手續費 / 稅 (FeeModel)：
+* TW_STOCK：券商手續費 0.1425% (最低 20 元)，賣出證交稅 0.3%
+* TW_ETF：券商手續費同上，賣出證交稅 0.1%
+* CRYPTO：taker 0.04% / maker 0.02% (Binance 一般等級)
+* 舊程式的「固定比例、無最低」可用 FeeModel(rate=fee) 表示，turtle_01 的每筆固定費用用 per_order
+
+入金 (deposit) 視為外部現金流，不算報酬：compute_metrics 以時間加權報酬 (扣除當天入金) 計算 Return / CAGR / Sharpe，
+定期定額之類的策略和一次投入的策略可以直接比較。股利等收入用 income()，算在報酬內。
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from rpa_qt.backtest.trades_summary import round_trips, summarize_round_trips
+
+TRADE_COLUMNS = ['timestamp', 'side', 'action', 'direction', 'price', 'qty', 'fee', 'tax', 'comment']
+
+
+@dataclass(frozen=True)
+class FeeModel:
+    rate: float = 0.0                   # 手續費率 (taker)
+    maker_rate: Optional[float] = None  # maker 手續費率，None 表示與 rate 相同
+    min_fee: float = 0.0                # 每筆最低手續費
+    per_order: float = 0.0              # 每筆固定費用
+    sell_tax: float = 0.0               # 賣出稅率 (證交稅)
+    discount: float = 1.0               # 手續費折扣，例如 0.6 = 6 折
+
+    def commission(self, notional: float, maker: bool = False) -> float:
+        rate = self.maker_rate if maker and self.maker_rate is not None else self.rate
+        fee = notional * rate * self.discount
+        if self.min_fee and fee < self.min_fee:
+            fee = self.min_fee
+        return fee + self.per_order
+
+    def tax(self, notional: float, is_sell: bool) -> float:
+        return notional * self.sell_tax if is_sell else 0.0
+
+    def commissions(self, notional: np.ndarray, maker: bool = False) -> np.ndarray:
+        """commission() 的陣列版本，數值與逐筆呼叫相同。"""
+        rate = self.maker_rate if maker and self.maker_rate is not None else self.rate
+        fee = notional * rate * self.discount
+        if self.min_fee:
+            fee = np.where(fee < self.min_fee, self.min_fee, fee)
+        return fee + self.per_order
+
+    def taxes(self, notional: np.ndarray, is_sell: bool) -> np.ndarray:
+        return notional * self.sell_tax if is_sell else np.zeros_like(notional)
+
+
+NO_FEES = FeeModel()
+TW_STOCK = FeeModel(rate=0.001425, min_fee=20.0, sell_tax=0.003)
+TW_ETF = FeeModel(rate=0.001425, min_fee=20.0, sell_tax=0.001)
+CRYPTO = FeeModel(rate=0.0004, maker_rate=0.0002)
+
+
+class Bars:
+    """回測資料的欄位陣列 (欄名不分大小寫，'close' 與 'Close' 都可以)。"""
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.index = df.index
+        self._lower = {str(c).lower(): c for c in df.columns}
+        self._arrays: Dict[str, np.ndarray] = {}
+
+    def __len__(self):
+        return len(self.df)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.df.columns or str(name).lower() in self._lower
+
+    def _column(self, name: str):
+        if name in self.df.columns:
+            return name
+        if name.lower() in self._lower:
+            return self._lower[name.lower()]
+        raise KeyError(f"資料沒有 {name} 欄位")
+
+    def array(self, name: str) -> np.ndarray:
+        col = self._column(name)
+        if col not in self._arrays:
+            self._arrays[col] = self.df[col].to_numpy(dtype=float)
+        return self._arrays[col]
+
+    def list(self, name: str) -> list:
+        """Python float 的 list，迴圈中以索引讀取比 NumPy 純量快。"""
+        return self.array(name).tolist()
+
+
+class Strategy:
+    """策略 callback 介面。"""
+
+    def prepare(self, bars: Bars, broker: "Broker"):
+        """回測開始前呼叫一次：計算指標、訊號，把需要的欄位轉成 list。"""
+
+    def on_bar(self, i: int, broker: "Broker"):
+        """第 i 根 K 棒，透過 broker 下單 / 入金。"""
+        raise NotImplementedError
+
+    def on_finish(self, broker: "Broker"):
+        """回測結束後呼叫一次。"""
+
+
+class Broker:
+    """
+    現金與單一部位的簿記。position 帶正負號 (空單為負)，cost 為持倉成本 (sum of 進場價 * 帶號數量)。
+    每次成交 / 入金把 (K 棒位置, 現金, 部位, 累計入金) 記在 _states，權益曲線由 _states 展開。
+    """
+
+    def __init__(self, bars: Bars, fees: FeeModel = NO_FEES, initial_cash: float = 0.0):
+        self.bars = bars
+        self.fees = fees
+        self.initial_cash = initial_cash
+        self.cash = initial_cash
+        self.position = 0.0
+        self.cost = 0.0
+        self.contributed = initial_cash
+        self._fills: List[tuple] = []
+        self._states: List[tuple] = []
+
+    # ---------- 查詢 ----------
+    @property
+    def avg_price(self) -> float:
+        return self.cost / self.position if self.position != 0 else 0.0
+
+    def equity(self, price: float) -> float:
+        """以 price 計算的市值權益。"""
+        return self.cash + self.position * price
+
+    @property
+    def realized_equity(self) -> float:
+        """已實現權益 (持倉以成本計)：初始資金 + 入金 + 已實現損益 - 手續費。"""
+        return self.cash + self.cost
+
+    def buy_cost(self, price: float, qty: float, maker: bool = False) -> float:
+        """買入 qty 股需要的現金 (成交金額 + 手續費)。"""
+        notional = abs(qty) * price
+        return notional + self.fees.commission(notional, maker)
+
+    # ---------- 下單 ----------
+    def buy(self, i: int, price: float, qty: float, action: str = None, comment: str = '',
+            maker: bool = False) -> float:
+        return self.fill(i, qty, price, action, comment, maker)
+
+    def sell(self, i: int, price: float, qty: float, action: str = None, comment: str = '',
+             maker: bool = False) -> float:
+        return self.fill(i, -qty, price, action, comment, maker)
+
+    def close(self, i: int, price: float, action: str = 'exit', comment: str = '', maker: bool = False) -> float:
+        """全部平倉，回傳手續費 + 稅。"""
+        if self.position == 0:
+            return 0.0
+        return self.fill(i, -self.position, price, action, comment, maker)
+
+    def fill(self, i: int, qty: float, price: float, action: str = None, comment: str = '',
+             maker: bool = False) -> float:
+        """
+        以 price 成交帶號數量 qty (正為買、負為賣)，回傳手續費 + 稅。
+        同方向為開倉 / 加碼 (action 預設 entry / add)，反方向為減碼 / 平倉 (預設 exit)；不允許一次反手。
+        """
+        if qty == 0:
+            return 0.0
+        position = self.position
+        opening = position == 0 or (position > 0) == (qty > 0)
+        if not opening and abs(qty) > abs(position) + 1e-12:
+            raise ValueError(f"成交數量 {qty} 超過部位 {position}，請先平倉再反手")
+
+        notional = abs(qty) * price
+        fee = self.fees.commission(notional, maker)
+        tax = self.fees.tax(notional, qty < 0)
+        if opening:
+            side = 'long' if qty > 0 else 'short'
+            action = action or ('entry' if position == 0 else 'add')
+            self.cost += qty * price
+            self.position = position + qty
+        else:
+            side = 'long' if position > 0 else 'short'
+            action = action or 'exit'
+            remaining = position + qty
+            if abs(remaining) <= 1e-12:
+                self.position = 0.0
+                self.cost = 0.0
+            else:
+                self.cost -= self.cost * (-qty / position)
+                self.position = remaining
+        self.cash -= qty * price + fee + tax
+        self._fills.append((i, side, action, 'BUY' if qty > 0 else 'SELL', price, abs(qty), fee + tax, tax, comment))
+        self._states.append((i, self.cash, self.position, self.contributed))
+        return fee + tax
+
+    # ---------- 現金流 ----------
+    def deposit(self, i: int, amount: float):
+        """外部入金 (例如定期定額)，不算報酬。"""
+        self.cash += amount
+        self.contributed += amount
+        self._states.append((i, self.cash, self.position, self.contributed))
+
+    def income(self, i: int, amount: float):
+        """收入 (例如現金股利)，算在報酬內。"""
+        self.cash += amount
+        self._states.append((i, self.cash, self.position, self.contributed))
+
+    # ---------- 輸出 ----------
+    def trades(self) -> pd.DataFrame:
+        if not self._fills:
+            return pd.DataFrame(columns=TRADE_COLUMNS)
+        bar_i, *rest = zip(*self._fills)
+        return pd.DataFrame(dict(zip(TRADE_COLUMNS, [self.bars.index[list(bar_i)], *rest])))
+
+    def equity_frame(self, price: np.ndarray, mark: str = 'after') -> pd.DataFrame:
+        """
+        每根 K 棒的 equity / cash / position / contributed。
+        mark='after'：當根成交之後以 price 計價；mark='before'：當根成交之前 (上一根結束時的部位) 以 price 計價。
+        """
+        n = len(price)
+        initial = (self.initial_cash, 0.0, self.initial_cash)
+        if self._states:
+            bar_i = np.array([s[0] for s in self._states])
+            states = np.vstack([initial, np.array([s[1:] for s in self._states])])
+        else:
+            bar_i = np.empty(0, dtype=int)
+            states = np.array([initial])
+        side = 'right' if mark == 'after' else 'left'
+        # states[0] 為初始狀態，states[k] 為第 k 筆事件之後
+        k = np.searchsorted(bar_i, np.arange(n), side=side)
+        cash, position, contributed = states[k].T
+        return pd.DataFrame({'equity': cash + position * price, 'cash': cash, 'position': position,
+                             'contributed': contributed}, index=self.bars.index)
+
+
+@dataclass
+class BacktestResult:
+    equity: pd.DataFrame        # equity / cash / position / contributed
+    trades: pd.DataFrame        # TRADE_COLUMNS，fee 含稅、tax 為其中的稅額
+    round_trips: pd.DataFrame   # trades_summary.round_trips
+    metrics: Dict[str, float]
+
+
+def infer_periods_per_year(index) -> float:
+    """日K 以上用 252 個交易日；日內 K 棒 (加密貨幣 24 小時) 以 365 天換算。"""
+    if not isinstance(index, pd.DatetimeIndex) or len(index) < 2:
+        return 252.0
+    step = pd.Series(index).diff().median()
+    if step >= pd.Timedelta(days=1):
+        return 252.0 * pd.Timedelta(days=1) / step
+    return pd.Timedelta(days=365) / step
+
+
+def period_returns(values: np.ndarray, contributed=None) -> np.ndarray:
+    """每期的時間加權報酬 (扣除當期入金)，第一期為 0。"""
+    values = np.asarray(values, dtype=float)
+    flows = np.zeros(len(values))
+    if contributed is not None and len(values):
+        flows[1:] = np.diff(np.asarray(contributed, dtype=float))
+    ret = np.zeros(len(values))
+    if len(values) > 1:
+        prev = values[:-1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ret[1:] = np.where(prev > 0, (values[1:] - flows[1:]) / prev - 1.0, 0.0)
+    return ret
+
+
+def drawdown(equity, contributed=None) -> pd.Series:
+    """
+    回撤序列 (<= 0)，以時間加權的淨值計算，入金不會被當成創新高。
+    :param equity: 權益 (pd.Series，或含 equity / contributed 欄位的 DataFrame)
+    """
+    if isinstance(equity, pd.DataFrame):
+        if contributed is None and 'contributed' in equity.columns:
+            contributed = equity['contributed']
+        equity = equity['equity']
+    growth = np.cumprod(1.0 + period_returns(equity.to_numpy(dtype=float), contributed))
+    return pd.Series(growth / np.maximum.accumulate(growth) - 1.0, index=equity.index, name='drawdown')
+
+
+def compute_metrics(equity, trades: pd.DataFrame, periods_per_year: float = None,
+                    contributed=None) -> Dict[str, float]:
+    """
+    :param equity: 權益 (pd.Series，或含 equity / contributed 欄位的 DataFrame)
+    :param trades: 成交紀錄 (timestamp, side, action, price, qty, fee)
+    :param periods_per_year: 年化用的期數，預設由 index 推算 (infer_periods_per_year)
+    :param contributed: 累計入金；有入金時報酬以時間加權計算 (當期入金不算報酬)
+    """
+    if isinstance(equity, pd.DataFrame):
+        if contributed is None and 'contributed' in equity.columns:
+            contributed = equity['contributed']
+        equity = equity['equity']
+    values = equity.to_numpy(dtype=float)
+    if periods_per_year is None:
+        periods_per_year = infer_periods_per_year(equity.index)
+    ret = period_returns(values, contributed)
+    growth = np.cumprod(1.0 + ret)
+    total_return = float(growth[-1] - 1.0) if len(values) else 0.0
+    days = max((equity.index[-1] - equity.index[0]).days, 1) if len(values) > 1 else 1
+    cagr = (1.0 + total_return) ** (365.0 / days) - 1.0 if total_return > -1 else -1.0
+    std = ret.std(ddof=1) if len(ret) > 1 else 0.0
+    sharpe = ret.mean() / std * np.sqrt(periods_per_year) if std > 0 else 0.0
+    downside = ret[ret < 0].std(ddof=1) if (ret < 0).sum() > 1 else 0.0
+    sortino = ret.mean() / downside * np.sqrt(periods_per_year) if downside > 0 else 0.0
+    max_dd = float((growth / np.maximum.accumulate(growth) - 1.0).min()) if len(values) else 0.0
+
+    stats = summarize_round_trips(round_trips(trades))
+    total_contributed = float(np.asarray(contributed, dtype=float)[-1]) if contributed is not None and len(values) \
+        else (float(values[0]) if len(values) else 0.0)
+    final = float(values[-1]) if len(values) else 0.0
+    return {
+        'CAGR': float(cagr),
+        'Sharpe': float(sharpe),
+        'Sortino': float(sortino),
+        'MaxDrawdown': max_dd,
+        'NumTrades': stats['NumTrades'],
+        'WinRate': stats['WinRate'],
+        'ProfitFactor': stats['ProfitFactor'],
+        'FinalEquity': final,
+        'Return': total_return,
+        'NetProfit': final - total_contributed,
+        'TotalFees': float(trades['fee'].sum()) if len(trades) and 'fee' in trades.columns else 0.0,
+        'TotalTax': float(trades['tax'].sum()) if len(trades) and 'tax' in trades.columns else 0.0,
+    }
+
+
+def run_backtest(data: pd.DataFrame, strategy: Strategy, initial_cash: float = 0.0, fees: FeeModel = NO_FEES,
+                 price_col: str = 'close', mark: str = 'after', periods_per_year: float = None) -> BacktestResult:
+    """
+    :param data: K 棒 (DatetimeIndex)，欄位至少包含 price_col；策略需要的指標可以先算好放在欄位中
+    :param strategy: Strategy 實例
+    :param price_col: 權益計價用的欄位
+    :param mark: 'after' 權益含當根成交；'before' 權益為當根成交前 (turtle 系列的紀錄方式)
+    """
+    bars = Bars(data)
+    broker = Broker(bars, fees, initial_cash)
+    strategy.prepare(bars, broker)
+    on_bar = strategy.on_bar
+    for i in range(len(bars)):
+        on_bar(i, broker)
+    strategy.on_finish(broker)
+
+    equity = broker.equity_frame(bars.array(price_col), mark)
+    trades = broker.trades()
+    metrics = compute_metrics(equity, trades, periods_per_year)
+    return BacktestResult(equity, trades, round_trips(trades, data), metrics)
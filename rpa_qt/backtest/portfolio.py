@@ -0,0 +1,181 @@
+"""
+多檔共用資金的投資組合回測 (Portfolio backtest)
+
+engine.run_backtest 與 swing_vector.backtest_panel 都是每檔各自一筆 init_cash；實際帳戶 (例如
+fubon/inventory_stop_loss_v3 的 TradingSystem 管理的庫存) 是一個資金池同時持有多檔股票。這裡：
+* 輸入為日期對齊的 panel (T 天 x M 檔)：收盤價、可進場遮罩、出場訊號遮罩、停損距離 (ATR * atr_mult)、排序分數
+* 每天先處理出場 (出場訊號或 close < 進場價 - 停損距離)，再依分數由高到低挑選進場
+* 部位大小：qty = floor(權益 * risk_per_trade / 停損距離 / lot_size) * lot_size (台股整張 1000 股)
+* 限制：最多 max_positions 檔同時持有；依排序累加 (成本 + 手續費)，超過可用現金就停止進場
+* 手續費 / 證交稅預設為 engine.TW_STOCK
+
+現金是所有股票共用的，所以日期之間必須依序處理，但每一天只對「持有中的股票」與「當天可進場的股票」
+做向量運算，不逐列掃 panel：1000 檔 x 10 年約 0.4 秒 (見 bench_portfolio.py)。
+panel 裡尚未上市 / 停牌的日子為 NaN：當天不進出場，持股以前一天的收盤價計價。
+"""
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from rpa_qt.backtest.engine import BacktestResult, compute_metrics, FeeModel, TRADE_COLUMNS, TW_STOCK
+from rpa_qt.backtest.trades_summary import round_trips
+
+LOT_SIZE = 1000  # 台股一張
+HOLDING_COLUMNS = ['ticker', 'entry_date', 'entry_price', 'qty', 'stop', 'close', 'market_value']
+
+
+@dataclass
+class PortfolioResult(BacktestResult):
+    holdings: pd.DataFrame  # 回測結束時仍持有的部位 (HOLDING_COLUMNS)
+
+
+def run_portfolio(close, enter, exit_, stop_dist, score=None, dates: Optional[Sequence] = None,
+                  tickers: Optional[Sequence] = None, init_cash: float = 1_000_000, risk_per_trade: float = 0.01,
+                  max_positions: int = 10, lot_size: int = LOT_SIZE, fees: FeeModel = TW_STOCK,
+                  stop_on_entry: bool = False, periods_per_year: float = None) -> PortfolioResult:
+    """
+    :param close: (T, M) 收盤價 (DataFrame 時 index / columns 當作 dates / tickers)，成交與計價都用收盤價
+    :param enter: (T, M) bool，當天收盤可進場
+    :param exit_: (T, M) bool，當天收盤出場 (進場當天不檢查)
+    :param stop_dist: (T, M) 停損距離 (例如 ATR * atr_mult)，同時用來計算部位大小
+    :param score: (T, M) 進場排序分數 (高者優先)，None 表示依欄位順序
+    :param dates / tickers: close 為陣列時的日期與股票代號
+    :param stop_on_entry: False 時每天以當天的停損距離重算停損價 (與 trading_swing 相同)；True 時固定為進場當天的值
+    :return: PortfolioResult，trades 多一個 ticker 欄；equity 欄位為 equity / cash / market_value / positions / contributed
+    """
+    if isinstance(close, pd.DataFrame):
+        dates = close.index if dates is None else dates
+        tickers = close.columns if tickers is None else tickers
+    close = np.asarray(close, dtype=float)
+    T, M = close.shape
+    if dates is None:
+        raise ValueError("close 不是 DataFrame 時需要傳入 dates")
+    dates = pd.DatetimeIndex(dates)
+    tickers = np.asarray(tickers if tickers is not None else np.arange(M), dtype=object)
+    stop_dist = np.asarray(stop_dist, dtype=float)
+    exit_ = np.asarray(exit_, dtype=bool)
+    finite = np.isfinite(close)
+    with np.errstate(invalid="ignore"):
+        can_enter = np.asarray(enter, dtype=bool) & finite & (stop_dist > 0)
+    mark = pd.DataFrame(close).ffill().fillna(0.0).to_numpy()
+    rank = None
+    if score is not None:
+        score = np.asarray(score, dtype=float)
+        rank = np.where(np.isnan(score), -np.inf, score)
+
+    held = np.zeros(M, dtype=bool)
+    qty = np.zeros(M)
+    entry_price = np.zeros(M)
+    entry_row = np.zeros(M, dtype=np.int64)
+    entry_stop = np.zeros(M)
+    cash = float(init_cash)
+    out_cash = np.empty(T)
+    out_value = np.empty(T)
+    out_count = np.empty(T, dtype=np.int64)
+    fills = []  # (row, col, is_buy, action, qty, fee, tax) 每天一組陣列
+
+    for t in range(T):
+        px = close[t]
+        cols = np.flatnonzero(held)
+        exited = cols[:0]
+        # ---------- 出場 ----------
+        if len(cols):
+            p = px[cols]
+            level = entry_stop[cols] if stop_on_entry else entry_price[cols] - stop_dist[t, cols]
+            tradable = finite[t, cols]
+            stopped = tradable & (p < level)
+            out = tradable & (stopped | exit_[t, cols])
+            if out.any():
+                exited = cols[out]
+                q = qty[exited]
+                notional = q * p[out]
+                fee = fees.commissions(notional)
+                tax = fees.taxes(notional, True)
+                cash += float(np.sum(notional - fee - tax))
+                fills.append((np.full(len(exited), t), exited, np.zeros(len(exited), dtype=bool),
+                              np.where(stopped[out], "stop", "exit"), q, fee + tax, tax))
+                held[exited] = False
+                qty[exited] = 0.0
+                cols = cols[~out]
+
+        # ---------- 進場 ----------
+        slots = max_positions - len(cols)
+        if slots > 0:
+            cand = np.flatnonzero(can_enter[t])
+            if len(cand):
+                cand = cand[~held[cand]]
+                if len(exited):
+                    cand = cand[~np.isin(cand, exited)]  # 出場當天不再進場
+            if len(cand):
+                equity = cash + float(np.dot(qty[cols], mark[t, cols]))
+                q = np.floor(equity * risk_per_trade / stop_dist[t, cand] / lot_size) * lot_size
+                ok = q > 0
+                cand, q = cand[ok], q[ok]
+                if rank is not None and len(cand) > 1:
+                    order = np.argsort(-rank[t, cand], kind="stable")
+                    cand, q = cand[order], q[order]
+                cand, q = cand[:slots], q[:slots]
+                notional = q * px[cand]
+                fee = fees.commissions(notional)
+                cost = np.cumsum(notional + fee)
+                n = int(np.searchsorted(cost, cash, side="right"))  # 依序進場，現金不足就停止
+                if n:
+                    cand, q, fee = cand[:n], q[:n], fee[:n]
+                    cash -= float(cost[n - 1])
+                    held[cand] = True
+                    qty[cand] = q
+                    entry_price[cand] = px[cand]
+                    entry_row[cand] = t
+                    entry_stop[cand] = px[cand] - stop_dist[t, cand]
+                    fills.append((np.full(n, t), cand, np.ones(n, dtype=bool), np.full(n, "entry"), q, fee,
+                                  np.zeros(n)))
+                    cols = np.flatnonzero(held)
+
+        out_cash[t] = cash
+        out_value[t] = float(np.dot(qty[cols], mark[t, cols])) if len(cols) else 0.0
+        out_count[t] = len(cols)
+
+    equity = pd.DataFrame({'equity': out_cash + out_value, 'cash': out_cash, 'market_value': out_value,
+                           'positions': out_count, 'contributed': float(init_cash)}, index=dates)
+    trades = _trades_frame(fills, close, dates, tickers)
+    # round_trips 依成交順序分組，多檔交錯時要先依股票排序
+    by_ticker = trades.sort_values(['ticker', 'timestamp'], kind='stable').reset_index(drop=True)
+    summary = round_trips(by_ticker)
+    closed_entries = by_ticker[(by_ticker['action'] == 'entry') & by_ticker['action'].shift(-1).isin(['exit', 'stop'])
+                               & (by_ticker['ticker'] == by_ticker['ticker'].shift(-1))]
+    summary.insert(0, 'ticker', closed_entries['ticker'].to_numpy())
+    metrics = compute_metrics(equity, by_ticker, periods_per_year)
+
+    cols = np.flatnonzero(held)
+    last = T - 1
+    holdings = pd.DataFrame({
+        'ticker': tickers[cols],
+        'entry_date': dates[entry_row[cols]] if len(cols) else pd.DatetimeIndex([]),
+        'entry_price': entry_price[cols],
+        'qty': qty[cols],
+        'stop': entry_stop[cols] if stop_on_entry else entry_price[cols] - stop_dist[last, cols],
+        'close': mark[last, cols],
+        'market_value': qty[cols] * mark[last, cols],
+    }, columns=HOLDING_COLUMNS)
+    return PortfolioResult(equity, trades, summary, metrics, holdings)
+
+
+def _trades_frame(fills, close, dates, tickers) -> pd.DataFrame:
+    columns = ['ticker'] + TRADE_COLUMNS
+    if not fills:
+        return pd.DataFrame(columns=columns)
+    row, col, is_buy, action, qty, fee, tax = (np.concatenate(a) for a in zip(*fills))
+    return pd.DataFrame({
+        'ticker': tickers[col],
+        'timestamp': dates[row],
+        'side': 'long',
+        'action': action,
+        'direction': np.where(is_buy, 'BUY', 'SELL'),
+        'price': close[row, col],
+        'qty': qty,
+        'fee': fee,
+        'tax': tax,
+        'comment': '',
+    }, columns=columns)
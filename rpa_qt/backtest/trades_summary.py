@@ -0,0 +1,214 @@
+"""
+成交紀錄 -> 每筆部位 (round trip) 的彙總表，各個回測程式共用
+
+輸入為逐筆成交 (fills)，欄位與 turtle_02 的 trades 相同：
+    timestamp, side ('long' / 'short'), action ('entry' / 'add' / 'exit' / 'stop'), price, qty, fee
+其他格式 (trading_swing 的 date/type=BUY/SELL、turtle_01 的 ENTRY/PYRAMID/EXIT/STOP_LOSS + shares) 先經 standardize_trades 轉換。
+
+round_trips 不逐列迴圈，而是以累計和把成交分組成部位：
+* 'entry'，或前一筆是出場後的第一筆開倉，開始一個新部位；之後的加碼、出場都屬於同一個部位
+* 開倉 / 出場的數量、金額、手續費以 np.add.reduceat 一次加總
+* VWAP = 開倉金額 / 開倉數量；PnL 扣除所有開倉、加碼、出場的手續費 (不是只有出場那筆)
+* 有傳入 K 棒時，以 sparse table 一次查詢每個部位持有期間的最高 / 最低價，計算 MAE / MFE
+最後沒有出場的部位 (回測結束時仍持有) 不列入。
+"""
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+OPEN_ACTIONS = ('entry', 'add')
+CLOSE_ACTIONS = ('exit', 'stop')
+FILL_COLUMNS = ['timestamp', 'side', 'action', 'price', 'qty', 'fee']
+SUMMARY_COLUMNS = ['position', 'side', 'entry_time', 'exit_time', 'fills', 'qty', 'vwap', 'exit_price',
+                   'exit_action', 'gross_pnl', 'fees', 'pnl', 'return_pct', 'hold_time', 'bars_held',
+                   'mae', 'mfe', 'mae_pct', 'mfe_pct']
+
+# 其他回測程式的成交格式 -> action
+ACTION_ALIASES = {
+    'BUY': 'entry', 'ENTRY': 'entry', 'ADD': 'add', 'PYRAMID': 'add',
+    'SELL': 'exit', 'EXIT': 'exit', 'STOP': 'stop', 'STOP_LOSS': 'stop',
+}
+
+
+def standardize_trades(trades: pd.DataFrame, fee_rate: float = 0.0, side: str = 'long') -> pd.DataFrame:
+    """
+    把各回測程式的成交表轉成 FILL_COLUMNS。
+    * date -> timestamp、type -> action (BUY/ENTRY -> entry、ADD/PYRAMID -> add、SELL/EXIT -> exit、STOP_LOSS -> stop)、
+      shares -> qty
+    * 沒有 side 欄時全部視為 side (預設只做多)
+    * 沒有 fee 欄時以成交金額 * fee_rate 估算
+    """
+    df = trades.rename(columns={'date': 'timestamp', 'type': 'action', 'shares': 'qty'}).copy()
+    if df.empty:
+        return pd.DataFrame(columns=FILL_COLUMNS)
+    df['action'] = df['action'].map(lambda a: ACTION_ALIASES.get(str(a).upper(), str(a).lower()))
+    if 'side' not in df.columns:
+        df['side'] = side
+    if 'fee' not in df.columns:
+        df['fee'] = df['price'].abs() * df['qty'].abs() * fee_rate
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    return df[FILL_COLUMNS].reset_index(drop=True)
+
+
+def _sparse_table(values: np.ndarray, ufunc) -> np.ndarray:
+    """table[k, i] = ufunc.reduce(values[i : i + 2**k])，長度不足的位置沿用上一層。"""
+    n = len(values)
+    levels = [values]
+    span = 1
+    while span * 2 <= n:
+        prev = levels[-1]
+        nxt = prev.copy()
+        nxt[:n - span] = ufunc(prev[:n - span], prev[span:])
+        levels.append(nxt)
+        span *= 2
+    return np.stack(levels)
+
+
+def range_reduce(values: np.ndarray, lo: np.ndarray, hi: np.ndarray, ufunc) -> np.ndarray:
+    """每一組 [lo, hi] (含兩端) 的 ufunc.reduce，例如 np.maximum / np.minimum，所有區間一次查詢。"""
+    values = np.asarray(values, dtype=float)
+    if len(lo) == 0 or len(values) == 0:
+        return np.full(len(lo), np.nan)
+    table = _sparse_table(values, ufunc)
+    k = np.floor(np.log2(hi - lo + 1)).astype(int)
+    return ufunc(table[k, lo], table[k, hi - (1 << k) + 1])
+
+
+def first_below(values: np.ndarray, start: np.ndarray, stop: np.ndarray, threshold: np.ndarray,
+                table: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    每一組查詢在 [start, stop) 中第一個 values[j] < threshold 的位置，沒有則為 stop。
+    以 min 的 sparse table 由大到小跳 2**k 步，所有查詢一次做完 (O(log n) 次向量運算)；NaN 視為不小於任何值。
+    table 可傳入預先算好的 _sparse_table(values, np.minimum)，多次查詢同一組 values 時重複使用。
+    """
+    values = np.asarray(values, dtype=float)
+    if table is None:
+        table = _sparse_table(np.where(np.isnan(values), np.inf, values), np.minimum)
+    pos = np.asarray(start, dtype=np.int64).copy()
+    stop = np.asarray(stop, dtype=np.int64)
+    last = len(values) - 1
+    for k in range(len(table) - 1, -1, -1):
+        span = 1 << k
+        jump = (pos + span <= stop) & (table[k, np.minimum(pos, last)] >= threshold)
+        pos = np.where(jump, pos + span, pos)
+    return np.minimum(pos, stop)
+
+
+def _bar_column(bars: pd.DataFrame, name: str) -> Optional[np.ndarray]:
+    for col in (name, name.capitalize()):
+        if col in bars.columns:
+            return bars[col].to_numpy(dtype=float)
+    return None
+
+
+def round_trips(trades: pd.DataFrame, bars: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """
+    :param trades: FILL_COLUMNS 格式的成交 (依時間排序)
+    :param bars: 選填，DatetimeIndex 的 K 棒 (high/low 或 High/Low)，用來計算 bars_held 與 MAE / MFE (沒有這兩欄則略過)
+    :return: 每個已出場的部位一列 (SUMMARY_COLUMNS)
+             vwap 為開倉均價、gross_pnl 為價差損益、fees 為此部位所有成交的手續費、pnl = gross_pnl - fees、
+             return_pct = pnl / (vwap * qty) * 100、
+             mae / mfe 為持有期間 (進場到出場的 K 棒，含兩端) 相對 VWAP 最不利 / 最有利的每單位價差
+    """
+    if trades is None or trades.empty:
+        return pd.DataFrame(columns=SUMMARY_COLUMNS)
+
+    action = trades['action'].to_numpy()
+    is_open = np.isin(action, OPEN_ACTIONS)
+    is_close = np.isin(action, CLOSE_ACTIONS)
+    prev_close = np.concatenate([[True], is_close[:-1]])
+    starts = (action == 'entry') | (is_open & prev_close)
+    group = np.cumsum(starts) - 1  # 第一次開倉前的成交為 -1
+    keep = group >= 0
+    if not keep.any():
+        return pd.DataFrame(columns=SUMMARY_COLUMNS)
+
+    price = trades['price'].to_numpy(dtype=float)[keep]
+    qty = np.abs(trades['qty'].to_numpy(dtype=float))[keep]
+    fee = trades['fee'].to_numpy(dtype=float)[keep]
+    ts = pd.DatetimeIndex(trades['timestamp'])[keep]
+    side = trades['side'].to_numpy()[keep]
+    action = action[keep]
+    is_open, is_close, group = is_open[keep], is_close[keep], group[keep]
+
+    bounds = np.flatnonzero(np.diff(group, prepend=-1))  # 每個部位第一筆成交的位置
+    open_qty = np.add.reduceat(np.where(is_open, qty, 0.0), bounds)
+    open_value = np.add.reduceat(np.where(is_open, price * qty, 0.0), bounds)
+    close_qty = np.add.reduceat(np.where(is_close, qty, 0.0), bounds)
+    close_value = np.add.reduceat(np.where(is_close, price * qty, 0.0), bounds)
+    fees = np.add.reduceat(fee, bounds)
+    fills = np.add.reduceat(is_open.astype(int), bounds)
+    # 每個部位最後一筆出場成交
+    last_close = np.maximum.reduceat(np.where(is_close, np.arange(len(group)), -1), bounds)
+
+    closed = (close_qty > 0) & (open_qty > 0)
+    bounds, open_qty, open_value = bounds[closed], open_qty[closed], open_value[closed]
+    close_qty, close_value, fees, fills, last_close = (close_qty[closed], close_value[closed], fees[closed],
+                                                       fills[closed], last_close[closed])
+
+    sign = np.where(side[bounds] == 'short', -1.0, 1.0)
+    vwap = open_value / open_qty
+    exit_price = close_value / close_qty
+    gross = (close_value - vwap * close_qty) * sign
+    pnl = gross - fees
+    entry_time = ts[bounds]
+    exit_time = ts[last_close]
+
+    out = pd.DataFrame({
+        'position': np.arange(len(bounds)),
+        'side': side[bounds],
+        'entry_time': entry_time,
+        'exit_time': exit_time,
+        'fills': fills,
+        'qty': open_qty,
+        'vwap': vwap,
+        'exit_price': exit_price,
+        'exit_action': action[last_close],
+        'gross_pnl': gross,
+        'fees': fees,
+        'pnl': pnl,
+        'return_pct': pnl / (vwap * open_qty) * 100,
+        'hold_time': exit_time - entry_time,
+        'bars_held': np.nan,
+        'mae': np.nan, 'mfe': np.nan, 'mae_pct': np.nan, 'mfe_pct': np.nan,
+    })
+
+    highs = _bar_column(bars, 'high') if bars is not None else None
+    lows = _bar_column(bars, 'low') if bars is not None else None
+    if highs is not None and lows is not None and len(bars) and len(out):
+        index = pd.DatetimeIndex(bars.index)
+        lo = index.searchsorted(entry_time)
+        hi = np.minimum(index.searchsorted(exit_time, side='right') - 1, len(index) - 1)
+        valid = (lo <= hi) & (lo < len(index))
+        lo, hi = np.where(valid, lo, 0), np.where(valid, hi, 0)
+        highest = range_reduce(highs, lo, hi, np.maximum)
+        lowest = range_reduce(lows, lo, hi, np.minimum)
+        adverse = np.where(sign > 0, vwap - lowest, highest - vwap)
+        favorable = np.where(sign > 0, highest - vwap, vwap - lowest)
+        out['bars_held'] = np.where(valid, hi - lo + 1, np.nan)
+        out['mae'] = np.where(valid, adverse, np.nan)
+        out['mfe'] = np.where(valid, favorable, np.nan)
+        out['mae_pct'] = out['mae'] / vwap * 100
+        out['mfe_pct'] = out['mfe'] / vwap * 100
+    return out[SUMMARY_COLUMNS]
+
+
+def summarize_round_trips(summary: pd.DataFrame) -> Dict[str, float]:
+    """round_trips 的統計：筆數、勝率、獲利因子 (毛利 / 毛損)、平均損益、平均持有時間。"""
+    n = len(summary)
+    if n == 0:
+        return {'NumTrades': 0, 'WinRate': 0.0, 'ProfitFactor': 0.0, 'AvgPnL': 0.0, 'AvgReturnPct': 0.0,
+                'TotalFees': 0.0, 'AvgHoldTime': pd.Timedelta(0)}
+    pnl = summary['pnl'].to_numpy(dtype=float)
+    profit = pnl[pnl >= 0].sum()
+    loss = -pnl[pnl < 0].sum()
+    return {
+        'NumTrades': n,
+        'WinRate': float((pnl > 0).mean()),
+        'ProfitFactor': float(profit / loss) if loss > 0 else float('inf') if profit > 0 else 0.0,
+        'AvgPnL': float(pnl.mean()),
+        'AvgReturnPct': float(summary['return_pct'].mean()),
+        'TotalFees': float(summary['fees'].sum()),
+        'AvgHoldTime': summary['hold_time'].mean(),
+    }
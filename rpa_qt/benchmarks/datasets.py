@@ -0,0 +1,103 @@
+"""
+效能測試用的資料集 (不連網)
+
+* synthetic_ohlcv：turnover_02.MockTicker 的隨機漫步 (每筆成交價乘上 exp(N(0, vol / 1000)))，
+  以向量運算一次產生 n 根 K 棒 x ticks_per_bar 筆成交，再聚合成 OHLC；成交量為每筆成交的隨機數量加總。
+  同一組 (n, seed) 每次產生的資料完全相同。
+* 錄製資料：直接讀本機快取，不經過會連網的 fetch / get_ohlcv
+  - "klines:SOLUSDT:1m"：kline_history 的日分割快取 (<cache>/klines/SOLUSDT/1m/*.npz) 全部串接
+  - "ohlcv:2330.TW"：ohlcv_cache 的日 K 快取
+  - 其他字串視為檔案路徑：.csv (第一欄為時間) 或 .npz (kline_history / ohlcv_cache 任一種格式)
+所有資料集都轉成小寫欄位 open / high / low / close / volume、DatetimeIndex (無時區)。
+"""
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+from rpa_qt.price_utils.kline_store import COLUMNS
+
+TICKS_PER_BAR = 8
+
+
+def synthetic_ohlcv(n: int, seed: int = 0, start_price: float = 30000.0, vol: float = 0.6,
+                    ticks_per_bar: int = TICKS_PER_BAR, freq: str = "1min", start: str = "2020-01-01") -> pd.DataFrame:
+    """MockTicker(start_price, vol) 的 n * ticks_per_bar 筆成交聚合成 n 根 K 棒。"""
+    rng = np.random.default_rng(seed)
+    steps = rng.normal(0, vol / 1000.0, (n, ticks_per_bar))
+    ticks = start_price * np.exp(np.cumsum(steps.ravel())).reshape(n, ticks_per_bar)
+    volume = rng.exponential(1.0, (n, ticks_per_bar)).sum(axis=1)
+    return pd.DataFrame({"open": ticks[:, 0], "high": ticks.max(axis=1), "low": ticks.min(axis=1),
+                         "close": ticks[:, -1], "volume": volume},
+                        index=pd.date_range(start, periods=n, freq=freq))
+
+
+def _from_kline_npz(paths) -> pd.DataFrame:
+    times, values = [], []
+    for path in paths:
+        with np.load(path) as f:
+            times.append(f["open_time"])
+            values.append(f["ohlcv"])
+    if not times:
+        return pd.DataFrame(columns=COLUMNS, index=pd.DatetimeIndex([]))
+    open_time = np.concatenate(times)
+    df = pd.DataFrame(np.concatenate(values), columns=COLUMNS,
+                      index=pd.to_datetime(open_time, unit="ms"))
+    return df[~df.index.duplicated(keep="last")].sort_index()
+
+
+def _from_ohlcv_npz(path) -> pd.DataFrame:
+    from rpa_qt.price_utils.ohlcv_cache import COLUMNS as CACHE_COLUMNS
+
+    with np.load(path) as f:
+        df = pd.DataFrame(f["values"], index=pd.DatetimeIndex(f["dates"].astype("datetime64[ns]")),
+                          columns=CACHE_COLUMNS)
+    df = df[["Open", "High", "Low", "Close", "Volume"]].dropna()
+    df.columns = COLUMNS
+    return df
+
+
+def recorded_klines(symbol: str, interval: str, cache_dir: str = None) -> pd.DataFrame:
+    """kline_history 快取中 symbol / interval 的所有 K 棒 (不補下載)。"""
+    from rpa_qt.price_utils.kline_history import CACHE_DIR
+
+    folder = os.path.join(cache_dir or CACHE_DIR, symbol.upper(), interval)
+    paths = sorted(p for p in glob.glob(os.path.join(folder, "*.npz")) if ".tmp" not in p)
+    return _from_kline_npz(paths)
+
+
+def recorded_daily(ticker: str, cache_dir: str = None) -> pd.DataFrame:
+    """ohlcv_cache 快取中的日 K (不補下載)，沒有快取時為空的 DataFrame。"""
+    from rpa_qt.price_utils.ohlcv_cache import CACHE_DIR
+
+    path = os.path.join(cache_dir or CACHE_DIR, f"{ticker}.npz")
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=COLUMNS, index=pd.DatetimeIndex([]))
+    return _from_ohlcv_npz(path)
+
+
+def load_file(path: str) -> pd.DataFrame:
+    if path.endswith(".npz"):
+        with np.load(path) as f:
+            is_kline = "open_time" in f.files
+        return _from_kline_npz([path]) if is_kline else _from_ohlcv_npz(path)
+    df = pd.read_csv(path, index_col=0, parse_dates=True)
+    df.columns = [c.lower() for c in df.columns]
+    return df[COLUMNS].dropna()
+
+
+def load_recorded(spec: str) -> pd.DataFrame:
+    """依 spec ("klines:SYMBOL:INTERVAL"、"ohlcv:TICKER" 或檔案路徑) 讀取錄製資料。"""
+    kind, _, rest = spec.partition(":")
+    if kind == "klines":
+        symbol, _, interval = rest.partition(":")
+        df = recorded_klines(symbol, interval or "1m")
+    elif kind == "ohlcv":
+        df = recorded_daily(rest)
+    else:
+        df = load_file(spec)
+    df.index = pd.DatetimeIndex(df.index)
+    if df.index.tz is not None:
+        df.index = df.index.tz_convert(None)
+    return df
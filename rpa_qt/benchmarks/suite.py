@@ -0,0 +1,231 @@
+"""
+回測與指標的效能測試 (Benchmark suite)
+
+每個 case 在 1k / 100k / 1M 根 K 棒上計時，結果寫成 JSON，換一個 commit 再跑一次就能比較：
+* turtle_02.Backtester.run          (Backtester 建構時的指標計算不計入)
+* trading_swing.compute_indicators / trading_swing.backtest
+* tw_rebound_scanner.detect_abc     (收盤價序列)
+* find_support_points               (n = 全部 K 棒)
+* StrategyThread 的指標更新          (每根 K 棒 store.update + _on_bar，與即時行情相同的路徑)
+資料集為 datasets.synthetic_ohlcv (MockTicker 隨機漫步)，另可用 --recorded 加入本機快取的錄製資料
+(錄製資料不足 n 根的大小會略過)。全程不連網。
+
+執行：
+    python -m rpa_qt.benchmarks.suite                                  # 全部 case，結果寫到 bench_<commit>.json
+    python -m rpa_qt.benchmarks.suite --sizes 1000 100000 --cases swing_backtest detect_abc
+    python -m rpa_qt.benchmarks.suite --recorded klines:SOLUSDT:1m --compare bench_abc1234.json
+--compare 時每個 (case, dataset, bars) 與舊結果比較，慢超過 --threshold 倍列為 REGRESSION (結束代碼 1)。
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from rpa_qt.benchmarks.datasets import load_recorded, synthetic_ohlcv
+
+SIZES = [1_000, 100_000, 1_000_000]
+SEED = 0
+THRESHOLD = 1.2  # 比舊結果慢 20% 以上視為退步
+
+
+# ---------- cases：setup(df) -> 要計時的無參數函式 ----------
+def _turtle_run(df: pd.DataFrame) -> Callable:
+    from rpa_qt.trading_turtle.turtle_02 import Backtester, BacktestConfig, StrategyConfig
+
+    bt = Backtester(df, StrategyConfig(), BacktestConfig())
+    return bt.run
+
+
+def _capitalized(df: pd.DataFrame) -> pd.DataFrame:
+    return df.rename(columns=str.capitalize)
+
+
+def _swing_indicators(df: pd.DataFrame) -> Callable:
+    from rpa_qt.trading_swing.trading_swing import compute_indicators
+
+    data = _capitalized(df)
+    return lambda: compute_indicators(data.copy())
+
+
+def _swing_backtest(df: pd.DataFrame) -> Callable:
+    from rpa_qt.trading_swing.trading_swing import backtest, compute_indicators
+
+    data = compute_indicators(_capitalized(df))
+    return lambda: backtest(data)
+
+
+def _detect_abc(df: pd.DataFrame) -> Callable:
+    from rpa_qt.trading_rebound.tw_rebound_scanner import detect_abc, MIN_REBOUND, N_PCT
+
+    close = df["close"]
+    return lambda: detect_abc(close, N_PCT, MIN_REBOUND)
+
+
+def _support_points(df: pd.DataFrame) -> Callable:
+    from rpa_qt.indicators.find_support_points import find_support_points
+
+    return lambda: find_support_points(df, n=len(df))
+
+
+def _strategy_refresh(df: pd.DataFrame) -> Callable:
+    from rpa_qt.price_utils.bar_bus import BAR_CLOSE, BarEvent
+    from rpa_qt.price_utils.kline_store import KlineRingBuffer
+    from rpa_qt.trading_turnover.strategy import StrategyThread
+
+    open_time = (df.index.values.astype("datetime64[ms]").astype(np.int64)).tolist()
+    rows = df[["open", "high", "low", "close", "volume"]].to_numpy().tolist()
+
+    def run():
+        store = KlineRingBuffer(capacity=1000)
+        thread = StrategyThread(interval="1m", dfs={"1m": store}, symbol="BENCH")
+        on_bar = thread._on_bar
+        with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):  # 訊號改變時的 print 不輸出
+            for t, (o, h, l, c, v) in zip(open_time, rows):
+                store.update(t, o, h, l, c, v, closed=True)
+                on_bar(BarEvent("BENCH", "1m", t, BAR_CLOSE, c))
+    return run
+
+
+CASES: Dict[str, Callable] = {
+    "turtle_run": _turtle_run,
+    "swing_indicators": _swing_indicators,
+    "swing_backtest": _swing_backtest,
+    "detect_abc": _detect_abc,
+    "find_support_points": _support_points,
+    "strategy_refresh": _strategy_refresh,
+}
+
+
+# ---------- 執行 ----------
+def time_case(fn: Callable, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def default_repeat(bars: int) -> int:
+    """小資料多跑幾次取最小值，大資料只跑一次。"""
+    return int(np.clip(100_000 // bars, 1, 5))
+
+
+def environment() -> Dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": pd.Timestamp.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "seed": SEED,
+    }
+
+
+def run_suite(cases: List[str] = None, sizes: List[int] = None, recorded: List[str] = (),
+              budget: Optional[float] = None, seed: int = SEED) -> Dict:
+    """
+    :param cases: 要跑的 case (CASES 的 key)，None 為全部
+    :param sizes: K 棒數
+    :param recorded: load_recorded 的 spec，每個都是額外的資料集 (取最後 n 根)
+    :param budget: 依上一個大小的耗時線性估計，超過 budget 秒的大小略過 (None 表示不限)
+    :return: {"environment": ..., "results": [{case, dataset, bars, seconds, repeat, us_per_bar, status}, ...]}
+    """
+    cases = cases or list(CASES)
+    sizes = sorted(sizes or SIZES)
+    datasets = {"synthetic": synthetic_ohlcv(max(sizes), seed=seed)}
+    for spec in recorded:
+        datasets[spec] = load_recorded(spec)
+
+    results = []
+    for name in cases:
+        for dataset, full in datasets.items():
+            last = None  # (bars, seconds)
+            for bars in sizes:
+                row = {"case": name, "dataset": dataset, "bars": bars, "seconds": None, "repeat": 0,
+                       "us_per_bar": None, "status": "ok"}
+                if len(full) < bars:
+                    row["status"] = f"skipped: only {len(full)} bars"
+                elif budget is not None and last is not None and last[1] * bars / last[0] > budget:
+                    row["status"] = f"skipped: estimated {last[1] * bars / last[0]:.0f}s > budget"
+                else:
+                    fn = CASES[name](full.iloc[-bars:])
+                    repeat = default_repeat(bars)
+                    seconds = time_case(fn, repeat)
+                    row.update(seconds=seconds, repeat=repeat, us_per_bar=seconds / bars * 1e6)
+                    last = (bars, seconds)
+                results.append(row)
+                print(format_row(row), flush=True)
+    return {"environment": environment(), "results": results}
+
+
+def format_row(row: Dict, baseline: Dict = None) -> str:
+    text = f"{row['case']:20s} {row['dataset']:22s} {row['bars']:>9,d} "
+    if row["seconds"] is None:
+        return text + row["status"]
+    text += f"{row['seconds'] * 1e3:11.1f} ms {row['us_per_bar']:9.2f} us/bar"
+    if baseline is not None and baseline.get("seconds"):
+        ratio = row["seconds"] / baseline["seconds"]
+        text += f"  {ratio:5.2f}x vs {baseline['seconds'] * 1e3:.1f} ms"
+    return text
+
+
+def compare(current: Dict, baseline: Dict, threshold: float = THRESHOLD) -> List[Dict]:
+    """回傳比 baseline 慢超過 threshold 倍的結果。"""
+    old = {(r["case"], r["dataset"], r["bars"]): r for r in baseline["results"]}
+    regressions = []
+    print(f"\n與 {baseline['environment'].get('commit')} ({baseline['environment'].get('timestamp')}) 比較：")
+    for row in current["results"]:
+        base = old.get((row["case"], row["dataset"], row["bars"]))
+        line = format_row(row, base)
+        if row["seconds"] and base and base.get("seconds") and row["seconds"] > base["seconds"] * threshold:
+            regressions.append({**row, "baseline_seconds": base["seconds"]})
+            line += "  REGRESSION"
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite for backtests and indicators")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=None)
+    parser.add_argument("--sizes", nargs="+", type=int, default=SIZES)
+    parser.add_argument("--recorded", nargs="*", default=[],
+                        help="recorded datasets: klines:SYMBOL:INTERVAL, ohlcv:TICKER or a .csv/.npz path")
+    parser.add_argument("--budget", type=float, default=None, help="skip sizes estimated to take longer (seconds)")
+    parser.add_argument("--output", default=None, help="JSON output path (default bench_<commit>.json)")
+    parser.add_argument("--compare", default=None, help="baseline JSON from an earlier run")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    args = parser.parse_args()
+
+    report = run_suite(args.cases, args.sizes, args.recorded, args.budget)
+    output = args.output or f"bench_{report['environment']['commit'] or 'local'}.json"
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"結果已輸出：{output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} 項慢了 {args.threshold:.2f} 倍以上")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
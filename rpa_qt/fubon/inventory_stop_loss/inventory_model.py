@@ -0,0 +1,201 @@
+"""
+庫存停損停利表格的 model (QAbstractTableModel)
+
+原本 tp_sl_gui_v3 用 QTableWidget，每筆 tick 都重算損益並改寫三個 QTableWidgetItem 的字串，
+持股 30 檔以上、tick 密集時 (或 fake websocket 每 0.1 秒一筆) Qt 的重繪成為瓶頸。這裡改為 model / view：
+* offer(diff) 可以從任何執行緒呼叫 (TickEngine 的 worker)，只把每檔最新的值寫進 dict 就返回
+* GUI 執行緒的 QTimer 每秒最多 max_fps 次 flush()：把累積的更新套用到資料，
+  發出「一個」涵蓋所有變動列的 dataChanged，view 只重繪這個範圍
+* 統計 ticks (收到的更新數)、flushes (flush 次數)、last_lag / max_lag (更新從收到到顯示的延遲秒數)，
+  給 GUI 的狀態列顯示
+* 停損 / 停利欄可勾選、未勾選時可編輯價格；勾選時呼叫 check_handler(symbol, column, checked, text)，
+  回傳 False 表示不接受 (例如價格不合理)，勾選狀態維持不變
+"""
+import threading
+import time
+
+from PySide6.QtCore import QAbstractTableModel, QModelIndex, Qt, QTimer
+
+# TickEngine.PositionState.ui_row() 的欄位 -> 表格欄位
+TICK_COLUMNS = {'shares': '庫存股數', 'avg_price': '庫存均價', 'price': '現價', 'pnl': '損益試算',
+                'return_rate': '獲利率%'}
+CHECK_COLUMNS = ('停損', '停利')
+MAX_FPS = 5
+EPSILON = 0.0000001
+
+
+def format_value(column, value) -> str:
+    if value is None:
+        return '-'
+    if column == '庫存均價':
+        return str(round(value + EPSILON, 2))
+    if column == '損益試算':
+        return str(int(round(value, 0)))
+    if column == '獲利率%':
+        return str(round(value + EPSILON, 2)) + '%'
+    return str(value)
+
+
+class InventoryTableModel(QAbstractTableModel):
+    def __init__(self, headers, max_fps: float = MAX_FPS, parent=None):
+        super().__init__(parent)
+        self.headers = list(headers)
+        self.col_idx_map = dict(zip(self.headers, range(len(self.headers))))
+        self.symbols = []  # row -> symbol
+        self.row_idx_map = {}  # symbol -> row
+        self.rows = {}  # symbol -> {欄位名稱: 值}
+        self.checked = {}  # (symbol, 欄位名稱) -> bool
+        self.check_handler = None
+
+        tick_cols = [self.col_idx_map[c] for c in TICK_COLUMNS.values()]
+        self._first_col, self._last_col = min(tick_cols), max(tick_cols)
+        self._lock = threading.Lock()
+        self._pending = {}  # symbol -> 最新的 ui_row
+        self._pending_since = None  # 最早一筆尚未顯示的更新的時間
+
+        self.ticks = 0
+        self.flushes = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self.flush)
+        self.set_max_fps(max_fps)
+
+    def set_max_fps(self, max_fps: float):
+        self._timer.start(max(int(1000 / max_fps), 1))
+
+    # ---------- QAbstractTableModel ----------
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.symbols)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.headers[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        symbol = self.symbols[index.row()]
+        column = self.headers[index.column()]
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            value = self.rows[symbol].get(column)
+            if column in CHECK_COLUMNS:
+                return value or ''
+            return format_value(column, value)
+        if role == Qt.CheckStateRole and column in CHECK_COLUMNS:
+            return Qt.Checked if self.checked.get((symbol, column)) else Qt.Unchecked
+        return None
+
+    def flags(self, index):
+        flags = Qt.ItemIsSelectable | Qt.ItemIsEnabled
+        if index.isValid() and self.headers[index.column()] in CHECK_COLUMNS:
+            flags |= Qt.ItemIsUserCheckable
+            if not self.checked.get((self.symbols[index.row()], self.headers[index.column()])):
+                flags |= Qt.ItemIsEditable  # 勾選後價格鎖定，取消勾選才能修改
+        return flags
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or self.headers[index.column()] not in CHECK_COLUMNS:
+            return False
+        symbol = self.symbols[index.row()]
+        column = self.headers[index.column()]
+        if role == Qt.EditRole:
+            self.rows[symbol][column] = str(value)
+        elif role == Qt.CheckStateRole:
+            checked = Qt.CheckState(value) == Qt.Checked
+            text = self.rows[symbol].get(column) or ''
+            if self.check_handler is not None and not self.check_handler(symbol, column, checked, text):
+                return False
+            self.checked[(symbol, column)] = checked
+        else:
+            return False
+        self.dataChanged.emit(index, index, [role])
+        return True
+
+    # ---------- 列的增減 (GUI 執行緒) ----------
+    def __contains__(self, symbol):
+        return symbol in self.row_idx_map
+
+    def add_row(self, symbol, values: dict, stop_loss=None, take_profit=None):
+        """
+        :param values: {欄位名稱: 值}
+        :param stop_loss / take_profit: 預設的停損 / 停利價，有值時該欄為勾選狀態
+        """
+        row = len(self.symbols)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.symbols.append(symbol)
+        self.row_idx_map[symbol] = row
+        self.rows[symbol] = dict(values)
+        for column, price in zip(CHECK_COLUMNS, (stop_loss, take_profit)):
+            self.rows[symbol][column] = str(price) if price is not None else ''
+            self.checked[(symbol, column)] = price is not None
+        self.endInsertRows()
+
+    def remove_row(self, symbol):
+        row = self.row_idx_map.get(symbol)
+        if row is None:
+            return
+        self.beginRemoveRows(QModelIndex(), row, row)
+        self.symbols.pop(row)
+        self.rows.pop(symbol)
+        for column in CHECK_COLUMNS:
+            self.checked.pop((symbol, column), None)
+        self.row_idx_map = {s: i for i, s in enumerate(self.symbols)}
+        self.endRemoveRows()
+        with self._lock:
+            self._pending.pop(symbol, None)
+
+    def clear(self):
+        self.beginResetModel()
+        self.symbols, self.row_idx_map, self.rows, self.checked = [], {}, {}, {}
+        self.endResetModel()
+        with self._lock:
+            self._pending, self._pending_since = {}, None
+
+    def update_row(self, symbol, ui_row: dict):
+        """立即更新一列 (成交回報等少量更新)。"""
+        row = self.row_idx_map.get(symbol)
+        if row is None:
+            return
+        self._apply(symbol, ui_row)
+        self.dataChanged.emit(self.index(row, self._first_col), self.index(row, self._last_col), [Qt.DisplayRole])
+
+    def _apply(self, symbol, ui_row: dict):
+        values = self.rows[symbol]
+        for key, column in TICK_COLUMNS.items():
+            if key in ui_row:
+                values[column] = ui_row[key]
+
+    # ---------- tick 更新 ----------
+    def offer(self, diff: dict):
+        """{symbol: ui_row}，可從任何執行緒呼叫；只記下最新值，等下一次 flush 才顯示。"""
+        with self._lock:
+            if self._pending_since is None:
+                self._pending_since = time.perf_counter()
+            self._pending.update(diff)
+            self.ticks += len(diff)
+
+    def flush(self):
+        """QTimer 呼叫 (GUI 執行緒)：套用累積的更新，發出一個涵蓋所有變動列的 dataChanged。"""
+        with self._lock:
+            if not self._pending:
+                return
+            pending, since = self._pending, self._pending_since
+            self._pending, self._pending_since = {}, None
+        changed = []
+        for symbol, ui_row in pending.items():
+            row = self.row_idx_map.get(symbol)
+            if row is not None:
+                self._apply(symbol, ui_row)
+                changed.append(row)
+        if changed:
+            self.dataChanged.emit(self.index(min(changed), self._first_col),
+                                  self.index(max(changed), self._last_col), [Qt.DisplayRole])
+        self.flushes += 1
+        self.last_lag = time.perf_counter() - since
+        self.max_lag = max(self.max_lag, self.last_lag)
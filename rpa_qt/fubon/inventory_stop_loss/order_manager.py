@@ -0,0 +1,239 @@
+"""
+停損停利單的防重複送單與追蹤 (OrderManager)
+
+舊版用 list (is_ordered) 記錄已送單的股票，`in` 線性搜尋，沒有逾時也沒有和成交回報對帳；
+TickEngine 改成 PositionState.ordered 旗標後仍有兩個問題：送單失敗只能等下一筆 tick 立刻重送 (沒有退避)，
+GUI 重開後旗標全部消失，還在路上的單會被再送一次。OrderManager：
+* 以 (symbol, reason) 為 key 記錄每張單 (OrderRecord)，狀態 pending (送單中) → acknowledged (已收到委託單號)
+  → filled (全部成交) / failed (重試用完或逾時)
+* in_flight(symbol)：每筆 tick 都會呼叫的快速判斷，只讀一個 dict，不拿鎖；真正要送單時再由 begin() 在鎖內確認並登記，
+  同一檔同時只會有一張停損或停利單
+* 送單失敗依 retry_delay() 退避 (base、2 倍、4 倍…，最多 max_delay 秒)，重試 max_attempts 次後標為 failed 並放行
+* on_fill() 依委託單號 (或 user_def) 累計成交股數，全部成交才結案；acknowledged 超過 ack_timeout 秒沒有成交、
+  或 pending 超過 ack_timeout 沒有結果 (例如重開前送出的單) 時由 expire() 標為 failed 並放行
+* 每次狀態改變都把還在進行中的單寫入 journal (JSON，先寫暫存檔再 os.replace)，重開時讀回，不會重送
+
+只用到標準函式庫。
+"""
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+PENDING = "pending"
+ACKNOWLEDGED = "acknowledged"
+FILLED = "filled"
+FAILED = "failed"
+ACTIVE_STATES = (PENDING, ACKNOWLEDGED)
+
+MAX_ATTEMPTS = 3
+RETRY_BASE = 0.5  # 秒，第一次重試前等待的時間
+RETRY_MAX_DELAY = 8.0
+ACK_TIMEOUT = 120.0  # 秒，送出後多久沒有成交 / 沒有結果就放行
+
+
+@dataclass
+class OrderRecord:
+    symbol: str
+    reason: str  # user_def：inv_SL / inv_TP
+    shares: int
+    state: str = PENDING
+    order_no: Optional[str] = None
+    attempts: int = 0
+    filled_qty: int = 0
+    error: str = ""
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return self.symbol, self.reason
+
+    @property
+    def active(self) -> bool:
+        return self.state in ACTIVE_STATES
+
+
+class OrderManager:
+    def __init__(self, journal_path: str = None, max_attempts: int = MAX_ATTEMPTS, retry_base: float = RETRY_BASE,
+                 max_delay: float = RETRY_MAX_DELAY, ack_timeout: float = ACK_TIMEOUT, logger=None):
+        """
+        :param journal_path: 進行中的單的紀錄檔，None 表示只存在記憶體
+        :param max_attempts: 每張單最多送幾次 (含第一次)
+        :param ack_timeout: acknowledged / pending 超過幾秒沒有成交就視為失敗並放行
+        """
+        self.journal_path = journal_path
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.max_delay = max_delay
+        self.ack_timeout = ack_timeout
+        self.logger = logger
+
+        self.orders: Dict[Tuple[str, str], OrderRecord] = {}  # 進行中的單
+        self._inflight = {}  # symbol -> reason，給 in_flight() 不拿鎖讀取
+        self._by_order_no = {}  # 委託單號 -> key
+        self._lock = threading.Lock()
+        self.history: List[OrderRecord] = []  # 已結案的單 (本次執行)
+
+        if journal_path:
+            self._load()
+
+    # ---------- 快速判斷 (worker 執行緒，每筆 tick) ----------
+    def in_flight(self, symbol: str) -> bool:
+        return symbol in self._inflight
+
+    # ---------- 狀態轉換 ----------
+    def begin(self, symbol: str, reason: str, shares: int) -> Optional[OrderRecord]:
+        """登記一張新單 (pending)；該檔已有進行中的單時回傳 None。"""
+        with self._lock:
+            if symbol in self._inflight:
+                return None
+            record = OrderRecord(symbol, reason, int(shares))
+            self.orders[record.key] = record
+            self._inflight[symbol] = reason
+            self._save()
+            return record
+
+    def acknowledge(self, symbol: str, reason: str, order_no: str = None) -> Optional[OrderRecord]:
+        with self._lock:
+            record = self.orders.get((symbol, reason))
+            if record is None:
+                return None
+            record.attempts += 1
+            record.state, record.order_no, record.error = ACKNOWLEDGED, order_no, ""
+            record.updated_at = time.time()
+            if order_no:
+                self._by_order_no[order_no] = record.key
+            self._save()
+            return record
+
+    def attempt_failed(self, symbol: str, reason: str, error: str) -> Optional[float]:
+        """
+        記錄一次送單失敗。
+        :return: 下次重試前要等的秒數；重試次數用完時標為 failed 並放行，回傳 None
+        """
+        with self._lock:
+            record = self.orders.get((symbol, reason))
+            if record is None:
+                return None
+            record.attempts += 1
+            record.error = error
+            record.updated_at = time.time()
+            if record.attempts >= self.max_attempts:
+                self._close(record, FAILED)
+                return None
+            self._save()
+            return self.retry_delay(record.attempts)
+
+    def retry_delay(self, attempts: int) -> float:
+        return min(self.retry_base * 2 ** (attempts - 1), self.max_delay)
+
+    def on_fill(self, symbol: str, qty: int, order_no: str = None, reason: str = None) -> Optional[OrderRecord]:
+        """
+        成交回報對帳：依委託單號找單，找不到時用 (symbol, user_def)。
+        :return: 對到的單 (全部成交時狀態為 filled)；不是本管理器送出的單回傳 None
+        """
+        with self._lock:
+            key = self._by_order_no.get(order_no) if order_no else None
+            if key is None and reason is not None:
+                key = (symbol, reason)
+            record = self.orders.get(key) if key is not None else None
+            if record is None:
+                return None
+            record.filled_qty += int(qty)
+            record.updated_at = time.time()
+            if record.state == PENDING:  # 成交回報比 place_order 的回應先到
+                record.state = ACKNOWLEDGED
+            if record.filled_qty >= record.shares:
+                self._close(record, FILLED)
+            else:
+                self._save()
+            return record
+
+    def release(self, symbol: str, error: str = "") -> Optional[OrderRecord]:
+        """部位已不存在 (例如手動賣光) 時，結束該檔進行中的單。"""
+        with self._lock:
+            reason = self._inflight.get(symbol)
+            record = self.orders.get((symbol, reason)) if reason is not None else None
+            if record is None:
+                return None
+            record.error = error
+            self._close(record, FAILED)
+            return record
+
+    def expire(self, now: float = None) -> List[OrderRecord]:
+        """把超過 ack_timeout 沒有成交 / 沒有結果的單標為 failed 並放行，回傳被放行的單。"""
+        now = time.time() if now is None else now
+        expired = []
+        with self._lock:
+            for record in list(self.orders.values()):
+                if now - record.updated_at >= self.ack_timeout:
+                    record.error = record.error or "timeout"
+                    self._close(record, FAILED)
+                    expired.append(record)
+        return expired
+
+    def _close(self, record: OrderRecord, state: str):
+        record.state = state
+        record.updated_at = time.time()
+        self.orders.pop(record.key, None)
+        if self._inflight.get(record.symbol) == record.reason:
+            del self._inflight[record.symbol]
+        if record.order_no:
+            self._by_order_no.pop(record.order_no, None)
+        self.history.append(record)
+        self._save()
+        if self.logger is not None:
+            self.logger.info(f"order closed: {asdict(record)}")
+
+    # ---------- journal ----------
+    def _save(self):
+        if not self.journal_path:
+            return
+        tmp = self.journal_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump([asdict(r) for r in self.orders.values()], f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.journal_path)
+
+    def _load(self):
+        if not os.path.exists(self.journal_path):
+            return
+        try:
+            with open(self.journal_path, encoding="utf-8") as f:
+                items = json.load(f)
+        except (OSError, ValueError) as e:
+            if self.logger is not None:
+                self.logger.error(f"order journal {self.journal_path} unreadable: {e}")
+            return
+        for item in items:
+            record = OrderRecord(**item)
+            if not record.active:
+                continue
+            self.orders[record.key] = record
+            self._inflight[record.symbol] = record.reason
+            if record.order_no:
+                self._by_order_no[record.order_no] = record.key
+
+
+if __name__ == '__main__':
+    import tempfile
+
+    path = os.path.join(tempfile.mkdtemp(), "order_journal.json")
+    manager = OrderManager(path, retry_base=0.01)
+    assert manager.begin("2330", "inv_SL", 2000) is not None
+    assert manager.begin("2330", "inv_TP", 2000) is None  # 同一檔只會有一張單
+    print("第一次失敗，等待", manager.attempt_failed("2330", "inv_SL", "timeout"), "秒後重試")
+    manager.acknowledge("2330", "inv_SL", "bA001")
+
+    # 模擬 GUI 重開：從 journal 讀回，仍視為進行中，不會重送
+    restarted = OrderManager(path)
+    assert restarted.in_flight("2330") and restarted.begin("2330", "inv_SL", 2000) is None
+    restarted.on_fill("2330", 1000, order_no="bA001")
+    assert restarted.in_flight("2330")  # 部分成交
+    print("成交後狀態:", restarted.on_fill("2330", 1000, order_no="bA001").state)
+    assert not restarted.in_flight("2330") and OrderManager(path).orders == {}
+
+    restarted.begin("2454", "inv_TP", 1000)
+    print("逾時放行:", [r.symbol for r in restarted.expire(time.time() + ACK_TIMEOUT)])
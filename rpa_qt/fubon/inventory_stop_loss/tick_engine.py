@@ -0,0 +1,366 @@
+"""
+庫存停損停利的 tick 處理引擎 (不在 GUI 執行緒上執行)
+
+原本 tp_sl_gui_v3.MainApp.handle_message 在 SDK 的 callback 執行緒上處理每一筆成交訊息：
+* 每筆都 emit item_update_signal，tick 一多就塞滿 Qt 的事件迴圈
+* 觸發停損 / 停利時從 QTableWidget 的儲存格讀回庫存股數 (在非 GUI 執行緒讀 GUI 元件)，並同步送出市價單，
+  place_order 等回應的期間後面的 tick 全部卡住
+
+TickEngine：
+* submit(message) 只把原始訊息放進佇列就返回，不阻塞 SDK 的執行緒
+* 自己的 worker 執行緒解析訊息，依記憶體中每檔的狀態 (PositionState：股數、均價、停損價、停利價) 判斷；
+  是否已下單 (委託狀態與防重複送單) 由 OrderManager 與它的 journal 管理
+* 觸發時先向 OrderManager (order_manager.py) 登記 (symbol, reason) 再交給下單執行緒送單，同一檔不會在送單期間
+  被重複觸發；送單失敗依退避時間重試，重試用完或逾時才放行；進行中的單寫入 journal，GUI 重開也不會重送
+* GUI 只收到節流、合併後的差異：每 ui_interval 秒最多呼叫一次 on_ui_update({symbol: {price, pnl, return_rate}})，
+  期間同一檔只保留最新的值
+
+只用到標準函式庫，沒有 Qt / SDK 也能單獨執行 (見 __main__ 的模擬)。
+"""
+import heapq
+import json
+import queue
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+from order_manager import OrderManager
+
+SL_REASON = "inv_SL"  # 停損單的 user_def
+TP_REASON = "inv_TP"  # 停利單的 user_def
+UI_INTERVAL = 0.2  # 秒，GUI 更新的最短間隔
+EXPIRE_INTERVAL = 1.0  # 秒，下單執行緒檢查逾時單的間隔
+
+
+@dataclass
+class PositionState:
+    symbol: str
+    shares: int
+    avg_price: float
+    stop_loss: Optional[float] = None
+    take_profit: Optional[float] = None
+    last_price: Optional[float] = None
+
+    @property
+    def pnl(self) -> float:
+        if self.last_price is None:
+            return 0.0
+        return (self.last_price - self.avg_price) * self.shares
+
+    @property
+    def return_rate(self) -> float:
+        cost = self.avg_price * self.shares
+        return self.pnl / cost * 100 if cost else 0.0
+
+    def ui_row(self) -> dict:
+        return {"price": self.last_price, "shares": self.shares, "avg_price": self.avg_price, "pnl": self.pnl,
+                "return_rate": self.return_rate}
+
+
+class TickEngine:
+    def __init__(self, order_fn: Callable, on_ui_update: Callable = None, on_log: Callable = None, logger=None,
+                 ui_interval: float = UI_INTERVAL, order_manager: OrderManager = None):
+        """
+        :param order_fn: order_fn(symbol, shares, reason) 送出市價賣單，回傳 SDK 的結果 (is_success / data.order_no / message)
+        :param order_manager: 防重複送單與重試 (預設為只存在記憶體的 OrderManager)
+        :param on_ui_update: on_ui_update({symbol: PositionState.ui_row()})，在 worker 執行緒呼叫 (GUI 端用 Signal 轉回主執行緒)
+        :param on_log: on_log(str) 顯示在 GUI 的 log 區
+        :param logger: logging.Logger
+        """
+        self.order_fn = order_fn
+        self.on_ui_update = on_ui_update
+        self.on_log = on_log
+        self.logger = logger
+        self.ui_interval = ui_interval
+        self.order_manager = order_manager if order_manager is not None else OrderManager(logger=logger)
+
+        self.positions: Dict[str, PositionState] = {}
+        self.subscribed_ids = {}  # symbol -> 訂閱 id
+        self._lock = threading.Lock()  # 保護 positions (worker / 下單 / GUI 三個執行緒都會讀寫)
+
+        self._cond = threading.Condition()
+        self._inbox = deque()
+        self._dirty = {}  # 尚未送到 GUI 的更新：symbol -> ui_row
+        self._next_flush = 0.0
+        self._orders = queue.Queue()  # (symbol, reason)
+        self._retries = []  # heap: (重試時間, symbol, reason)，只有下單執行緒會用到
+        self._running = False
+        self._threads = []
+
+        # 統計
+        self.ticks = 0
+        self.ui_flushes = 0
+        self.orders_sent = 0
+
+    # ---------- 生命週期 ----------
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._threads = [threading.Thread(target=self._run, name="TickEngine", daemon=True),
+                         threading.Thread(target=self._order_loop, name="TickEngineOrders", daemon=True)]
+        for t in self._threads:
+            t.start()
+
+    def stop(self, timeout: float = 5):
+        if not self._threads:
+            return
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._orders.put(None)
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    # ---------- 部位 (GUI 執行緒呼叫) ----------
+    def add_position(self, symbol: str, shares: int, avg_price: float, stop_loss: float = None,
+                     take_profit: float = None, last_price: float = None) -> PositionState:
+        with self._lock:
+            state = PositionState(symbol, int(shares), float(avg_price), stop_loss, take_profit,
+                                  last_price=last_price)
+            self.positions[symbol] = state
+            return state
+
+    def clear(self):
+        with self._lock:
+            self.positions.clear()
+            self._dirty.clear()
+
+    def get(self, symbol: str) -> Optional[PositionState]:
+        return self.positions.get(symbol)
+
+    def set_stop_loss(self, symbol: str, price: Optional[float]):
+        with self._lock:
+            if symbol in self.positions:
+                self.positions[symbol].stop_loss = price
+
+    def set_take_profit(self, symbol: str, price: Optional[float]):
+        with self._lock:
+            if symbol in self.positions:
+                self.positions[symbol].take_profit = price
+
+    def apply_fill(self, symbol: str, is_buy: bool, qty: int, price: float, order_no: str = None,
+                   reason: str = None) -> Optional[PositionState]:
+        """
+        成交回報更新股數與均價 (賣出不改變均價)；賣出時同時交給 OrderManager 對帳 (order_no / reason 為回報的
+        委託單號與 user_def)。
+        :return: 更新後的狀態；賣到 0 股時移除該檔並回傳最後的狀態 (shares=0)；不在 positions 中時回傳 None
+                 (新部位由 add_position 加入)
+        """
+        with self._lock:
+            state = self.positions.get(symbol)
+            if is_buy:
+                if state is None:
+                    return None
+                total = state.shares + qty
+                state.avg_price = (state.shares * state.avg_price + qty * price) / total
+                state.shares = total
+            else:
+                # 部位不在 positions (未追蹤或已歸零) 時也要對帳，否則這張單會一直留在 journal 直到逾時
+                self.order_manager.on_fill(symbol, qty, order_no=order_no, reason=reason)
+                if state is None:
+                    return None
+                state.shares = max(state.shares - qty, 0)
+                if state.shares == 0:
+                    del self.positions[symbol]
+                    # 例如手動賣光：還在進行中的停損停利單已無意義
+                    if self.order_manager.release(symbol, "position closed") is not None:
+                        self._log(f"{symbol} 庫存已歸零，停止追蹤進行中的停損停利單")
+            state.last_price = price
+            return state
+
+    # ---------- 行情 (SDK callback 執行緒呼叫) ----------
+    def submit(self, message: str):
+        with self._cond:
+            self._inbox.append(message)
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and not self._inbox:
+                    if self._dirty:
+                        wait = self._next_flush - time.perf_counter()
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+                if not self._running:
+                    return
+                batch, self._inbox = self._inbox, deque()
+            for message in batch:
+                try:
+                    self._handle(message)
+                except Exception as e:
+                    self._log(f"tick 處理錯誤: {e}", error=True)
+            self._flush_ui()
+
+    def _handle(self, message: str):
+        msg = json.loads(message)
+        event = msg.get("event")
+        data = msg.get("data", {})
+        if event == "subscribed":
+            self.subscribed_ids[data["symbol"]] = data["id"]
+            self._log("訂閱成功..." + data["symbol"], to_file=False)
+        elif event == "unsubscribed":
+            for symbol, sub_id in list(self.subscribed_ids.items()):
+                if sub_id == data["id"]:
+                    self.subscribed_ids.pop(symbol)
+                    self._log(symbol + "...成功移除訂閱", to_file=False)
+        elif event in ("data", "snapshot"):
+            if data.get("isTrial") or "price" not in data:
+                return
+            self.on_tick(data["symbol"], float(data["price"]), check=event == "data")
+
+    def on_tick(self, symbol: str, price: float, check: bool = True):
+        """更新現價並判斷停損 / 停利 (worker 執行緒)。"""
+        self.ticks += 1
+        reason = None
+        with self._lock:
+            state = self.positions.get(symbol)
+            if state is None:
+                return
+            state.last_price = price
+            self._dirty[symbol] = state.ui_row()
+            if check and not self.order_manager.in_flight(symbol):
+                if state.stop_loss is not None and price <= state.stop_loss:
+                    reason = SL_REASON
+                elif state.take_profit is not None and price >= state.take_profit:
+                    reason = TP_REASON
+                # 先登記，送單期間後續的 tick 不會再觸發
+                if reason is not None and self.order_manager.begin(symbol, reason, state.shares) is None:
+                    reason = None
+        if reason is not None:
+            self._orders.put((symbol, reason))
+
+    def _flush_ui(self):
+        now = time.perf_counter()
+        if not self._dirty or now < self._next_flush:
+            return
+        with self._lock:
+            diff, self._dirty = self._dirty, {}
+        self._next_flush = now + self.ui_interval
+        self.ui_flushes += 1
+        if self.on_ui_update is not None:
+            self.on_ui_update(diff)
+
+    # ---------- 下單 (下單執行緒) ----------
+    def _order_loop(self):
+        next_expire = time.monotonic() + EXPIRE_INTERVAL
+        while True:
+            due = min(next_expire, self._retries[0][0]) if self._retries else next_expire
+            try:
+                item = self._orders.get(timeout=max(due - time.monotonic(), 0))
+            except queue.Empty:
+                item = ()
+            if item is None:
+                return
+            now = time.monotonic()
+            if item:
+                self._place(*item)
+            while self._retries and self._retries[0][0] <= now:
+                _, symbol, reason = heapq.heappop(self._retries)
+                self._place(symbol, reason)
+            if now >= next_expire:
+                next_expire = now + EXPIRE_INTERVAL
+                for record in self.order_manager.expire():
+                    self._log(f"{record.symbol} {record.reason} 委託逾時未成交 ({record.error})，恢復停損停利監控",
+                              error=True)
+
+    def _place(self, symbol: str, reason: str):
+        record = self.order_manager.orders.get((symbol, reason))
+        if record is None:  # 已成交、已逾時或部位已不存在
+            return
+        with self._lock:
+            state = self.positions.get(symbol)
+            shares = state.shares if state is not None else 0
+        if shares <= 0:
+            self.order_manager.release(symbol, "position closed")
+            return
+        name = "停損" if reason == SL_REASON else "停利"
+        self._log(f"{symbol}...{name}市價單發送...", to_file=False)
+        try:
+            res = self.order_fn(symbol, shares, reason)
+            ok, error = res.is_success, getattr(res, "message", "")
+        except Exception as e:
+            res, ok, error = None, False, str(e)
+        self.orders_sent += 1
+        if ok:
+            self.order_manager.acknowledge(symbol, reason, res.data.order_no)
+            self._log(f"{symbol} {shares}股, {name}市價單發送成功, 單號: {res.data.order_no}")
+            return
+        delay = self.order_manager.attempt_failed(symbol, reason, str(error))
+        if delay is None:
+            self._log(f"{symbol} {name}市價單發送失敗, fail message: {error}，重試次數已用完，下一筆觸價的 tick 再送",
+                      error=True)
+        else:
+            self._log(f"{symbol} {name}市價單發送失敗, fail message: {error}，{delay:g} 秒後重試", error=True)
+            heapq.heappush(self._retries, (time.monotonic() + delay, symbol, reason))
+
+    def _log(self, text: str, error: bool = False, to_file: bool = True):
+        if self.on_log is not None:
+            self.on_log(text)
+        if to_file and self.logger is not None:
+            (self.logger.error if error else self.logger.info)(text)
+
+
+if __name__ == '__main__':
+    # 模擬：30 檔、每檔 2000 筆 tick 一次湧入，下單需要 0.2 秒，第一檔的第一次送單失敗
+    import os
+    import tempfile
+    from types import SimpleNamespace
+
+    sent = []
+    failed_once = set()
+
+    def fake_order(symbol, shares, reason):
+        time.sleep(0.2)
+        if symbol == "2300" and symbol not in failed_once:
+            failed_once.add(symbol)
+            raise ConnectionError("place_order timeout")
+        sent.append((symbol, shares, reason))
+        return SimpleNamespace(is_success=True, data=SimpleNamespace(order_no=f"A{len(sent):04d}"), message="")
+
+    journal = os.path.join(tempfile.mkdtemp(), "order_journal.json")
+    symbols = [str(2300 + i) for i in range(30)]
+    template = '{{"event":"data","data":{{"symbol":"{symbol}","price":{price}}},"channel":"trades"}}'
+    messages = [template.format(symbol=s, price=100 - i * 0.01) for i in range(2000) for s in symbols]
+
+    def run_engine():
+        updates = []
+        engine = TickEngine(fake_order, on_ui_update=updates.append, on_log=lambda s: None,
+                            order_manager=OrderManager(journal, retry_base=0.1))
+        for s in symbols:
+            engine.add_position(s, 2000, 100.0, stop_loss=95.0, take_profit=110.0)
+        engine.start()
+        started = time.perf_counter()
+        for m in messages:
+            engine.submit(m)
+        t_submit = time.perf_counter() - started
+        while engine.ticks < len(messages):
+            time.sleep(0.01)
+        return engine, updates, t_submit, time.perf_counter() - started
+
+    engine, updates, t_submit, t_ticks = run_engine()
+    deadline = time.perf_counter() + 30
+    while len(sent) < len(symbols) and time.perf_counter() < deadline:
+        time.sleep(0.05)
+    time.sleep(0.3)  # 確認沒有多送的單
+    engine.stop()
+    print(f"{len(messages)} 筆 tick：submit 共 {t_submit * 1e3:.0f}ms，worker 處理完 {t_ticks * 1e3:.0f}ms")
+    print(f"GUI 更新 {engine.ui_flushes} 次 (每次最多 {max(len(u) for u in updates)} 檔)，"
+          f"停損單 {len(sent)} 筆 (每檔一筆: {len({s for s, _, _ in sent}) == len(sent) == len(symbols)})，"
+          f"送單 {engine.orders_sent} 次 (含 1 次失敗重試)")
+
+    # 模擬 GUI 重開：單已送出但還沒收到成交回報，同樣的 tick 再來一次也不會重送
+    engine, _, _, _ = run_engine()
+    time.sleep(0.5)
+    engine.stop()
+    print(f"重開後進行中的單 {len(engine.order_manager.orders)} 筆，新送單 {engine.orders_sent} 筆")
+    for i, (s, shares, reason) in enumerate(sent):
+        engine.apply_fill(s, False, shares, 95.0, order_no=f"A{i + 1:04d}", reason=reason)
+    print(f"成交回報對帳後進行中的單 {len(engine.order_manager.orders)} 筆")
@@ -4,21 +4,31 @@
 
 # 改版紀錄
 * 將資料結構改為以StockRecords，依停損停利原則監控現價，並決定是否下單停損或停利。
+* 行情訊息改由 TickEngine (tick_engine.py) 在自己的執行緒處理：每檔的股數、均價、停損、停利都存在記憶體，
+  不再從表格儲存格讀回；停損停利單由引擎的下單執行緒送出。
+* 表格改為 QTableView + InventoryTableModel (inventory_model.py)：tick 只寫進 model 的 dict，每秒最多 N 次
+  以一個 dataChanged 範圍重繪；狀態列顯示每秒 tick 數、表格更新次數與 UI 延遲。
+* 委託狀態 (是否已下單) 與防重複送單改由 OrderManager (order_manager.py) 及其 journal 管理：送單失敗退避重試、成交回報依委託單號對帳、
+  逾時放行；進行中的單記在 order_journal.json，重開程式不會重送。
 """
 from login_gui_v1 import LoginForm
 from sdk_logger import fubon_neo_logger
+from tick_engine import TickEngine
+from order_manager import OrderManager
+from inventory_model import InventoryTableModel
 
 import sys
 import pickle
 import json
+import time
 from pathlib import Path
 
 from fubon_neo.sdk import FubonSDK, Mode, Order
 from fubon_neo.constant import TimeInForce, OrderType, PriceType, MarketType, BSAction
 
-from PySide6.QtWidgets import QApplication, QWidget, QPushButton, QLabel, QLineEdit, QGridLayout, QVBoxLayout, QHeaderView, QMessageBox, QTableWidget, QTableWidgetItem, QPlainTextEdit, QFileDialog, QSizePolicy
+from PySide6.QtWidgets import QApplication, QWidget, QPushButton, QLabel, QLineEdit, QGridLayout, QVBoxLayout, QHeaderView, QMessageBox, QTableView, QPlainTextEdit, QFileDialog, QSizePolicy, QStatusBar
 from PySide6.QtGui import QTextCursor, QIcon, QColor
-from PySide6.QtCore import Qt, Signal, QObject, QMutex
+from PySide6.QtCore import Qt, Signal, QObject, QMutex, QTimer
 
 from threading import Timer
 
@@ -47,7 +57,6 @@ class RepeatTimer(Timer):
 class Communicate(QObject):
     # 定義一個帶參數的信號
     print_log_signal = Signal(str)
-    item_update_signal = Signal(dict)
     filled_data_signal = Signal(dict)
 
 class MainApp(QWidget):
@@ -85,8 +94,12 @@ class MainApp(QWidget):
         # 庫存表表頭
         self.table_header = ['股票名稱', '股票代號', '類別', '庫存股數', '庫存均價', '現價', '停損', '停利', '損益試算', '獲利率%']
         
-        self.tablewidget = QTableWidget(0, len(self.table_header))
-        self.tablewidget.setHorizontalHeaderLabels([f'{item}' for item in self.table_header])
+        # 表格資料放在 model，tick 更新由 model 合併後每秒最多 ui_max_fps 次重繪
+        self.ui_max_fps = 5
+        self.table_model = InventoryTableModel(self.table_header, max_fps=self.ui_max_fps)
+        self.table_model.check_handler = self.on_check_changed
+        self.tableview = QTableView()
+        self.tableview.setModel(self.table_model)
         
         # 整個設定區layout
         layout_condition = QGridLayout()
@@ -141,10 +154,15 @@ class MainApp(QWidget):
         self.log_text = QPlainTextEdit()
         self.log_text.setReadOnly(True)
 
-        layout.addWidget(self.tablewidget, stretch=8)
+        # 狀態列：每秒 tick 數、表格更新次數、UI 延遲
+        self.status_bar = QStatusBar()
+        self.status_bar.setSizeGripEnabled(False)
+
+        layout.addWidget(self.tableview, stretch=8)
         layout.addLayout(layout_condition, stretch=1)
         # layout.addLayout(layout_sim, stretch=1)
         layout.addWidget(self.log_text, stretch=3)
+        layout.addWidget(self.status_bar)
         self.setLayout(layout)
 
         self.print_log("login success, 現在使用帳號: {}".format(self.active_account.account))
@@ -160,7 +178,6 @@ class MainApp(QWidget):
         # slot function connect
         self.button_start.clicked.connect(self.on_button_start_clicked)
         self.button_stop.clicked.connect(self.on_button_stop_clicked)
-        self.tablewidget.itemClicked[QTableWidgetItem].connect(self.onItemClicked)
         self.button_fake_websocket.clicked.connect(self.fake_ws_data)
         self.button_fake_buy_filled.clicked.connect(self.fake_buy_filled)
         self.button_fake_sell_filled.clicked.connect(self.fake_sell_filled)
@@ -168,107 +185,72 @@ class MainApp(QWidget):
         # communicator init and slot function connect
         self.communicator = Communicate()
         self.communicator.print_log_signal.connect(self.print_log)
-        self.communicator.item_update_signal.connect(self.item_update)
         self.communicator.filled_data_signal.connect(self.handle_filled_data)
+
+        # 行情處理、停損停利判斷與下單都在 TickEngine 的執行緒上；每處理完一批 tick 就把最新值交給 model，
+        # 由 model 的 QTimer 在 GUI 執行緒節流重繪 (ui_interval=0，不在引擎端重複節流)
+        self.order_manager = OrderManager(journal_path='order_journal.json', logger=self.sl_tp_logger)
+        self.engine = TickEngine(order_fn=self.sell_market_order,
+                                 on_ui_update=self.table_model.offer,
+                                 on_log=self.communicator.print_log_signal.emit,
+                                 logger=self.sl_tp_logger,
+                                 ui_interval=0,
+                                 order_manager=self.order_manager)
+        for record in self.order_manager.orders.values():
+            self.print_log(f"{record.symbol} 有上次執行尚未成交的{'停損' if record.reason == 'inv_SL' else '停利'}單"
+                           f" (單號: {record.order_no})，等待成交回報，不會重送")
+
+        self.status_counters = (time.perf_counter(), 0, 0)  # (時間, engine.ticks, model.flushes)
+        self.status_timer = QTimer(self)
+        self.status_timer.timeout.connect(self.update_status_bar)
+        self.status_timer.start(1000)
         
         # 初始化庫存表資訊
         self.inventories = {}
         self.unrealized_pnl = {}
-        self.row_idx_map = {} # symbol: row_data
-        self.col_idx_map = dict(zip(self.table_header, range(len(self.table_header))))
+        self.col_idx_map = self.table_model.col_idx_map
         self.epsilon = 0.0000001
 
         self.tickers_name = {}
         self.tickers_name_init()
         self.sl_tp_logger.info("snapshoting tickers name finish")
-        self.subscribed_ids = {}
-        self.is_ordered = []
-        
-        self.stop_loss_dict = {}
-        self.take_profit_dict = {}
+        self.subscribed_ids = self.engine.subscribed_ids
 
         # 模擬用變數
         self.fake_price_cnt = 0
         self.fake_buy_clicked = 0
     
     # 當有庫存歸零時刪除該列的slot function
-    def del_table_row(self, row_idx):
-        symbol = self.tablewidget.item(row_idx, self.col_idx_map['股票代號']).text
+    def del_table_row(self, symbol):
         self.sl_tp_logger.info(f"Deleting {symbol} from table...")
-        self.tablewidget.removeRow(row_idx)
-        
-        for key, value in self.row_idx_map.items():
-            if value > row_idx:
-                self.row_idx_map[key] = value-1
-            elif value == row_idx:
-                pop_idx = key
-        pop_item = self.row_idx_map.pop(pop_idx)
-        self.sl_tp_logger.info(f"Pop {pop_item} from inventory...done")
+        self.table_model.remove_row(symbol)
+        self.sl_tp_logger.info(f"Pop {symbol} from inventory...done")
 
     # 當有成交有不在現有庫存的現股股票時新增至現有表格最下方
     def add_new_inv(self, symbol, qty, price):
-        row = self.tablewidget.rowCount()
-        self.tablewidget.insertRow(row)
-        
-        for j in range(len(self.table_header)):
-            if self.table_header[j] == '股票名稱':
-                item = QTableWidgetItem(self.tickers_name[symbol])
-                self.tablewidget.setItem(row, j, item)
-            elif self.table_header[j] == '股票代號':
-                item = QTableWidgetItem(symbol)
-                self.tablewidget.setItem(row, j, item)
-            elif self.table_header[j] == '類別':
-                item = QTableWidgetItem("Stock")
-                self.tablewidget.setItem(row, j, item)
-            elif self.table_header[j] == '庫存股數':
-                item = QTableWidgetItem(str(qty))
-                self.tablewidget.setItem(row, j, item)
-            elif self.table_header[j] == '庫存均價':
-                item = QTableWidgetItem(str(round(price+self.epsilon, 2)))
-                self.tablewidget.setItem(row, j, item)
-            elif self.table_header[j] == '現價':
-                item = QTableWidgetItem(str(round(price+self.epsilon, 2)))
-                self.tablewidget.setItem(row, j, item)
-            elif self.table_header[j] == '停損':
-                item = QTableWidgetItem()
-                item.setFlags(Qt.ItemIsSelectable & ~Qt.ItemIsEditable | Qt.ItemIsEnabled | Qt.ItemIsUserCheckable)
-                if self.default_sl_percent < 0:
-                    item.setCheckState(Qt.Checked)
-                    new_sl_price = round(price*(1+self.default_sl_percent)+self.epsilon, 2)
-                    item.setText(str(new_sl_price))
-                    self.stop_loss_dict[symbol] = new_sl_price
-                    self.tablewidget.setItem(row, j, item)
-                    self.sl_tp_logger.info(f'{symbol} add sl {self.default_sl_percent*100}%, new_sl_price: {new_sl_price}')
-                else:
-                    item.setCheckState(Qt.Unchecked)
-                    self.tablewidget.setItem(row, j, item)
-                    self.sl_tp_logger.info(f'{symbol} no default sl set')
-                
-            elif self.table_header[j] == '停利':
-                item = QTableWidgetItem()
-                item.setFlags(Qt.ItemIsSelectable & ~Qt.ItemIsEditable | Qt.ItemIsEnabled|Qt.ItemIsUserCheckable)
-                if self.default_tp_percent > 0:
-                    item.setCheckState(Qt.Checked)
-                    new_tp_price = round(price*(1+self.default_tp_percent)+self.epsilon, 2)
-                    item.setText(str(new_tp_price))
-                    self.take_profit_dict[symbol] = new_tp_price
-                    self.tablewidget.setItem(row, j, item)
-                    self.sl_tp_logger.info(f'{symbol} add tp {self.default_tp_percent*100}%, new_tp_price: {new_tp_price}')
-                else:
-                    item.setCheckState(Qt.Unchecked)
-                    self.tablewidget.setItem(row, j, item)
-                    self.sl_tp_logger.info(f'{symbol} no default tp set')
-                    
-            elif self.table_header[j] == '損益試算':
-                cur_upnl = 0
-                item = QTableWidgetItem(str(cur_upnl))
-                self.tablewidget.setItem(row, j, item)
-            elif self.table_header[j] == '獲利率%':
-                return_rate = 0
-                item = QTableWidgetItem(str(round(return_rate+self.epsilon, 2))+'%')
-                self.tablewidget.setItem(row, j, item)
-
-        self.row_idx_map[symbol] = row
+        new_sl_price = new_tp_price = None
+        if self.default_sl_percent < 0:
+            new_sl_price = round(price*(1+self.default_sl_percent)+self.epsilon, 2)
+            self.sl_tp_logger.info(f'{symbol} add sl {self.default_sl_percent*100}%, new_sl_price: {new_sl_price}')
+        else:
+            self.sl_tp_logger.info(f'{symbol} no default sl set')
+        if self.default_tp_percent > 0:
+            new_tp_price = round(price*(1+self.default_tp_percent)+self.epsilon, 2)
+            self.sl_tp_logger.info(f'{symbol} add tp {self.default_tp_percent*100}%, new_tp_price: {new_tp_price}')
+        else:
+            self.sl_tp_logger.info(f'{symbol} no default tp set')
+
+        self.table_model.add_row(symbol, {
+            '股票名稱': self.tickers_name[symbol],
+            '股票代號': symbol,
+            '類別': "Stock",
+            '庫存股數': qty,
+            '庫存均價': price,
+            '現價': round(price+self.epsilon, 2),
+            '損益試算': 0,
+            '獲利率%': 0,
+        }, stop_loss=new_sl_price, take_profit=new_tp_price)
+        self.engine.add_position(symbol, qty, price, stop_loss=new_sl_price, take_profit=new_tp_price, last_price=price)
         self.sl_tp_logger.info(f'{symbol} inv adding done. Subscribing...')
 
         self.wsstock.subscribe({
@@ -279,7 +261,7 @@ class MainApp(QWidget):
     # 測試用假裝有賣出成交的按鈕slot function
     def fake_sell_filled(self):
         new_fake_sell = fake_filled_data()
-        stock_no = list(self.row_idx_map.keys())[0]
+        stock_no = self.table_model.symbols[0]
         new_fake_sell.stock_no = stock_no
         new_fake_sell.buy_sell = BSAction.Sell
         new_fake_sell.filled_qty = 1000
@@ -319,6 +301,7 @@ class MainApp(QWidget):
         filled_dict['order_type'] = content.order_type
         filled_dict['filled_time'] = content.filled_time
         filled_dict['user_def'] = content.user_def
+        filled_dict['order_no'] = content.order_no
         return filled_dict
 
     # 主動回報做基本判斷後轉資料給mainthread
@@ -330,81 +313,60 @@ class MainApp(QWidget):
                 cur_filled_data = self.filled_data_to_dict(content)
                 self.communicator.filled_data_signal.emit(cur_filled_data)
     
-    # 主動回報接回mainthread判斷，接入成交回報後判斷 row_idx_map 要如何更新，sl 及 tp 監控列表及庫存列表是否需pop，訂閱是否加退訂
+    # 主動回報接回mainthread判斷，接入成交回報後判斷表格要如何更新，停損停利監控 (TickEngine) 及庫存列表是否需pop，訂閱是否加退訂
     def handle_filled_data(self, filled_data):
         symbol = filled_data['symbol']
         filled_qty = filled_data['filled_qty']
         filled_price = filled_data['filled_price']
+        inv_key = (symbol, str(filled_data['order_type']))
 
         if filled_data['buy_sell'] == BSAction.Buy:
             self.sl_tp_logger.info(f"recevied Buy filled data: {symbol}")
-            if (symbol, str(filled_data['order_type'])) in self.inventories:
-                
-                inv_qty_item = self.tablewidget.item(self.row_idx_map[symbol], self.col_idx_map['庫存股數'])
-                inv_qty = int(inv_qty_item.text())
-                new_inv_qty = inv_qty + filled_qty
-                self.sl_tp_logger.info(f"{symbol} already in inventories, original inv_qty:{inv_qty}, new_inv_qty:{new_inv_qty}")
-
-                avg_item = self.tablewidget.item(self.row_idx_map[symbol], self.col_idx_map['庫存均價'])
-                avg_price = float(avg_item.text())
-
-                new_avg_price = ((inv_qty*avg_price) + (filled_qty*filled_price))/new_inv_qty
-                new_pnl = (filled_price-new_avg_price)*new_inv_qty
-                new_cost = new_avg_price*new_inv_qty
-                new_rate_return = new_pnl/new_cost*100
-
-                # update row
-                self.tablewidget.item(self.row_idx_map[symbol], self.col_idx_map['庫存股數']).setText(str(new_inv_qty))
-                self.tablewidget.item(self.row_idx_map[symbol], self.col_idx_map['庫存均價']).setText(str(round(new_avg_price+self.epsilon, 2)))
-                self.tablewidget.item(self.row_idx_map[symbol], self.col_idx_map['現價']).setText(str(round(filled_price+self.epsilon, 2)))
-                self.tablewidget.item(self.row_idx_map[symbol], self.col_idx_map['損益試算']).setText(str(round(new_pnl+self.epsilon, 2)))
-                self.tablewidget.item(self.row_idx_map[symbol], self.col_idx_map['獲利率%']).setText(str(round(new_rate_return+self.epsilon, 2))+"%")
-                self.sl_tp_logger.info(f"{symbol} inv: {new_inv_qty}, buy hoding inv update finish")
+            if inv_key in self.inventories:
+                # 股數與均價由 TickEngine 的狀態計算，不再從表格儲存格讀回
+                state = self.engine.apply_fill(symbol, True, filled_qty, filled_price)
+                if state is None:
+                    return
+                self.sl_tp_logger.info(f"{symbol} already in inventories, new_inv_qty:{state.shares}")
+                self.table_model.update_row(symbol, state.ui_row())
+                self.sl_tp_logger.info(f"{symbol} inv: {state.shares}, buy hoding inv update finish")
 
             else:
                 self.sl_tp_logger.info(f"{symbol} brand new, adding inv...")
                 self.add_new_inv(symbol, filled_qty, filled_price)
-                self.inventories[(symbol, str(filled_data['order_type']))] = filled_data
+                self.inventories[inv_key] = filled_data
                 self.sl_tp_logger.info(f"{symbol} inv: {filled_qty}, buy new inv update finish")
                 
         elif filled_data['buy_sell'] == BSAction.Sell:
             self.sl_tp_logger.info(f"recevied Sell filled data: {symbol}")
-            if (symbol, str(filled_data['order_type'])) in self.inventories:
-                inv_qty_item = self.tablewidget.item(self.row_idx_map[symbol], self.col_idx_map['庫存股數'])
-                inv_qty = int(inv_qty_item.text())
-                remain_qty = inv_qty-filled_qty
+            if inv_key in self.inventories:
+                # 賣出成交同時交給 OrderManager 對帳 (委託單號 / user_def)
+                state = self.engine.apply_fill(symbol, False, filled_qty, filled_price,
+                                               order_no=filled_data['order_no'], reason=filled_data['user_def'])
+                if state is None:
+                    # 引擎沒有這檔 (未追蹤或已歸零) 但表格與 inventories 還有：視為已出清，一併移除
+                    self.print_log(f"{symbol} 成交回報與停損停利監控的庫存不一致，移除該檔")
+                    self.sl_tp_logger.warning(f"{symbol} sell filled but not tracked by TickEngine, removing from table and inventories")
+                    remain_qty = 0
+                else:
+                    remain_qty = state.shares
 
-                self.sl_tp_logger.info(f"{symbol} sell is in inventories, cur_inv: {inv_qty}, remain_qty: {remain_qty}")
+                self.sl_tp_logger.info(f"{symbol} sell is in inventories, remain_qty: {remain_qty}")
                 if remain_qty > 0:
-                    remain_qty_str = str(int(round(remain_qty, 0)))
+                    remain_qty_str = str(remain_qty)
                     if filled_data['user_def'] == "inv_SL":
                         self.print_log("停損出場 "+symbol+": "+str(filled_qty)+"股, 成交價:"+str(filled_price)+", 剩餘: "+remain_qty_str+"股")
                         self.sl_tp_logger.info(f"停損出場 {symbol}: {filled_qty} 股, 成交價: {filled_price}, 剩餘: {remain_qty_str} 股")
                     elif filled_data['user_def'] == "inv_TP":
                         self.print_log("停利出場 "+symbol+": "+str(filled_qty)+"股, 成交價:"+str(filled_price)+", 剩餘: "+remain_qty_str+"股")
                         self.sl_tp_logger.info(f"停利出場 {symbol}: {filled_qty} 股, 成交價: {filled_price}, 剩餘: {remain_qty_str} 股")
-                
-                    self.tablewidget.item(inv_qty_item.row(), self.col_idx_map['庫存股數']).setText(remain_qty_str)
-                    avg_price_item = self.tablewidget.item(self.row_idx_map[symbol], self.col_idx_map['庫存均價'])
-                    avg_price = float(avg_price_item.text())
-                    new_pnl = (filled_price-avg_price)*remain_qty
-                    new_cost = avg_price*remain_qty
-                    new_rate_return = new_pnl/new_cost*100
-
-                    # update row
-                    self.tablewidget.item(self.row_idx_map[symbol], self.col_idx_map['庫存股數']).setText(str(remain_qty))
-                    self.tablewidget.item(self.row_idx_map[symbol], self.col_idx_map['現價']).setText(str(round(filled_price+self.epsilon, 2)))
-                    self.tablewidget.item(self.row_idx_map[symbol], self.col_idx_map['損益試算']).setText(str(round(new_pnl+self.epsilon, 2)))
-                    self.tablewidget.item(self.row_idx_map[symbol], self.col_idx_map['獲利率%']).setText(str(round(new_rate_return+self.epsilon, 2))+"%")
-
-                elif remain_qty == 0:
-                    # del table row and unsubscribe
-                    self.del_table_row(self.row_idx_map[symbol])
-
-                    if symbol in self.stop_loss_dict:
-                        self.stop_loss_dict.pop(symbol)
-                    if symbol in self.take_profit_dict:
-                        self.take_profit_dict.pop(symbol)
+
+                    self.table_model.update_row(symbol, state.ui_row())
+
+                else:
+                    # del table row and unsubscribe (TickEngine 已移除該檔的停損停利與下單狀態)
+                    self.del_table_row(symbol)
+
                     if symbol in self.subscribed_ids:
                         self.wsstock.unsubscribe({
                             'id':self.subscribed_ids[symbol]
@@ -420,19 +382,7 @@ class MainApp(QWidget):
                         self.print_log("手動出場 "+symbol+": "+str(filled_qty)+"股, 成交價:"+str(filled_price))
                         self.sl_tp_logger.info(f"手動出場 {symbol}: {filled_qty} 股, 成交價: {filled_price}")
 
-                    print("deleting...")
-                    while symbol in self.row_idx_map:
-                        print("deleting...", symbol)
-                        pass
-                    print("deleting done")
-            
-                    self.inventories.pop(symbol, str(filled_data['order_type']))
-                
-                    try:
-                        self.is_ordered.remove(symbol)
-                        self.sl_tp_logger.info(f"Removed {symbol} from is_ordered map")
-                    except ValueError as v_err:
-                        self.sl_tp_logger.error(f"{symbol} not in is_ordered, error {v_err}")
+                    self.inventories.pop(inv_key, None)
 
     # 測試用假裝有websocket data的按鈕slot function
     def fake_ws_data(self):
@@ -453,102 +403,55 @@ class MainApp(QWidget):
         json_str = json_template.format(symbol=stock_list[self.price_interval % len(stock_list)], price=str(json_price))
         self.handle_message(json_str)
 
-    # 更新表格內某一格值的slot function
-    def item_update(self, tick_data):
-        symbol = tick_data['symbol']
-        if symbol not in self.row_idx_map:
-            return
-        
-        row = self.row_idx_map[symbol]
-        cur_price = tick_data['price']
-        
-        avg_price_item = self.tablewidget.item(row, self.col_idx_map['庫存均價'])
-        avg_price = avg_price_item.text()
-    
-        share_item = self.tablewidget.item(row, self.col_idx_map['庫存股數'])
-        share = share_item.text()
-    
-        cur_pnl = (cur_price-float(avg_price))*float(share)
-        return_rate = cur_pnl/(float(avg_price)*float(share))*100
-        
-        self.tablewidget.item(row, self.col_idx_map['現價']).setText(str(cur_price))
-        self.tablewidget.item(row, self.col_idx_map['損益試算']).setText(str(int(round(cur_pnl, 0))))
-        self.tablewidget.item(row, self.col_idx_map['獲利率%']).setText(str(round(return_rate+self.epsilon, 2))+'%')
-
+    # 停損 / 停利欄勾選狀態改變時由 model 呼叫，回傳 False 表示不接受 (維持原本的勾選狀態)
+    def on_check_changed(self, symbol, column, checked, item_str):
+        state = self.engine.get(symbol)
+        if state is None:
+            return False
+        rule = "停損價格必須小於現價並大於0" if column == '停損' else "停利價格必須大於現價"
+        set_price = self.engine.set_stop_loss if column == '停損' else self.engine.set_take_profit
 
-    def onItemClicked(self, item):
-        if item.checkState() == Qt.Checked:
-            if item.column() == self.col_idx_map['停損']:
-                symbol = self.tablewidget.item(item.row(), self.col_idx_map['股票代號']).text()
-                item_str = item.text()
-                if symbol in self.stop_loss_dict:
-                    return
-                
-                try:
-                    item_price = float(item_str)
-                except Exception as e:
-                    self.print_log(str(e))
-                    self.print_log("請輸入正確價格，停損價格必須小於現價並大於0")
-                    item.setCheckState(Qt.Unchecked)
-                    self.sl_tp_logger.error(f"{symbol} stop loss update fail, user input {item_str} is not digit")
-                    return
-                
-                cur_price = self.tablewidget.item(item.row(), self.col_idx_map['現價']).text()
-                cur_price = float(cur_price)
-                if cur_price <= item_price or 0 >= item_price:
-                    self.print_log("請輸入正確價格，停損價格必須小於現價並大於0")
-                    self.sl_tp_logger.error(f"{symbol} stop loss update fail, user input {item_price} is less than 0 or greater than cur_price")
-                    item.setCheckState(Qt.Unchecked)
-                else:
-                    self.stop_loss_dict[symbol] = item_price
-                    item.setFlags(item.flags() & ~Qt.ItemIsEditable)
-                    self.print_log(symbol+"...停損設定成功: "+item_str)
-                    self.sl_tp_logger.info(f"{symbol} stop loss manul modify successfully: {self.stop_loss_dict}")
+        if not checked:
+            set_price(symbol, None)
+            self.print_log(symbol+"...移除"+column+"，請重新設置")
+            self.sl_tp_logger.info(f"{symbol} {column} cancelled")
+            return True
 
-            elif item.column() == self.col_idx_map['停利']:
-                symbol = self.tablewidget.item(item.row(), self.col_idx_map['股票代號']).text()
-                item_str = item.text()
-
-                if symbol in self.take_profit_dict:
-                    return
-
-                try:
-                    item_price = float(item_str)
-                except Exception as e:
-                    self.print_log(str(e))
-                    self.print_log("請輸入正確價格，停利價格必須大於現價")
-                    item.setCheckState(Qt.Unchecked)
-                    self.sl_tp_logger.error(f"{symbol} take profit update fail, user input {item_str} is not digit")
-                    return
-                
-                cur_price = self.tablewidget.item(item.row(), self.col_idx_map['現價']).text()
-                cur_price = float(cur_price)
-                if cur_price >= item_price:
-                    self.print_log("請輸入正確價格，停利價格必須大於現價")
-                    self.sl_tp_logger.error(f"{symbol} take profit update fail, user input {item_price} is less than item_price")
-                    item.setCheckState(Qt.Unchecked)
-                else:
-                    self.take_profit_dict[symbol] = item_price
-                    item.setFlags(item.flags() & ~Qt.ItemIsEditable)
-                    self.print_log(symbol+"...停利設定成功: "+item_str)
-                    self.sl_tp_logger.info(f"{symbol} take profit manul modify successfully: {self.take_profit_dict}")
-
-        elif item.checkState() == Qt.Unchecked:
-            if item.column() == self.col_idx_map['停損']:
-                item.setFlags(item.flags() | Qt.ItemIsEditable)
-                symbol = self.tablewidget.item(item.row(), self.col_idx_map['股票代號']).text()
-                if symbol in self.stop_loss_dict:
-                    self.stop_loss_dict.pop(symbol)
-                    self.print_log(symbol+"...移除停損，請重新設置")
-                    self.sl_tp_logger.info(f"{symbol} stop loss cancelled: {self.stop_loss_dict}")
-
-            elif item.column() == self.col_idx_map['停利']:
-                item.setFlags(item.flags() | Qt.ItemIsEditable)
-                symbol = self.tablewidget.item(item.row(), self.col_idx_map['股票代號']).text()
-                if symbol in self.take_profit_dict:
-                    self.take_profit_dict.pop(symbol)
-                    self.print_log(symbol+"...移除停利，請重新設置")
-                    self.sl_tp_logger.info(f"{symbol} take profet cancelled: {self.stop_loss_dict}")
+        try:
+            item_price = float(item_str)
+        except Exception as e:
+            self.print_log(str(e))
+            self.print_log("請輸入正確價格，"+rule)
+            self.sl_tp_logger.error(f"{symbol} {column} update fail, user input {item_str} is not digit")
+            return False
+
+        cur_price = state.last_price
+        if column == '停損':
+            valid = cur_price is not None and 0 < item_price < cur_price
+        else:
+            valid = cur_price is not None and item_price > cur_price
+        if not valid:
+            self.print_log("請輸入正確價格，"+rule)
+            self.sl_tp_logger.error(f"{symbol} {column} update fail, user input {item_price}, cur_price {cur_price}")
+            return False
+
+        set_price(symbol, item_price)
+        self.print_log(symbol+"..."+column+"設定成功: "+item_str)
+        self.sl_tp_logger.info(f"{symbol} {column} manul modify successfully: {item_price}")
+        return True
+
+    # 狀態列：每秒 tick 數、表格更新次數 (上限 ui_max_fps)、UI 延遲 (tick 到顯示)
+    def update_status_bar(self):
+        now = time.perf_counter()
+        last_time, last_ticks, last_flushes = self.status_counters
+        ticks, flushes = self.engine.ticks, self.table_model.flushes
+        elapsed = max(now - last_time, 1e-9)
+        self.status_counters = (now, ticks, flushes)
+        self.status_bar.showMessage(
+            f"tick: {(ticks - last_ticks) / elapsed:.0f}/s | "
+            f"表格更新: {(flushes - last_flushes) / elapsed:.1f}/s (上限 {self.ui_max_fps}) | "
+            f"UI 延遲: {self.table_model.last_lag * 1000:.0f} ms (最大 {self.table_model.max_lag * 1000:.0f} ms) | "
+            f"持股: {len(self.table_model.symbols)}")
 
     # 停損停利用的市價單函式
     def sell_market_order(self, stock_symbol, sell_qty, sl_or_tp):
@@ -567,95 +470,9 @@ class MainApp(QWidget):
         order_res = self.sdk.stock.place_order(self.active_account, order)
         return order_res
 
+    # SDK callback 執行緒：只把訊息交給 TickEngine 就返回，解析、停損停利判斷與下單都在引擎的執行緒上
     def handle_message(self, message):
-        msg = json.loads(message)
-        event = msg["event"]
-        data = msg["data"]
-        # print(event, data)
-        
-        # subscribed事件處理
-        if event == "subscribed":
-            id = data["id"]
-            symbol = data["symbol"]
-            self.communicator.print_log_signal.emit('訂閱成功...'+symbol)
-            self.subscribed_ids[symbol] = id
-        
-        elif event == "unsubscribed":
-            for key, value in self.subscribed_ids.items():
-                if value == data["id"]:
-                    print(key, value)
-                    remove_key = key
-            self.subscribed_ids.pop(remove_key)
-            self.communicator.print_log_signal.emit(remove_key+"...成功移除訂閱")
-        
-        # data事件處理
-        elif event == "snapshot":
-            if 'isTrial' in data:
-                if data['isTrial']:
-                    return
-                
-            if 'price' in data:
-                cur_price = data["price"]
-            else:
-                cur_price = '-'
-            symbol = data["symbol"]
-
-            self.communicator.item_update_signal.emit(data)
-
-        # data事件處理
-        elif event == "data":
-            if 'isTrial' in data:
-                if data['isTrial']:
-                    return
-            
-            symbol = data["symbol"]
-            
-            if symbol not in self.row_idx_map:
-                return
-            
-            if 'price' in data:
-                cur_price = data["price"]
-            else:
-                return
-                     
-            self.communicator.item_update_signal.emit(data)
-            
-            if symbol in self.stop_loss_dict:
-                if cur_price <= self.stop_loss_dict[symbol] and symbol not in self.is_ordered:
-                    share_item = self.tablewidget.item(self.row_idx_map[symbol], self.col_idx_map['庫存股數'])
-                    share = share_item.text()
-                    self.communicator.print_log_signal.emit(symbol+"...停損市價單發送...")
-                    sl_res = self.sell_market_order(symbol, share, "inv_SL")
-                    if sl_res.is_success:
-                        self.communicator.print_log_signal.emit(symbol+"...停損市價單發送成功，單號: "+sl_res.data.order_no)
-                        self.is_ordered.append(symbol)
-                        self.sl_tp_logger.info(f"{symbol} {share}股, 停損市價單發送成功, 單號: {sl_res.data.order_no}")
-                    else:
-                        self.communicator.print_log_signal.emit(symbol+"...停損市價單發送失敗...")
-                        self.communicator.print_log_signal.emit(sl_res.message)
-                        self.sl_tp_logger.error(f"{symbol} 停損市價單發送失敗, fail message: {sl_res.message}")
-                elif symbol in self.is_ordered:
-                    self.communicator.print_log_signal.emit(symbol+"...停損市價單已發送過...")
-                    # self.sl_tp_logger.info(f"{symbol} {share}股, 停損市價單已發送過")
-                    self.sl_tp_logger.info(f"{symbol} share股, 停損市價單已發送過")
-
-            if symbol in self.take_profit_dict:
-                if cur_price >= self.take_profit_dict[symbol] and symbol not in self.is_ordered:
-                    share_item = self.tablewidget.item(self.row_idx_map[symbol], self.col_idx_map['庫存股數'])
-                    share = share_item.text()
-                    self.communicator.print_log_signal.emit(symbol+"...停利市價單發送...")
-                    tp_res = self.sell_market_order(symbol, share, "inv_TP")
-                    if tp_res.is_success:
-                        self.communicator.print_log_signal.emit(symbol+"...停利市價單發送成功，單號: "+tp_res.data.order_no)
-                        self.is_ordered.append(symbol)
-                        self.sl_tp_logger.info(f"{symbol} {share}股, 停利市價單發送成功, 單號: {sl_res.data.order_no}")
-                    else:
-                        self.communicator.print_log_signal.emit(symbol+"...停利市價單發送失敗...")
-                        self.communicator.print_log_signal.emit(tp_res.message)
-                        self.sl_tp_logger.error(f"{symbol} 停利市價單發送失敗, fail message: {sl_res.message}")
-                elif symbol in self.is_ordered:
-                    self.communicator.print_log_signal.emit(symbol+"...停利市價單已發送過...")
-                    self.sl_tp_logger.info(f"{symbol} {share}股, 停利市價單已發送過")
+        self.engine.submit(message)
             
     def handle_connect(self):
         self.communicator.print_log_signal.emit('market data connected')
@@ -698,56 +515,23 @@ class MainApp(QWidget):
             stock_symbol = key[0]
             stock_name = self.tickers_name[key[0]]
             print(stock_symbol)
-            row = self.tablewidget.rowCount()
-            self.tablewidget.insertRow(row)
-            self.row_idx_map[stock_symbol] = row
-            for j in range(len(self.table_header)):
-                item = QTableWidgetItem()
-                item.setFlags(item.flags() & ~Qt.ItemIsEditable)
-                if self.table_header[j] == '股票名稱':
-                    item.setText(stock_name)
-                    self.tablewidget.setItem(row, j, item)
-                elif self.table_header[j] == '股票代號':
-                    item.setText(stock_symbol)
-                    self.tablewidget.setItem(row, j, item)
-                elif self.table_header[j] == '類別':
-                    item.setText(str(value.order_type).split('.')[-1])
-                    self.tablewidget.setItem(row, j, item)
-                elif self.table_header[j] == '庫存股數':
-                    item.setText(str(value.today_qty))
-                    self.tablewidget.setItem(row, j, item)
-                elif self.table_header[j] == '現價':
-                    item.setText('-')
-                    self.tablewidget.setItem(row, j, item)
-                elif self.table_header[j] == '停損':
-                    item.setFlags(Qt.ItemIsSelectable | Qt.ItemIsEditable | Qt.ItemIsEnabled | Qt.ItemIsUserCheckable)
-                    item.setCheckState(Qt.Unchecked)
-                    self.tablewidget.setItem(row, j, item)
-                elif self.table_header[j] == '停利':
-                    item.setFlags(Qt.ItemIsSelectable | Qt.ItemIsEditable | Qt.ItemIsEnabled | Qt.ItemIsUserCheckable)
-                    item.setCheckState(Qt.Unchecked)
-                    self.tablewidget.setItem(row, j, item)
-                elif self.table_header[j] == '庫存均價':
-                    item.setText(str(round(self.unrealized_pnl[key].cost_price+self.epsilon, 2)))
-                    self.tablewidget.setItem(row, j, item)
-                elif self.table_header[j] == '損益試算':
-                    cur_upnl = 0
-                    if self.unrealized_pnl[key].unrealized_profit > self.unrealized_pnl[key].unrealized_loss:
-                        cur_upnl = self.unrealized_pnl[key].unrealized_profit
-                    else:
-                        cur_upnl = -(self.unrealized_pnl[key].unrealized_loss)
-                    item.setText(str(cur_upnl))
-                    self.tablewidget.setItem(row, j, item)
-                elif self.table_header[j] == '獲利率%':
-                    cur_upnl = 0
-                    if self.unrealized_pnl[key].unrealized_profit > self.unrealized_pnl[key].unrealized_loss:
-                        cur_upnl = self.unrealized_pnl[key].unrealized_profit
-                    else:
-                        cur_upnl = -(self.unrealized_pnl[key].unrealized_loss)
-                    stock_cost = value.today_qty*self.unrealized_pnl[key].cost_price
-                    return_rate = cur_upnl/stock_cost*100
-                    item.setText(str(round(return_rate+self.epsilon, 2))+'%')
-                    self.tablewidget.setItem(row, j, item)
+            upnl = self.unrealized_pnl[key]
+            if upnl.unrealized_profit > upnl.unrealized_loss:
+                cur_upnl = upnl.unrealized_profit
+            else:
+                cur_upnl = -(upnl.unrealized_loss)
+            stock_cost = value.today_qty*upnl.cost_price
+            self.table_model.add_row(stock_symbol, {
+                '股票名稱': stock_name,
+                '股票代號': stock_symbol,
+                '類別': str(value.order_type).split('.')[-1],
+                '庫存股數': value.today_qty,
+                '庫存均價': upnl.cost_price,
+                '現價': None,
+                '損益試算': cur_upnl,
+                '獲利率%': cur_upnl/stock_cost*100,
+            })
+            self.engine.add_position(stock_symbol, value.today_qty, upnl.cost_price)
             self.wsstock.subscribe({
                 'channel': 'trades',
                 'symbol': stock_symbol
@@ -757,9 +541,9 @@ class MainApp(QWidget):
         self.sl_tp_logger.info('inventories fetched and initialized done')
 
         # 調整股票名稱欄位寬度
-        header = self.tablewidget.horizontalHeader()      
+        header = self.tableview.horizontalHeader()      
         header.setSectionResizeMode(0, QHeaderView.ResizeMode.ResizeToContents)
-        print(self.row_idx_map)
+        print(self.table_model.row_idx_map)
         print(self.col_idx_map)
 
     def on_button_start_clicked(self):
@@ -802,8 +586,9 @@ class MainApp(QWidget):
         self.lineEdit_default_tp.setReadOnly(True)
         self.button_start.setVisible(False)
         self.button_stop.setVisible(True)
-        self.tablewidget.clearContents()
-        self.tablewidget.setRowCount(0)
+        self.table_model.clear()
+        self.engine.clear()
+        self.engine.start()
 
         self.sl_tp_logger.info(f"establishing quote websocket")
         self.print_log("建立WebSocket行情連線")
@@ -830,6 +615,7 @@ class MainApp(QWidget):
         self.button_start.setVisible(True)
 
         self.wsstock.disconnect()
+        self.engine.stop()
         try:
             if self.fake_ws_timer.is_alive():
                 self.fake_ws_timer.cancel()
@@ -871,6 +657,7 @@ class MainApp(QWidget):
         self.save_sl_tp_parameter()
         self.print_log("disconnect websocket...")
         self.wsstock.disconnect()
+        self.engine.stop()
         self.sdk.logout()
 
         try:
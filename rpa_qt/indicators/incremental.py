@@ -0,0 +1,138 @@
+"""
+增量指標狀態 (Incremental indicator state)
+
+StrategyThread 原本每秒對整張 K 線表重算 ewm(span=20/60/120) 與 rolling(20)，
+卻只讀最後兩列。這裡改為逐根 K 棒 O(1) 更新：
+* EMA：與 pandas ewm(span=n, adjust=False) 相同的遞迴式 ema = a*x + (1-a)*prev，a = 2/(n+1)。
+* 平均量：與 pandas volume.rolling(n, min_periods=1).mean() 相同。
+* forming bar (尚未收盤的 K 棒)：每次更新都從「前一根已確定的狀態」重新計算暫定值 (provisional)，
+  收到下一根開盤時間時，才把目前這根的值確定 (commit) 下來。
+
+current() / previous() 對應原本的 df.iloc[-1] / df.iloc[-2]。
+"""
+from collections import deque
+
+import numpy as np
+
+EMA_SPANS = (20, 60, 120)
+VOLUME_WINDOW = 20
+
+
+class IndicatorState:
+    def __init__(self, spans=EMA_SPANS, volume_window: int = VOLUME_WINDOW):
+        """
+        :param spans: 要計算的 EMA 週期
+        :param volume_window: 平均量的視窗長度
+        """
+        self.spans = tuple(spans)
+        self.alphas = {span: 2.0 / (span + 1.0) for span in self.spans}
+        self.volume_window = volume_window
+
+        # 目前這根 K 棒 (可能尚未收盤)
+        self.open_time = None
+        self.closed = False
+        self._cur = None
+
+        # 前一根已確定的 K 棒，也是計算目前這根暫定值的基礎
+        self._prev = None
+        self._base_vols = deque()  # 前 volume_window-1 根已確定 K 棒的成交量
+        self._base_vol_sum = 0.0
+
+        self.bars = 0  # 已處理的 K 棒數 (含目前這根)
+
+    def _compute(self, close: float, volume: float) -> dict:
+        row = {"close": close, "volume": volume}
+        for span in self.spans:
+            if self._prev is None:
+                row[f"ema{span}"] = close
+            else:
+                a = self.alphas[span]
+                row[f"ema{span}"] = a * close + (1.0 - a) * self._prev[f"ema{span}"]
+        row["avg_vol"] = (self._base_vol_sum + volume) / (len(self._base_vols) + 1)
+        return row
+
+    def _commit(self):
+        """把目前這根 K 棒確定下來，成為下一根的計算基礎。"""
+        self._prev = self._cur
+        if self.volume_window > 1:
+            if len(self._base_vols) == self.volume_window - 1:
+                self._base_vol_sum -= self._base_vols.popleft()
+            self._base_vols.append(self._cur["volume"])
+            self._base_vol_sum += self._cur["volume"]
+
+    def update(self, open_time: int, close: float, volume: float, closed: bool = False) -> bool:
+        """
+        更新一根 K 棒。
+
+        :param open_time: K 棒開盤時間 (ms)
+        :param closed: 這根 K 棒是否已收盤
+        :return: True 表示是新的一根 K 棒
+        """
+        is_new = open_time != self.open_time
+        if is_new:
+            if self.open_time is not None and open_time < self.open_time:
+                # 過期的訊息，直接忽略
+                return False
+            if self._cur is not None:
+                self._commit()
+            self.open_time = open_time
+            self.bars += 1
+        self._cur = self._compute(float(close), float(volume))
+        self.closed = bool(closed)
+        return is_new
+
+    def sync(self, store) -> int:
+        """
+        從 KlineRingBuffer 補上自上次同步以來的 K 棒 (含目前 forming bar 的最新值)。
+
+        :return: 處理了幾根 K 棒
+        """
+        with store.lock:
+            times = store.open_times()
+            if len(times) == 0:
+                return 0
+            start = 0 if self.open_time is None else int(np.searchsorted(times, self.open_time))
+            times = times[start:].copy()
+            values = store.values()[start:].copy()
+            closed = store.closed_flags()[start:].copy()
+        for t, row, x in zip(times, values, closed):
+            self.update(int(t), row[3], row[4], bool(x))
+        return len(times)
+
+    def current(self) -> dict:
+        """目前這根 K 棒的值 (對應 df.iloc[-1])；forming bar 時為暫定值。"""
+        return self._cur
+
+    def previous(self) -> dict:
+        """前一根已確定 K 棒的值 (對應 df.iloc[-2])。"""
+        return self._prev
+
+    @property
+    def ready(self) -> bool:
+        return self._cur is not None and self._prev is not None
+
+
+if __name__ == '__main__':
+    import pandas as pd
+
+    # 與 pandas 全量重算的結果比對
+    rng = np.random.default_rng(0)
+    n = 300
+    closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    vols = rng.uniform(1, 10, n)
+
+    state = IndicatorState()
+    for i in range(n):
+        # 模擬 forming bar：同一根 K 棒先收到一個暫定價，再收到收盤價
+        state.update(i * 1000, closes[i] * 1.01, vols[i] / 2)
+        state.update(i * 1000, closes[i], vols[i], closed=True)
+
+    df = pd.DataFrame({"close": closes, "volume": vols})
+    for span in EMA_SPANS:
+        df[f"ema{span}"] = df["close"].ewm(span=span, adjust=False).mean()
+    df["avg_vol"] = df["volume"].rolling(VOLUME_WINDOW, min_periods=1).mean()
+
+    for name, row, expected in (("current", state.current(), df.iloc[-1]),
+                                ("previous", state.previous(), df.iloc[-2])):
+        diff = max(abs(row[k] - expected[k]) for k in row)
+        print(f"{name}: max diff vs pandas = {diff:.3e}")
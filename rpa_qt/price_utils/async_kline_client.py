@@ -0,0 +1,238 @@
+"""
+asyncio 版 K 線即時行情 (asyncio market data client)
+
+與 coin_price_ws.KlineWebSocket 相同的對外介面：start() / get_latest_price() / get_dataframe()，
+差別在於：
+* 所有 client 共用同一個 event loop (在一條背景執行緒上執行)，不再是一個 stream 一個執行緒。
+* 斷線重連使用指數退避 + 隨機抖動 (exponential backoff with jitter)，取代固定的 time.sleep(5)。
+* 追蹤 heartbeat：ping 延遲、最後一筆訊息的時間；超過 stale_timeout 沒有訊息就主動重連。
+* 接收迴圈與處理迴圈之間用有上限的 asyncio.Queue 串接：處理跟不上時接收端會等待 (backpressure)，
+  不會無限制地堆積記憶體。
+* 資料寫入 KlineRingBuffer，Dash callback 等執行緒可以用 get_dataframe() / snapshot() 讀取快照。
+* 重連時的 REST 補洞在 executor 中以 task 執行：接收與 heartbeat 立即開始，收到的訊息先放進佇列，
+  補洞完成後才開始處理 (舊的 K 棒必須先寫入緩衝區)。
+
+使用方式 (同步程式)：
+    client = AsyncKlineClient(symbol="solusdt", interval="1s")
+    client.start()
+    client.get_latest_price()
+
+使用方式 (asyncio 程式)：
+    await client.run()
+"""
+import asyncio
+import json
+import random
+import threading
+import time
+
+import pandas as pd
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed
+
+from rpa_qt.price_utils.bar_bus import BAR_CLOSE, BAR_UPDATE, BarEvent, bar_bus
+from rpa_qt.price_utils.gap_fill import KlineGapFiller
+from rpa_qt.price_utils.kline_store import KlineRingBuffer
+from rpa_qt.price_utils.price_binance import get_klines
+
+BINANCE_WS_URL = "wss://stream.binance.com:9443/ws"
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """取得所有 client 共用的 event loop，第一次呼叫時在背景執行緒啟動。"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="AsyncKlineLoop", daemon=True).start()
+        return _loop
+
+
+def backoff_delay(attempt: int, base: float = 1.0, max_delay: float = 60.0) -> float:
+    """第 attempt 次重連前的等待秒數：指數退避，並在 [delay/2, delay] 之間隨機抖動，避免同時重連。"""
+    delay = min(max_delay, base * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class AsyncKlineClient:
+    def __init__(self, symbol="btcusdt", interval="1s", capacity=1000, queue_size=1000,
+                 bus=None, url: str = None, preload: bool = True,
+                 ping_interval: float = 20, ping_timeout: float = 10, stale_timeout: float = 30,
+                 backoff_base: float = 1.0, backoff_max: float = 60.0):
+        """
+        :param queue_size: 接收與處理之間的佇列上限，滿了接收端就會等待
+        :param url: websocket 位址，預設為 Binance 的 <symbol>@kline_<interval>
+        :param preload: 是否先用 get_klines 載入 500 根歷史 K 線
+        :param stale_timeout: 超過幾秒沒有收到任何訊息就視為斷線並重連
+        :param backoff_base: 重連退避的起始秒數
+        :param backoff_max: 重連退避的最大秒數
+        """
+        self.symbol = symbol.lower()
+        self.interval = interval
+        self.url = url or f"{BINANCE_WS_URL}/{self.symbol}@kline_{interval}"
+        self.bus = bus if bus is not None else bar_bus
+        self.store = KlineRingBuffer(capacity=capacity)
+        if preload:
+            self.store.load_dataframe(get_klines(symbol=self.symbol, interval=self.interval, limit=500))
+
+        self.queue_size = queue_size
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.stale_timeout = stale_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        # 重新連線時用 REST 補上斷線期間的 K 棒；監控數據見 self.gap_filler.stats
+        self.gap_filler = KlineGapFiller(symbol=self.symbol, interval=self.interval)
+
+        self.latest_price = None
+        self.running = False
+        self._future = None
+
+        # 監控數據
+        self.stats = {
+            "connects": 0,
+            "reconnects": 0,
+            "messages": 0,
+            "queue_full_waits": 0,  # 因佇列已滿而等待的次數 (backpressure)
+            "ping_latency": None,  # 最近一次 ping/pong 的往返秒數
+            "last_message_at": None,  # time.monotonic()
+        }
+
+    # -------- 對外介面 (與 KlineWebSocket 相同) --------
+    def start(self):
+        """在共用的 event loop 上啟動，立即返回。"""
+        if self._future is None or self._future.done():
+            self._future = asyncio.run_coroutine_threadsafe(self.run(), get_event_loop())
+        return self._future
+
+    def stop(self):
+        self.running = False
+        if self._future is not None:
+            self._future.cancel()
+
+    def get_latest_price(self):
+        return self.latest_price
+
+    def get_dataframe(self) -> pd.DataFrame:
+        # 跨執行緒讀取，回傳快照
+        return self.store.snapshot()
+
+    def last_message_age(self):
+        if self.stats["last_message_at"] is None:
+            return None
+        return time.monotonic() - self.stats["last_message_at"]
+
+    # -------- asyncio 主迴圈 --------
+    async def run(self):
+        self.running = True
+        attempt = 0
+        while self.running:
+            try:
+                async with connect(self.url, ping_interval=self.ping_interval,
+                                   ping_timeout=self.ping_timeout) as ws:
+                    self.stats["connects"] += 1
+                    received = self.stats["messages"]
+                    await self._session(ws)
+                    if self.stats["messages"] > received:
+                        attempt = 0  # 連線期間有收到資料，退避重新計算
+            except asyncio.CancelledError:
+                raise
+            except (ConnectionClosed, OSError, asyncio.TimeoutError) as e:
+                print(f"WebSocket {self.symbol} {self.interval} 錯誤:", e)
+            except Exception as e:
+                print(f"[EXCEPTION] WebSocket {self.symbol} {self.interval} exception: {e}")
+            if not self.running:
+                break
+            delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+            attempt += 1
+            self.stats["reconnects"] += 1
+            print(f"[RECONNECT] Reconnecting WebSocket {self.symbol} {self.interval} in {delay:.1f}s...")
+            await asyncio.sleep(delay)
+
+    async def _session(self, ws):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        # REST 補洞是阻塞呼叫，放到 executor 執行；不等它完成就開始接收，consumer 等補洞完成才處理佇列
+        gap_fill = asyncio.get_running_loop().run_in_executor(None, self.gap_filler.fill, self.store)
+        consumer = asyncio.create_task(self._consume(queue, gap_fill))
+        tasks = [asyncio.create_task(self._receive(ws, queue)),
+                 asyncio.create_task(self._heartbeat(ws))]
+        try:
+            # 斷線或 heartbeat 逾時就結束這次連線
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # 佇列中已收到的訊息仍要處理完
+            await queue.put(None)
+            await consumer
+            for task in done:
+                task.result()
+        finally:
+            consumer.cancel()
+
+    async def _receive(self, ws, queue: asyncio.Queue):
+        async for message in ws:
+            self.stats["last_message_at"] = time.monotonic()
+            if queue.full():
+                self.stats["queue_full_waits"] += 1
+            await queue.put(message)
+
+    async def _consume(self, queue: asyncio.Queue, ready=None):
+        if ready is not None:
+            try:
+                await ready
+            except Exception as e:
+                print(f"[EXCEPTION] WebSocket {self.symbol} {self.interval} gap fill: {e}")
+        while True:
+            message = await queue.get()
+            if message is None:
+                return
+            try:
+                self.on_message(message)
+            except Exception as e:
+                print(f"[EXCEPTION] WebSocket {self.symbol} {self.interval} on_message: {e}")
+
+    async def _heartbeat(self, ws):
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            self.stats["ping_latency"] = ws.latency
+            age = self.last_message_age()
+            if age is not None and age > self.stale_timeout:
+                print(f"[HEARTBEAT] WebSocket {self.symbol} {self.interval} 已 {age:.0f}s 沒有資料，重新連線")
+                await ws.close()
+                return
+
+    def on_message(self, message):
+        data = json.loads(message)
+        k = data["k"]
+        self.stats["messages"] += 1
+        self.latest_price = float(k["c"])
+        self.store.update(open_time=k["t"],
+                          o=float(k["o"]),
+                          h=float(k["h"]),
+                          l=float(k["l"]),
+                          c=self.latest_price,
+                          v=float(k["v"]),
+                          closed=k["x"])
+        self.bus.publish(BarEvent(symbol=self.symbol,
+                                  interval=self.interval,
+                                  open_time=k["t"],
+                                  kind=BAR_CLOSE if k["x"] else BAR_UPDATE,
+                                  close=self.latest_price))
+
+
+if __name__ == '__main__':
+    clients = [AsyncKlineClient(symbol="btcusdt", interval="1s"),
+               AsyncKlineClient(symbol="btcusdt", interval="1m")]
+    for client in clients:
+        client.start()
+
+    for i in range(10):
+        time.sleep(10)  # 等 10 秒接收資料
+        for client in clients:
+            print(f"{client.interval} 最新價格:", client.get_latest_price(), client.stats)
+            print(f"{client.interval} 資料:", client.get_dataframe().tail())
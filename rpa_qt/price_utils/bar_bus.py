@@ -0,0 +1,208 @@
+"""
+K 棒事件匯流排 (Bar bus)：publish / subscribe
+
+KlineWebSocket 收到訊息後發佈 bar-update (forming bar 更新) 或 bar-close (K 棒收盤) 事件，
+策略訂閱後只在事件到達時才計算，取代 StrategyThread 每秒輪詢的作法：
+* 沒有新資料時訂閱者的執行緒停在 Condition.wait()，不佔 CPU。
+* 訊號延遲從最多 1 秒降到訊息到達的時間。
+* coalesce_ms：同一個 (symbol, interval) 的 update 事件最多每 N ms 送一次，期間只保留最新的一筆；
+  close 事件一律送出，不會被合併掉。
+
+使用方式：
+    bus = BarBus()
+    sub = bus.subscribe(callback, symbol="solusdt", interval="1m", coalesce_ms=200)
+    bus.publish(BarEvent(symbol="solusdt", interval="1m", open_time=..., kind=BAR_UPDATE))
+    sub.stop()
+"""
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+BAR_UPDATE = "update"
+BAR_CLOSE = "close"
+
+
+@dataclass(frozen=True)
+class BarEvent:
+    symbol: str
+    interval: str
+    open_time: int  # K 棒開盤時間 (ms)
+    kind: str = BAR_UPDATE  # BAR_UPDATE / BAR_CLOSE
+    close: float = None
+    received_at: float = field(default_factory=time.perf_counter)  # 收到訊息的時間，用來量測延遲
+
+    @property
+    def key(self):
+        return self.symbol, self.interval
+
+    @property
+    def is_close(self) -> bool:
+        return self.kind == BAR_CLOSE
+
+
+class Subscription:
+    def __init__(self, bus, callback, symbol=None, interval=None, coalesce_ms: float = 0,
+                 closes_only: bool = False, name: str = None):
+        """
+        :param callback: 收到事件時呼叫 callback(event)，在訂閱者自己的執行緒上執行
+        :param symbol: 只接收這個 symbol 的事件，None 表示全部
+        :param interval: 只接收這個 interval 的事件，None 表示全部
+        :param coalesce_ms: 同一個 (symbol, interval) 的 update 事件最短間隔 (毫秒)，0 表示不合併
+        :param closes_only: 只接收 bar-close 事件
+        """
+        self.bus = bus
+        self.callback = callback
+        self.symbol = symbol.lower() if symbol else None
+        self.interval = interval
+        self.coalesce = coalesce_ms / 1000.0
+        self.closes_only = closes_only
+
+        self._cond = threading.Condition()
+        self._closes = deque()  # 待送出的 close 事件，依序送出
+        self._updates = {}  # key -> 最新一筆待送出的 update 事件
+        self._last_sent = {}  # key -> 上次送出 update 的時間
+        self._running = True
+
+        self.delivered = 0
+        self.dropped = 0  # 被合併掉的 update 事件數
+        self._thread = threading.Thread(target=self._loop, name=name or "BarBusSubscriber", daemon=True)
+        self._thread.start()
+
+    def matches(self, event: BarEvent) -> bool:
+        if self.symbol is not None and event.symbol != self.symbol:
+            return False
+        if self.interval is not None and event.interval != self.interval:
+            return False
+        if self.closes_only and not event.is_close:
+            return False
+        return True
+
+    def offer(self, event: BarEvent):
+        with self._cond:
+            if event.is_close:
+                # close 事件代表這根 K 棒的最終值，同 key 尚未送出的 update 可以丟掉
+                if self._updates.pop(event.key, None) is not None:
+                    self.dropped += 1
+                self._closes.append(event)
+            else:
+                if self._updates.get(event.key) is not None:
+                    self.dropped += 1
+                self._updates[event.key] = event
+            self._cond.notify()
+
+    def _next_event(self):
+        """取出下一個可以送出的事件；沒有則等待。停止時回傳 None。"""
+        with self._cond:
+            while self._running:
+                if self._closes:
+                    return self._closes.popleft()
+                if self._updates:
+                    now = time.perf_counter()
+                    wait = None
+                    for key, event in self._updates.items():
+                        remaining = self._last_sent.get(key, float("-inf")) + self.coalesce - now
+                        if remaining <= 0:
+                            del self._updates[key]
+                            self._last_sent[key] = now
+                            return event
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._cond.wait(wait)
+                else:
+                    self._cond.wait()
+            return None
+
+    def _loop(self):
+        while True:
+            event = self._next_event()
+            if event is None:
+                return
+            try:
+                self.callback(event)
+            except Exception as e:
+                print(f"[BarBus] subscriber callback error: {e}")
+            self.delivered += 1
+
+    def stop(self):
+        self.bus.unsubscribe(self)
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+
+
+class BarBus:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = []
+
+    def subscribe(self, callback, symbol=None, interval=None, coalesce_ms: float = 0,
+                  closes_only: bool = False, name: str = None) -> Subscription:
+        sub = Subscription(self, callback, symbol=symbol, interval=interval, coalesce_ms=coalesce_ms,
+                           closes_only=closes_only, name=name)
+        with self._lock:
+            self._subscriptions = self._subscriptions + [sub]
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            self._subscriptions = [s for s in self._subscriptions if s is not sub]
+
+    def publish(self, event: BarEvent):
+        # copy-on-write 的訂閱清單，發佈時不需要上鎖
+        for sub in self._subscriptions:
+            if sub.matches(event):
+                sub.offer(event)
+
+
+class InlineSubscription:
+    """InlineBarBus 的訂閱：沒有自己的執行緒，也不合併 update 事件。"""
+    matches = Subscription.matches
+
+    def __init__(self, bus, callback, symbol=None, interval=None, closes_only: bool = False):
+        self.bus = bus
+        self.callback = callback
+        self.symbol = symbol.lower() if symbol else None
+        self.interval = interval
+        self.closes_only = closes_only
+        self.delivered = 0
+        self.dropped = 0
+
+    def offer(self, event: BarEvent):
+        self.callback(event)
+        self.delivered += 1
+
+    def stop(self):
+        self.bus.unsubscribe(self)
+
+
+class InlineBarBus(BarBus):
+    """
+    同步版本：publish 時直接在發佈者的執行緒呼叫 callback，發佈順序即計算順序。
+    重播錄製資料做回歸比對時使用 (tick_replay)，結果不受執行緒排程影響；coalesce_ms 不適用。
+    """
+    def subscribe(self, callback, symbol=None, interval=None, coalesce_ms: float = 0,
+                  closes_only: bool = False, name: str = None) -> InlineSubscription:
+        sub = InlineSubscription(self, callback, symbol=symbol, interval=interval, closes_only=closes_only)
+        with self._lock:
+            self._subscriptions = self._subscriptions + [sub]
+        return sub
+
+
+# 預設共用的匯流排：KlineWebSocket 與 StrategyThread 沒有指定 bus 時使用
+bar_bus = BarBus()
+
+
+if __name__ == '__main__':
+    bus = BarBus()
+    received = []
+    sub = bus.subscribe(received.append, symbol="solusdt", interval="1s", coalesce_ms=100)
+
+    t0 = 1_700_000_000_000
+    for i in range(50):
+        bus.publish(BarEvent("solusdt", "1s", t0, BAR_UPDATE, close=100 + i))
+        time.sleep(0.005)
+    bus.publish(BarEvent("solusdt", "1s", t0, BAR_CLOSE, close=150))
+    time.sleep(0.3)
+    sub.stop()
+    print(f"published 51, delivered {sub.delivered}, coalesced {sub.dropped}")
+    print([(e.kind, e.close) for e in received])
@@ -0,0 +1,301 @@
+"""
+Binance combined stream 多工管理 (Combined-stream multiplexer)
+
+原本每個 KlineWebSocket / turnover_02_4.start_ws_thread 都各自開一條
+wss://stream.binance.com:9443/ws/<sym>@kline_<iv> 連線與一個執行緒，
+50 個 symbol x 3 個 interval 就是 150 條連線、150 個執行緒。
+
+這裡改用 combined stream：
+* 一條連線訂閱多個 stream：/stream?streams=a/b/c，訊息格式為 {"stream": "...", "data": {...}}。
+* 連線中可以動態 SUBSCRIBE / UNSUBSCRIBE，不需要重連。
+* 每條連線最多 max_streams_per_connection 個 stream，超過就自動開下一條 (sharding)。
+* 收到的 K 線依 (symbol, interval) 寫入各自的 KlineRingBuffer，並發佈到 BarBus。
+* ws_factory 可以替換成 ws_replay.ReplayWebSocketApp，用錄好的訊息在本機測試。
+
+文件：https://developers.binance.com/docs/binance-spot-api-docs/web-socket-streams
+"""
+import itertools
+import json
+import threading
+import time
+
+import websocket
+
+from rpa_qt.price_utils.bar_bus import BAR_CLOSE, BAR_UPDATE, BarEvent, bar_bus
+from rpa_qt.price_utils.gap_fill import KlineGapFiller
+from rpa_qt.price_utils.kline_store import KlineRingBuffer
+
+BINANCE_STREAM_URL = "wss://stream.binance.com:9443/stream"
+MAX_STREAMS_PER_CONNECTION = 1024  # Binance 單一連線最多 1024 個 stream
+RECONNECT_DELAY = 5
+
+
+def kline_stream_name(symbol: str, interval: str) -> str:
+    return f"{symbol.lower()}@kline_{interval}"
+
+
+def parse_kline_stream_name(stream: str):
+    """'btcusdt@kline_1m' -> ('btcusdt', '1m')"""
+    symbol, _, interval = stream.partition("@kline_")
+    return symbol, interval
+
+
+class _StreamConnection:
+    """一條 combined stream 連線 (一個 shard)，在自己的執行緒上自動重連。"""
+
+    def __init__(self, manager, conn_id: int):
+        self.manager = manager
+        self.conn_id = conn_id
+        self.streams = set()  # 這條連線應該訂閱的 stream
+        self.live_streams = set()  # 目前連線上已生效的 stream
+        self.ws = None
+        self.connected = False
+        self.lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"BinanceStream-{self.conn_id}", daemon=True)
+            self._thread.start()
+        self._wakeup.set()
+
+    def _send(self, method: str, streams):
+        if not streams:
+            return
+        payload = {"method": method, "params": sorted(streams), "id": next(self.manager._request_ids)}
+        try:
+            self.ws.send(json.dumps(payload))
+        except Exception as e:
+            print(f"[BinanceStream-{self.conn_id}] {method} 失敗: {e}")
+
+    def add(self, streams):
+        with self.lock:
+            new = set(streams) - self.streams
+            self.streams |= new
+            if self.connected:
+                self._send("SUBSCRIBE", new)
+                self.live_streams |= new
+        self.start()
+
+    def remove(self, streams):
+        with self.lock:
+            gone = set(streams) & self.streams
+            self.streams -= gone
+            if self.connected:
+                self._send("UNSUBSCRIBE", gone & self.live_streams)
+                self.live_streams -= gone
+
+    def _on_open(self, ws):
+        with self.lock:
+            self.connected = True
+            # 建立連線到 on_open 之間新增的 stream，用 SUBSCRIBE 補上
+            self._send("SUBSCRIBE", self.streams - self.live_streams)
+            self._send("UNSUBSCRIBE", self.live_streams - self.streams)
+            self.live_streams = set(self.streams)
+            streams = set(self.live_streams)
+        # 這條連線的訊息在 on_open 返回前不會被處理，先把斷線期間的 K 棒補回來
+        self.manager.fill_gaps(streams)
+
+    def _on_message(self, ws, message):
+        self.manager._dispatch(message)
+
+    def _on_error(self, ws, error):
+        print(f"[BinanceStream-{self.conn_id}] 錯誤:", error)
+
+    def _on_close(self, ws, close_status_code, close_msg):
+        with self.lock:
+            self.connected = False
+        print(f"[BinanceStream-{self.conn_id}] 關閉")
+
+    def _run(self):
+        while self.manager.running:
+            with self.lock:
+                streams = set(self.streams)
+            if not streams:
+                # 沒有任何訂閱時不連線，等待新的 stream
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            try:
+                with self.lock:
+                    self.live_streams = streams
+                    self.ws = self.manager.ws_factory(
+                        f"{self.manager.base_url}?streams={'/'.join(sorted(streams))}",
+                        on_open=self._on_open,
+                        on_message=self._on_message,
+                        on_error=self._on_error,
+                        on_close=self._on_close
+                    )
+                self.ws.run_forever(ping_interval=20, ping_timeout=10)
+            except Exception as e:
+                print(f"[EXCEPTION] BinanceStream-{self.conn_id} exception: {e}")
+            with self.lock:
+                self.connected = False
+            if not self.manager.running:
+                break
+            print(f"[RECONNECT] Reconnecting BinanceStream-{self.conn_id} in {self.manager.reconnect_delay}s...")
+            time.sleep(self.manager.reconnect_delay)
+
+    def close(self):
+        self._wakeup.set()
+        if self.ws is not None:
+            self.ws.close()
+
+
+class BinanceStreamManager:
+    def __init__(self, base_url: str = BINANCE_STREAM_URL,
+                 max_streams_per_connection: int = MAX_STREAMS_PER_CONNECTION,
+                 capacity: int = 1000, bus=None, ws_factory=websocket.WebSocketApp,
+                 reconnect_delay: float = RECONNECT_DELAY, gap_fill: bool = True):
+        """
+        :param base_url: combined stream 端點，測試時可換成本機位址
+        :param max_streams_per_connection: 每條連線最多訂閱幾個 stream，超過就開新連線
+        :param capacity: 每個 (symbol, interval) 的 KlineRingBuffer 容量
+        :param bus: K 棒事件匯流排，預設使用共用的 bar_bus
+        :param ws_factory: 建立 WebSocketApp 的函式，介面同 websocket.WebSocketApp
+        :param gap_fill: 連線 (含重連) 時是否用 REST 補上斷線期間缺漏的 K 棒
+        """
+        self.base_url = base_url
+        self.max_streams = max_streams_per_connection
+        self.capacity = capacity
+        self.bus = bus if bus is not None else bar_bus
+        self.ws_factory = ws_factory
+        self.reconnect_delay = reconnect_delay
+
+        self.running = True
+        self.lock = threading.Lock()
+        self.connections = []
+        self.stream_conn = {}  # stream name -> _StreamConnection
+        self.stores = {}  # (symbol, interval) -> KlineRingBuffer
+        self.latest_prices = {}  # symbol -> 最新價格
+        self.gap_fill = gap_fill
+        self.gap_fillers = {}  # (symbol, interval) -> KlineGapFiller
+        self.message_count = 0
+        self._request_ids = itertools.count(1)
+
+    # -------- 訂閱管理 --------
+    def _connection_with_room(self, pending: dict) -> _StreamConnection:
+        for conn in self.connections:
+            if len(conn.streams) + len(pending.get(conn, ())) < self.max_streams:
+                return conn
+        conn = _StreamConnection(self, conn_id=len(self.connections))
+        self.connections.append(conn)
+        return conn
+
+    def subscribe(self, symbol: str, interval: str, store: KlineRingBuffer = None) -> KlineRingBuffer:
+        """
+        訂閱 (symbol, interval) 的 K 線，回傳對應的 KlineRingBuffer。
+
+        :param store: 使用既有的緩衝區 (例如已用 get_klines 預先載入歷史資料)，None 則新建一個
+        """
+        return self.subscribe_many([(symbol, interval)], stores={(symbol.lower(), interval): store})[0]
+
+    def subscribe_many(self, pairs, stores: dict = None) -> list:
+        """一次訂閱多個 (symbol, interval)，同一條連線上的 stream 會合併成一個 SUBSCRIBE 請求。"""
+        stores = stores or {}
+        result = []
+        pending = {}  # _StreamConnection -> 新增的 stream
+        with self.lock:
+            for symbol, interval in pairs:
+                key = (symbol.lower(), interval)
+                if key not in self.stores:
+                    store = stores.get(key)
+                    self.stores[key] = store if store is not None else KlineRingBuffer(capacity=self.capacity)
+                result.append(self.stores[key])
+
+                stream = kline_stream_name(*key)
+                if stream in self.stream_conn:
+                    continue
+                conn = self._connection_with_room(pending)
+                self.stream_conn[stream] = conn
+                pending.setdefault(conn, set()).add(stream)
+        for conn, streams in pending.items():
+            conn.add(streams)
+        return result
+
+    def unsubscribe(self, symbol: str, interval: str, drop_data: bool = True):
+        key = (symbol.lower(), interval)
+        stream = kline_stream_name(*key)
+        with self.lock:
+            conn = self.stream_conn.pop(stream, None)
+            if drop_data:
+                self.stores.pop(key, None)
+        if conn is not None:
+            conn.remove([stream])
+
+    def is_subscribed(self, symbol: str, interval: str) -> bool:
+        return kline_stream_name(symbol, interval) in self.stream_conn
+
+    def fill_gaps(self, streams) -> int:
+        """對指定的 stream 用 REST 補上緩衝區最後一根之後缺漏的 K 棒，回傳補回的總根數。"""
+        if not self.gap_fill:
+            return 0
+        recovered = 0
+        for stream in streams:
+            key = parse_kline_stream_name(stream)
+            store = self.stores.get(key)
+            if store is None:
+                continue
+            if key not in self.gap_fillers:
+                self.gap_fillers[key] = KlineGapFiller(symbol=key[0], interval=key[1])
+            recovered += self.gap_fillers[key].fill(store)
+        return recovered
+
+    # -------- 訊息分派 --------
+    def _dispatch(self, message):
+        msg = json.loads(message)
+        data = msg.get("data")
+        if data is None:
+            # SUBSCRIBE / UNSUBSCRIBE 的回應：{"result": null, "id": 1}
+            return
+        if data.get("e") != "kline":
+            return
+        k = data["k"]
+        key = (k["s"].lower(), k["i"])
+        store = self.stores.get(key)
+        if store is None:
+            # 已取消訂閱但仍在途中的訊息
+            return
+        self.message_count += 1
+        close = float(k["c"])
+        self.latest_prices[key[0]] = close
+        store.update(open_time=k["t"],
+                     o=float(k["o"]),
+                     h=float(k["h"]),
+                     l=float(k["l"]),
+                     c=close,
+                     v=float(k["v"]),
+                     closed=k["x"])
+        self.bus.publish(BarEvent(symbol=key[0],
+                                  interval=key[1],
+                                  open_time=k["t"],
+                                  kind=BAR_CLOSE if k["x"] else BAR_UPDATE,
+                                  close=close))
+
+    # -------- 讀取 --------
+    def get_store(self, symbol: str, interval: str) -> KlineRingBuffer:
+        return self.stores.get((symbol.lower(), interval))
+
+    def get_latest_price(self, symbol: str):
+        return self.latest_prices.get(symbol.lower())
+
+    def stop(self):
+        self.running = False
+        for conn in self.connections:
+            conn.close()
+
+
+if __name__ == '__main__':
+    manager = BinanceStreamManager(max_streams_per_connection=4)
+    symbols = ["btcusdt", "ethusdt", "solusdt"]
+    manager.subscribe_many([(s, iv) for s in symbols for iv in ("1s", "1m", "5m")])
+    print(f"{len(manager.stream_conn)} streams on {len(manager.connections)} connections")
+
+    for i in range(6):
+        time.sleep(5)
+        for s in symbols:
+            print(s, manager.get_latest_price(s), len(manager.get_store(s, "1s")))
+    manager.unsubscribe("ethusdt", "1s")
+    time.sleep(5)
+    manager.stop()
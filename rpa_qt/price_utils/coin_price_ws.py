@@ -36,10 +36,14 @@ return format:
 """
 import json
 import threading
+import time
 import pandas as pd
 import websocket
 from datetime import datetime
 
+from rpa_qt.price_utils.bar_bus import BAR_CLOSE, BAR_UPDATE, BarEvent, bar_bus
+from rpa_qt.price_utils.gap_fill import KlineGapFiller
+from rpa_qt.price_utils.kline_store import KlineRingBuffer
 from rpa_qt.price_utils.price_binance import get_klines
 
 
@@ -55,50 +59,85 @@ def resample_to_5s(df_1s):
     return df_5s
 
 class KlineWebSocket:
-    def __init__(self, symbol="btcusdt", interval="1s",dfs:{}={}):
-        self.dfs = dfs  # 儲存不同 interval 的 K 線資料
+    def __init__(self, symbol="btcusdt", interval="1s",dfs:{}={}, capacity=1000, bus=None, manager=None,
+                 ws_factory=websocket.WebSocketApp, preload: bool = True, gap_fill: bool = True,
+                 reconnect_delay: float = 5):
+        """
+        :param manager: BinanceStreamManager，指定時改由共用的 combined-stream 連線接收資料，不另開連線與執行緒
+        :param ws_factory: 建立 WebSocketApp 的函式，介面同 websocket.WebSocketApp (可換成 ws_replay / tick_replay 的重播版本)
+        :param preload: 是否先用 REST 載入最近 500 根 K 棒
+        :param gap_fill: 連線 (含重連) 時是否用 REST 補上斷線期間缺漏的 K 棒
+        """
+        self.dfs = dfs  # 儲存不同 interval 的 K 線資料 (KlineRingBuffer)
+        self.bus = bus if bus is not None else bar_bus  # 發佈 bar-update / bar-close 事件
+        self.manager = manager
         self.symbol = symbol.lower()
         self.interval = interval
-        self.df = pd.DataFrame(columns=["open","high","low","close","volume"])
-        raw_df=get_klines(symbol=self.symbol, interval=self.interval, limit=500)
-        self.df= raw_df
+        self.ws_factory = ws_factory
+        self.reconnect_delay = reconnect_delay
+        # 固定容量的 K 線環形緩衝區：forming bar 原位更新，新開盤時間才 append
+        self.store = KlineRingBuffer(capacity=capacity)
+        if preload:
+            raw_df=get_klines(symbol=self.symbol, interval=self.interval, limit=500)
+            self.store.load_dataframe(raw_df)
+        self.dfs[self.interval] = self.store
+        # 重新連線時用 REST 補上斷線期間的 K 棒；補洞次數、延遲與補回根數見 self.gap_filler.stats
+        self.gap_filler = KlineGapFiller(symbol=self.symbol, interval=self.interval) if gap_fill else None
         self.latest_price = None
+        self.message_count = 0
         self.threads = []
+        self.ws = None
+        self._stop = threading.Event()
+
+    def handle_message(self, message: str, interval: str = None, received_at: float = None) -> BarEvent:
+        """
+        處理一筆 kline 訊息 (單一 stream 或 combined stream 格式)：寫入 store 並發佈事件。
+        :param received_at: 收到訊息的時間 (time.perf_counter())，None 表示現在
+        """
+        if received_at is None:
+            received_at = time.perf_counter()
+        data = json.loads(message)
+        data = data.get("data", data)
+        k = data["k"]
+        self.latest_price = float(k["c"])
+        self.message_count += 1
+
+        # 原作法：每筆訊息都 pd.concat + sort_index 重建整張表，O(n)
+        # if interval not in self.dfs:
+        #      self.dfs[interval] = self.df
+        # self.dfs[interval] = pd.concat(
+        #     [ self.dfs[interval][~ self.dfs[interval].index.isin(new_row.index)], new_row]
+        # ).sort_index()
+
+        # 新作法：直接寫入環形緩衝區，O(1)
+        self.store.update(open_time=k["t"],
+                          o=float(k["o"]),
+                          h=float(k["h"]),
+                          l=float(k["l"]),
+                          c=self.latest_price,
+                          v=float(k["v"]),
+                          closed=k["x"])
+
+        # 通知訂閱的策略：只有資料到達時才需要計算
+        event = BarEvent(symbol=self.symbol,
+                         interval=interval or self.interval,
+                         open_time=k["t"],
+                         kind=BAR_CLOSE if k["x"] else BAR_UPDATE,
+                         close=self.latest_price,
+                         received_at=received_at)
+        self.bus.publish(event)
+        return event
 
     def _create_ws(self, interval):
         url = f"wss://stream.binance.com:9443/ws/{self.symbol}@kline_{interval}"
 
         def on_message(ws, message):
-            data = json.loads(message)
-            k = data["k"]
-            ts = datetime.fromtimestamp(k["t"] / 1000.0)
-
-            # volume = float(k["v"])
-            # print(f"volume: {volume}, type: {type(volume)}")
-            new_row = pd.DataFrame({
-                "open": [float(k["o"])],
-                "high": [float(k["h"])],
-                "low": [float(k["l"])],
-                "close": [float(k["c"])],
-                "volume": [float(k["v"])]
-            }, index=[ts])
-            self.latest_price = float(k["c"])
-
-
-            # # 更新對應 interval 的 DataFrame
-            # self.df = pd.concat(
-            #     [self.df[~self.df.index.isin(new_row.index)], new_row]
-            # ).sort_index()
-            #
-            # self.dfs[interval] = self.df # 改成每次都重設，確保有更新。
-
-
-            if interval not in self.dfs:
-                 self.dfs[interval] = self.df
-            self.dfs[interval] = pd.concat(
-                [ self.dfs[interval][~ self.dfs[interval].index.isin(new_row.index)], new_row]
-            ).sort_index()
-            # print("add one row:", new_row)
+            self.handle_message(message, interval, received_at=time.perf_counter())
+
+        def on_open(ws):
+            # 在處理任何新訊息之前先補洞，確保 K 棒連續
+            if self.gap_filler is not None:
+                self.gap_filler.fill(self.store)
 
         def on_error(ws, error):
             print(f"WebSocket {self.symbol} {interval} 錯誤:", error)
@@ -110,34 +149,49 @@ class KlineWebSocket:
         # ws = websocket.WebSocketApp(url, on_message=on_message, on_error=on_error, on_close=on_close)
         # ws.run_forever()
 
-        # 新作法：會重新連線。
+        # 新作法：會重新連線，直到 stop()。
         # Auto-reconnect loop
-        while True:
+        while not self._stop.is_set():
             try:
-                ws = websocket.WebSocketApp(
+                self.ws = self.ws_factory(
                     url,
+                    on_open=on_open,
                     on_message=on_message,
                     on_error=on_error,
                     on_close=on_close
                 )
-                ws.run_forever(ping_interval=20, ping_timeout=10)  # 可設定 ping 保活
+                self.ws.run_forever(ping_interval=20, ping_timeout=10)  # 可設定 ping 保活
             except Exception as e:
                 print(f"[EXCEPTION] WebSocket {self.symbol} {interval} exception: {e}")
-            print(f"[RECONNECT] Reconnecting WebSocket {self.symbol} {interval} in 5s...")
-            time.sleep(5)
+            if self._stop.is_set():
+                break
+            print(f"[RECONNECT] Reconnecting WebSocket {self.symbol} {interval} in {self.reconnect_delay}s...")
+            self._stop.wait(self.reconnect_delay)
 
     def start(self):
         """啟動所有 interval 的 WebSocket"""
+        if self.manager is not None:
+            # 共用連線：只需要訂閱，資料會寫進同一個 self.store
+            self.manager.subscribe(self.symbol, self.interval, store=self.store)
+            return
         t = threading.Thread(target=self._create_ws, args=(self.interval,), daemon=True)
         t.start()
         self.threads.append(t)
 
+    def stop(self):
+        """停止重新連線並關閉目前的連線"""
+        self._stop.set()
+        if self.ws is not None:
+            self.ws.close()
+
 
     def get_latest_price(self):
+        if self.manager is not None:
+            return self.manager.get_latest_price(self.symbol)
         return self.latest_price
 
     def get_dataframe(self)-> pd.DataFrame:
-        return self.df
+        return self.store.to_frame()
 
 
 if __name__ == '__main__':
@@ -150,7 +204,6 @@ if __name__ == '__main__':
     kws2.start()
 
     # 之後可以取資料
-    import time
     for i in range(10):
         time.sleep(10)  # 等 10 秒接收資料
 
@@ -0,0 +1,116 @@
+"""
+websocket 重連後的 K 線補洞 (REST gap-fill on reconnect)
+
+斷線期間收盤的 K 棒不會再從 websocket 送來，KlineRingBuffer 會留下一段空洞，
+讓 EMA120、平均量等指標悄悄算錯。重新連線時：
+1. 從緩衝區最後一根 K 棒的開盤時間開始 (含這一根，因為斷線時它可能還沒收盤)，
+2. 以 get_klines(start_time=...) 分頁抓到現在，
+3. 寫回緩衝區；相同開盤時間會原位覆蓋，所以重複補同一段也不會產生重複的 K 棒 (idempotent)。
+   REST 會連同還沒收盤的最後一根一起回傳：收盤時間 (open_time + interval - 1) >= 現在的 K 棒以 closed=False 寫入，
+   指標不會把未完成的 K 棒當成已收盤。
+
+補洞必須在處理新的 websocket 訊息之前完成 (同步的 on_open，或 asyncio 版先補洞再消化佇列)，
+否則比最新 K 棒還舊的資料會被緩衝區忽略。
+"""
+import time
+
+import pandas as pd
+
+from rpa_qt.price_utils.price_binance import INTERVAL_MS, get_klines
+
+PAGE_LIMIT = 1000  # Binance klines 單次最多 1000 根
+
+
+class KlineGapFiller:
+    def __init__(self, symbol: str, interval: str, fetch=get_klines, page_limit: int = PAGE_LIMIT,
+                 max_pages: int = 50):
+        """
+        :param fetch: 取 K 線的函式，介面同 price_binance.get_klines，測試時可替換
+        :param max_pages: 單次補洞最多抓幾頁，避免長時間斷線後一次打太多 REST 請求
+        """
+        self.symbol = symbol
+        self.interval = interval
+        self.interval_ms = INTERVAL_MS[interval]
+        self.fetch = fetch
+        self.page_limit = page_limit
+        self.max_pages = max_pages
+
+        # 監控數據
+        self.stats = {
+            "fills": 0,  # 補洞次數
+            "requests": 0,  # REST 請求次數
+            "bars_recovered": 0,  # 累計補回的 K 棒數
+            "last_bars_recovered": 0,
+            "last_latency": None,  # 最近一次補洞花費的秒數
+            "max_latency": 0.0,
+            "errors": 0,
+        }
+
+    def fill(self, store, now_ms: int = None) -> int:
+        """
+        補上 store 最後一根 K 棒之後缺漏的資料。
+
+        :return: 補回的 K 棒數
+        """
+        last = store.last_open_time()
+        if last is None:
+            return 0
+        fixed_now = now_ms
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        if now_ms - last < self.interval_ms:
+            # 最後一根還沒收盤，websocket 會繼續更新它
+            return 0
+
+        started = time.perf_counter()
+        recovered = 0
+        start_time = last
+        try:
+            for _ in range(self.max_pages):
+                # 請求前的時間：收盤時間早於這個時間的 K 棒在伺服器端一定已經收盤
+                now_ms = int(time.time() * 1000) if fixed_now is None else fixed_now
+                df = self.fetch(symbol=self.symbol, interval=self.interval, limit=self.page_limit,
+                                start_time=start_time, verbose=False)
+                self.stats["requests"] += 1
+                if df is None or df.empty:
+                    break
+                forming = self._forming(df, store, now_ms)
+                recovered += store.load_dataframe(df[~forming])
+                recovered += store.load_dataframe(df[forming], closed=False)
+                if len(df) < self.page_limit:
+                    break
+                start_time = store.last_open_time() + 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"[GAP-FILL] {self.symbol} {self.interval} 補資料失敗: {e}")
+
+        latency = time.perf_counter() - started
+        self.stats["fills"] += 1
+        self.stats["bars_recovered"] += recovered
+        self.stats["last_bars_recovered"] = recovered
+        self.stats["last_latency"] = latency
+        self.stats["max_latency"] = max(self.stats["max_latency"], latency)
+        if recovered:
+            print(f"[GAP-FILL] {self.symbol} {self.interval} 補回 {recovered} 根 K 棒，耗時 {latency:.2f}s")
+        return recovered
+
+    def _forming(self, df, store, now_ms: int):
+        """收盤時間 (open_time + interval - 1) >= now_ms 的 K 棒，即還沒收盤。"""
+        index = pd.DatetimeIndex(df.index)
+        if index.tz is None:
+            index = index.tz_localize(store.tz)
+        return index.as_unit("ms").asi8 + self.interval_ms > now_ms
+
+
+if __name__ == '__main__':
+    from rpa_qt.price_utils.kline_store import KlineRingBuffer
+
+    store = KlineRingBuffer(capacity=3000)
+    store.load_dataframe(get_klines(symbol="SOLUSDT", interval="1m", limit=500))
+    # 模擬斷線：丟掉最後 200 根 K 棒 (用前 300 根重建緩衝區)
+    gap_store = KlineRingBuffer(capacity=3000)
+    gap_store.load_dataframe(store.to_frame().iloc[:300])
+
+    filler = KlineGapFiller(symbol="SOLUSDT", interval="1m", page_limit=100)
+    filler.fill(gap_store)
+    filler.fill(gap_store)  # 重複補不會產生重複的 K 棒
+    print(filler.stats, len(gap_store))
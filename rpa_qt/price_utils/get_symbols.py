@@ -6,6 +6,7 @@ import requests
 from bs4 import BeautifulSoup
 
 from rpa_qt.db.df_utils import df_to_csv, csv_to_df
+from rpa_qt.price_utils.ohlcv_cache import get_ohlcv
 
 
 # get TW and TWO stock symbols from yfinance
@@ -67,6 +68,7 @@ def fetch_twse_tickers():
 def filter_by_volume(df: pd.DataFrame, min_volume: int = 1000) -> pd.DataFrame:
     avg_volumes = []
     filtered_symbols = []
+    start = pd.Timestamp.today().normalize() - pd.DateOffset(months=3)  # 近 3 個月
     for symbol in df['symbol']:
         # 確保 symbol 轉成字串
         symbol_str = str(symbol)
@@ -77,8 +79,9 @@ def filter_by_volume(df: pd.DataFrame, min_volume: int = 1000) -> pd.DataFrame:
         # 上市加 .TW，上櫃加 .TWO
         ticker = symbol_str + ('.TW' if market == '上市' else '.TWO')
 
-        stock = yf.Ticker(ticker)
-        hist = stock.history(period="3mo")
+        # stock = yf.Ticker(ticker)
+        # hist = stock.history(period="3mo")
+        hist = get_ohlcv(ticker, start) # 經由本機快取，只下載快取之後的新資料
 
         # 計算平均成交量
         avg_volume = hist['Volume'].mean() if not hist.empty else 0
@@ -0,0 +1,243 @@
+"""
+Binance 歷史 K 線下載器 (Paginated, concurrent historical kline downloader)
+
+price_binance.get_klines 一次只能取 limit 根 (最多 1000)，回測與 1s/1m 的 EMA120 暖機需要數個月的資料。
+KlineHistory：
+* 以 startTime / endTime 分頁，多執行緒並行下載。
+* 依 Binance REST 的權重限制 (request weight per minute) 控制速度，並參考回應 header
+  X-MBX-USED-WEIGHT-1M；收到 429 / 418 時依 Retry-After 等待。
+* 共用 requests.Session (連線池)，不再每次建立新連線。
+* 結果存成本機的欄式快取 (columnar cache)，依 symbol / interval / 日期 (UTC) 分割：
+      <cache_dir>/<SYMBOL>/<interval>/<YYYY-MM-DD>.npz
+  每個檔案以欄為單位存 open_time 與 OHLCV 陣列。已經完整的日期下次不會再下載，
+  今天這種尚未結束的日期從已快取的最後一根開始補 (最後一根存檔時通常還沒收盤，會重新下載覆蓋)。
+
+使用方式：
+    history = KlineHistory()
+    df = history.fetch("SOLUSDT", "1m", start="2025-06-01", end="2025-09-01")
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from rpa_qt.price_utils.kline_store import COLUMNS, TIMEZONE
+from rpa_qt.price_utils.price_binance import BINANCE_API_URL, INTERVAL_MS
+from rpa_qt.root import ROOT_DIR
+
+CACHE_DIR = os.path.join(ROOT_DIR, "cache", "klines")
+PAGE_LIMIT = 1000  # klines 單次最多 1000 根
+KLINES_WEIGHT = 2  # limit 101~1000 時每次請求的權重
+WEIGHT_PER_MINUTE = 2400  # 保守使用的權重上限 (Binance spot 目前為每分鐘 6000)
+DAY_MS = 86_400_000
+
+
+def to_ms(value, tz: str = TIMEZONE) -> int:
+    """把 'YYYY-MM-DD' / datetime / pd.Timestamp / ms 轉成 UTC ms；沒有時區的時間視為台北時間。"""
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is None:
+        ts = ts.tz_localize(tz)
+    return int(ts.tz_convert("UTC").value // 1_000_000)
+
+
+class WeightBudget:
+    """每分鐘權重額度的 token bucket，讓多個下載執行緒共用。"""
+
+    def __init__(self, weight_per_minute: int = WEIGHT_PER_MINUTE):
+        self.capacity = weight_per_minute
+        self.tokens = float(weight_per_minute)
+        self.rate = weight_per_minute / 60.0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, weight: int):
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= weight:
+                    self.tokens -= weight
+                    return
+                wait = (weight - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def observe(self, used_weight: int, limit: int):
+        """依伺服器回報的已用權重調整：接近上限時把額度清空，等待自然回補。"""
+        if used_weight >= limit * 0.9:
+            with self.lock:
+                self.tokens = min(self.tokens, 0.0)
+
+    def pause(self, seconds: float):
+        with self.lock:
+            self.tokens = -seconds * self.rate
+
+
+class KlineHistory:
+    def __init__(self, cache_dir: str = CACHE_DIR, max_workers: int = 8,
+                 weight_per_minute: int = WEIGHT_PER_MINUTE, session: requests.Session = None,
+                 page_limit: int = PAGE_LIMIT, server_weight_limit: int = 6000):
+        """
+        :param cache_dir: 本機快取目錄
+        :param max_workers: 並行下載的執行緒數
+        :param weight_per_minute: 自行控制的每分鐘權重上限
+        :param session: 共用的 requests.Session，None 則建立一個有連線池的 Session
+        :param server_weight_limit: 伺服器的每分鐘權重上限，用來解讀 X-MBX-USED-WEIGHT-1M
+        """
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.page_limit = page_limit
+        self.server_weight_limit = server_weight_limit
+        self.budget = WeightBudget(weight_per_minute)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+            session.mount("https://", adapter)
+        self.session = session
+        self.stats = {"requests": 0, "retries": 0, "bars_downloaded": 0, "partitions_written": 0}
+        self._stats_lock = threading.Lock()
+
+    # -------- REST --------
+    def _request(self, symbol: str, interval: str, start_ms: int, end_ms: int) -> list:
+        params = {"symbol": symbol, "interval": interval, "limit": self.page_limit,
+                  "startTime": start_ms, "endTime": end_ms}
+        while True:
+            self.budget.acquire(KLINES_WEIGHT)
+            resp = self.session.get(BINANCE_API_URL, params=params, timeout=10)
+            with self._stats_lock:
+                self.stats["requests"] += 1
+            used = resp.headers.get("X-MBX-USED-WEIGHT-1M")
+            if used is not None:
+                self.budget.observe(int(used), self.server_weight_limit)
+            if resp.status_code in (418, 429):
+                # 超過限制：依 Retry-After 暫停所有執行緒
+                retry_after = float(resp.headers.get("Retry-After", 60))
+                print(f"[KlineHistory] rate limited ({resp.status_code})，等待 {retry_after:.0f}s")
+                self.budget.pause(retry_after)
+                with self._stats_lock:
+                    self.stats["retries"] += 1
+                continue
+            resp.raise_for_status()
+            return resp.json()
+
+    # -------- 快取 --------
+    def _partition_path(self, symbol: str, interval: str, day_ms: int) -> str:
+        day = pd.Timestamp(day_ms, unit="ms").strftime("%Y-%m-%d")
+        return os.path.join(self.cache_dir, symbol, interval, f"{day}.npz")
+
+    @staticmethod
+    def _load_partition(path: str):
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as f:
+            return f["open_time"], f["ohlcv"], bool(f["complete"])
+
+    def _save_partition(self, path: str, open_time: np.ndarray, ohlcv: np.ndarray, complete: bool):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp.npz"
+        np.savez(tmp, open_time=open_time, ohlcv=ohlcv, complete=np.bool_(complete))
+        os.replace(tmp, path)  # 原子替換，避免讀到寫一半的檔案
+        with self._stats_lock:
+            self.stats["partitions_written"] += 1
+
+    def cached_days(self, symbol: str, interval: str) -> list:
+        folder = os.path.join(self.cache_dir, symbol.upper(), interval)
+        if not os.path.isdir(folder):
+            return []
+        return sorted(name[:-4] for name in os.listdir(folder) if name.endswith(".npz") and ".tmp" not in name)
+
+    # -------- 下載 --------
+    def fetch(self, symbol: str, interval: str, start, end=None) -> pd.DataFrame:
+        """
+        取得 [start, end) 的 K 線，只下載快取中沒有的部分。
+
+        :param start: 起始時間 ('YYYY-MM-DD'、datetime 或 UTC ms)；沒有時區的時間視為台北時間
+        :param end: 結束時間，None 表示到現在
+        :return: 與 get_klines 相同格式的 DataFrame (index 為台北時間的 ts，欄位為 ohlcv)
+        """
+        symbol = symbol.upper()
+        iv = INTERVAL_MS[interval]
+        now_ms = int(time.time() * 1000)
+        start_ms = to_ms(start)
+        end_ms = min(to_ms(end) if end is not None else now_ms, now_ms)
+
+        days = range(start_ms - start_ms % DAY_MS, end_ms, DAY_MS)
+        partitions = {}
+        tasks = []  # (day_ms, page_start, page_end)
+        for day_ms in days:
+            path = self._partition_path(symbol, interval, day_ms)
+            part = self._load_partition(path)
+            if part is not None and part[2]:
+                partitions[day_ms] = part
+                continue
+            # 不完整的日期：從已快取的最後一根開始補，這一根存檔時可能還沒收盤，重新下載後以新值覆蓋
+            fetch_from = day_ms
+            if part is not None and len(part[0]):
+                fetch_from = int(part[0][-1])
+            fetch_to = min(day_ms + DAY_MS, now_ms + 1)
+            for page_start in range(fetch_from, fetch_to, iv * self.page_limit):
+                tasks.append((day_ms, page_start, min(page_start + iv * self.page_limit, fetch_to) - 1))
+            partitions[day_ms] = part
+
+        if tasks:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                results = list(pool.map(lambda t: (t[0], self._request(symbol, interval, t[1], t[2])), tasks))
+
+            downloaded = {}
+            for day_ms, rows in results:
+                downloaded.setdefault(day_ms, []).extend(rows)
+            for day_ms in {t[0] for t in tasks}:
+                rows = downloaded.get(day_ms, [])
+                open_time = np.array([r[0] for r in rows], dtype=np.int64)
+                ohlcv = np.array([r[1:6] for r in rows], dtype=np.float64).reshape(-1, len(COLUMNS))
+                old = partitions.get(day_ms)
+                if old is not None:
+                    open_time = np.concatenate([old[0], open_time])
+                    ohlcv = np.concatenate([old[1], ohlcv])
+                # 依開盤時間排序並去除重複 (保留最後下載的值)
+                order = np.argsort(open_time, kind="stable")
+                open_time, ohlcv = open_time[order], ohlcv[order]
+                keep = np.append(open_time[1:] != open_time[:-1], True) if len(open_time) else np.array([], bool)
+                open_time, ohlcv = open_time[keep], ohlcv[keep]
+                # 這一天已經結束，且最後一根 K 棒也已收盤，才算完整
+                complete = day_ms + DAY_MS + iv <= now_ms
+                self._save_partition(self._partition_path(symbol, interval, day_ms), open_time, ohlcv, complete)
+                partitions[day_ms] = (open_time, ohlcv, complete)
+                with self._stats_lock:
+                    self.stats["bars_downloaded"] += len(rows)
+
+        parts = [partitions[d] for d in days if partitions.get(d) is not None]
+        if parts:
+            open_time = np.concatenate([p[0] for p in parts])
+            ohlcv = np.concatenate([p[1] for p in parts])
+        else:
+            open_time = np.array([], dtype=np.int64)
+            ohlcv = np.empty((0, len(COLUMNS)))
+        mask = (open_time >= start_ms) & (open_time < end_ms)
+        index = (pd.to_datetime(open_time[mask], unit="ms", utc=True)
+                 .tz_convert(TIMEZONE)
+                 .tz_localize(None)
+                 .rename("ts"))
+        return pd.DataFrame(ohlcv[mask], index=index, columns=COLUMNS)
+
+
+if __name__ == '__main__':
+    history = KlineHistory()
+    started = time.perf_counter()
+    df = history.fetch("SOLUSDT", "1m", start=pd.Timestamp.now() - pd.Timedelta(days=30))
+    print(f"第一次：{len(df)} 根，{time.perf_counter() - started:.1f}s，{history.stats}")
+
+    started = time.perf_counter()
+    df = history.fetch("SOLUSDT", "1m", start=pd.Timestamp.now() - pd.Timedelta(days=30))
+    print(f"第二次 (快取)：{len(df)} 根，{time.perf_counter() - started:.1f}s，{history.stats}")
+    print(df.tail())
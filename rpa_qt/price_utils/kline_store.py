@@ -0,0 +1,218 @@
+"""
+K 線環形緩衝區 (Kline ring buffer)
+
+取代 KlineWebSocket 每收到一筆訊息就 pd.concat + sort_index 重建整張表的作法：
+* 預先配置固定容量的 NumPy 陣列，以 kline 開盤時間 (open time, ms) 為鍵。
+* 同一根尚未收盤的 K 棒 (forming bar) 直接在原位更新。
+* 只有出現新的開盤時間才會 append，超過容量時自動覆蓋最舊的資料。
+* 陣列採「鏡像寫入」：每筆資料同時寫在 slot 與 slot+capacity，
+  因此任何時刻最近 n 根 K 棒在記憶體中都是連續的，可以零複製 (zero-copy) 取出。
+
+使用方式：
+    store = KlineRingBuffer(capacity=1000)
+    store.load_dataframe(get_klines(symbol="SOLUSDT", interval="1m", limit=500))
+    store.update(open_time=k["t"], o=..., h=..., l=..., c=..., v=..., closed=k["x"])
+    df = store.to_frame()      # 零複製 DataFrame view
+    arr = store.close()        # 零複製 np.ndarray view
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ["open", "high", "low", "close", "volume"]
+OPEN, HIGH, LOW, CLOSE, VOLUME = range(len(COLUMNS))
+
+TIMEZONE = "Asia/Taipei"  # 與 price_binance.get_klines 的 index 時區一致
+
+
+class KlineRingBuffer:
+    def __init__(self, capacity: int = 1000, tz: str = TIMEZONE):
+        """
+        :param capacity: 最多保留幾根 K 棒
+        :param tz: DataFrame index 使用的時區 (轉換後去掉時區資訊，與 get_klines 相同)
+        """
+        if capacity <= 0:
+            raise ValueError(f"capacity must be positive: {capacity}")
+        self.capacity = capacity
+        self.tz = tz
+        self.lock = threading.RLock()
+
+        # 鏡像配置 2 倍容量，保證視窗永遠連續
+        self._ohlcv = np.zeros((2 * capacity, len(COLUMNS)), dtype=np.float64)
+        self._open_time = np.zeros(2 * capacity, dtype=np.int64)
+        self._closed = np.zeros(2 * capacity, dtype=bool)
+        self._count = 0  # 累計 append 過的 K 棒數 (不會因覆蓋而減少)
+
+        # DataFrame index 快取：只有新增 K 棒時才需要重建
+        self._index_cache = None
+        self._index_key = None
+
+    # -------- 寫入 --------
+    def _slot(self, n: int) -> int:
+        return n % self.capacity
+
+    def _write(self, slot: int, open_time: int, values, closed: bool):
+        for pos in (slot, slot + self.capacity):
+            self._open_time[pos] = open_time
+            self._ohlcv[pos] = values
+            self._closed[pos] = closed
+
+    def update(self, open_time: int, o: float, h: float, l: float, c: float, v: float,
+               closed: bool = False) -> bool:
+        """
+        更新或新增一根 K 棒。
+
+        :param open_time: K 棒開盤時間 (ms)，即 websocket 訊息中的 k["t"]
+        :param closed: K 棒是否已收盤，即 k["x"]
+        :return: True 表示新增了一根 K 棒；False 表示原位更新 (或忽略過期資料)
+        """
+        open_time = int(open_time)
+        values = (o, h, l, c, v)
+        with self.lock:
+            if self._count > 0:
+                last_slot = self._slot(self._count - 1)
+                last_time = self._open_time[last_slot]
+                if open_time == last_time:
+                    self._write(last_slot, open_time, values, closed)
+                    return False
+                if open_time < last_time:
+                    # 較舊的 K 棒：若仍在緩衝區內則原位修正，否則忽略
+                    slot = self._find_slot(open_time)
+                    if slot is not None:
+                        self._write(slot, open_time, values, closed)
+                    return False
+            self._write(self._slot(self._count), open_time, values, closed)
+            self._count += 1
+            return True
+
+    def _find_slot(self, open_time: int):
+        start, size = self._window()
+        times = self._open_time[start:start + size]
+        i = int(np.searchsorted(times, open_time))
+        if i < size and times[i] == open_time:
+            return self._slot(start + i)
+        return None
+
+    def load_dataframe(self, df: pd.DataFrame, closed: bool = True):
+        """
+        從 get_klines 回傳的 DataFrame (index 為 ts，欄位含 open/high/low/close/volume) 載入歷史資料。
+        已存在的開盤時間會原位覆蓋，因此重複載入同一段資料不會產生重複的 K 棒。
+
+        :return: 新增的 K 棒數
+        """
+        if df is None or df.empty:
+            return 0
+        index = pd.DatetimeIndex(df.index)
+        if index.tz is None:
+            index = index.tz_localize(self.tz)
+        open_times = index.as_unit("ms").asi8
+        values = df[COLUMNS].to_numpy(dtype=np.float64)
+        appended = 0
+        with self.lock:
+            for t, row in zip(open_times, values):
+                appended += self.update(t, *row, closed=closed)
+        return appended
+
+    # -------- 讀取 --------
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    @property
+    def empty(self) -> bool:
+        return self._count == 0
+
+    def _window(self, last: int = None):
+        size = len(self)
+        if last is not None:
+            size = min(size, last)
+        start = self._slot(self._count - size) if size else 0
+        return start, size
+
+    def values(self, last: int = None) -> np.ndarray:
+        """回傳 (n, 5) 的 OHLCV 陣列 view (零複製)，欄位順序同 COLUMNS。"""
+        start, size = self._window(last)
+        return self._ohlcv[start:start + size]
+
+    def open_times(self, last: int = None) -> np.ndarray:
+        start, size = self._window(last)
+        return self._open_time[start:start + size]
+
+    def closed_flags(self, last: int = None) -> np.ndarray:
+        start, size = self._window(last)
+        return self._closed[start:start + size]
+
+    def close(self, last: int = None) -> np.ndarray:
+        return self.values(last)[:, CLOSE]
+
+    def volume(self, last: int = None) -> np.ndarray:
+        return self.values(last)[:, VOLUME]
+
+    def last_open_time(self):
+        if self._count == 0:
+            return None
+        return int(self._open_time[self._slot(self._count - 1)])
+
+    def last_bar(self):
+        """回傳最新一根 K 棒 (open_time, ohlcv 複本, closed)，沒有資料則為 None。"""
+        with self.lock:
+            if self._count == 0:
+                return None
+            slot = self._slot(self._count - 1)
+            return int(self._open_time[slot]), self._ohlcv[slot].copy(), bool(self._closed[slot])
+
+    def _index(self, start: int, size: int) -> pd.DatetimeIndex:
+        key = (self._count, size)
+        if self._index_key != key:
+            self._index_cache = (pd.to_datetime(self._open_time[start:start + size], unit="ms", utc=True)
+                                 .tz_convert(self.tz)
+                                 .tz_localize(None))
+            self._index_key = key
+        return self._index_cache
+
+    def to_frame(self, last: int = None) -> pd.DataFrame:
+        """
+        以 DataFrame 形式取出最近 last 根 K 棒 (預設全部)。
+        數值部分與緩衝區共用記憶體 (零複製)，forming bar 更新時會直接反映在回傳的 frame 上；
+        若需要穩定的快照請使用 snapshot()。
+        """
+        with self.lock:
+            start, size = self._window(last)
+            return pd.DataFrame(self._ohlcv[start:start + size],
+                                index=self._index(start, size),
+                                columns=COLUMNS,
+                                copy=False)
+
+    def snapshot(self, last: int = None) -> pd.DataFrame:
+        """取出最近 last 根 K 棒的複本，給跨執行緒讀取 (例如 Dash callback) 使用。"""
+        with self.lock:
+            start, size = self._window(last)
+            return pd.DataFrame(self._ohlcv[start:start + size].copy(),
+                                index=self._index(start, size),
+                                columns=COLUMNS)
+
+
+if __name__ == '__main__':
+    import time
+
+    store = KlineRingBuffer(capacity=5)
+    t0 = 1_700_000_000_000
+    for i in range(8):
+        store.update(t0 + i * 1000, 1.0 + i, 2.0 + i, 0.5 + i, 1.5 + i, 10.0)
+        store.update(t0 + i * 1000, 1.0 + i, 2.5 + i, 0.5 + i, 1.8 + i, 12.0, closed=True)
+    print(store.to_frame())
+
+    # 與原本 pd.concat 作法的效能比較
+    n = 5000
+    store = KlineRingBuffer(capacity=1000)
+    start = time.perf_counter()
+    for i in range(n):
+        store.update(t0 + i * 1000, 1.0, 2.0, 0.5, 1.5, 10.0)
+    print(f"ring buffer: {(time.perf_counter() - start) / n * 1e6:.2f} us/msg")
+
+    df = pd.DataFrame({c: [1.0] for c in COLUMNS}, index=[pd.Timestamp(t0 - 1000, unit="ms")])
+    start = time.perf_counter()
+    for i in range(n):
+        new_row = pd.DataFrame({c: [1.0] for c in COLUMNS}, index=[pd.Timestamp(t0 + i * 1000, unit="ms")])
+        df = pd.concat([df[~df.index.isin(new_row.index)], new_row]).sort_index()
+    print(f"pd.concat:   {(time.perf_counter() - start) / n * 1e6:.2f} us/msg")
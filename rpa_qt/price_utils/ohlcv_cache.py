@@ -0,0 +1,321 @@
+"""
+台股日 K 本機快取 (Local columnar OHLCV cache in front of yfinance)
+
+反彈掃描、成交量篩選、波段回測、0050 回測原本每次執行都直接 yf.download / Ticker.history，
+全市場掃描每天都把每一檔的 6 個月資料重新下載一次。這裡在 yfinance 前面加一層共用快取：
+* 每檔股票一個檔案：<cache_dir>/<ticker>.npz，以欄為單位存日期與
+  Open / High / Low / Close / Adj Close / Volume / Dividends / Stock Splits 陣列。
+* 增量下載：只抓快取最後一天 (含，因為當天可能還沒收盤) 之後的資料；
+  要求的起始日比快取更早時才補抓前段。
+* 除權息調整：新抓到的資料若有除息 (Dividends) 或分割 (Stock Splits)，
+  依 Yahoo 的算法把快取中較舊的 Adj Close / 價量一併調整，不必整段重抓。
+* 多檔一起要時，需要連網的股票每 BATCH_SIZE 檔合併成一次 yf.download，以執行緒池並行下載。
+* 下載失敗 (例外) 或沒有抓到新資料時不寫快取、不更新 fetched_at，下次呼叫會再試，不會被當成新資料直到過期。
+* 統一入口 get_ohlcv(tickers, start, end)，yf_api、tw_rebound_scanner、get_symbols、
+  trading_swing / swing_02、backtest_0050 都改用這裡。
+
+使用方式：
+    df = get_ohlcv("2330.TW", "2024-01-01", "2025-01-01")
+    dfs = get_ohlcv(["2330.TW", "2317.TW"], "2024-01-01")  # dict: ticker -> DataFrame
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+from rpa_qt.root import ROOT_DIR
+
+CACHE_DIR = os.path.join(ROOT_DIR, "cache", "ohlcv")
+PRICE_COLUMNS = ["Open", "High", "Low", "Close", "Adj Close"]
+COLUMNS = PRICE_COLUMNS + ["Volume", "Dividends", "Stock Splits"]
+REFRESH_SECONDS = 3600  # 一小時內抓過就不再連網 (盤中最後一根會在下次更新時覆蓋)
+BATCH_SIZE = 100  # 每次 yf.download 合併下載的股票數
+MAX_WORKERS = 4
+
+# 舊版 yfinance 的 download() 共用模組層級的暫存 (shared._DFS)，同時呼叫會互相覆蓋，只能排隊；
+# 新版每次呼叫有自己的 _DownloadCtx，可以並行。
+_YF_THREAD_SAFE = hasattr(getattr(yf, "multi", None), "_DownloadCtx")
+_yf_lock = threading.Lock()
+
+
+def _to_date(value) -> pd.Timestamp:
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is not None:
+        ts = ts.tz_localize(None)
+    return ts.normalize()
+
+
+def _normalize(df: pd.DataFrame) -> pd.DataFrame:
+    """整理 yfinance 回傳的單一股票資料：無時區日期 index、固定欄位順序、去掉全空的列。"""
+    if df is None or df.empty:
+        return pd.DataFrame(columns=COLUMNS, index=pd.DatetimeIndex([], name="Date"), dtype=float)
+    df = df.copy()
+    if df.index.tz is not None:
+        df.index = df.index.tz_localize(None)
+    df.index = df.index.normalize()
+    df.index.name = "Date"
+    for col in COLUMNS:
+        if col not in df.columns:
+            df[col] = np.nan if col == "Adj Close" else 0.0
+    if df["Adj Close"].isna().all():
+        df["Adj Close"] = df["Close"]
+    df = df[COLUMNS].astype(float)
+    df[["Dividends", "Stock Splits"]] = df[["Dividends", "Stock Splits"]].fillna(0.0)
+    df = df.dropna(subset=["Close"])
+    return df[~df.index.duplicated(keep="last")].sort_index()
+
+
+def download(tickers: List[str], start, end=None) -> Dict[str, pd.DataFrame]:
+    """
+    以 yf.download 下載 (未調整價格 + 除權息事件)，回傳 ticker -> 整理過的 DataFrame。
+    沒有資料的股票不會出現在結果中。
+    """
+    if _YF_THREAD_SAFE:
+        raw = yf.download(tickers, start=start, end=end, interval="1d", auto_adjust=False, actions=True,
+                          group_by="ticker", progress=False, threads=True)
+    else:
+        with _yf_lock:
+            raw = yf.download(tickers, start=start, end=end, interval="1d", auto_adjust=False, actions=True,
+                              group_by="ticker", progress=False, threads=True)
+    result = {}
+    if raw is None or raw.empty:
+        return result
+    for ticker in tickers:
+        if isinstance(raw.columns, pd.MultiIndex):
+            if ticker in raw.columns.get_level_values(0):
+                df = raw[ticker]
+            elif ticker in raw.columns.get_level_values(-1):
+                df = raw.xs(ticker, axis=1, level=-1)
+            else:
+                continue
+        else:
+            df = raw
+        df = _normalize(df)
+        if not df.empty:
+            result[ticker] = df
+    return result
+
+
+class OhlcvCache:
+    def __init__(self, cache_dir: str = CACHE_DIR, refresh_seconds: float = REFRESH_SECONDS,
+                 downloader=download):
+        """
+        :param cache_dir: 快取目錄
+        :param refresh_seconds: 距離上次連網更新少於這個秒數時直接用快取
+        :param downloader: 下載函式，介面同 download(tickers, start, end)，測試時可替換
+        """
+        self.cache_dir = cache_dir
+        self.refresh_seconds = refresh_seconds
+        self.downloader = downloader
+        self.stats = {"hits": 0, "downloads": 0, "adjustments": 0}
+
+    # -------- 檔案 --------
+    def _path(self, ticker: str) -> str:
+        return os.path.join(self.cache_dir, f"{ticker}.npz")
+
+    def load(self, ticker: str):
+        """回傳 (DataFrame, meta)；meta 包含 first_requested (最早要求過的日期) 與 fetched_at。"""
+        path = self._path(ticker)
+        if not os.path.exists(path):
+            return None, None
+        with np.load(path) as f:
+            df = pd.DataFrame(f["values"], index=pd.DatetimeIndex(f["dates"].astype("datetime64[ns]"), name="Date"),
+                              columns=COLUMNS)
+            meta = {"first_requested": pd.Timestamp(int(f["first_requested"])),
+                    "fetched_at": float(f["fetched_at"])}
+        return df, meta
+
+    def save(self, ticker: str, df: pd.DataFrame, first_requested: pd.Timestamp, fetched_at: float = None):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(ticker)
+        tmp = f"{path}.{threading.get_ident()}.tmp.npz"
+        np.savez(tmp,
+                 dates=df.index.values.astype("datetime64[ns]").astype(np.int64),
+                 values=df[COLUMNS].to_numpy(dtype=np.float64),
+                 first_requested=np.int64(first_requested.value),
+                 fetched_at=np.float64(time.time() if fetched_at is None else fetched_at))
+        os.replace(tmp, path)  # 原子替換，避免讀到寫一半的檔案
+
+    # -------- 除權息調整 --------
+    @staticmethod
+    def apply_actions(cached: pd.DataFrame, fresh: pd.DataFrame, since: pd.Timestamp) -> pd.DataFrame:
+        """
+        fresh 中晚於 since (上次下載的最後一天) 的除權息事件會改變舊資料的調整後價格：
+        * 分割 r：事件日之前的價格 / r、成交量 * r (Yahoo 的 Close 已做分割調整)
+        * 除息 d：事件日之前的 Adj Close * (1 - d / 前一日收盤)
+        """
+        cached = cached.copy()
+        events = fresh[(fresh.index > since) & ((fresh["Dividends"] > 0) | (fresh["Stock Splits"] > 0))]
+        for date, row in events.iterrows():
+            before = cached.index < date
+            if row["Stock Splits"] > 0:
+                ratio = row["Stock Splits"]
+                cached.loc[before, PRICE_COLUMNS] /= ratio
+                cached.loc[before, "Volume"] *= ratio
+            if row["Dividends"] > 0:
+                prev = fresh[fresh.index < date]["Close"]
+                prev_close = prev.iloc[-1] if len(prev) else cached["Close"].iloc[-1]
+                cached.loc[before, "Adj Close"] *= 1 - row["Dividends"] / prev_close
+        return cached
+
+    # -------- 讀取 --------
+    def get(self, ticker: str, start, end=None) -> pd.DataFrame:
+        """取得單一股票 [start, end) 的日 K，必要時增量下載並更新快取。"""
+        return self.get_many([ticker], start, end)[ticker]
+
+    def get_many(self, tickers: List[str], start, end=None, batch_size: int = BATCH_SIZE,
+                 max_workers: int = MAX_WORKERS) -> Dict[str, pd.DataFrame]:
+        """
+        取得多檔股票 [start, end) 的日 K。
+        需要連網的股票依下載區間分組，每 batch_size 檔合併成一次 yf.download，並以執行緒池並行下載。
+
+        :return: dict: ticker -> DataFrame (沒有資料的股票為空的 DataFrame)
+        """
+        start = _to_date(start)
+        end = _to_date(end) if end is not None else None
+        tickers = list(dict.fromkeys(tickers))
+
+        # 1. 讀快取並規劃要下載的區間：(fetch_start, fetch_end) -> [ticker]
+        cached, metas, plans = {}, {}, {}
+        for ticker in tickers:
+            df, meta = self.load(ticker)
+            cached[ticker], metas[ticker] = df, meta
+            if df is None or df.empty:
+                plans.setdefault((start, None), []).append(ticker)
+                continue
+            if start < meta["first_requested"]:
+                # 補抓前段
+                plans.setdefault((start, df.index[0]), []).append(ticker)
+            stale = time.time() - meta["fetched_at"] > self.refresh_seconds
+            if stale and (end is None or end > df.index[-1] + pd.Timedelta(days=1)):
+                # 從快取最後一天開始重抓 (最後一天可能是盤中資料)
+                plans.setdefault((df.index[-1], None), []).append(ticker)
+            elif start >= meta["first_requested"]:
+                self.stats["hits"] += 1
+
+        # 2. 分批下載
+        downloaded, failed = self._download_batches(plans, batch_size, max_workers)
+
+        # 3. 合併、調整並寫回快取
+        result = {}
+        for ticker in tickers:
+            df, meta = cached[ticker], metas[ticker]
+            if df is None or df.empty:
+                df = downloaded.get((start, None), {}).get(ticker)
+                if df is not None and not df.empty:
+                    self.save(ticker, df, start)
+                else:
+                    df = _normalize(None)  # 失敗或沒有資料：不寫快取，下次再試
+            else:
+                changed = refreshed = False
+                head_key = (start, df.index[0])
+                tail_key = (df.index[-1], None)
+                if ticker in plans.get(head_key, ()):
+                    head = downloaded.get(head_key, {}).get(ticker)
+                    if head is not None and not head.empty:
+                        df = pd.concat([head[head.index < df.index[0]], df])
+                    # 下載成功但沒有更早的資料 (例如上市日較晚) 也記下 first_requested，失敗才下次再補
+                    changed = (head_key, ticker) not in failed
+                if ticker in plans.get(tail_key, ()):
+                    fresh = downloaded.get(tail_key, {}).get(ticker)
+                    if fresh is not None and not fresh.empty:
+                        old = df[df.index < fresh.index[0]]
+                        if len(old):
+                            adjusted = self.apply_actions(old, fresh, tail_key[0])
+                            if not adjusted.equals(old):
+                                self.stats["adjustments"] += 1
+                            old = adjusted
+                        df = pd.concat([old, fresh])
+                        changed = refreshed = True
+                if changed:
+                    df = df[~df.index.duplicated(keep="last")].sort_index()
+                    # 只有最後一段真的抓到資料才更新 fetched_at
+                    self.save(ticker, df, min(start, meta["first_requested"]),
+                              fetched_at=None if refreshed else meta["fetched_at"])
+
+            mask = df.index >= start
+            if end is not None:
+                mask &= df.index < end
+            result[ticker] = df[mask].copy()
+        return result
+
+    def _download_batches(self, plans: dict, batch_size: int, max_workers: int) -> dict:
+        """
+        plans: (fetch_start, fetch_end) -> [ticker]
+        :return: ((fetch_start, fetch_end) -> {ticker: DataFrame}, 下載失敗的 {((fetch_start, fetch_end), ticker)})
+        """
+        jobs = [(key, names[i:i + batch_size])
+                for key, names in plans.items() for i in range(0, len(names), batch_size)]
+        if not jobs:
+            return {}, set()
+
+        def run(job):
+            key, names = job
+            try:
+                return key, names, self.downloader(names, *key), False
+            except Exception as e:
+                print(f"[OHLCV] 下載 {len(names)} 檔 ({names[0]} ...) 失敗: {e}")
+                return key, names, {}, True
+
+        self.stats["downloads"] += len(jobs)
+        downloaded, failed = {}, set()
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for key, names, frames, error in pool.map(run, jobs):
+                downloaded.setdefault(key, {}).update(frames)
+                if error:
+                    failed.update((key, name) for name in names)
+        return downloaded, failed
+
+
+_default_cache: Optional[OhlcvCache] = None
+
+
+def default_cache() -> OhlcvCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = OhlcvCache()
+    return _default_cache
+
+
+def get_ohlcv(tickers: Union[str, List[str]], start, end=None, auto_adjust: bool = False,
+              cache: OhlcvCache = None, batch_size: int = BATCH_SIZE,
+              max_workers: int = MAX_WORKERS) -> Union[pd.DataFrame, Dict[str, pd.DataFrame]]:
+    """
+    取得日 K (index 為日期)，欄位為 Open, High, Low, Close, Adj Close, Volume, Dividends, Stock Splits。
+
+    :param tickers: 單一代號 (回傳 DataFrame) 或代號清單 (回傳 dict: ticker -> DataFrame，沒有資料的不列入)
+    :param start: 起始日期 'YYYY-MM-DD'
+    :param end: 結束日期 (不含)，None 表示到最新
+    :param auto_adjust: True 時 OHLC 依 Adj Close / Close 比例調整，並移除 Adj Close (同 yfinance auto_adjust)
+    :param batch_size: 每次 yf.download 合併下載的股票數
+    :param max_workers: 並行下載的批次數
+    """
+    cache = cache or default_cache()
+    single = isinstance(tickers, str)
+    frames = cache.get_many([tickers] if single else tickers, start, end, batch_size, max_workers)
+    result = {}
+    for ticker, df in frames.items():
+        if auto_adjust:
+            ratio = df["Adj Close"] / df["Close"]
+            df[["Open", "High", "Low", "Close"]] = df[["Open", "High", "Low", "Close"]].mul(ratio, axis=0)
+            df = df.drop(columns="Adj Close")
+        if single:
+            return df
+        if not df.empty:
+            result[ticker] = df
+    return result
+
+
+if __name__ == '__main__':
+    started = time.perf_counter()
+    df = get_ohlcv("2330.TW", "2024-01-01")
+    print(f"第一次：{len(df)} 筆，{time.perf_counter() - started:.2f}s")
+    started = time.perf_counter()
+    df = get_ohlcv("2330.TW", "2024-01-01")
+    print(f"第二次 (快取)：{len(df)} 筆，{time.perf_counter() - started:.2f}s，{default_cache().stats}")
+    print(df.tail())
@@ -26,16 +26,36 @@ SYMBOL = "SOLUSDT"
 INTERVAL = "5m"
 LIMIT = 500  # 取200根K線做計算
 
-def get_klines(symbol=SYMBOL, interval=INTERVAL, limit=LIMIT):
-    symbol=symbol.upper()
-    url = f"{BINANCE_API_URL}?symbol={symbol}&interval={interval}&limit={limit}"
-    data = requests.get(url).json()
+# 各 interval 的 K 棒長度 (ms)
+INTERVAL_MS = {
+    "1s": 1_000,
+    "1m": 60_000,
+    "3m": 3 * 60_000,
+    "5m": 5 * 60_000,
+    "15m": 15 * 60_000,
+    "30m": 30 * 60_000,
+    "1h": 3_600_000,
+    "2h": 2 * 3_600_000,
+    "4h": 4 * 3_600_000,
+    "6h": 6 * 3_600_000,
+    "8h": 8 * 3_600_000,
+    "12h": 12 * 3_600_000,
+    "1d": 86_400_000,
+    "3d": 3 * 86_400_000,
+    "1w": 7 * 86_400_000,
+    "1M": 31 * 86_400_000,  # 月線長度不固定，只用來判斷是否可能有缺漏
+}
+
+KLINE_COLUMNS = [
+    "timestamp", "open", "high", "low", "close", "volume",
+    "close_time", "quote_asset_volume", "trades",
+    "taker_buy_base", "taker_buy_quote", "ignore"
+]
 
-    raw_df = pd.DataFrame(data, columns=[
-        "timestamp", "open", "high", "low", "close", "volume",
-        "close_time", "quote_asset_volume", "trades",
-        "taker_buy_base", "taker_buy_quote", "ignore"
-    ])
+
+def klines_to_df(data) -> pd.DataFrame:
+    """把 Binance klines API 回傳的 list 轉成 DataFrame (index 為台北時間的 ts，欄位為 ohlcv)。"""
+    raw_df = pd.DataFrame(data, columns=KLINE_COLUMNS)
     # print(raw_df.dtypes)
 
     # transform to best data types
@@ -67,7 +87,27 @@ def get_klines(symbol=SYMBOL, interval=INTERVAL, limit=LIMIT):
     raw_df = raw_df[["ts","open", "high", "low", "close", "volume"]]
     raw_df.set_index('ts', inplace=True)
     raw_df.sort_index(inplace=True)
-    print(f"資料:", raw_df.tail())
+    return raw_df
+
+
+def get_klines(symbol=SYMBOL, interval=INTERVAL, limit=LIMIT, start_time=None, end_time=None, verbose=True):
+    """
+    取得 Binance K 線資料。
+    start_time / end_time: 開盤時間範圍 (ms)，用來分頁補資料；不指定則取最近 limit 根。
+    verbose: 是否印出最後幾筆資料
+    大量歷史資料請改用 kline_history.KlineHistory (分頁、並行、本機快取)。
+    """
+    symbol=symbol.upper()
+    url = f"{BINANCE_API_URL}?symbol={symbol}&interval={interval}&limit={limit}"
+    if start_time is not None:
+        url += f"&startTime={int(start_time)}"
+    if end_time is not None:
+        url += f"&endTime={int(end_time)}"
+    data = requests.get(url).json()
+
+    raw_df = klines_to_df(data)
+    if verbose:
+        print(f"資料:", raw_df.tail())
     return raw_df
 
 if __name__ == '__main__':
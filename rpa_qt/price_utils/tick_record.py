@@ -0,0 +1,258 @@
+"""
+原始 kline websocket 訊息的錄製檔 (Tick recording)
+
+TickRecorder 把收到的每一筆原始訊息原封不動地附加 (append-only) 到錄製檔，之後可用 tick_replay 重播：
+* 每筆紀錄：收到時間 (epoch ns, int64) + 訊息長度 (uint32) + 訊息 UTF-8 bytes，little-endian
+* 檔名以 .gz 結尾時以 gzip 壓縮 (kline JSON 約可壓到 1/5)；每次開檔附加一個新的 gzip member，
+  多個 member 串接仍是合法的 gzip 檔
+* 程式中斷時最後一筆 (或 gzip member 的檔尾) 可能不完整，直接接在後面寫的資料會讀不到。TickRecorder 開啟
+  既有的檔案時先檢查，檔尾不完整就截到最後一筆完整的紀錄 (gzip 檔改寫成只含完整紀錄的檔案) 再繼續錄
+* read_records 讀到不完整或損壞的紀錄就停止，不影響之前的資料
+
+VirtualClock 依錄製時間控制重播速度：speed=1 為原速、N 為 N 倍速、0 為不等待 (最快)。
+
+使用方式：
+    recorder = TickRecorder("solusdt_1s.krec.gz")
+    kws = KlineWebSocket("solusdt", "1s", ws_factory=recording_factory(recorder))
+    ...
+    recorder.close()
+    for received_ns, frame in read_records("solusdt_1s.krec.gz"): ...
+"""
+import gzip
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Iterator, List, Tuple
+
+import websocket
+
+MAGIC = b"KREC1\n"
+HEADER = struct.Struct("<qI")  # received_ns, length
+
+
+def _open(path: str, mode: str):
+    return gzip.open(path, mode) if path.endswith(".gz") else open(path, mode)
+
+
+class TickRecorder:
+    def __init__(self, path: str, flush_every: int = 1000):
+        """
+        :param path: 錄製檔路徑，已存在時接在後面繼續寫
+        :param flush_every: 每 N 筆寫入磁碟一次 (gzip 每次 flush 都會降低壓縮率)
+        """
+        self.path = path
+        self.flush_every = flush_every
+        self.repaired = False  # 開檔時截掉了不完整的檔尾
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            self.repaired = _repair(path)
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = _open(path, "ab")
+        if new_file:
+            self._file.write(MAGIC)
+        self._lock = threading.Lock()  # 多條連線可以寫同一個檔案
+        self.count = 0
+
+    def write(self, frame, received_ns: int = None):
+        data = frame.encode("utf-8") if isinstance(frame, str) else frame
+        if received_ns is None:
+            received_ns = time.time_ns()
+        with self._lock:
+            self._file.write(HEADER.pack(received_ns, len(data)))
+            self._file.write(data)
+            self.count += 1
+            if self.count % self.flush_every == 0:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# 讀到檔尾被截斷或損壞時的例外 (gzip.BadGzipFile 是 OSError 的子類別)
+_TRUNCATED = (EOFError, OSError, zlib.error, UnicodeDecodeError)
+
+
+def _iter_records(f, path: str, status: dict = None):
+    """
+    (收到時間, 訊息, 這筆紀錄結束的位置 (未壓縮))；讀到不完整或損壞的紀錄就停止。
+    :param status: 讀完後 status["clean"] 表示是否剛好停在最後一筆完整紀錄之後
+    """
+    status = status if status is not None else {}
+    status["clean"] = False
+    magic = f.read(len(MAGIC))
+    if magic != MAGIC:
+        if MAGIC.startswith(magic):  # 建檔時就中斷，連檔頭都不完整
+            return
+        raise ValueError(f"{path} 不是 tick 錄製檔")
+    end = len(MAGIC)
+    try:
+        while True:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                status["clean"] = not header
+                return
+            received_ns, length = HEADER.unpack(header)
+            data = f.read(length)
+            if len(data) < length:
+                return
+            end += HEADER.size + length
+            yield received_ns, data.decode("utf-8"), end
+    except _TRUNCATED:
+        return
+
+
+def read_records(path: str) -> Iterator[Tuple[int, str]]:
+    """依序讀出 (收到時間 epoch ns, 原始訊息)。"""
+    with _open(path, "rb") as f:
+        for received_ns, frame, _ in _iter_records(f, path):
+            yield received_ns, frame
+
+
+def _repair(path: str) -> bool:
+    """
+    檔尾不完整時截到最後一筆完整的紀錄，回傳是否有修改。
+    一般檔直接 truncate；gzip 檔無法在壓縮資料中間截斷，改寫成只含完整紀錄的新檔再取代。
+    """
+    records, end, status = [], len(MAGIC), {}
+    with _open(path, "rb") as f:
+        for received_ns, frame, end in _iter_records(f, path, status):
+            records.append((received_ns, frame))
+    if status["clean"]:
+        return False
+    if not records:
+        end = 0  # 連檔頭都不完整時整個重建
+    if not path.endswith(".gz"):
+        with open(path, "r+b") as f:
+            f.truncate(end)
+        return True
+    tmp = path + ".tmp"
+    with gzip.open(tmp, "wb") as f:
+        f.write(MAGIC)
+        for received_ns, frame in records:
+            data = frame.encode("utf-8")
+            f.write(HEADER.pack(received_ns, len(data)))
+            f.write(data)
+    os.replace(tmp, path)
+    return True
+
+
+def recording_factory(recorder: TickRecorder, ws_factory=websocket.WebSocketApp):
+    """包一層 ws_factory，on_message 收到的每筆訊息先寫入 recorder 再交給原本的 callback。"""
+    def make(url, on_message=None, **callbacks):
+        def record(ws, message):
+            recorder.write(message)
+            if on_message is not None:
+                on_message(ws, message)
+        return ws_factory(url, on_message=record, **callbacks)
+    return make
+
+
+class VirtualClock:
+    def __init__(self, speed: float = 1.0):
+        """
+        :param speed: 1 為原速，N 為 N 倍速，0 (或 inf) 為不等待
+        """
+        self.speed = speed
+        self.start_ns = None
+        self.now_ns = None  # 目前的虛擬時間 (錄製時間軸，epoch ns)
+        self.max_lag = 0.0  # 落後排程的最大秒數 (處理速度跟不上重播速度時)
+        self._wall0 = None
+
+    @property
+    def unpaced(self) -> bool:
+        return not self.speed or self.speed == float("inf")
+
+    def start(self, start_ns: int):
+        self.start_ns = self.now_ns = start_ns
+        self._wall0 = time.perf_counter()
+
+    def wait_until(self, t_ns: int):
+        """等到虛擬時間 t_ns 對應的實際時間。"""
+        if self.start_ns is None:
+            self.start(t_ns)
+        self.now_ns = t_ns
+        if self.unpaced:
+            return
+        delay = self._wall0 + (t_ns - self.start_ns) / 1e9 / self.speed - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            self.max_lag = max(self.max_lag, -delay)
+
+
+def kline_message(symbol: str, interval: str, open_time: int, o: float, h: float, l: float, c: float, v: float,
+                  closed: bool, interval_ms: int, event_time: int = None) -> str:
+    """單一 stream (/ws/<symbol>@kline_<interval>) 格式的 kline 訊息。"""
+    k = {"t": open_time, "T": open_time + interval_ms - 1, "s": symbol.upper(), "i": interval,
+         "o": repr(o), "c": repr(c), "h": repr(h), "l": repr(l), "v": repr(v), "x": closed}
+    return json.dumps({"e": "kline", "E": event_time if event_time is not None else open_time,
+                       "s": symbol.upper(), "k": k}, separators=(",", ":"))
+
+
+def synthetic_records(n_bars: int, symbol: str = "solusdt", interval: str = "1s", interval_ms: int = 1000,
+                      updates_per_bar: int = 4, seed: int = 0, start_ms: int = 1_700_000_000_000,
+                      start_price: float = 150.0) -> List[Tuple[int, str]]:
+    """
+    不連網的測試資料：benchmarks.datasets.synthetic_ohlcv 的 K 棒，每根拆成 updates_per_bar - 1 筆未收盤的
+    update 與最後一筆收盤訊息，收到時間平均分布在 K 棒期間內。
+    """
+    from rpa_qt.benchmarks.datasets import synthetic_ohlcv
+
+    df = synthetic_ohlcv(n_bars, seed=seed, start_price=start_price)
+    records = []
+    for i, (o, h, l, c, v) in enumerate(df[["open", "high", "low", "close", "volume"]].to_numpy().tolist()):
+        open_time = start_ms + i * interval_ms
+        for j in range(1, updates_per_bar + 1):
+            event_ms = open_time + interval_ms * j // updates_per_bar
+            if j < updates_per_bar:
+                frac = j / updates_per_bar
+                px = o + (c - o) * frac
+                msg = kline_message(symbol, interval, open_time, o, max(o, px), min(o, px), px, v * frac, False,
+                                    interval_ms, event_ms)
+            else:
+                msg = kline_message(symbol, interval, open_time, o, h, l, c, v, True, interval_ms, event_ms)
+            records.append((event_ms * 1_000_000, msg))
+    return records
+
+
+def write_records(path: str, records) -> int:
+    with TickRecorder(path) as recorder:
+        for received_ns, frame in records:
+            recorder.write(frame, received_ns)
+    return len(records)
+
+
+if __name__ == '__main__':
+    import tempfile
+
+    records = synthetic_records(1000)
+    path = os.path.join(tempfile.mkdtemp(), "synthetic.krec.gz")
+    write_records(path, records)
+    raw = sum(len(f) for _, f in records)
+    print(f"{len(records)} 筆訊息：原始 {raw / 1e3:.0f} KB，錄製檔 {os.path.getsize(path) / 1e3:.0f} KB")
+    assert list(read_records(path)) == records
+    # 接續錄製：新的 gzip member 接在檔尾
+    write_records(path, records[:10])
+    assert list(read_records(path)) == records + records[:10]
+    print("讀回內容與寫入相同 (含接續錄製)")
+    # 模擬錄到一半中斷：截掉檔尾幾個 bytes 後再接續錄製
+    for suffix in (".krec.gz", ".krec"):
+        path = os.path.join(tempfile.mkdtemp(), "crashed" + suffix)
+        write_records(path, records[:100])
+        with open(path, "r+b") as f:
+            f.truncate(os.path.getsize(path) - 7)
+        survived = list(read_records(path))
+        with TickRecorder(path) as recorder:
+            for received_ns, frame in records[100:110]:
+                recorder.write(frame, received_ns)
+        assert recorder.repaired and list(read_records(path)) == survived + records[100:110]
+        print(f"{suffix}：中斷後保留 {len(survived)} 筆，修復並接續錄製 10 筆")
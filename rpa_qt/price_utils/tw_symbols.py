@@ -0,0 +1,84 @@
+"""
+台股代號 -> Yahoo 代號對照 (exchange suffix resolution)
+
+Yahoo 的台股代號要加交易所後綴：上市 .TW、上櫃 .TWO。原本的做法是每次都先試 .TW 再試 .TWO，
+一檔最多兩次 HTTP 請求。這裡改成：
+1. 先看已存檔的對照表 (<ROOT_DIR>/cache/tw_yahoo_symbols.csv)；
+2. 沒有的依 tw_tickers_detailed.csv 的 market 欄決定 (上市 / 上市臺灣創新板 -> .TW，上櫃 -> .TWO)；
+3. 兩者都沒有的 (例如 ETF)，才以批次下載試 .TW，再試 .TWO；
+結果寫回對照表，下次不必再判斷。
+"""
+import os
+from typing import Dict, List, Tuple
+
+import pandas as pd
+
+from rpa_qt.db.df_utils import csv_to_df, df_to_csv
+from rpa_qt.price_utils.ohlcv_cache import get_ohlcv
+from rpa_qt.root import ROOT_DIR
+
+TICKERS_PATH = os.path.join(ROOT_DIR, "price_utils", "tw_tickers_detailed.csv")
+MAPPING_PATH = os.path.join(ROOT_DIR, "cache", "tw_yahoo_symbols.csv")
+SUFFIXES = [(".TW", "TWSE"), (".TWO", "TPEX")]
+PROBE_DAYS = 14  # 試探後綴時只抓最近幾天的資料
+
+
+def market_to_suffix(market: str) -> Tuple[str, str]:
+    """'上市' / '上市臺灣創新板' -> ('.TW', 'TWSE')，'上櫃' -> ('.TWO', 'TPEX')"""
+    return SUFFIXES[0] if str(market).startswith("上市") else SUFFIXES[1]
+
+
+def load_mapping(path: str = MAPPING_PATH) -> Dict[str, Tuple[str, str]]:
+    if not os.path.exists(path):
+        return {}
+    df = csv_to_df(path)
+    return {str(code): (ysym, exch) for code, ysym, exch in
+            zip(df["symbol"].astype(str), df["yahoo_symbol"], df["exchange"])}
+
+
+def save_mapping(mapping: Dict[str, Tuple[str, str]], path: str = MAPPING_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    df = pd.DataFrame([(code, ysym, exch) for code, (ysym, exch) in sorted(mapping.items())],
+                      columns=["symbol", "yahoo_symbol", "exchange"])
+    df_to_csv(df, path)
+
+
+def resolve_yahoo_symbols(codes: List[str], tickers_path: str = TICKERS_PATH,
+                          mapping_path: str = MAPPING_PATH) -> Dict[str, Tuple[str, str]]:
+    """
+    :param codes: 純數字代碼，例如 ['2330', '6182']
+    :return: dict: code -> (yahoo_symbol, exchange)，例如 {'2330': ('2330.TW', 'TWSE')}；找不到的不列入
+    """
+    mapping = load_mapping(mapping_path)
+    missing = [c for c in dict.fromkeys(codes) if c not in mapping]
+    changed = False
+
+    if missing and os.path.exists(tickers_path):
+        detail = csv_to_df(tickers_path)
+        markets = dict(zip(detail["symbol"].astype(str).str.strip(), detail["market"]))
+        for code in missing:
+            if code in markets:
+                suffix, exch = market_to_suffix(markets[code])
+                mapping[code] = (code + suffix, exch)
+                changed = True
+        missing = [c for c in missing if c not in mapping]
+
+    # 清單中沒有的代碼：批次試 .TW，再試 .TWO
+    start = pd.Timestamp.today().normalize() - pd.Timedelta(days=PROBE_DAYS)
+    for suffix, exch in SUFFIXES:
+        if not missing:
+            break
+        frames = get_ohlcv([c + suffix for c in missing], start)
+        for code in missing:
+            if code + suffix in frames:
+                mapping[code] = (code + suffix, exch)
+                changed = True
+        missing = [c for c in missing if c not in mapping]
+
+    if changed:
+        save_mapping(mapping, mapping_path)
+    return {c: mapping[c] for c in codes if c in mapping}
+
+
+if __name__ == '__main__':
+    print(resolve_yahoo_symbols(["2330", "6182", "0050"]))
@@ -0,0 +1,124 @@
+"""
+本機 websocket 替身 (Local websocket stand-in)
+
+ReplayWebSocketApp 的介面與 websocket.WebSocketApp 相同 (run_forever / send / close 與 on_* callback)，
+但不連網，而是把錄好的 Binance combined stream 訊息依序重播：
+* 只送出目前有訂閱的 stream：URL 的 ?streams=a/b/c 加上之後 SUBSCRIBE / UNSUBSCRIBE 的結果。
+* SUBSCRIBE / UNSUBSCRIBE 會回覆 {"result": null, "id": n}，與 Binance 相同。
+* frames 可以是字串清單，或是每行一筆 JSON 的錄製檔路徑。
+
+使用方式：
+    factory = ReplayWebSocketApp.factory(frames)
+    manager = BinanceStreamManager(ws_factory=factory)
+"""
+import json
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+
+def load_frames(path: str) -> list:
+    """讀取錄製檔：每行一筆原始 websocket 訊息。"""
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.rstrip("\n") for line in f if line.strip()]
+
+
+class ReplayWebSocketApp:
+    def __init__(self, url, frames=(), on_open=None, on_message=None, on_error=None, on_close=None,
+                 delay: float = 0.0, close_when_done: bool = True):
+        """
+        :param frames: 要重播的原始訊息 (combined stream 格式)
+        :param delay: 每筆訊息之間的間隔秒數
+        :param close_when_done: 重播完畢後是否關閉連線 (False 則保持連線直到 close())
+        """
+        self.url = url
+        self.frames = load_frames(frames) if isinstance(frames, str) else list(frames)
+        self.on_open = on_open
+        self.on_message = on_message
+        self.on_error = on_error
+        self.on_close = on_close
+        self.delay = delay
+        self.close_when_done = close_when_done
+
+        query = parse_qs(urlparse(url).query)
+        streams = query.get("streams", [""])[0]
+        self.streams = {s for s in streams.split("/") if s}
+        self.sent = []  # 客戶端送出的訊息
+        self._closed = threading.Event()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def factory(cls, frames, **kwargs):
+        """回傳可以傳給 BinanceStreamManager(ws_factory=...) 的建構函式。"""
+        def make(url, **callbacks):
+            return cls(url, frames=frames, **kwargs, **callbacks)
+        return make
+
+    def _emit(self, message: str):
+        if self.on_message is not None:
+            self.on_message(self, message)
+
+    def send(self, data):
+        self.sent.append(data)
+        msg = json.loads(data)
+        with self._lock:
+            if msg.get("method") == "SUBSCRIBE":
+                self.streams |= set(msg["params"])
+            elif msg.get("method") == "UNSUBSCRIBE":
+                self.streams -= set(msg["params"])
+        self._emit(json.dumps({"result": None, "id": msg.get("id")}))
+
+    def run_forever(self, **kwargs):
+        try:
+            if self.on_open is not None:
+                self.on_open(self)
+            for frame in self.frames:
+                if self._closed.is_set():
+                    break
+                stream = json.loads(frame).get("stream")
+                with self._lock:
+                    subscribed = stream in self.streams
+                if subscribed:
+                    self._emit(frame)
+                if self.delay:
+                    time.sleep(self.delay)
+            if not self.close_when_done:
+                self._closed.wait()
+        except Exception as e:
+            if self.on_error is not None:
+                self.on_error(self, e)
+        finally:
+            if self.on_close is not None:
+                self.on_close(self, None, None)
+
+    def close(self):
+        self._closed.set()
+
+
+def make_kline_frame(symbol: str, interval: str, open_time: int, close: float, volume: float = 1.0,
+                     closed: bool = False, interval_ms: int = 1000) -> str:
+    """產生一筆 combined stream 格式的 kline 訊息，方便建立測試資料。"""
+    stream = f"{symbol.lower()}@kline_{interval}"
+    k = {"t": open_time, "T": open_time + interval_ms - 1, "s": symbol.upper(), "i": interval,
+         "o": str(close), "c": str(close), "h": str(close), "l": str(close), "v": str(volume),
+         "x": closed}
+    return json.dumps({"stream": stream, "data": {"e": "kline", "E": open_time, "s": symbol.upper(), "k": k}})
+
+
+if __name__ == '__main__':
+    from rpa_qt.price_utils.bar_bus import BarBus
+    from rpa_qt.price_utils.binance_stream import BinanceStreamManager
+
+    t0 = 1_700_000_000_000
+    frames = [make_kline_frame(sym, "1s", t0 + i * 1000, 100.0 + i, closed=True)
+              for i in range(10) for sym in ("btcusdt", "ethusdt", "solusdt")]
+
+    manager = BinanceStreamManager(max_streams_per_connection=2, bus=BarBus(),
+                                   ws_factory=ReplayWebSocketApp.factory(frames, close_when_done=False),
+                                   reconnect_delay=0.1, gap_fill=False)
+    manager.subscribe_many([("btcusdt", "1s"), ("ethusdt", "1s"), ("solusdt", "1s")])
+    time.sleep(0.5)
+    print(f"connections: {len(manager.connections)}, messages: {manager.message_count}")
+    for sym in ("btcusdt", "ethusdt", "solusdt"):
+        print(sym, len(manager.get_store(sym, "1s")), manager.get_latest_price(sym))
+    manager.stop()
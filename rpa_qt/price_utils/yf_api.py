@@ -1,6 +1,8 @@
 import pandas as pd
 import yfinance as yf
 
+from rpa_qt.price_utils.ohlcv_cache import get_ohlcv
+
 
 # ---------- 工具函數 ----------
 # 收盤價
@@ -16,8 +18,8 @@ def fetch_ohlcv(ticker: str, start: str, end: str,header_lower_case=False) -> pd
 
 
     """使用 yfinance 取得資料，回傳 OHLCV（index 為日期）"""
-    # df = yf.download(ticker, start=start, end=end, progress=False) # 預設會加入tiker，例如：Open/2330.TW
-    df = yf.download(ticker, start=start, end=end, auto_adjust=False) # 預設會加入tiker，例如：Open/2330.TW
+    # df = yf.download(ticker, start=start, end=end, auto_adjust=False) # 預設會加入tiker，例如：Open/2330.TW
+    df = get_ohlcv(ticker, start, end) # 經由本機快取，只下載快取之後的新資料
     df = df[['Open', 'High', 'Low', 'Close', 'Volume']].dropna()
     if header_lower_case:
         df.columns = ['open', 'high', 'low', 'close', 'volume']
@@ -34,14 +36,9 @@ def fetch_dividend(ticker: str, start: str, end: str) -> pd.DataFrame:
     end: 結束日期，格式 'YYYY-MM-DD'
     回傳 DataFrame，欄位為 ['Dividend']
     """
-    stock = yf.Ticker(ticker)
-    dividends = stock.dividends
-
-    # 將帶有時區的索引轉換為無時區
-    # dividends.index = dividends.index.tz_localize(None) # 或者用下面的 astype
-    dividends.index = dividends.index.tz_localize(None)
-
-    dividends = dividends[(dividends.index >= pd.to_datetime(start)) & (dividends.index <= pd.to_datetime(end))]
+    # 股利與日 K 存在同一份快取 (Dividends 欄)，end 含當天
+    df = get_ohlcv(ticker, start, pd.to_datetime(end) + pd.Timedelta(days=1))
+    dividends = df.loc[df['Dividends'] > 0, 'Dividends']
     dividends = dividends.to_frame(name='Dividends')
     return dividends
 
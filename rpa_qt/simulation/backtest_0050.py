@@ -5,9 +5,16 @@
 3. 可以設定近期高點回檔多少%時，停損賣出。然後將賣出後的金額放在一個變數中，分成10等份，若繼續下跌，則每下跌3%再買入1等份，直到買完為止。若反彈至賣出價格，則停止買入，就將剩下的金額全部買入。
 4. 每年的股利在年底時再投入買股。
 
-
+* 股價與股利只讀一次：load_0050 經由本機快取 (ohlcv_cache) 取得同一份日 K 的 Close 與 Dividends 欄，
+  快取是新的就不連網；backtest_0050 可直接傳入 data 重複使用
+* 回傳的 equity 含 drawdown 欄 (時間加權淨值的回撤，定期定額入金不算創新高)
+* sweep_0050：stop_loss_percentage x monthly_investment 的網格丟進 process pool，資料只在每個 worker 初始化時傳一次
 """
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
 
+import numpy as np
 import yfinance as yf
 import pandas as pd
 
@@ -16,7 +23,18 @@ from datetime import datetime
 
 import matplotlib.pyplot as plt
 
-from rpa_qt.price_utils.yf_api import fetch_ohlcv, fetch_dividend
+from rpa_qt.backtest.engine import (BacktestResult, Bars, Broker, drawdown, FeeModel, NO_FEES, run_backtest,
+                                    Strategy)
+from rpa_qt.price_utils.ohlcv_cache import get_ohlcv
+
+TICKER = "0050.TW"
+DEFAULT_GRID = {
+    "stop_loss_percentage": [0.10, 0.15, 0.20, 0.25, 0.30, 1.0],  # 1.0 = 不停損
+    "monthly_investment": [5000, 10000, 20000],
+}
+
+# worker 端的日 K (每個 process 一份)
+_worker = {}
 
 
 def get_current_price():
@@ -36,14 +54,142 @@ def get_current_price():
 
 
 
+class DCA0050Strategy(Strategy):
+    """
+    backtest_0050 的規則，跑在共用回測引擎上 (rpa_qt.backtest.engine)：
+    * 第一天買入 initial_shares 張；每月第一個「日期 >= 起始日」的交易日 (當月沒有則為月底) 入金 monthly_investment 並買入
+    * 股利以 income 入帳 (算報酬)，reinvest_dividend 時以股利金額買入
+    * 收盤價從高點回檔 stop_loss_percentage 時全部賣出，賣出金額分成 tranches 等份，
+      自賣出價每再跌 step_pct 買回 1 等份；反彈到賣出價時把剩餘現金全部買入，高點從反彈價重新起算
+    入金 (初始 + 定期定額) 用 deposit 記錄，不算報酬。
+    """
+
+    def __init__(self, initial_shares: int, monthly_investment: float, stop_loss_percentage: float,
+                 reinvest_dividend: bool = True, tranches: int = 10, step_pct: float = 0.03, verbose: bool = True):
+        self.initial_shares = initial_shares
+        self.monthly_investment = monthly_investment
+        self.stop_loss_percentage = stop_loss_percentage
+        self.reinvest_dividend = reinvest_dividend
+        self.tranches = tranches
+        self.step_pct = step_pct
+        self.verbose = verbose
+
+    def prepare(self, bars: Bars, broker: Broker):
+        index = pd.DatetimeIndex(bars.index)
+        self.dates = index
+        self.close = bars.list('Close')
+        self.dividends = bars.list('Dividends') if 'Dividends' in bars else [0.0] * len(bars)
+        # 定期定額日：起始月之後，每月第一個 day >= 起始日 (或當月最後一個交易日) 的交易日
+        month = index.year * 12 + index.month
+        last_of_month = np.append(month[1:] != month[:-1], True)
+        eligible = ((index.day >= index[0].day) | last_of_month) & (month != month[0])
+        rows = np.flatnonzero(eligible)
+        first = rows[np.append(True, month[rows][1:] != month[rows][:-1])] if len(rows) else rows
+        self.invest = np.zeros(len(index), dtype=bool)
+        self.invest[first] = True
+        self.invest = self.invest.tolist()
+
+        self.peak_price = 0.0
+        self.sell_out_price = 0.0
+        self.sold_cash_for_reinvest = 0.0
+        self.reinvest_tranche = 0.0  # 分批買回的等份金額
+        self.reinvest_times = 0      # 已經買回的等份數
+
+    def _buy_with(self, i: int, broker: Broker, amount: float, price: float, comment: str) -> float:
+        """以 amount 元 (含手續費) 買入整數股，回傳股數。"""
+        fees = broker.fees
+        shares = amount // (price * (1 + fees.rate * fees.discount))
+        while shares > 0 and broker.buy_cost(price, shares) > amount:
+            shares -= 1
+        if shares > 0:
+            broker.buy(i, price, shares, comment=comment)
+        return shares
+
+    def on_bar(self, i: int, broker: Broker):
+        price = self.close[i]
+        date = self.dates[i]
+
+        if i == 0 and self.initial_shares > 0:
+            shares = self.initial_shares * 1000  # 一張等於 1000 股
+            broker.deposit(i, shares * price + broker.fees.commission(shares * price))
+            broker.buy(i, price, shares, comment='initial')
+
+        # 1. 紀錄最高價
+        if price > self.peak_price:
+            self.peak_price = price
+
+        # 2. 定期定額買入
+        if self.invest[i]:
+            broker.deposit(i, self.monthly_investment)
+            self._buy_with(i, broker, self.monthly_investment, price, 'monthly')
+
+        # 3. 股利 (再投入)
+        dividend = self.dividends[i]
+        if dividend > 0 and broker.position > 0:
+            dividend_cash = broker.position * dividend
+            broker.income(i, dividend_cash)
+            if self.reinvest_dividend:
+                shares = self._buy_with(i, broker, dividend_cash, price, 'dividend')
+                if self.verbose:
+                    print(f"在 {date.date()} 收到股利並再投資，股利總額: ${dividend_cash:,.2f}，買入 {shares:,.0f} 股。")
+
+        # 4. 停損賣出並分批買回
+        if self.sold_cash_for_reinvest == 0 and broker.position > 0 \
+                and price <= self.peak_price * (1 - self.stop_loss_percentage):
+            # 觸發停損條件，全部賣出
+            self.sell_out_price = price
+            self.sold_cash_for_reinvest = broker.position * price
+            broker.close(i, price, action='stop', comment='stop loss')
+            self.reinvest_tranche = self.sold_cash_for_reinvest / self.tranches
+            self.reinvest_times = 0
+            if self.verbose:
+                print(f"在 {date.date()} 觸發停損賣出，價格 ${price:,.2f}，賣出總金額 ${self.sold_cash_for_reinvest:,.2f}。")
+
+        # 停損賣出後，分批買回邏輯
+        elif self.sold_cash_for_reinvest > 0:
+            drop = (self.sell_out_price - price) / self.sell_out_price
+            # 賣出後，若價格繼續下跌，則每下跌 step_pct 買回 1 等份
+            if self.reinvest_times < self.tranches and drop >= self.step_pct * (self.reinvest_times + 1) \
+                    and broker.cash >= self.reinvest_tranche:
+                self._buy_with(i, broker, self.reinvest_tranche, price, 'tranche')
+                self.reinvest_times += 1
+                if self.verbose:
+                    print(f"在 {date.date()} 繼續下跌，價格 ${price:,.2f}，買回第 {self.reinvest_times} 等份。")
+
+            # 若反彈至賣出價格，則將剩餘金額全部買入
+            elif price >= self.sell_out_price and broker.cash > 0:
+                self._buy_with(i, broker, broker.cash, price, 'rebound')
+                self.sold_cash_for_reinvest = 0.0
+                self.reinvest_tranche = 0.0
+                self.reinvest_times = 0
+                # 高點從反彈買入價重新起算，否則價格仍在舊高點的停損線下時，下一根就會再停損
+                self.peak_price = price
+                if self.verbose:
+                    print(f"在 {date.date()} 價格反彈至賣出價，將剩餘資金全部買入。")
+
+
+def load_0050(start_date: str, end_date: str, ticker: str = TICKER) -> pd.DataFrame:
+    """
+    [start_date, end_date) 的日 K (Open / High / Low / Close / Volume / Dividends)，經由本機快取。
+    股利來自同一份快取的 Dividends 欄，沒有股利的日子為 0。
+    """
+    df = get_ohlcv(ticker, start_date, end_date)
+    data = df[['Open', 'High', 'Low', 'Close', 'Volume']].dropna()
+    data['Dividends'] = df['Dividends'].reindex(data.index).fillna(0)
+    return data
+
+
 def backtest_0050(
         start_date: str,
         end_date: str,
         initial_shares: int,
         monthly_investment: int,
         stop_loss_percentage: float,
-        reinvest_dividend: bool = True
-):
+        reinvest_dividend: bool = True,
+        fees: FeeModel = NO_FEES,
+        verbose: bool = True,
+        data: Optional[pd.DataFrame] = None,
+) -> Optional[BacktestResult]:
     """
     回測台股0050的定期定額投資策略，並加入高點回檔分批買入的停損機制。
 
@@ -54,136 +200,111 @@ def backtest_0050(
     - monthly_investment (int): 每月定期定額投入的金額
     - stop_loss_percentage (float): 高點回檔停損賣出的百分比 (e.g., 0.20 代表 20%)
     - reinvest_dividend (bool): 是否將股利再投入，預設為 True
+    - fees (FeeModel): 手續費與證交稅，預設不計 (與舊版相同)，可改用 engine.TW_ETF
+    - data (DataFrame): 已載入的日 K (load_0050)，None 時由快取讀取 [start_date, end_date)
+    回傳共用引擎的 BacktestResult (equity 含 contributed 累計入金與 drawdown)。
     """
-    # 獲取 0050 的歷史股價及股利資料
-    ticker = "0050.TW"
-    try:
-        # data = yf.download(ticker, start=start_date, end=end_date)
-        data=fetch_ohlcv(ticker, start_date, end_date)
-        dividends=fetch_dividend(ticker,start_date,end_date)
-
-        # data add dividends
-        data = data.join(dividends, how='left')
-
-        # if 'Dividends' is NaN, fill with 0
-        data['Dividends'] = data['Dividends'].fillna(0)
-
-
-        if data.empty:
-            print("無法下載 0050.TW 的歷史資料，請檢查日期範圍或網路連線。")
-            return
-    except Exception as e:
-        print(f"下載資料時發生錯誤：{e}")
-        return
-
-    # 初始化變數
-    cash = 0
-    shares = initial_shares * 1000  # 一張等於 1000 股
-    total_investment = initial_shares * data['Close'].iloc[0] * 1000
-
-    # 紀錄高點和賣出價格
-    peak_price = 0
-    sell_out_price = 0
-    sold_cash_for_reinvest = 0
-    reinvest_tranches = 0 # 分批買回的等份金額
-    reinvest_times = 0 # 已經買回的等份數
-
-    # 處理第一筆初始買入的成本
-    last_investment_date = data.index[0]
-    monthly_invest_date = pd.to_datetime(last_investment_date).day
-
-    # 回測主迴圈
-    for date, row in data.iterrows():
-        current_price = row['Close']
-        month_changed = (date.month != last_investment_date.month)
-
-        # year_changed = (date.year != last_investment_date.year)
-
-        # 1. 紀錄最高價
-        if current_price > peak_price:
-            peak_price = current_price
-
-        # 2. 定期定額買入
-        if month_changed and date.day == monthly_invest_date:
-            buy_shares = monthly_investment // current_price
-            shares += buy_shares
-            cash -= buy_shares * current_price
-            total_investment += monthly_investment
-            last_investment_date = date
-
-        # 3. 股利再投入
-        if reinvest_dividend and row['Dividends'] > 0:
-            dividend_cash = shares * row['Dividends']
-            buy_shares = dividend_cash // current_price
-            shares += buy_shares
-            total_investment -= dividend_cash  # 為了正確計算投入成本，先減去股利
-            print(f"在 {date.date()} 收到股利並再投資，股利總額: ${dividend_cash:,.2f}，買入 {buy_shares:,.0f} 股。")
-
-        # 4. 停損賣出並分批買回
-        if sold_cash_for_reinvest == 0 and current_price <= peak_price * (1 - stop_loss_percentage):
-            # 觸發停損條件，全部賣出
-            sell_out_price = current_price
-            sold_cash_for_reinvest = shares * current_price
-            cash += sold_cash_for_reinvest
-            shares = 0
-            reinvest_tranches = sold_cash_for_reinvest / 10
-            print(
-                f"在 {date.date()} 觸發停損賣出，價格 ${current_price:,.2f}，賣出總金額 ${sold_cash_for_reinvest:,.2f}。")
-
-        # 停損賣出後，分批買回邏輯
-        elif sold_cash_for_reinvest > 0:
-            # 賣出後，若價格繼續下跌，則每下跌 3% 買回 1 等份
-            if (sell_out_price - current_price) / sell_out_price >= 0.03 * (
-                    10 - reinvest_times) and cash >= reinvest_tranches:
-                buy_shares = reinvest_tranches // current_price
-                shares += buy_shares
-                cash -= buy_shares * current_price
-                reinvest_tranches.append(reinvest_tranches)
-                reinvest_times += 1
-                print(f"在 {date.date()} 繼續下跌，價格 ${current_price:,.2f}，買回第 {len(reinvest_tranches)} 等份。")
-
-            # 若反彈至賣出價格，則將剩餘金額全部買入
-            elif current_price >= sell_out_price and cash > 0:
-                buy_shares = cash // current_price
-                shares += buy_shares
-                cash = 0
-                sold_cash_for_reinvest = 0
-                reinvest_tranches = 0
-                reinvest_times = 0
-                print(f"在 {date.date()} 價格反彈至賣出價，將剩餘資金全部買入。")
+    if data is None:
+        # 獲取 0050 的歷史股價及股利資料
+        try:
+            data = load_0050(start_date, end_date)
+        except Exception as e:
+            print(f"下載資料時發生錯誤：{e}")
+            return None
+    else:
+        data = data[(data.index >= pd.Timestamp(start_date)) & (data.index < pd.Timestamp(end_date))]
+    if data.empty:
+        print("無法下載 0050.TW 的歷史資料，請檢查日期範圍或網路連線。")
+        return None
 
-        last_investment_date = date
+    strategy = DCA0050Strategy(initial_shares, monthly_investment, stop_loss_percentage, reinvest_dividend,
+                               verbose=verbose)
+    result = run_backtest(data, strategy, fees=fees, price_col='Close')
+    result.equity['drawdown'] = drawdown(result.equity)
 
     # 5. 計算最終結果
-    end_date = data.index[-1]
-    final_value = shares * data['Close'].iloc[-1] + cash
-    total_profit = final_value - total_investment
-    profit_percentage = (total_profit / total_investment) * 100 if total_investment > 0 else 0
-
-    print("\n--- 回測結果 ---")
-    print(f"回測區間：{start_date} 到 {end_date.strftime('%Y-%m-%d')}")
-    print(f"初始投入成本：${initial_shares * data['Close'].iloc[0] * 1000:,.2f}")
-    print(f"總投入成本 (含定期定額)：${total_investment:,.2f}")
-    print(f"最終資產總值：${final_value:,.2f}")
-    print(f"總損益：${total_profit:,.2f}")
-    print(f"總報酬率：{profit_percentage:,.2f}%")
-
-
-# 執行回測
-backtest_0050(
-    start_date="2004-01-01",
-    end_date="2024-09-01",
-    initial_shares=1,  # 初始投入 1 張
-    monthly_investment=10000,  # 每月定期定額 10,000 元
-    stop_loss_percentage=0.20  # 高點回檔 20% 停損
-)
-
-
-
-
-
-
-
-
-
-
+    m = result.metrics
+    total_investment = result.equity['contributed'].iloc[-1]
+    if verbose:
+        print("\n--- 回測結果 ---")
+        print(f"回測區間：{start_date} 到 {data.index[-1].strftime('%Y-%m-%d')}")
+        print(f"初始投入成本：${result.equity['contributed'].iloc[0]:,.2f}")
+        print(f"總投入成本 (含定期定額)：${total_investment:,.2f}")
+        print(f"最終資產總值：${m['FinalEquity']:,.2f}")
+        print(f"總損益：${m['NetProfit']:,.2f}")
+        print(f"總報酬率：{m['NetProfit'] / total_investment * 100 if total_investment > 0 else 0:,.2f}%")
+        print(f"時間加權報酬：{m['Return'] * 100:,.2f}% (CAGR {m['CAGR'] * 100:.2f}%、最大回撤 {m['MaxDrawdown'] * 100:.2f}%)")
+    return result
+
+
+def _init_worker(data: pd.DataFrame, start_date: str, end_date: str, initial_shares: int, reinvest_dividend: bool,
+                 fees: FeeModel):
+    _worker.update(data=data, start_date=start_date, end_date=end_date, initial_shares=initial_shares,
+                   reinvest_dividend=reinvest_dividend, fees=fees)
+
+
+def _evaluate_in_worker(params: Dict) -> Dict:
+    result = backtest_0050(_worker['start_date'], _worker['end_date'], _worker['initial_shares'],
+                           reinvest_dividend=_worker['reinvest_dividend'], fees=_worker['fees'], verbose=False,
+                           data=_worker['data'], **params)
+    if result is None:  # 這組參數的區間沒有資料：回傳空的一列，不中斷整個掃描
+        return {**params, 'Contributed': np.nan, 'NumStops': 0}
+    contributed = result.equity['contributed'].iloc[-1]
+    return {**params, **result.metrics, 'Contributed': contributed,
+            'NumStops': int((result.trades['action'] == 'stop').sum())}
+
+
+def sweep_0050(start_date: str, end_date: str, initial_shares: int = 1, grid: Dict[str, List] = None,
+               reinvest_dividend: bool = True, fees: FeeModel = NO_FEES, data: Optional[pd.DataFrame] = None,
+               max_workers: int = None) -> pd.DataFrame:
+    """
+    stop_loss_percentage x monthly_investment 的參數掃描。
+    :param grid: key 為 stop_loss_percentage / monthly_investment，預設 DEFAULT_GRID
+    :return: 每組參數一列：參數、compute_metrics 的欄位、Contributed (總投入)、NumStops (停損次數)
+    """
+    grid = grid or DEFAULT_GRID
+    if data is None:
+        data = load_0050(start_date, end_date)
+    keys = list(grid)
+    combos = [dict(zip(keys, combo)) for combo in itertools.product(*(grid[k] for k in keys))]
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(data, start_date, end_date, initial_shares, reinvest_dividend, fees)) as pool:
+        results = list(pool.map(_evaluate_in_worker, combos))
+    return pd.DataFrame(results)
+
+
+def plot_equity(result: BacktestResult, title: str = "0050 DCA backtest"):
+    """權益、累計投入與回撤。"""
+    equity = result.equity
+    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 8), sharex=True, gridspec_kw={"height_ratios": [3, 1]})
+    ax1.plot(equity.index, equity['equity'], label='Equity')
+    ax1.plot(equity.index, equity['contributed'], label='Contributed')
+    ax1.set_title(title)
+    ax1.legend()
+    ax1.grid(True)
+    ax2.fill_between(equity.index, equity['drawdown'] * 100, 0, color='tab:red', alpha=0.4)
+    ax2.set_ylabel("Drawdown (%)")
+    ax2.grid(True)
+    plt.tight_layout()
+    plt.show()
+
+
+if __name__ == '__main__':
+    data = load_0050("2004-01-01", "2024-09-01")
+
+    # 執行回測
+    result = backtest_0050(
+        start_date="2004-01-01",
+        end_date="2024-09-01",
+        initial_shares=1,  # 初始投入 1 張
+        monthly_investment=10000,  # 每月定期定額 10,000 元
+        stop_loss_percentage=0.20,  # 高點回檔 20% 停損
+        data=data,
+    )
+    result.equity.to_csv("backtest_0050_equity.csv")
+
+    # 參數掃描
+    table = sweep_0050("2004-01-01", "2024-09-01", initial_shares=1, data=data)
+    print(table[["stop_loss_percentage", "monthly_investment", "FinalEquity", "Contributed", "CAGR",
+                 "MaxDrawdown", "NumStops"]].sort_values("CAGR", ascending=False).to_string(index=False))
+    plot_equity(result)
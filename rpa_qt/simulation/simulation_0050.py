@@ -1,8 +1,25 @@
+"""
+0050 長期定期定額的模擬
+
+* simulate_0050 / simulate_0050_v2：固定年化報酬率的單一路徑
+* simulate_paths / simulate_0050_mc：Monte Carlo，一次產生 n_paths 條月價格路徑 (n_paths x months 的矩陣)
+  - method="gbm"：幾何布朗運動，年化報酬率 annual_return (期望值與固定路徑相同)、年化波動 annual_volatility
+  - method="bootstrap"：從快取的 0050 歷史月報酬以 block 個月為一段重抽 (保留波動聚集與趨勢)
+  - 定期定額 (invest_schedule)、每月累積股利、每年第 1 個月股利再投入，與 simulate_0050_v2 的規則相同，
+    但每個月只做一次所有路徑的向量運算
+  - 起始價格與歷史資料只讀本機快取 (ohlcv_cache)，不連網；給定 seed 結果可重現
+"""
 from datetime import datetime
+from typing import Dict, List, Optional, Sequence
 
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
+TICKER = "0050.TW"
+DEFAULT_PRICE = 52.0
+
+
 def get_current_price():
     # 即時抓取股價的程式碼, 使用 yfinance API
     import yfinance as yf
@@ -14,7 +31,26 @@ def get_current_price():
     else:
         # raise ValueError("無法取得股價資料")
         print("無法取得股價資料，使用預設價格 52.0")
-        return 52.0
+        return DEFAULT_PRICE
+
+
+def cached_history(ticker: str = TICKER) -> Optional[pd.Series]:
+    """本機快取中的日收盤價 (不連網)，沒有快取時回傳 None。"""
+    from rpa_qt.price_utils.ohlcv_cache import default_cache
+
+    df, _ = default_cache().load(ticker)
+    if df is None or df.empty:
+        return None
+    return df["Close"].dropna()
+
+
+def get_cached_price(ticker: str = TICKER) -> float:
+    """快取中最後一天的收盤價；沒有快取時使用預設價格，讓模擬不需要連網。"""
+    close = cached_history(ticker)
+    if close is None or close.empty:
+        print(f"快取中沒有 {ticker} 的資料，使用預設價格 {DEFAULT_PRICE}")
+        return DEFAULT_PRICE
+    return float(close.iloc[-1])
 
 
 
@@ -30,13 +66,14 @@ def simulate_0050(
         dividend_growth=0.0,  # 股利成長率
         monthly_invest=111000,  # 每月定期定額金額
         initial_shares=33,  # 已有張數
+        start_price=None,  # 起始價格，None 時即時抓取
 ):
     # 計算月化報酬率
     monthly_return = (1 + annual_return) ** (1 / 12) - 1
     monthly_dividend_growth = (1 + dividend_growth) ** (1 / 12) - 1
 
     # 初始數據
-    current_price = get_current_price()
+    current_price = get_current_price() if start_price is None else start_price
     price = current_price
     shares = initial_shares * 1000  # 張數轉股數 (1張=1000股)
     total_dividend = 0
@@ -86,14 +123,14 @@ def simulate_0050_v2(
     dividend_growth=0.0,         # 股利成長率
     invest_schedule=[{1: 111000}], # 投入計畫 [{起始月: 每月投入金額}]
     initial_shares=33,           # 已有張數 (張)
-
+    start_price=None,            # 起始價格，None 時即時抓取
 ):
     # 計算月化報酬率 & 股利成長率
     monthly_return = (1 + annual_return) ** (1/12) - 1
     monthly_dividend_growth = (1 + dividend_growth) ** (1/12) - 1
 
     # 初始數據
-    current_price = get_current_price()
+    current_price = get_current_price() if start_price is None else start_price
     price = current_price
     shares = initial_shares * 1000   # 張數轉股數
     total_dividend = 0
@@ -154,37 +191,184 @@ def simulate_0050_v2(
     return df
 
 
-# 範例執行
-df = simulate_0050(
-    months=120,
-    annual_return=0.06,
-    dividend_yield=0.025,
-    dividend_growth=0.0,
-    monthly_invest=111000,
-    initial_shares=33,
-)
-
-pd.set_option("display.float_format", "{:,.2f}".format)
-print(df.tail(12))  # 顯示前12個月
+def schedule_amounts(invest_schedule: List[Dict[int, float]], months: int) -> np.ndarray:
+    """invest_schedule ([{起始月: 每月金額}, ...]) -> 第 1..months 月的投入金額 (長度 months)。"""
+    schedule_dict = {}
+    for s in invest_schedule:
+        schedule_dict.update(s)
+    amounts = np.zeros(months)
+    for start, amount in sorted(schedule_dict.items()):
+        if 1 <= start <= months:
+            amounts[start - 1:] = amount
+    return amounts
+
+
+def monthly_returns(close: pd.Series) -> np.ndarray:
+    """日收盤價 -> 月報酬 (以每月最後一個交易日計算)。"""
+    month_end = close.groupby(close.index.to_period("M")).last()
+    return month_end.pct_change().dropna().to_numpy(dtype=float)
+
+
+def price_paths(months: int, n_paths: int, start_price: float, method: str = "gbm", annual_return: float = 0.06,
+                annual_volatility: float = 0.2, history: Optional[pd.Series] = None, block: int = 12,
+                rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """
+    (n_paths, months) 的月底價格矩陣 (第 1..months 月)。
+    gbm：月對數報酬 ~ N(log(1 + annual_return) / 12 - σ² / 24, σ / √12)，期望價格與固定報酬率的路徑相同
+    bootstrap：從 history (日收盤價) 的月報酬中，每次抽一段連續 block 個月 (循環)，接成 months 個月
+    """
+    rng = rng or np.random.default_rng()
+    if method == "gbm":
+        sigma = annual_volatility / np.sqrt(12)
+        mu = np.log1p(annual_return) / 12 - sigma ** 2 / 2
+        growth = np.exp(mu + sigma * rng.standard_normal((n_paths, months)))
+    elif method == "bootstrap":
+        if history is None:
+            history = cached_history()
+        if history is None:
+            raise ValueError(f"bootstrap 需要歷史價格：快取中沒有 {TICKER}，請先下載或傳入 history")
+        returns = monthly_returns(history)
+        if len(returns) == 0:
+            raise ValueError("歷史價格不足一個月，無法 bootstrap")
+        n_blocks = -(-months // block)
+        starts = rng.integers(0, len(returns), (n_paths, n_blocks))
+        idx = (starts[:, :, None] + np.arange(block)) % len(returns)
+        growth = 1 + returns[idx.reshape(n_paths, -1)[:, :months]]
+    else:
+        raise ValueError(f"未知的 method: {method}")
+    return start_price * np.cumprod(growth, axis=1)
+
+
+def simulate_paths(
+        months=120,
+        n_paths=10000,
+        method="gbm",                 # "gbm" 或 "bootstrap"
+        annual_return=0.06,           # gbm 的年化報酬率
+        annual_volatility=0.2,        # gbm 的年化波動
+        dividend_yield=0.025,         # 股利殖利率
+        dividend_growth=0.0,          # 股利成長率
+        invest_schedule=[{1: 111000}],  # 投入計畫 [{起始月: 每月投入金額}]
+        initial_shares=33,            # 已有張數 (張)
+        start_price=None,             # 起始價格，None 時取快取的最後收盤價
+        history=None,                 # bootstrap 用的日收盤價，None 時讀快取
+        block=12,                     # bootstrap 每段的月數
+        seed=None,
+) -> Dict[str, np.ndarray]:
+    """
+    simulate_0050_v2 的規則套用到 n_paths 條隨機路徑。
+    回傳 dict：Price / Shares / Cumulative_Dividend / Net_Value 皆為 (n_paths, months) 矩陣，Monthly_Invest 為 (months,)
+    """
+    rng = np.random.default_rng(seed)
+    if start_price is None:
+        start_price = get_cached_price()
+    price = price_paths(months, n_paths, start_price, method, annual_return, annual_volatility, history, block, rng)
+    invest = schedule_amounts(invest_schedule, months)
+    monthly_dividend_growth = (1 + dividend_growth) ** (1 / 12) - 1
+    yields = dividend_yield * (1 + monthly_dividend_growth) ** np.arange(months)
 
-df2 = simulate_0050_v2(
-    months=120,
-    annual_return=0.06,
-    dividend_yield=0.025,
-    dividend_growth=0.0,
-    invest_schedule=[{1: 111000}, {37: 60000}, {61: 10000}], #
-    initial_shares=33,
-)
+    shares = np.full(n_paths, initial_shares * 1000.0)
+    total_dividend = np.zeros(n_paths)
+    out_shares = np.empty((n_paths, months))
+    out_dividend = np.empty((n_paths, months))
+    for m in range(1, months + 1):
+        p = price[:, m - 1]
+        # 當月股利（存起來，等每年第 1 個月一次投入）
+        total_dividend += shares * (p * yields[m - 1] / 12)
+        # 定期定額買股
+        shares += invest[m - 1] // p
+        if m % 12 == 1:
+            reinvest_shares = total_dividend // p
+            shares += reinvest_shares
+            total_dividend -= reinvest_shares * p  # 剩下換不到整股的股利保留
+        out_shares[:, m - 1] = shares
+        out_dividend[:, m - 1] = total_dividend
+
+    return {"Price": price, "Shares": out_shares, "Cumulative_Dividend": out_dividend,
+            "Net_Value": out_shares * price + out_dividend, "Monthly_Invest": invest}
+
+
+def simulate_0050_mc(months=120, percentiles: Sequence[float] = (5, 25, 50, 75, 95), plot=False,
+                     **kwargs) -> pd.DataFrame:
+    """
+    Monte Carlo 模擬的 Net_Value 分位數帶。
+    :param kwargs: simulate_paths 的參數 (n_paths、method、annual_return、annual_volatility、invest_schedule、seed ...)
+    :return: 每月一列：YM、Month、Monthly_Invest、Invested (累計投入)、P5 / P25 / ... 與 Mean
+    """
+    paths = simulate_paths(months=months, **kwargs)
+    net_value = paths["Net_Value"]
+    bands = np.percentile(net_value, percentiles, axis=0)
+    now = datetime.now()
+    df = pd.DataFrame({
+        "YM": [(now + pd.DateOffset(months=m)).strftime("%Y-%m") for m in range(1, months + 1)],
+        "Month": np.arange(1, months + 1),
+        "Monthly_Invest": paths["Monthly_Invest"],
+        "Invested": np.cumsum(paths["Monthly_Invest"]),
+    })
+    for q, band in zip(percentiles, bands):
+        df[f"P{q:g}"] = band
+    df["Mean"] = net_value.mean(axis=0)
+
+    if plot:
+        plt.figure(figsize=(10, 6))
+        lo, hi = f"P{percentiles[0]:g}", f"P{percentiles[-1]:g}"
+        plt.fill_between(df["Month"], df[lo], df[hi], alpha=0.2, label=f"{lo} - {hi}")
+        for q in percentiles[1:-1]:
+            plt.plot(df["Month"], df[f"P{q:g}"], label=f"P{q:g}")
+        plt.xlabel("Month")
+        plt.ylabel("Net Value (NTD)")
+        plt.title(f"0050 Monte Carlo Simulation ({len(net_value)} paths)")
+        plt.legend()
+        plt.grid(True)
+        plt.show()
+    return df
 
-pd.set_option("display.float_format", "{:,.2f}".format)
-print(df2.tail(12))  # 顯示前12個月
 
-df3 = simulate_0050_v2(
-    months=120,
-    annual_return=0.06,
-    dividend_yield=0.025,
-    dividend_growth=0.0,
-    invest_schedule=[{1: 40000}, {37: 20000}, {61: 10000}], #
-    initial_shares=150,
-)
-print(df3.tail(12))  # 顯示前12個月
\ No newline at end of file
+if __name__ == "__main__":
+    # 範例執行
+    df = simulate_0050(
+        months=120,
+        annual_return=0.06,
+        dividend_yield=0.025,
+        dividend_growth=0.0,
+        monthly_invest=111000,
+        initial_shares=33,
+    )
+
+    pd.set_option("display.float_format", "{:,.2f}".format)
+    print(df.tail(12))  # 顯示前12個月
+
+    df2 = simulate_0050_v2(
+        months=120,
+        annual_return=0.06,
+        dividend_yield=0.025,
+        dividend_growth=0.0,
+        invest_schedule=[{1: 111000}, {37: 60000}, {61: 10000}], #
+        initial_shares=33,
+    )
+
+    pd.set_option("display.float_format", "{:,.2f}".format)
+    print(df2.tail(12))  # 顯示前12個月
+
+    df3 = simulate_0050_v2(
+        months=120,
+        annual_return=0.06,
+        dividend_yield=0.025,
+        dividend_growth=0.0,
+        invest_schedule=[{1: 40000}, {37: 20000}, {61: 10000}], #
+        initial_shares=150,
+    )
+    print(df3.tail(12))  # 顯示前12個月
+
+    # Monte Carlo：10000 條路徑，起始價格取自本機快取
+    bands = simulate_0050_mc(
+        months=120,
+        n_paths=10000,
+        method="gbm",
+        annual_return=0.06,
+        annual_volatility=0.2,
+        dividend_yield=0.025,
+        invest_schedule=[{1: 111000}, {37: 60000}, {61: 10000}],
+        initial_shares=33,
+        seed=0,
+    )
+    print(bands.tail(12))
@@ -0,0 +1,82 @@
+"""
+find_pivots / detect_abc micro-benchmark
+
+比較原本逐根比較的 find_pivots_loop 與 NumPy 滑動視窗版 find_pivot_arrays，
+並用隨機漫步價格 (含大量平盤、重複價格以測試 tie-break) 確認兩者結果完全相同。
+
+執行：
+    python -m rpa_qt.trading_rebound.bench_pivots
+"""
+import time
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from rpa_qt.trading_rebound.tw_rebound_scanner import (detect_abc, find_pivot_arrays, find_pivots,
+                                                       find_pivots_loop, MIN_REBOUND, N_PCT)
+
+
+def detect_abc_loop(close: pd.Series, n_pct: float, min_rebound: float, neighbor: int = 1) -> Optional[Dict]:
+    """原本以 tuple list 逐組比較的 detect_abc，作為對照。"""
+    pivots = find_pivots_loop(close, neighbor=neighbor)
+    if len(pivots) < 3:
+        return None
+    candidates = []
+    for i in range(len(pivots) - 2):
+        (ia, pa, ka), (ib, pb, kb), (ic, pc, kc) = pivots[i], pivots[i + 1], pivots[i + 2]
+        if ka == 'H' and kb == 'L' and kc == 'H' and ia < ib < ic:
+            drop = (pa - pb) / pa
+            rebound = (pc - pb) / pb
+            if drop >= n_pct and rebound >= min_rebound:
+                if i + 3 < len(pivots):
+                    turned_down = pivots[i + 3][2] == 'L'
+                else:
+                    turned_down = float(close.iloc[-1]) < pc
+                if turned_down:
+                    candidates.append({"ia": ia, "pa": pa, "ib": ib, "pb": pb, "ic": ic, "pc": pc,
+                                       "drop": drop, "rebound": rebound})
+    if not candidates:
+        return None
+    return max(candidates, key=lambda d: d["ic"])
+
+
+def make_close(n: int, seed: int) -> pd.Series:
+    """隨機漫步收盤價，四捨五入到 0.5 元讓相鄰價格常常相等。"""
+    rng = np.random.default_rng(seed)
+    close = np.round(100 * np.exp(np.cumsum(rng.normal(0, 0.04, n))) * 2) / 2
+    return pd.Series(close, index=pd.bdate_range("2020-01-01", periods=n))
+
+
+def check_identical(trials: int = 300):
+    for seed in range(trials):
+        close = make_close(int(np.random.default_rng(seed).integers(1, 400)), seed)
+        for neighbor in (1, 2, 3):
+            assert find_pivots(close, neighbor) == find_pivots_loop(close, neighbor), (seed, neighbor)
+            for n_pct in (0.05, 0.1, N_PCT):
+                assert detect_abc(close, n_pct, 0.5 * n_pct, neighbor) == \
+                       detect_abc_loop(close, n_pct, 0.5 * n_pct, neighbor), (seed, neighbor, n_pct)
+    print(f"{trials} 組隨機價格 x neighbor 1~3：find_pivots / detect_abc 與原版結果完全相同")
+
+
+def bench(fn, *args, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+if __name__ == '__main__':
+    check_identical()
+
+    for n in (130, 1000, 5000):  # 130 ≈ 6 個月日K
+        close = make_close(n, seed=n)
+        t_loop = bench(find_pivots_loop, close, 1)
+        t_vec = bench(find_pivot_arrays, close, 1)
+        t_abc_loop = bench(detect_abc_loop, close, N_PCT, MIN_REBOUND)
+        t_abc_vec = bench(detect_abc, close, N_PCT, MIN_REBOUND)
+        print(f"n={n:5d}  find_pivots: loop {t_loop * 1e3:8.2f} ms / numpy {t_vec * 1e3:6.3f} ms "
+              f"({t_loop / t_vec:6.0f}x)   detect_abc: loop {t_abc_loop * 1e3:8.2f} ms / "
+              f"numpy {t_abc_vec * 1e3:6.3f} ms ({t_abc_loop / t_abc_vec:6.0f}x)")
@@ -0,0 +1,131 @@
+"""
+整個股票池一次計算的 ABC 反彈偵測 (Panel-wide ABC detection)
+
+輸入為 2-D 收盤價陣列 close[日期, 股票]，缺值為 NaN (未上市、停牌、或不在回看區間內)。
+* find_pivots_panel：每一欄去掉 NaN 後找 pivot，規則與 tw_rebound_scanner.find_pivots 完全相同，
+  所有股票的 pivot 攤平成依 (股票, 日期) 排序的陣列。
+* detect_abc_panel：在攤平的 pivot 陣列上一次比較所有連續三個 pivot，
+  取每檔股票最後一組符合的 (A, B, C)，結果與逐檔 detect_abc 相同。
+
+pivot 只和 neighbor 有關，同一份 pivot 可以用不同的 n_pct / min_rebound 重複呼叫 detect_abc_panel，
+做參數敏感度分析時不必重新計算。
+"""
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def align_frames(frames: Dict[str, pd.DataFrame], columns: List[str]):
+    """
+    把多檔日K對齊到所有日期的聯集。
+    回傳 (codes, dates, values)，values[欄位, 日期, 股票]，沒有資料的位置為 NaN。
+    以 searchsorted 直接填值，比 pd.concat 逐欄 reindex 快很多。
+    """
+    codes = list(frames)
+    if not codes:
+        return codes, pd.DatetimeIndex([]), np.empty((len(columns), 0, 0))
+    day_values = np.unique(np.concatenate([frames[code].index.values for code in codes]))
+    values = np.full((len(columns), len(day_values), len(codes)), np.nan)
+    for j, code in enumerate(codes):
+        df = frames[code]
+        rows = np.searchsorted(day_values, df.index.values)
+        values[:, rows, j] = df[columns].to_numpy(dtype=float).T
+    return codes, pd.DatetimeIndex(day_values), values
+
+
+def compact_panel(close: np.ndarray):
+    """
+    把每一欄的 NaN 移到最前面、有效值依原順序排在後面 (等同每欄各自 dropna 後靠下對齊)。
+    回傳 (compact, order)：compact[r, c] = close[order[r, c], c]
+    """
+    order = np.argsort(~np.isnan(close), axis=0, kind="stable")  # NaN (False) 在前
+    return np.take_along_axis(close, order, axis=0), order
+
+
+def find_pivots_panel(close: np.ndarray, neighbor: int = 1) -> Dict[str, np.ndarray]:
+    """
+    :param close: 收盤價 [日期, 股票]
+    :return: dict of arrays，依 (col, row) 排序：
+             col (股票欄位)、row (close 中的列)、pos (去掉 NaN 後的位置)、price、kind ('H' / 'L')
+    """
+    close = np.asarray(close, dtype=float)
+    if close.ndim == 1:
+        close = close[:, None]
+    compact, order = compact_panel(close)
+    width = 2 * neighbor + 1
+    n_rows, n_cols = compact.shape
+    if n_rows < width:
+        empty = np.empty(0, dtype=np.int64)
+        return {"col": empty, "row": empty, "pos": empty, "price": np.empty(0), "kind": np.empty(0, dtype="<U1")}
+
+    window = sliding_window_view(compact, width, axis=0)  # [n_rows - 2n, n_cols, width]
+    center = compact[neighbor:n_rows - neighbor]
+    left = window[..., 0]
+    right = window[..., -1]
+    # 視窗內有 NaN 代表超出這檔股票的資料範圍 (逐檔版本不會檢查這些位置)
+    complete = ~np.isnan(window).any(axis=2)
+    with np.errstate(invalid="ignore"):
+        is_high = complete & (center == window.max(axis=2)) & ((center > left) | (center > right))
+        is_low = complete & ~is_high & (center == window.min(axis=2)) & ((center < left) | (center < right))
+
+    cols, rows = np.nonzero((is_high | is_low).T)  # 依股票、再依日期排序
+    first_valid = np.isnan(close).sum(axis=0)  # 每欄前面有幾個 NaN
+    return {
+        "col": cols,
+        "row": order[rows + neighbor, cols],
+        "pos": rows + neighbor - first_valid[cols],
+        "price": center[rows, cols],
+        "kind": np.where(is_high[rows, cols], "H", "L"),
+    }
+
+
+def last_valid(close: np.ndarray) -> np.ndarray:
+    """每一欄最後一個有效收盤價 (全為 NaN 的欄位為 NaN)。"""
+    compact, _ = compact_panel(np.asarray(close, dtype=float))
+    return compact[-1]
+
+
+def detect_abc_panel(pivots: Dict[str, np.ndarray], last_close: np.ndarray,
+                     n_pct: float, min_rebound: float) -> Dict[str, np.ndarray]:
+    """
+    對所有股票一次找 (A 高點, B 低點, C 高點)，條件同 detect_abc：
+    - (A->B) 跌幅 >= n_pct，(B->C) 漲幅 >= min_rebound
+    - C 之後轉跌：同一檔的下一個 pivot 是低點；沒有下一個 pivot 則看最新收盤 < C
+    每檔只保留最後一組 (離現在最近的 C)。
+
+    :param last_close: 每一欄最後的收盤價，見 last_valid()
+    :return: dict of arrays，每檔命中的股票一筆：col、ia / ib / ic (close 中的列)、
+             pa / pb / pc、drop、rebound
+    """
+    col, price, kind, row = pivots["col"], pivots["price"], pivots["kind"], pivots["row"]
+    m = len(col)
+    if m < 3:
+        empty = np.empty(0, dtype=np.int64)
+        return {k: empty for k in ("col", "ia", "ib", "ic")} | \
+               {k: np.empty(0) for k in ("pa", "pb", "pc", "drop", "rebound")}
+
+    pa, pb, pc = price[:-2], price[1:-1], price[2:]
+    same = col[:-2] == col[2:]  # 三個 pivot 屬於同一檔 (已依股票排序，中間那個也一定是)
+    drop = (pa - pb) / pa
+    rebound = (pc - pb) / pb
+
+    has_next = np.zeros(m - 2, dtype=bool)
+    has_next[:-1] = col[3:] == col[:-3]
+    next_low = np.zeros(m - 2, dtype=bool)
+    next_low[:-1] = kind[3:] == "L"
+    turned_down = np.where(has_next, next_low, last_close[col[:-2]] < pc)
+
+    ok = (same & (kind[:-2] == "H") & (kind[1:-1] == "L") & (kind[2:] == "H")
+          & (drop >= n_pct) & (rebound >= min_rebound) & turned_down)
+    hits = np.flatnonzero(ok)
+    # 每檔最後一組
+    hits = hits[np.append(col[hits][1:] != col[hits][:-1], True)] if len(hits) else hits
+
+    return {
+        "col": col[hits],
+        "ia": row[hits], "ib": row[hits + 1], "ic": row[hits + 2],
+        "pa": pa[hits], "pb": pb[hits], "pc": pc[hits],
+        "drop": drop[hits], "rebound": rebound[hits],
+    }
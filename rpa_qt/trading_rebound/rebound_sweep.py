@@ -0,0 +1,153 @@
+"""
+反彈掃描 + 追蹤的參數掃描 (Parameter sweep)
+
+N_PCT、MIN_REBOUND、LOOKBACK_MONTHS、PIVOT_NEIGHBOR 原本是 tw_rebound_scanner 的常數，
+每換一組就要改程式、重新下載。這裡把一組參數網格丟進 process pool：
+* 股票池的 OHLC 只下載一次 (經由本機快取)，對齊成 values[欄位, 日期, 股票] 後放進 shared memory，
+  各個 worker 直接掛上同一塊記憶體，不必複製或 pickle 整個 panel。
+* 每個 worker 負責一組參數：在歷史上每 step 個交易日做一次「當天的掃描」(rebound_panel 一次算全部股票)，
+  目前價格在可買區間的股票，隔天開盤買入，以 tw_rebound_tracker 的規則 (停損 5%、高點回落 3% 停利、
+  持有一個月) 計算結果。
+* 同一組 A/B/C 連續幾天都在可買區間只算一筆 (第一次出現的那天)。
+
+執行：
+    python -m rpa_qt.trading_rebound.rebound_sweep
+輸出：rebound_sweep.csv (每組參數一列)
+"""
+import itertools
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from rpa_qt.trading_rebound.rebound_panel import align_frames, detect_abc_panel, find_pivots_panel
+from rpa_qt.trading_rebound.tw_rebound_scanner import (download_universe, EXTRA_BUFFER_DAYS, LOOKBACK_MONTHS,
+                                                       load_universe, MIN_REBOUND, N_PCT, PIVOT_NEIGHBOR)
+from rpa_qt.trading_rebound.tw_rebound_tracker import (HOLD_MONTHS, simulate_trade, STOP_PCT, summarize,
+                                                       TRAIL_PCT)
+
+FIELDS = ["Open", "High", "Low", "Close"]
+DEFAULT_GRID = {
+    "n_pct": [0.15, N_PCT, 0.25],
+    "min_rebound": [0.075, MIN_REBOUND],
+    "lookback_months": [3, LOOKBACK_MONTHS],
+    "neighbor": [PIVOT_NEIGHBOR, 2],
+}
+MIN_BARS = 30
+
+# worker 端掛上的 shared memory 與 panel (每個 process 一份)
+_worker = {}
+
+
+def _init_worker(shm_name: str, shape, dates: np.ndarray, asof_rows: np.ndarray, hold_months: int,
+                 stop_pct: float, trail_pct: float):
+    # 這塊記憶體由主程式建立與釋放 (unlink)，worker 只是掛上來讀取
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker.update(shm=shm, values=np.ndarray(shape, dtype=np.float64, buffer=shm.buf),
+                   dates=pd.DatetimeIndex(dates), asof_rows=asof_rows, hold_months=hold_months,
+                   stop_pct=stop_pct, trail_pct=trail_pct)
+
+
+def evaluate_params(values: np.ndarray, dates: pd.DatetimeIndex, asof_rows, n_pct: float, min_rebound: float,
+                    lookback_months: int, neighbor: int, hold_months: int = HOLD_MONTHS,
+                    stop_pct: float = STOP_PCT, trail_pct: float = TRAIL_PCT) -> pd.DataFrame:
+    """
+    一組參數在所有掃描日的交易結果。
+    :param values: [Open/High/Low/Close, 日期, 股票]
+    :return: 每筆交易一列：col、signal_row、return_pct、exit_reason、hold_days
+    """
+    opens, highs, lows, close = values
+    seen = set()
+    trades = []
+    for t in asof_rows:
+        as_of = dates[t]
+        first = dates.searchsorted(as_of - pd.DateOffset(months=lookback_months) - pd.Timedelta(days=EXTRA_BUFFER_DAYS))
+        window = close[first:t + 1].copy()
+        # 掃描日沒有收盤價 (停牌 / 未上市) 或資料太少的股票不列入
+        window[:, np.isnan(window[-1])] = np.nan
+        window[:, (~np.isnan(window)).sum(axis=0) < MIN_BARS] = np.nan
+
+        pivots = find_pivots_panel(window, neighbor=neighbor)
+        last_close = window[-1]
+        abc = detect_abc_panel(pivots, last_close, n_pct=n_pct, min_rebound=min_rebound)
+        current = last_close[abc["col"]]
+        in_zone = ((abc["pb"] + abc["pc"]) / 2.0 <= current) & (current <= abc["pc"])
+
+        end = dates.searchsorted(dates[t + 1] + pd.DateOffset(months=hold_months), side="right")
+        for j in np.flatnonzero(in_zone):
+            col = abc["col"][j]
+            key = (col, first + abc["ic"][j])
+            if key in seen:
+                continue
+            seen.add(key)
+            rows = slice(t + 1, end)
+            ohlc = np.stack([opens[rows, col], highs[rows, col], lows[rows, col], close[rows, col]])
+            ohlc = ohlc[:, ~np.isnan(ohlc).any(axis=0)]  # 停牌日跳過
+            if ohlc.shape[1] == 0:
+                continue
+            i, exit_price, reason = simulate_trade(*ohlc, stop_pct=stop_pct, trail_pct=trail_pct)
+            trades.append({"col": col, "signal_row": t, "return_pct": (exit_price / ohlc[0, 0] - 1) * 100,
+                           "exit_reason": reason, "hold_days": i + 1})
+    return pd.DataFrame(trades, columns=["col", "signal_row", "return_pct", "exit_reason", "hold_days"])
+
+
+def _evaluate_in_worker(params: Dict) -> Dict:
+    started = time.perf_counter()
+    trades = evaluate_params(_worker["values"], _worker["dates"], _worker["asof_rows"],
+                             hold_months=_worker["hold_months"], stop_pct=_worker["stop_pct"],
+                             trail_pct=_worker["trail_pct"], **params)
+    return {**params, **summarize(trades), "seconds": round(time.perf_counter() - started, 2)}
+
+
+def scan_dates(dates: pd.DatetimeIndex, start, step: int, hold_months: int) -> np.ndarray:
+    """從 start 開始每 step 個交易日掃描一次，只取之後還有完整持有期資料的日期。"""
+    first = dates.searchsorted(pd.Timestamp(start))
+    last_signal = dates.searchsorted(dates[-1] - pd.DateOffset(months=hold_months)) - 1
+    return np.arange(first, max(first, last_signal), step)
+
+
+def run_sweep(data: Dict[str, tuple], grid: Dict[str, List] = None, start=None, step: int = 5,
+              max_workers: int = None, hold_months: int = HOLD_MONTHS, stop_pct: float = STOP_PCT,
+              trail_pct: float = TRAIL_PCT) -> pd.DataFrame:
+    """
+    :param data: download_universe 的結果 (需包含 start 之前 LOOKBACK_MONTHS 的歷史)
+    :param grid: 參數網格，key 為 n_pct / min_rebound / lookback_months / neighbor
+    :param start: 第一個掃描日，預設為資料第一天之後一年
+    :param step: 每幾個交易日掃描一次
+    :return: 每組參數一列，欄位為參數與 summarize() 的統計
+    """
+    grid = grid or DEFAULT_GRID
+    codes, dates, values = align_frames({code: frame for code, (_, frame, _) in data.items()}, FIELDS)
+    if start is None:
+        start = dates[0] + pd.DateOffset(years=1)
+    asof_rows = scan_dates(dates, start, step, hold_months)
+    keys = list(grid)
+    combos = [dict(zip(keys, combo)) for combo in itertools.product(*(grid[k] for k in keys))]
+    print(f"{len(codes)} 檔 x {len(dates)} 天，{len(asof_rows)} 個掃描日，{len(combos)} 組參數")
+
+    shm = shared_memory.SharedMemory(create=True, size=values.nbytes)
+    try:
+        np.ndarray(values.shape, dtype=np.float64, buffer=shm.buf)[:] = values
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(shm.name, values.shape, dates.values, asof_rows, hold_months,
+                                           stop_pct, trail_pct)) as pool:
+            results = list(pool.map(_evaluate_in_worker, combos))
+    finally:
+        shm.close()
+        shm.unlink()
+    return pd.DataFrame(results)
+
+
+if __name__ == '__main__':
+    universe, _ = load_universe()
+    data = download_universe(universe, start=pd.Timestamp.today().normalize() - pd.DateOffset(years=2))
+    started = time.perf_counter()
+    out_df = run_sweep(data)
+    print(f"完成，耗時 {time.perf_counter() - started:.1f}s")
+    print(out_df.sort_values("avg_return_pct", ascending=False).to_string(index=False))
+    save_path = "rebound_sweep.csv"
+    out_df.to_csv(save_path, index=False, encoding="utf-8-sig")
+    print(f"結果已儲存：{save_path}")
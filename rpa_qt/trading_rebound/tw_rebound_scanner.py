@@ -23,8 +23,12 @@ from typing import List, Tuple, Optional, Dict
 import numpy as np
 import pandas as pd
 import yfinance as yf
+from numpy.lib.stride_tricks import sliding_window_view
 
 from rpa_qt.db.df_utils import csv_to_df
+from rpa_qt.price_utils.ohlcv_cache import get_ohlcv
+from rpa_qt.price_utils.tw_symbols import resolve_yahoo_symbols
+from rpa_qt.trading_rebound.rebound_panel import align_frames, detect_abc_panel, find_pivots_panel, last_valid
 from rpa_qt.root import ROOT_DIR
 
 # ------ 參數區 ------
@@ -92,36 +96,92 @@ def load_universe() -> Tuple[List[str],List[str]]:
     return default_list,[]
 
 
+def lookback_start() -> pd.Timestamp:
+    return pd.Timestamp.today().normalize() - pd.DateOffset(months=6)  # 近 6 個月
+
+
 def try_download_symbol(numeric_code: str) -> Tuple[str, Optional[pd.DataFrame], Optional[str]]:
     """
     給純數字代碼，如 '2330'。
-    依序嘗試 '2330.TW'（上市）、'2330.TWO'（上櫃）。
+    依已存檔的對照表 / tw_tickers_detailed.csv 的 market 欄決定 '2330.TW'（上市）或 '2330.TWO'（上櫃）。
     成功時回傳 (yahoo_symbol, df, exchange)
     若都失敗，回傳 (original, None, None)
     """
-    for suffix, exch in [(".TW", "TWSE"), (".TWO", "TPEX")]:
-        symbol = numeric_code + suffix
-        try:
-            df = yf.download(symbol, period="6mo", interval="1d", progress=False, auto_adjust=False)
-            if df is not None and len(df) > 0:
-                df = df[["Open", "High", "Low", "Close", "Adj Close", "Volume"]].dropna()
-                return symbol, df, exch
-        except Exception:
-            pass
+    resolved = resolve_yahoo_symbols([numeric_code])
+    if numeric_code not in resolved:
+        return numeric_code, None, None
+    symbol, exch = resolved[numeric_code]
+    try:
+        # df = yf.download(symbol, period="6mo", interval="1d", progress=False, auto_adjust=False)
+        df = get_ohlcv(symbol, lookback_start()) # 經由本機快取，只下載快取之後的新資料
+        if df is not None and len(df) > 0:
+            df = df[["Open", "High", "Low", "Close", "Adj Close", "Volume"]].dropna()
+            return symbol, df, exch
+    except Exception:
+        pass
     return numeric_code, None, None
 
 
+def download_universe(codes: List[str], batch_size: int = 100, max_workers: int = 4,
+                      start=None) -> Dict[str, Tuple[str, pd.DataFrame, str]]:
+    """
+    一次下載整個股票池：先解析每個代碼的後綴，再以多檔合併的 yf.download 分批、並行下載。
+    回傳 dict: code -> (yahoo_symbol, df, exchange)；沒有資料的代碼不列入。
+    start: 起始日期，預設為近 6 個月
+    """
+    resolved = resolve_yahoo_symbols(codes)
+    frames = get_ohlcv([ysym for ysym, _ in resolved.values()], start if start is not None else lookback_start(),
+                       batch_size=batch_size, max_workers=max_workers)
+    universe = {}
+    for code, (ysym, exch) in resolved.items():
+        df = frames.get(ysym)
+        if df is not None and len(df) > 0:
+            universe[code] = (ysym, df[["Open", "High", "Low", "Close", "Adj Close", "Volume"]].dropna(), exch)
+    return universe
+
+
 def slice_last_n_months(df: pd.DataFrame, months: int = 3, extra_days: int = 20) -> pd.DataFrame:
     end_date = df.index.max()
     start_date = end_date - pd.DateOffset(months=months) - pd.Timedelta(days=extra_days)
     return df[df.index >= start_date]
 
 
+def find_pivot_arrays(close, neighbor: int = 1) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    以 NumPy 滑動視窗一次找出所有區域極值（pivot），規則與 find_pivots_loop 完全相同：
+    - 高點：center 為視窗最大值，且大於視窗最左或最右的值
+    - 低點：不是高點，center 為視窗最小值，且小於視窗最左或最右的值
+    回傳三個陣列 (index_pos, price, kind)，kind 為 'H' 或 'L'
+    """
+    values = np.asarray(close, dtype=float).ravel()
+    width = 2 * neighbor + 1
+    if len(values) < width:
+        return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0, dtype="<U1")
+
+    window = sliding_window_view(values, width)  # 第 j 列為以 j+neighbor 為中心的視窗
+    center = values[neighbor:len(values) - neighbor]
+    left = window[:, 0]
+    right = window[:, -1]
+    # fmax / fmin 會略過 NaN，與 pandas 的 max() / min() 一致
+    is_high = (center == np.fmax.reduce(window, axis=1)) & ((center > left) | (center > right))
+    is_low = ~is_high & (center == np.fmin.reduce(window, axis=1)) & ((center < left) | (center < right))
+
+    pos = np.flatnonzero(is_high | is_low)
+    kind = np.where(is_high[pos], "H", "L")
+    return pos + neighbor, center[pos], kind
+
+
 def find_pivots(close: pd.Series, neighbor: int = 1) -> List[Tuple[int, float, str]]:
     """
     以簡單相鄰比較找區域極值（pivot），回傳 list of (index_pos, price, kind)
     kind: 'H'（高點）或 'L'（低點）
     """
+    idx, price, kind = find_pivot_arrays(close, neighbor=neighbor)
+    return [(int(i), float(p), str(k)) for i, p, k in zip(idx, price, kind)]
+
+
+def find_pivots_loop(close: pd.Series, neighbor: int = 1) -> List[Tuple[int, float, str]]:
+    """原本逐根比較的版本，保留作為 find_pivots 的對照與 benchmark。"""
     pivots = []
     for i in range(neighbor, len(close) - neighbor):
         window = close.iloc[i - neighbor:i + neighbor + 1]
@@ -140,6 +200,34 @@ def find_pivots(close: pd.Series, neighbor: int = 1) -> List[Tuple[int, float, s
     return pivots
 
 
+def detect_abc_arrays(idx: np.ndarray, price: np.ndarray, kind: np.ndarray, last_close: float,
+                      n_pct: float, min_rebound: float) -> Optional[Dict]:
+    """
+    直接在 pivot 陣列上找 (A 高點, B 低點, C 高點)，規則同 detect_abc。
+    連續三個 pivot 的組合一次比較完，回傳離現在最近的一組（最後一個符合的 C）。
+    """
+    if len(idx) < 3:
+        return None
+
+    pa, pb, pc = price[:-2], price[1:-1], price[2:]
+    drop = (pa - pb) / pa
+    rebound = (pc - pb) / pb
+    # C 之後轉跌：下一個 pivot 是低點；最後一組沒有下一個 pivot，用「最近價格 < C」判斷
+    turned_down = np.append(kind[3:] == "L", last_close < price[-1])
+    ok = ((kind[:-2] == "H") & (kind[1:-1] == "L") & (kind[2:] == "H")
+          & (drop >= n_pct) & (rebound >= min_rebound) & turned_down)
+
+    hits = np.flatnonzero(ok)
+    if len(hits) == 0:
+        return None
+
+    i = hits[-1]
+    return {
+        "ia": int(idx[i]), "pa": float(pa[i]),
+        "ib": int(idx[i + 1]), "pb": float(pb[i]),
+        "ic": int(idx[i + 2]), "pc": float(pc[i]),
+        "drop": float(drop[i]), "rebound": float(rebound[i])
+    }
 
 
 def detect_abc(close: pd.Series, n_pct: float, min_rebound: float, neighbor: int = 1) -> Optional[Dict]:
@@ -152,44 +240,10 @@ def detect_abc(close: pd.Series, n_pct: float, min_rebound: float, neighbor: int
     若找到，回傳 dict，否則 None。
     若有多組，回傳離現在最近的一組。
     """
-    pivots = find_pivots(close, neighbor=neighbor)
-    if len(pivots) < 3:
-        return None
-
-    candidates = []
-    for i in range(len(pivots) - 2):
-        (ia, pa, ka) = pivots[i]
-        (ib, pb, kb) = pivots[i + 1]
-        (ic, pc, kc) = pivots[i + 2]
-        if ka == 'H' and kb == 'L' and kc == 'H' and ia < ib < ic:
-            drop = (pa - pb) / pa
-            rebound = (pc - pb) / pb
-            if drop >= n_pct and rebound >= min_rebound:
-                # 檢查C後是否轉跌
-                turned_down = False
-                if i + 3 < len(pivots):
-                    next_kind = pivots[i + 3][2]
-                    if next_kind == 'L':
-                        turned_down = True
-                else:
-                    # 沒有下一個pivot，用「最近價格 < C」當作轉跌跡象
-                    if float(close.iloc[-1]) < pc:
-                        turned_down = True
-
-                if turned_down:
-                    candidates.append({
-                        "ia": ia, "pa": pa,
-                        "ib": ib, "pb": pb,
-                        "ic": ic, "pc": pc,
-                        "drop": drop, "rebound": rebound
-                    })
-
-    if not candidates:
-        return None
-
-    # 取離現在最近的C
-    best = max(candidates, key=lambda d: d["ic"])
-    return best
+    values = np.asarray(close, dtype=float).ravel()
+    idx, price, kind = find_pivot_arrays(values, neighbor=neighbor)
+    return detect_abc_arrays(idx, price, kind, float(values[-1]) if len(values) else np.nan,
+                             n_pct=n_pct, min_rebound=min_rebound)
 
 
 def scan_symbol(numeric_code: str, n_pct: float = N_PCT, min_rebound: float = MIN_REBOUND,
@@ -210,7 +264,12 @@ def scan_symbol(numeric_code: str, n_pct: float = N_PCT, min_rebound: float = MI
     ysym, df, exch = try_download_symbol(numeric_code)
     if df is None:
         return None
+    return scan_frame(numeric_code, ysym, exch, df, n_pct=n_pct, min_rebound=min_rebound, neighbor=neighbor)
 
+
+def scan_frame(numeric_code: str, ysym: str, exch: str, df: pd.DataFrame, n_pct: float = N_PCT,
+               min_rebound: float = MIN_REBOUND, neighbor: int = PIVOT_NEIGHBOR) -> Optional[Dict]:
+    """對已下載的日K執行 ABC 偵測，回傳格式同 scan_symbol。"""
     df = slice_last_n_months(df, months=LOOKBACK_MONTHS, extra_days=EXTRA_BUFFER_DAYS)
     if len(df) < 30:  # 資料太少
         return None
@@ -260,42 +319,112 @@ def scan_symbol(numeric_code: str, n_pct: float = N_PCT, min_rebound: float = MI
     }
 
 
-def run_scan():
-    universe,names = load_universe()
-    results = []
-    for i,code in enumerate(universe):
-        try:
-            row = scan_symbol(code, n_pct=N_PCT, min_rebound=MIN_REBOUND, neighbor=PIVOT_NEIGHBOR)
-            if row:
-                # row add symbol name
-                if names and i < len(names):
-                    row["name"] = names[i]
-                else:
-                    row["name"] = ""
+CANDIDATE_COLUMNS = ["symbol", "exchange", "buy_high", "buy_low", "drop_pct", "stop_loss",
+                     "A_date", "B_date", "C_date", "A", "B", "C", "last_close", "last_date", "name"]
 
 
+def candidates_to_frame(results: List[Dict]) -> pd.DataFrame:
+    """整理成 rebound_candidates.csv 的格式。"""
+    if results:
+        return pd.DataFrame(results)[CANDIDATE_COLUMNS].sort_values(["exchange", "symbol"]).reset_index(drop=True)
+    return pd.DataFrame(columns=CANDIDATE_COLUMNS)
 
-                results.append(row)
-        except Exception as e:
-            # 不中斷，繼續掃描其他股票
-            print(f"掃描 {code} 時發生錯誤：{e}")
-            pass
 
-    if results:
-        out_df = pd.DataFrame(results)[
-            ["symbol", "exchange", "buy_high", "buy_low", "drop_pct", "stop_loss",
-             "A_date", "B_date", "C_date", "A", "B", "C", "last_close", "name"]
-        ].sort_values(["exchange", "symbol"]).reset_index(drop=True)
-    else:
-        out_df = pd.DataFrame(columns=[
-            "symbol", "exchange", "buy_high", "buy_low", "drop_pct", "stop_loss",
-            "A_date", "B_date", "C_date", "A", "B", "C", "last_close", "name"
-        ])
+def build_close_panel(data: Dict[str, Tuple[str, pd.DataFrame, str]], months: int = LOOKBACK_MONTHS,
+                      extra_days: int = EXTRA_BUFFER_DAYS, min_bars: int = 30):
+    """
+    把 download_universe 的結果整理成 2-D 收盤價陣列 close[日期, 股票]。
+    每檔依自己的最後日期只保留近 months 個月 (同 slice_last_n_months)，資料不足 min_bars 的整欄設為 NaN。
+    回傳 (codes, dates, close)
+    """
+    codes, dates, values = align_frames({code: data[code][1] for code in data}, ["Close"])
+    if not codes:
+        return codes, dates, np.empty((0, 0))
+    values = values[0]
+    last_dates = [data[code][1].index.max() for code in codes]
+
+    start_dates = pd.DatetimeIndex(last_dates) - pd.DateOffset(months=months) - pd.Timedelta(days=extra_days)
+    close = np.where(dates.values[:, None] >= start_dates.values[None, :], values, np.nan)
+    close[:, (~np.isnan(close)).sum(axis=0) < min_bars] = np.nan  # 資料太少
+    return codes, dates, close
+
+
+def scan_panel(data: Dict[str, Tuple[str, pd.DataFrame, str]], names_by_code: Dict[str, str] = None,
+               n_pct: float = N_PCT, min_rebound: float = MIN_REBOUND, neighbor: int = PIVOT_NEIGHBOR,
+               panel=None, pivots=None) -> pd.DataFrame:
+    """
+    整個股票池一次偵測 ABC，回傳目前價格在可買區間的候選表 (rebound_candidates.csv 的格式)，
+    結果與逐檔 scan_frame 相同。
+
+    :param panel: build_close_panel 的結果，None 則由 data 建立
+    :param pivots: find_pivots_panel 的結果，None 則重新計算；用不同 n_pct / min_rebound 重複掃描時可共用
+    """
+    codes, dates, close = panel if panel is not None else build_close_panel(data)
+    if pivots is None:
+        pivots = find_pivots_panel(close, neighbor=neighbor)
+    last_close = last_valid(close)
+    abc = detect_abc_panel(pivots, last_close, n_pct=n_pct, min_rebound=min_rebound)
+
+    # 可買區間：[(B+C)/2, C]
+    buy_low = (abc["pb"] + abc["pc"]) / 2.0
+    buy_high = abc["pc"]
+    current = last_close[abc["col"]]
+    in_zone = (buy_low <= current) & (current <= buy_high)
+
+    names_by_code = names_by_code or {}
+    results = []
+    for j in np.flatnonzero(in_zone):
+        code = codes[abc["col"][j]]
+        ysym, df, exch = data[code]
+        pa, pb, pc = float(abc["pa"][j]), float(abc["pb"][j]), float(abc["pc"][j])
+        results.append({
+            "symbol": ysym,
+            "exchange": exch,
+            "A_date": dates[abc["ia"][j]].date(),
+            "B_date": dates[abc["ib"][j]].date(),
+            "C_date": dates[abc["ic"][j]].date(),
+            "A": round(pa, 2),
+            "B": round(pb, 2),
+            "C": round(pc, 2),
+            "drop_pct": round(float(abc["drop"][j]) * 100, 2),
+            "buy_high": round(pc, 2),
+            "buy_low": round((pb + pc) / 2.0, 2),
+            "stop_loss": round(pb, 2),
+            "last_close": round(float(current[j]), 2),
+            "last_date": df.index[-1].date(),
+            "name": names_by_code.get(code, ""),
+        })
+    return candidates_to_frame(results)
+
+
+def scan_sensitivity(data: Dict[str, Tuple[str, pd.DataFrame, str]], n_pcts, rebound_ratio: float = 0.5,
+                     neighbor: int = PIVOT_NEIGHBOR) -> pd.DataFrame:
+    """
+    用多組 n_pct (min_rebound = rebound_ratio * n_pct) 掃描同一份資料，panel 與 pivot 只計算一次。
+    回傳每組的候選表合併在一起，加上 n_pct、min_rebound 欄位。
+    """
+    panel = build_close_panel(data)
+    pivots = find_pivots_panel(panel[2], neighbor=neighbor)
+    tables = []
+    for n_pct in n_pcts:
+        table = scan_panel(data, n_pct=n_pct, min_rebound=rebound_ratio * n_pct, panel=panel, pivots=pivots)
+        tables.append(table.assign(n_pct=n_pct, min_rebound=rebound_ratio * n_pct))
+    return pd.concat(tables, ignore_index=True) if tables else pd.DataFrame()
+
+
+def run_scan():
+    universe,names = load_universe()
+    # 整個股票池分批一次下載，之後的偵測只用已載入的資料
+    data = download_universe(universe)
+    print(f"已載入 {len(data)} / {len(universe)} 檔日K")
+    # row add symbol name
+    names_by_code = dict(zip(universe, names)) if names else {}
+    out_df = scan_panel(data, names_by_code, n_pct=N_PCT, min_rebound=MIN_REBOUND, neighbor=PIVOT_NEIGHBOR)
 
     save_path = "rebound_candidates.csv"
     out_df.to_csv(save_path, index=False, encoding="utf-8-sig")
     print(f"完成。結果已儲存：{save_path}")
-    if results:
+    if len(out_df):
         print(out_df.to_string(index=False))
     else:
         print("目前沒有股票在可買區間。")
@@ -4,32 +4,143 @@
     於last_date當天隔天開盤買入，依停損5%，並且移動停利(高點回落3%賣出)
     於一個月後計算報酬率。
 
+出場規則 (simulate_trade)：
+    停損價 = 買進價 * (1 - 5%)
+    移動停利 = 買進後 (不含當天) 的最高價 * (1 - 3%)，只在此價格不低於買進價時啟動
+    當天最低價觸及出場價就出場；開盤已跳空低於出場價則以開盤價出場。
+    一個月內都沒有出場，以最後一天收盤價計算。
 """
+import os
+from typing import Dict
 
-# 載入rebound_candidates.csv to df
+import numpy as np
 import pandas as pd
-import os
+
 from rpa_qt.db.df_utils import csv_to_df
+from rpa_qt.price_utils.ohlcv_cache import get_ohlcv
 from rpa_qt.root import ROOT_DIR
-file_path = os.path.join(ROOT_DIR, 'trading_rebound', 'rebound_candidates.csv')
-df = csv_to_df(file_path)
-print(df.head())
+
+STOP_PCT = 0.05  # 停損 5%
+TRAIL_PCT = 0.03  # 高點回落 3% 停利
+HOLD_MONTHS = 1  # 持有一個月
+
+EXIT_STOP = "stop"
+EXIT_TRAIL = "trail"
+EXIT_TIME = "time"
+
+
+def simulate_trade(opens: np.ndarray, highs: np.ndarray, lows: np.ndarray, closes: np.ndarray,
+                   stop_pct: float = STOP_PCT, trail_pct: float = TRAIL_PCT):
+    """
+    以陣列一次計算一筆交易：第 0 天開盤買入，最後一天收盤前若沒觸發出場就以收盤價出場。
+
+    :return: (exit_offset, exit_price, reason)，exit_offset 為出場那天在陣列中的位置
+    """
+    entry = opens[0]
+    # 每一天開盤前已知的最高價 (買進價與前幾天的最高價)
+    peak = np.maximum.accumulate(np.concatenate([[entry], highs[:-1]]))
+    trail = peak * (1 - trail_pct)
+    level = np.full(len(opens), entry * (1 - stop_pct))
+    active = trail >= entry
+    level[active] = np.maximum(level[active], trail[active])
+
+    hit = np.flatnonzero(lows <= level)
+    if len(hit) == 0:
+        return len(closes) - 1, closes[-1], EXIT_TIME
+    i = hit[0]
+    reason = EXIT_TRAIL if active[i] else EXIT_STOP
+    return i, min(opens[i], level[i]), reason
+
+
+def track_symbol(df: pd.DataFrame, signal_date, stop_pct: float = STOP_PCT, trail_pct: float = TRAIL_PCT,
+                 hold_months: int = HOLD_MONTHS) -> Dict:
+    """
+    df 為日K (Open/High/Low/Close)，signal_date 的下一個交易日開盤買入。
+    資料不足一個月時以最後一天結算，status 為 'open'。
+    """
+    signal_date = pd.Timestamp(signal_date)
+    after = df[df.index > signal_date].dropna(subset=["Open", "High", "Low", "Close"])
+    if after.empty:
+        return {"entry_date": None, "entry_price": np.nan, "exit_date": None, "exit_price": np.nan,
+                "exit_reason": None, "return_pct": np.nan, "hold_days": 0, "status": "pending"}
+    entry_date = after.index[0]
+    horizon = after[after.index <= entry_date + pd.DateOffset(months=hold_months)]
+    i, exit_price, reason = simulate_trade(horizon["Open"].to_numpy(), horizon["High"].to_numpy(),
+                                           horizon["Low"].to_numpy(), horizon["Close"].to_numpy(),
+                                           stop_pct=stop_pct, trail_pct=trail_pct)
+    entry_price = float(horizon["Open"].iloc[0])
+    complete = reason != EXIT_TIME or after.index[-1] >= entry_date + pd.DateOffset(months=hold_months)
+    return {
+        "entry_date": entry_date.date(),
+        "entry_price": round(entry_price, 2),
+        "exit_date": horizon.index[i].date(),
+        "exit_price": round(float(exit_price), 2),
+        "exit_reason": reason,
+        "return_pct": round((exit_price / entry_price - 1) * 100, 2),
+        "hold_days": int(i) + 1,
+        "status": "closed" if complete else "open",
+    }
+
+
+def summarize(outcomes: pd.DataFrame) -> Dict:
+    """彙總 track_candidates 的結果：筆數、勝率、平均 / 中位數報酬、各出場原因比例。"""
+    done = outcomes.dropna(subset=["return_pct"])
+    n = len(done)
+    if n == 0:
+        return {"trades": 0}
+    returns = done["return_pct"]
+    return {
+        "trades": n,
+        "win_rate": round((returns > 0).mean() * 100, 2),
+        "avg_return_pct": round(returns.mean(), 2),
+        "median_return_pct": round(returns.median(), 2),
+        "stop_rate": round((done["exit_reason"] == EXIT_STOP).mean() * 100, 2),
+        "trail_rate": round((done["exit_reason"] == EXIT_TRAIL).mean() * 100, 2),
+        "time_rate": round((done["exit_reason"] == EXIT_TIME).mean() * 100, 2),
+        "avg_hold_days": round(done["hold_days"].mean(), 2),
+    }
+
+
+def track_candidates(df: pd.DataFrame, stop_pct: float = STOP_PCT, trail_pct: float = TRAIL_PCT,
+                     hold_months: int = HOLD_MONTHS) -> pd.DataFrame:
+    """對候選表的每一檔計算後續表現，日K經由本機快取一次批次取得。"""
+    if "last_date" not in df.columns:
+        raise ValueError("rebound_candidates.csv 沒有 last_date 欄位，請用新版 tw_rebound_scanner 重新產生")
+    start = pd.to_datetime(df["last_date"]).min()
+    frames = get_ohlcv(df["symbol"].tolist(), start)
+    rows = []
+    for _, row in df.iterrows():
+        prices = frames.get(row["symbol"])
+        if prices is None:
+            rows.append({"status": "no data"})
+            continue
+        rows.append(track_symbol(prices, row["last_date"], stop_pct, trail_pct, hold_months))
+    return pd.concat([df.reset_index(drop=True), pd.DataFrame(rows)], axis=1)
 
 
-# get symbol's chinese name
-symbol_path = ROOT_DIR+"/price_utils/tw_tickers_detailed.csv"
-symbols_df=csv_to_df(symbol_path)
-# get 'symbol' column as list
-if 'symbol' in symbols_df.columns:
-    symbol_name_dict = pd.Series(symbols_df.name.values,index=symbols_df.symbol).to_dict()
-    # bu df's 'symbol' need to skip '.TW' or '.TWO'
-    df['symbol_skip'] = df['symbol'].str.replace('.TW', '').str.replace('O', '')
-    df['symbol_skip'] = df['symbol_skip'].astype(int)
-    # map to symbol_name_dict's name
-    df['name'] = df['symbol_skip'].map(symbol_name_dict)
-    df.drop(columns=['symbol_skip'], inplace=True)
+if __name__ == '__main__':
+    # 載入rebound_candidates.csv to df
+    file_path = os.path.join(ROOT_DIR, 'trading_rebound', 'rebound_candidates.csv')
+    df = csv_to_df(file_path)
+    print(df.head())
 
-print(df.head())
+    # get symbol's chinese name
+    symbol_path = ROOT_DIR+"/price_utils/tw_tickers_detailed.csv"
+    symbols_df=csv_to_df(symbol_path)
+    # get 'symbol' column as list
+    if 'symbol' in symbols_df.columns:
+        symbol_name_dict = pd.Series(symbols_df.name.values,index=symbols_df.symbol).to_dict()
+        # bu df's 'symbol' need to skip '.TW' or '.TWO'
+        df['symbol_skip'] = df['symbol'].str.replace('.TW', '').str.replace('O', '')
+        df['symbol_skip'] = df['symbol_skip'].astype(int)
+        # map to symbol_name_dict's name
+        df['name'] = df['symbol_skip'].map(symbol_name_dict)
+        df.drop(columns=['symbol_skip'], inplace=True)
 
+    print(df.head())
 
-#
\ No newline at end of file
+    if 'last_date' in df.columns:
+        result = track_candidates(df)
+        print(result[["symbol", "name", "entry_date", "entry_price", "exit_date", "exit_price",
+                      "exit_reason", "return_pct", "status"]].to_string(index=False))
+        print(summarize(result))
@@ -0,0 +1,107 @@
+"""
+swing_vector (向量化) 與 trading_swing.backtest (共用引擎逐根 K 棒) 的對照與計時
+
+* check_identical：隨機漫步日 K (含趨勢段，讓 ATR 停損與訊號出場都會出現)，單檔逐筆比對交易 (日期、方向、價格、股數)
+  與權益曲線；再把多檔不同上市日的資料排成 panel，逐檔與單檔結果比對
+* bench：單檔與 panel (多檔一次) 的執行時間
+
+執行：
+    python -m rpa_qt.trading_swing.bench_swing
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from rpa_qt.trading_swing import swing_vector
+from rpa_qt.trading_swing.trading_swing import backtest, compute_indicators
+
+
+def make_fixture(n: int, seed: int, start: str = "2010-01-01") -> pd.DataFrame:
+    """隨機漫步的日 K，漂移每 250 天換一次方向。"""
+    rng = np.random.default_rng(seed)
+    drift = np.repeat(rng.normal(0, 0.002, n // 250 + 1), 250)[:n]
+    close = 100 * np.exp(np.cumsum(rng.normal(drift, 0.02)))
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.02, n))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.02, n))
+    return pd.DataFrame({"Open": open_, "High": high, "Low": low, "Close": close,
+                         "Volume": rng.integers(1_000, 100_000, n).astype(float)},
+                        index=pd.bdate_range(start, periods=n))
+
+
+def make_panel(n_tickers: int, n: int, seed: int = 0):
+    """多檔 panel：每檔上市日不同 (前段為 NaN)。回傳 (各檔 DataFrame, High / Low / Close panel)。"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2010-01-01", periods=n)
+    frames = {}
+    for m in range(n_tickers):
+        offset = int(rng.integers(0, n // 3))
+        frames[f"T{m:04d}"] = make_fixture(n - offset, seed * 10_000 + m, start=dates[offset])
+    fields = {name: pd.DataFrame({t: f[name] for t, f in frames.items()}, index=dates)
+              for name in ("High", "Low", "Close")}
+    return frames, fields
+
+
+def check_identical(trials: int = 20):
+    n_trades = 0
+    for seed in range(trials):
+        df = compute_indicators(make_fixture(3000, seed))
+        for kwargs in ({}, {"risk_per_trade": 0.02, "atr_mult": 3}, {"atr_mult": 1}):
+            t_loop, e_loop = backtest(df.copy(), **kwargs)
+            t_vec, e_vec = swing_vector.backtest(df, **kwargs)
+            pd.testing.assert_frame_equal(t_vec, t_loop, check_exact=True)
+            pd.testing.assert_frame_equal(e_vec, e_loop, check_exact=True)
+            n_trades += len(t_loop)
+    print(f"單檔：{trials} 組隨機價格 x 3 組參數 ({n_trades} 筆成交)，交易紀錄與權益曲線與逐根版本完全相同")
+
+    frames, fields = make_panel(50, 2000, seed=1)
+    panel = swing_vector.compute_indicators_panel(fields["High"], fields["Low"], fields["Close"])
+    panel["Close"] = fields["Close"]
+    result = swing_vector.backtest_panel(panel)
+    trades = result["trades"]
+    for ticker, frame in frames.items():
+        t_loop, e_loop = backtest(compute_indicators(frame.copy()))
+        mine = trades[trades["ticker"] == ticker]
+        buys = t_loop[t_loop["type"] == "BUY"]
+        assert len(mine) == len(buys), ticker
+        assert (mine["entry_date"].to_numpy() == buys["date"].to_numpy()).all(), ticker
+        assert np.array_equal(mine["qty"].to_numpy(), buys["qty"].to_numpy()), ticker
+        equity = result["equity"][ticker].loc[e_loop.index]
+        np.testing.assert_array_equal(equity.to_numpy(), e_loop["equity"].to_numpy())
+    print(f"panel：{len(frames)} 檔 ({len(trades)} 筆交易)，逐檔與單檔回測相同")
+
+
+def bench(fn, *args, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+if __name__ == "__main__":
+    check_identical()
+
+    for n in (1_000, 10_000, 50_000):  # 50k 根日 K 約 190 年
+        df = compute_indicators(make_fixture(n, seed=n))
+        t_loop = bench(backtest, df)
+        t_vec = bench(swing_vector.backtest, df)
+        print(f"單檔 n={n:7d}: engine loop {t_loop * 1e3:8.1f} ms / vectorized {t_vec * 1e3:7.1f} ms "
+              f"({t_loop / t_vec:4.0f}x)")
+
+    n_tickers, n = 500, 2500  # 500 檔 x 10 年
+    frames, fields = make_panel(n_tickers, n, seed=2)
+    started = time.perf_counter()
+    panel = swing_vector.compute_indicators_panel(fields["High"], fields["Low"], fields["Close"])
+    panel["Close"] = fields["Close"]
+    t_ind = time.perf_counter() - started
+    t_panel = bench(swing_vector.backtest_panel, panel, repeat=1)
+    sample = list(frames.values())[:20]
+    started = time.perf_counter()
+    for frame in sample:
+        backtest(compute_indicators(frame.copy()))
+    t_each = (time.perf_counter() - started) / len(sample) * n_tickers
+    print(f"panel {n_tickers} 檔 x {n} 天: 指標 {t_ind:.2f}s + 回測 {t_panel:.2f}s，"
+          f"逐檔 (估計) {t_each:.1f}s")
@@ -23,6 +23,8 @@ import matplotlib.pyplot as plt
 import argparse
 from datetime import datetime
 
+from rpa_qt.trading_swing.trading_swing import backtest as swing_backtest
+
 # --------------------------
 # 技術指標
 # --------------------------
@@ -94,52 +96,9 @@ def backtest(df, init_cash=1_000_000, risk_per_trade=0.01, atr_mult=2, fee=0.001
     * atr * atr_mult = 預設停損幅度 (每股可能虧損)。
     👉 意思是「依照停損位置反推，最多能買多少股才不會超過風險承受範圍」
 
+    與 trading_swing.backtest 相同的規則，直接使用共用回測引擎的版本。
     """
-    cash = init_cash
-    pos = 0
-    entry_price = 0
-    trades = []
-    equity_curve = []
-
-    # df for-loop get every row to dict
-
-
-
-
-
-    for i in range(len(df)):
-        row = df.iloc[i]
-        date, close, atr = row.name, row["Close"], row["ATR"]
-
-
-
-        # 開倉條件（多頭）
-        if pos == 0:
-            if (row["EMA20"] > row["EMA60"]) and (row["RSI"] > 50) and (row["K"] > row["D"]):
-                risk_amount = init_cash * risk_per_trade
-                qty = risk_amount // (atr * atr_mult)
-                if qty > 0:
-                    entry_price = close
-                    stop_loss = close - atr * atr_mult
-                    pos = qty
-                    trades.append({"date": date, "type": "BUY", "price": close, "qty": qty})
-                    cash -= qty * close * (1 + fee)
-
-        # 平倉條件
-        elif pos > 0:
-            stop_loss = entry_price - atr * atr_mult
-            if close < stop_loss or row["EMA20"] < row["EMA60"] or row["RSI"] < 45:
-                trades.append({"date": date, "type": "SELL", "price": close, "qty": pos})
-                cash += pos * close * (1 - fee)
-                pos = 0
-                entry_price = 0
-
-        equity = cash + pos * close
-        equity_curve.append({"date": date, "equity": equity})
-
-    df_equity = pd.DataFrame(equity_curve).set_index("date")
-    df_trades = pd.DataFrame(trades)
-    return df_trades, df_equity
+    return swing_backtest(df, init_cash, risk_per_trade, atr_mult, fee)
 
 # --------------------------
 # 績效分析
@@ -5,6 +5,10 @@ import matplotlib.pyplot as plt
 import argparse
 import os
 
+from rpa_qt.backtest.engine import FeeModel, run_backtest, Strategy
+from rpa_qt.price_utils.ohlcv_cache import get_ohlcv
+from rpa_qt.trading_swing import swing_vector
+
 # ----------------------------
 # 技術指標計算
 # ----------------------------
@@ -41,50 +45,54 @@ def compute_indicators(df):
 # ----------------------------
 # 交易策略邏輯
 # ----------------------------
-def backtest(df, init_capital=1000000, fee=0.001425, risk_per_trade=0.01):
-    df = compute_indicators(df).dropna()
-    cash = init_capital
-    position = 0
-    entry_price = 0
-    equity_curve = []
-    trades = []
-
-    for i in range(len(df)):
-        row = df.iloc[i]
-        date = row.name
-        close = row["Close"]
+class Swing02Strategy(Strategy):
+    """
+    多頭排列 (SMA20 > SMA60 > SMA120) + K > D + RSI > 50 進場，2ATR 停損 / 4ATR 停利出場。
+    出場後同一根 K 棒可以再進場；訊號與下單數量在 prepare() 一次算好。
+    """
+
+    def __init__(self, init_capital=1000000, risk_per_trade=0.01):
+        self.risk_amount = init_capital * risk_per_trade
+
+    def prepare(self, bars, broker):
+        sma20, sma60, sma120 = bars.array("SMA20"), bars.array("SMA60"), bars.array("SMA120")
+        atr = bars.array("ATR")
+        self.close = bars.list("Close")
+        self.atr = atr.tolist()
+        self.enter = ((sma20 > sma60) & (sma60 > sma120) & (bars.array("K") > bars.array("D"))
+                      & (bars.array("RSI") > 50)).tolist()
+        self.size = np.trunc(self.risk_amount / (2 * atr)).tolist()
+        self.entry_price = 0
+
+    def on_bar(self, i, broker):
+        close = self.close[i]
 
         # 持有部位檢查停損 / 停利
-        if position > 0:
-            atr = row["ATR"]
-            stop_loss = entry_price - 2 * atr
-            take_profit = entry_price + 4 * atr
-            if close < stop_loss or close > take_profit:
-                cash += position * close * (1 - fee)
-                trades.append((date, "SELL", close, position))
-                position = 0
-                entry_price = 0
+        if broker.position > 0:
+            atr = self.atr[i]
+            if close < self.entry_price - 2 * atr or close > self.entry_price + 4 * atr:
+                broker.close(i, close)
+                self.entry_price = 0
 
         # 開倉訊號
-        if position == 0:
-            if (
-                row["SMA20"] > row["SMA60"] > row["SMA120"]
-                and row["K"] > row["D"]
-                and row["RSI"] > 50
-            ):
-                atr = row["ATR"]
-                risk_amount = init_capital * risk_per_trade
-                position_size = int(risk_amount / (2 * atr))
-                if position_size > 0:
-                    position = position_size
-                    entry_price = close
-                    cash -= position * close * (1 + fee)
-                    trades.append((date, "BUY", close, position))
-
-        equity = cash + position * close
-        equity_curve.append(equity)
-
-    df["Equity"] = equity_curve
+        if broker.position == 0 and self.enter[i]:
+            size = self.size[i]
+            if size > 0:
+                self.entry_price = close
+                broker.buy(i, close, size)
+
+
+def backtest(df, init_capital=1000000, fee=0.001425, risk_per_trade=0.01, fees=None):
+    """
+    回傳 (df + Equity 欄, trades)，trades 為 (date, "BUY"/"SELL", price, qty) 的 list。
+    fees: 選填 FeeModel (例如 engine.TW_STOCK)，預設為固定比例 fee。
+    """
+    df = compute_indicators(df).dropna()
+    result = run_backtest(df, Swing02Strategy(init_capital, risk_per_trade), initial_cash=init_capital,
+                          fees=fees or FeeModel(rate=fee), price_col="Close")
+    t = result.trades
+    trades = list(zip(t["timestamp"], t["direction"], t["price"], t["qty"].astype(int)))
+    df["Equity"] = result.equity["equity"].to_numpy()
     return df, trades
 
 # ----------------------------
@@ -138,27 +146,29 @@ def main():
     args = parser.parse_args()
 
     if args.mode == "backtest":
-        df = yf.download(args.ticker, start=args.start, end=args.end)
-        df.columns = ['Open', 'High', 'Low', 'Close', 'Volume']
+        df = get_ohlcv(args.ticker, args.start, args.end, auto_adjust=True)  # 經由本機快取
+        df = df[['Open', 'High', 'Low', 'Close', 'Volume']]
         df, trades = backtest(df)
         plot_results(df, trades, args.ticker, args.output)
         df.to_csv(f"{args.output}_equity.csv")
         print("回測完成，結果已輸出")
 
     elif args.mode == "screen":
-        results = []
+        # 所有股票排成 panel，以向量化的波段回測 (swing_vector) 一次算出每檔最後一天的部位與訊號：
+        # BUY = 最後一天進場、SELL = 最後一天出場、HOLD = 持有中、NONE = 空手
+        frames = {}
         for t in args.tickers:
-            df = yf.download(t, start=args.start, end=args.end)
-            df.columns = ['Open', 'High', 'Low', 'Close', 'Volume']
-            df = compute_indicators(df).dropna()
-            last = df.iloc[-1]
-            signal = "NONE"
-            if last["SMA20"] > last["SMA60"] > last["SMA120"] and last["K"] > last["D"] and last["RSI"] > 50:
-                signal = "BUY"
-            elif last["K"] < last["D"] and last["RSI"] < 40:
-                signal = "SELL"
-            results.append((t, last.name, signal, last["Close"]))
-        out = pd.DataFrame(results, columns=["Ticker", "Date", "Signal", "Close"])
+            df = get_ohlcv(t, args.start, args.end, auto_adjust=True)  # 經由本機快取
+            frames[t] = df[['Open', 'High', 'Low', 'Close', 'Volume']]
+        fields = {name: pd.DataFrame({t: df[name] for t, df in frames.items()}) for name in ("High", "Low", "Close")}
+        panel = swing_vector.compute_indicators_panel(fields["High"], fields["Low"], fields["Close"])
+        panel["Close"] = fields["Close"]
+        state = swing_vector.backtest_panel(panel)["state"]
+        # state 是每檔自己最後一個有收盤價的日子 (資料較早結束的股票不是 panel 的最後一列)
+        out = pd.DataFrame({"Ticker": state.index, "Date": state["date"].to_numpy(),
+                            "Signal": state["last_signal"].to_numpy(), "Close": state["close"].to_numpy(),
+                            "Position": state["position"].to_numpy(), "EntryDate": state["entry_date"].to_numpy(),
+                            "EntryPrice": state["entry_price"].to_numpy(), "Stop": state["stop"].to_numpy()})
         out.to_csv(args.output, index=False)
         print("掃描完成，結果已輸出")
 
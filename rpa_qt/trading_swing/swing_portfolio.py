@@ -0,0 +1,85 @@
+"""
+trading_swing 的波段策略套用到整個台股股票池、共用一筆資金 (rpa_qt.backtest.portfolio)
+
+* 進出場規則與 trading_swing 相同 (EMA20 > EMA60 & RSI > 50 & K > D 進場；EMA20 < EMA60、RSI < 45 或 ATR 停損出場)
+* 部位大小以「目前總權益」* risk_per_trade / (ATR * atr_mult) 計算，取整張 (1000 股)
+* 同一天可進場的股票以 EMA20 / EMA60 - 1 (趨勢強度) 由高到低排序，最多持有 max_positions 檔
+* 日K 經由 ohlcv_cache 取得，對齊成 panel 後以 swing_vector.compute_indicators_panel 一次算完指標
+
+執行：
+    python -m rpa_qt.trading_swing.swing_portfolio --start 2015-01-01 --max-positions 10
+"""
+import argparse
+import json
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from rpa_qt.backtest.engine import FeeModel, TW_STOCK
+from rpa_qt.backtest.portfolio import LOT_SIZE, PortfolioResult, run_portfolio
+from rpa_qt.trading_swing.swing_vector import compute_indicators_panel, swing_signals
+
+
+def load_tw_panel(codes: List[str], start, end=None) -> Dict[str, pd.DataFrame]:
+    """股票池的 High / Low / Close panel (index=日期、columns=數字代號)，經由本機快取下載。"""
+    from rpa_qt.trading_rebound.rebound_panel import align_frames
+    from rpa_qt.trading_rebound.tw_rebound_scanner import download_universe
+
+    data = download_universe(codes, start=start)
+    frames = {code: df for code, (_, df, _) in data.items()}
+    if end is not None:
+        frames = {code: df[df.index < pd.Timestamp(end)] for code, df in frames.items()}
+    names = ["High", "Low", "Close"]
+    tickers, dates, values = align_frames(frames, names)
+    return {name: pd.DataFrame(values[k], index=dates, columns=tickers) for k, name in enumerate(names)}
+
+
+def backtest_portfolio(panel: Dict[str, pd.DataFrame], init_cash=1_000_000, risk_per_trade=0.01, atr_mult=2,
+                       max_positions: int = 10, lot_size: int = LOT_SIZE, fees: FeeModel = TW_STOCK,
+                       stop_on_entry_atr: bool = False) -> PortfolioResult:
+    """
+    :param panel: High / Low / Close panel (load_tw_panel)，或已含 compute_indicators_panel 指標的 dict
+    """
+    if "ATR" not in panel:
+        panel = {**compute_indicators_panel(panel["High"], panel["Low"], panel["Close"]), "Close": panel["Close"]}
+    close_df = panel["Close"]
+    arr = {name: panel[name].to_numpy(dtype=float) for name in ("Close", "ATR", "EMA20", "EMA60", "RSI", "K", "D")}
+    # 股數由 run_portfolio 依當天的總權益計算
+    enter, exit_, stop_dist, _ = swing_signals(arr["Close"], arr["ATR"], arr["EMA20"], arr["EMA60"], arr["RSI"],
+                                               arr["K"], arr["D"], None, risk_per_trade, atr_mult)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        score = arr["EMA20"] / arr["EMA60"] - 1
+    return run_portfolio(close_df, enter, exit_, stop_dist, score, init_cash=init_cash,
+                         risk_per_trade=risk_per_trade, max_positions=max_positions, lot_size=lot_size, fees=fees,
+                         stop_on_entry=stop_on_entry_atr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Swing strategy portfolio backtest (TW universe, shared cash)")
+    parser.add_argument("--start", default="2015-01-01")
+    parser.add_argument("--end", default=None)
+    parser.add_argument("--cash", type=float, default=1_000_000)
+    parser.add_argument("--risk", type=float, default=0.01)
+    parser.add_argument("--atr-mult", type=float, default=2)
+    parser.add_argument("--max-positions", type=int, default=10)
+    parser.add_argument("--output", default="swing_portfolio")
+    args = parser.parse_args()
+
+    from rpa_qt.trading_rebound.tw_rebound_scanner import load_universe
+
+    codes, _ = load_universe()
+    panel = load_tw_panel(codes, args.start, args.end)
+    print(f"panel: {panel['Close'].shape[1]} 檔 x {panel['Close'].shape[0]} 天")
+    result = backtest_portfolio(panel, init_cash=args.cash, risk_per_trade=args.risk, atr_mult=args.atr_mult,
+                                max_positions=args.max_positions)
+    print(json.dumps(result.metrics, indent=2, default=str))
+    print(result.holdings.to_string(index=False))
+    result.trades.to_csv(f"{args.output}_trades.csv", index=False)
+    result.round_trips.to_csv(f"{args.output}_round_trips.csv", index=False)
+    result.equity.to_csv(f"{args.output}_equity.csv")
+    print(f"結果已輸出：{args.output}_*.csv")
+
+
+if __name__ == "__main__":
+    main()
@@ -23,6 +23,10 @@ import matplotlib.pyplot as plt
 import argparse
 from datetime import datetime
 
+from rpa_qt.backtest.engine import BacktestResult, FeeModel, run_backtest, Strategy
+from rpa_qt.backtest.trades_summary import round_trips, standardize_trades, summarize_round_trips
+from rpa_qt.price_utils.ohlcv_cache import get_ohlcv
+
 # ----------------------------
 # 技術指標計算
 # ----------------------------
@@ -60,7 +64,47 @@ def compute_indicators(df):
 # --------------------------
 # 回測交易策略
 # --------------------------
-def backtest(df, init_cash=1_000_000, risk_per_trade=0.01, atr_mult=2, fee=0.0015):
+class SwingStrategy(Strategy):
+    """
+    backtest() 的進出場規則，跑在共用回測引擎上 (rpa_qt.backtest.engine)。
+    進場 / 出場訊號與下單數量在 prepare() 一次以向量運算算好，on_bar 只剩部位判斷與 ATR 停損。
+    """
+
+    def __init__(self, init_cash=1_000_000, risk_per_trade=0.01, atr_mult=2):
+        self.risk_amount = init_cash * risk_per_trade
+        self.atr_mult = atr_mult
+
+    def prepare(self, bars, broker):
+        ema20, ema60 = bars.array("EMA20"), bars.array("EMA60")
+        rsi, k, d = bars.array("RSI"), bars.array("K"), bars.array("D")
+        atr = bars.array("ATR")
+        self.close = bars.list("Close")
+        self.stop_dist = (atr * self.atr_mult).tolist()
+        self.enter = ((ema20 > ema60) & (rsi > 50) & (k > d)).tolist()
+        self.exit = ((ema20 < ema60) | (rsi < 45)).tolist()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.qty = np.floor_divide(self.risk_amount, atr * self.atr_mult).tolist()
+        self.entry_price = 0
+
+    def on_bar(self, i, broker):
+        close = self.close[i]
+        if broker.position == 0:
+            qty = self.qty[i]
+            if self.enter[i] and qty > 0:
+                self.entry_price = close
+                broker.buy(i, close, qty)
+        elif close < self.entry_price - self.stop_dist[i] or self.exit[i]:
+            broker.close(i, close)
+            self.entry_price = 0
+
+
+def run_swing(df, init_cash=1_000_000, risk_per_trade=0.01, atr_mult=2, fees=None) -> BacktestResult:
+    """SwingStrategy 的回測，回傳共用引擎的 BacktestResult (equity / trades / round_trips / metrics)。"""
+    strategy = SwingStrategy(init_cash, risk_per_trade, atr_mult)
+    return run_backtest(df, strategy, initial_cash=init_cash, fees=fees or FeeModel(rate=0.0015), price_col="Close")
+
+
+def backtest(df, init_cash=1_000_000, risk_per_trade=0.01, atr_mult=2, fee=0.0015, fees=None):
     """
     df: 包含技術指標的 DataFrame
     init_cash: 初始資金
@@ -95,43 +139,15 @@ def backtest(df, init_cash=1_000_000, risk_per_trade=0.01, atr_mult=2, fee=0.001
     * atr * atr_mult = 預設停損幅度 (每股可能虧損)。
     👉 意思是「依照停損位置反推，最多能買多少股才不會超過風險承受範圍」
 
+    fees: 選填 FeeModel (例如 engine.TW_STOCK 含最低手續費與證交稅)，預設為固定比例 fee
+
+    回傳格式與舊版相同：df_trades (date / type / price / qty)、df_equity (index=date，equity)
     """
-    cash = init_cash
-    pos = 0
-    entry_price = 0
-    trades = []
-    equity_curve = []
-
-    for i in range(len(df)):
-        row = df.iloc[i]
-        date, close, atr = row.name, row["Close"], row["ATR"]
-
-        # 開倉條件（多頭）
-        if pos == 0:
-            if (row["EMA20"] > row["EMA60"]) and (row["RSI"] > 50) and (row["K"] > row["D"]):
-                risk_amount = init_cash * risk_per_trade
-                qty = risk_amount // (atr * atr_mult)
-                if qty > 0:
-                    entry_price = close
-                    stop_loss = close - atr * atr_mult # 停損取平均振幅兩倍
-                    pos = qty
-                    trades.append({"date": date, "type": "BUY", "price": close, "qty": qty})
-                    cash -= qty * close * (1 + fee)
-
-        # 平倉條件
-        elif pos > 0:
-            stop_loss = entry_price - atr * atr_mult
-            if close < stop_loss or row["EMA20"] < row["EMA60"] or row["RSI"] < 45:
-                trades.append({"date": date, "type": "SELL", "price": close, "qty": pos})
-                cash += pos * close * (1 - fee)
-                pos = 0
-                entry_price = 0
-
-        equity = cash + pos * close
-        equity_curve.append({"date": date, "equity": equity})
-
-    df_equity = pd.DataFrame(equity_curve).set_index("date")
-    df_trades = pd.DataFrame(trades)
+    result = run_swing(df, init_cash, risk_per_trade, atr_mult, fees or FeeModel(rate=fee))
+    trades = result.trades
+    df_trades = pd.DataFrame({"date": trades["timestamp"], "type": trades["direction"], "price": trades["price"],
+                              "qty": trades["qty"]}) if len(trades) else pd.DataFrame()
+    df_equity = result.equity[["equity"]].rename_axis("date")
     return df_trades, df_equity
 
 # ----------------------------
@@ -189,7 +205,7 @@ def plot_results(df, df_trades, df_equity, ticker, output_prefix):
 # --------------------------
 # 績效分析
 # --------------------------
-def performance(trades, equity, init_cash):
+def performance(trades, equity, init_cash, fee=0.0015):
     if equity.empty:
         return {}
 
@@ -204,18 +220,11 @@ def performance(trades, equity, init_cash):
     drawdown = equity["equity"] / rolling_max - 1
     max_dd = drawdown.min()
 
-    if not trades.empty:
-        buy_trades = trades[trades["type"] == "BUY"]
-        sell_trades = trades[trades["type"] == "SELL"]
-        merged = pd.merge(buy_trades, sell_trades, left_index=True, right_index=True, suffixes=("_buy", "_sell"))
-        merged["pnl"] = (merged["price_sell"] - merged["price_buy"]) * merged["qty_buy"]
-        win_rate = (merged["pnl"] > 0).mean()
-        avg_win = merged.loc[merged["pnl"] > 0, "pnl"].mean()
-        avg_loss = merged.loc[merged["pnl"] <= 0, "pnl"].mean()
-        profit_factor = abs(avg_win / avg_loss) if avg_loss != 0 else np.inf
-    else:
-        win_rate = 0
-        profit_factor = 0
+    # 每筆買賣配對成一個部位 (含買進、賣出手續費)
+    round_trip = round_trips(standardize_trades(trades, fee_rate=fee))
+    stats = summarize_round_trips(round_trip)
+    win_rate = stats["WinRate"]
+    profit_factor = stats["ProfitFactor"]
 
     return {
         "Total Return": total_return,
@@ -224,7 +233,7 @@ def performance(trades, equity, init_cash):
         "Max Drawdown": max_dd,
         "Win Rate": win_rate,
         "Profit Factor": profit_factor,
-        "Trades": len(trades) // 2
+        "Trades": stats["NumTrades"]
     }
 
 # ----------------------------
@@ -242,8 +251,8 @@ def main():
 
     if args.mode == "backtest":
         # 下載資料
-        df = yf.download(args.ticker, start=args.start, end=args.end)
-        df.columns = ['Open', 'High', 'Low', 'Close', 'Volume']
+        df = get_ohlcv(args.ticker, args.start, args.end, auto_adjust=True)  # 經由本機快取
+        df = df[['Open', 'High', 'Low', 'Close', 'Volume']]
 
         # 計算技術指標
         df = compute_indicators(df)
@@ -268,8 +277,8 @@ def main():
     elif args.mode == "screen":
         results = []
         for t in args.tickers:
-            df = yf.download(t, start=args.start, end=args.end)
-            df.columns = ['Open', 'High', 'Low', 'Close', 'Volume']
+            df = get_ohlcv(t, args.start, args.end, auto_adjust=True)  # 經由本機快取
+            df = df[['Open', 'High', 'Low', 'Close', 'Volume']]
             df = compute_indicators(df).dropna()
             last = df.iloc[-1]
             signal = "NONE"
@@ -3,6 +3,8 @@ import threading
 import numpy as np
 import pandas as pd
 
+from rpa_qt.indicators.incremental import IndicatorState
+from rpa_qt.price_utils.bar_bus import BarEvent, bar_bus
 from rpa_qt.price_utils.coin_price_ws import KlineWebSocket
 
 
@@ -520,11 +522,23 @@ class TradingStrategy:
 
 
 class StrategyThread:
-    def __init__(self, interval="1s",dfs:{}={}):
-        self.dfs = dfs  # 儲存不同 interval 的 K 線資料
+    def __init__(self, interval="1s",dfs:{}={}, symbol=None, bus=None, coalesce_ms=0, on_signal=None):
+        """
+        :param symbol: 只處理這個 symbol 的事件，None 表示不限
+        :param bus: K 棒事件匯流排，預設使用共用的 bar_bus
+        :param coalesce_ms: 同一個 symbol 的 bar-update 最多每 N ms 計算一次，0 表示每筆都計算
+        :param on_signal: 每次算出訊號後呼叫 on_signal(event, signal) (例如 tick_replay 記錄訊號序列與延遲)
+        """
+        self.dfs = dfs  # 儲存不同 interval 的 K 線資料 (KlineRingBuffer)
+        self.symbol = symbol
+        self.bus = bus if bus is not None else bar_bus
+        self.coalesce_ms = coalesce_ms
+        self.on_signal = on_signal
+        self.subscription = None
         self.strategy = TradingStrategy(capital=500, leverage=3)
         self.interval = interval
         self.last_signal = ""
+        self.indicators = IndicatorState()  # EMA20/60/120 與平均量的增量狀態
 
         # setting variables
         # 停損點
@@ -542,64 +556,73 @@ class StrategyThread:
         self.pnl = 0                 # 未實現損益
 
 
-    def _run(self):
-
-        while True:
-            if self.interval in self.dfs and not self.dfs[self.interval].empty:
-                df = self.dfs[self.interval]
-                df = df.sort_index()
-                df["ema20"] = df["close"].ewm(span=20, adjust=False).mean()
-                df["ema60"] = df["close"].ewm(span=60, adjust=False).mean()
-                df["ema120"] = df["close"].ewm(span=120, adjust=False).mean()
-                df["avg_vol"] = df["volume"].rolling(20, min_periods=1).mean()
-
-                pre_row=df.iloc[-2]
-                latest_row = df.iloc[-1]
-
-                signal:{}=analyze_trading_signal(current_price=latest_row.close,
-                                       ema20=latest_row.ema20,
-                                       ema60=latest_row.ema60,
-                                       ema120=latest_row.ema120,
-                                       volume=latest_row.volume,
-                                       avg_volume=latest_row.avg_vol,
-                                        prev_ema20=pre_row.ema20,
-                                        prev_ema60=pre_row.ema60,
-                                        prev_ema120=pre_row.ema120
-                                       )
-                # if self.last_signal==f"{action_advice};{signal_description}":
-                #     continue
-                # else:
-                #     self.last_signal=f"{action_advice};{signal_description}"
-                #     print(f"{latest_row.name} price:{latest_row.close} action_advice: {action_advice}, signal_description: {signal_description}")
-
-                if self.last_signal==signal:
-                    continue
-                else:
-                    self.last_signal=signal
-                    print(f"{latest_row.name} price:{latest_row.close} ... signal: {signal}")
-
-                # signal, pos_size = self.strategy.check_signal(
-                #     close=latest_row.close,
-                #     ema20=latest_row.ema20,
-                #     ema60=latest_row.ema60,
-                #     ema120=latest_row.ema120,
-                #     volume=latest_row.volume,
-                #     avg_volume=latest_row.avg_vol
-                # )
-                #
-                # if signal:
-                #     self.strategy.update_position(latest_row.close, signal, pos_size)
-                #
-                # self.strategy.check_stop_loss(latest_row.close)
-
-            # 每秒檢查一次
-            threading.Event().wait(1)
+    def _on_bar(self, event: BarEvent):
+        """收到 bar-update / bar-close 事件時才計算，取代原本每秒輪詢的 _run()。"""
+        store = self.dfs.get(self.interval)
+        if store is None or len(store) < 2:
+            return
+
+        # 原作法：每秒對整張表 sort_index + ewm/rolling 全量重算，只為了取最後兩列
+        # df["ema20"] = df["close"].ewm(span=20, adjust=False).mean()
+        # ...
+        # pre_row=df.iloc[-2]
+        # latest_row = df.iloc[-1]
+
+        # 新作法：只把新進的 K 棒餵給增量指標狀態，O(1) 更新
+        self.indicators.sync(store)
+        if not self.indicators.ready:
+            return
+        signal = self._evaluate()
+        if self.on_signal is not None:
+            self.on_signal(event, signal)
+        if self.last_signal != signal:
+            self.last_signal = signal
+            latest_row = self.indicators.current()
+            ts = pd.Timestamp(self.indicators.open_time, unit="ms", tz="UTC").tz_convert(store.tz).tz_localize(None)
+            print(f"{ts} price:{latest_row['close']} ... signal: {signal}")
+
+        # signal, pos_size = self.strategy.check_signal(
+        #     close=latest_row.close,
+        #     ema20=latest_row.ema20,
+        #     ema60=latest_row.ema60,
+        #     ema120=latest_row.ema120,
+        #     volume=latest_row.volume,
+        #     avg_volume=latest_row.avg_vol
+        # )
+        #
+        # if signal:
+        #     self.strategy.update_position(latest_row.close, signal, pos_size)
+        #
+        # self.strategy.check_stop_loss(latest_row.close)
+
+    def _evaluate(self) -> dict:
+        """用增量指標狀態的目前值與前一根值判斷交易訊號。"""
+        latest_row = self.indicators.current()
+        pre_row = self.indicators.previous()
+        return analyze_trading_signal(current_price=latest_row["close"],
+                                      ema20=latest_row["ema20"],
+                                      ema60=latest_row["ema60"],
+                                      ema120=latest_row["ema120"],
+                                      volume=latest_row["volume"],
+                                      avg_volume=latest_row["avg_vol"],
+                                      prev_ema20=pre_row["ema20"],
+                                      prev_ema60=pre_row["ema60"],
+                                      prev_ema120=pre_row["ema120"]
+                                      )
 
 
     def start(self):
-        """啟動所有 interval 的 WebSocket"""
-        t = threading.Thread(target=self._run, daemon=True)
-        t.start()
+        """訂閱 K 棒事件，之後由事件驅動策略計算"""
+        self.subscription = self.bus.subscribe(self._on_bar,
+                                               symbol=self.symbol,
+                                               interval=self.interval,
+                                               coalesce_ms=self.coalesce_ms,
+                                               name=f"StrategyThread-{self.interval}")
+
+    def stop(self):
+        if self.subscription is not None:
+            self.subscription.stop()
+            self.subscription = None
 
 
 
@@ -612,7 +635,7 @@ def tmp_run_strategy():
     kws2 = KlineWebSocket(symbol=DEFAULT_SYMBOL, interval=DEFAULT_INTERVAL_2, dfs=dfs)
     kws2.start()
 
-    sth = StrategyThread(interval=DEFAULT_INTERVAL_2, dfs=dfs)
+    sth = StrategyThread(interval=DEFAULT_INTERVAL_2, dfs=dfs, symbol=DEFAULT_SYMBOL, coalesce_ms=200)
     sth.start()
 
     # 很重要：加了while，thread才會一直跑！
@@ -0,0 +1,216 @@
+"""
+Tick 重播測試 (Tick replay harness)
+
+把 price_utils.tick_record 錄下的原始 kline 訊息重播進 KlineWebSocket.handle_message (與連線時 on_message
+相同的處理) 與 StrategyThread，不連網也能量測延遲與做回歸比對：
+* 速度：speed=1 原速、N 為 N 倍速、0 為最快 (VirtualClock 依錄製時的收到時間排程)
+* threaded=False (預設)：InlineBarBus，策略在重播執行緒上同步計算，每筆訊息都計算一次，訊號序列每次都相同；
+  threaded=True：與實際執行相同的 BarBus + 訂閱執行緒 (可加 coalesce_ms)，延遲包含跨執行緒排隊的時間；
+  策略跟不上時 update 事件會被合併，訊號序列與執行緒排程有關，不適合拿來做回歸比對
+* 報告：訊息數、吞吐量 (msgs/s)、訊息到訊號的延遲 (p50 / p95 / p99 / max)、落後排程的最大秒數，
+  以及每次 analyze_trading_signal 的輸出序列 (可存成 CSV，之後以 --expect 比對)
+
+執行：
+    python -m rpa_qt.trading_turnover.tick_replay record --symbol solusdt --interval 1s --seconds 600 --output solusdt_1s.krec.gz
+    python -m rpa_qt.trading_turnover.tick_replay replay solusdt_1s.krec.gz --speed 0 --signals signals.csv
+    python -m rpa_qt.trading_turnover.tick_replay replay solusdt_1s.krec.gz --speed 10 --expect signals.csv
+    python -m rpa_qt.trading_turnover.tick_replay replay solusdt_1s.krec.gz --speed 1 --threaded --coalesce-ms 200
+    python -m rpa_qt.trading_turnover.tick_replay synthetic --bars 5000 --output synthetic.krec.gz
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+from rpa_qt.price_utils.bar_bus import BarBus, InlineBarBus
+from rpa_qt.price_utils.coin_price_ws import KlineWebSocket
+from rpa_qt.price_utils.tick_record import read_records, recording_factory, synthetic_records, TickRecorder, \
+    VirtualClock, write_records
+from rpa_qt.trading_turnover.strategy import StrategyThread
+
+SIGNAL_COLUMNS = ['open_time', 'kind', 'close', 'status', 'action_advice', 'position']
+DRAIN_TIMEOUT = 30  # threaded 模式等訂閱執行緒處理完剩餘事件的秒數
+
+
+@dataclass
+class ReplayReport:
+    messages: int
+    seconds: float  # 重播開始到策略處理完最後一筆事件的實際秒數
+    speed: float
+    threaded: bool
+    max_lag: float  # 落後排程的最大秒數 (speed > 0 時)
+    latency: np.ndarray  # 每次計算訊號的延遲 (秒)：訊息交給 handle_message 到 analyze_trading_signal 算完
+    signals: pd.DataFrame  # SIGNAL_COLUMNS，每次計算一列
+
+    @property
+    def throughput(self) -> float:
+        return self.messages / self.seconds if self.seconds > 0 else float("inf")
+
+    def latency_summary(self) -> Dict[str, float]:
+        if len(self.latency) == 0:
+            return {}
+        us = self.latency * 1e6
+        return {"p50_us": float(np.percentile(us, 50)), "p95_us": float(np.percentile(us, 95)),
+                "p99_us": float(np.percentile(us, 99)), "max_us": float(us.max())}
+
+    def summary(self) -> str:
+        mode = "threaded" if self.threaded else "inline"
+        speed = "max" if not self.speed else f"{self.speed:g}x"
+        text = (f"{self.messages} 筆訊息 / {self.seconds:.2f}s ({self.throughput:,.0f} msgs/s, {speed}, {mode})，"
+                f"{len(self.signals)} 次訊號計算")
+        lat = self.latency_summary()
+        if lat:
+            text += "，延遲 " + " ".join(f"{k[:-3]}={v:.0f}us" for k, v in lat.items())
+        if self.speed:
+            text += f"，最大落後 {self.max_lag * 1e3:.1f}ms"
+        return text
+
+
+def _kline_of(frame: str) -> dict:
+    data = json.loads(frame)
+    return data.get("data", data)["k"]
+
+
+def replay(records, symbol: str = None, interval: str = None, speed: float = 0.0, threaded: bool = False,
+           coalesce_ms: float = 0, warmup: pd.DataFrame = None, capacity: int = 1000,
+           quiet: bool = True) -> ReplayReport:
+    """
+    :param records: 錄製檔路徑或 [(收到時間 epoch ns, 原始訊息), ...]
+    :param symbol / interval: 預設取第一筆訊息的值
+    :param warmup: 重播前先載入 store 的歷史 K 棒 (代替連線時 REST 載入的 500 根)；無時區的 index 視為 UTC
+    :param quiet: 不輸出 StrategyThread 在訊號改變時的 print
+    """
+    if isinstance(records, str):
+        records = list(read_records(records))
+    if not records:
+        raise ValueError("錄製檔沒有任何訊息")
+    if symbol is None or interval is None:
+        k = _kline_of(records[0][1])
+        symbol, interval = symbol or k["s"].lower(), interval or k["i"]
+
+    bus = BarBus() if threaded else InlineBarBus()
+    dfs = {}
+    kws = KlineWebSocket(symbol, interval, dfs=dfs, capacity=capacity, bus=bus, preload=False, gap_fill=False)
+    if warmup is not None and not warmup.empty:
+        if warmup.index.tz is None:
+            warmup = warmup.tz_localize("UTC")
+        first_open = pd.Timestamp(_kline_of(records[0][1])["t"], unit="ms", tz="UTC")
+        kws.store.load_dataframe(warmup[warmup.index < first_open].iloc[-capacity:])
+
+    rows, latency = [], []
+
+    def on_signal(event, signal):
+        latency.append(time.perf_counter() - event.received_at)
+        rows.append((event.open_time, event.kind, event.close, signal["status"], signal["action_advice"],
+                     signal["position"]))
+
+    strategy = StrategyThread(interval=interval, dfs=dfs, symbol=kws.symbol, bus=bus, coalesce_ms=coalesce_ms,
+                              on_signal=on_signal)
+    clock = VirtualClock(speed)
+    with open(os.devnull, "w") as sink, \
+            (contextlib.redirect_stdout(sink) if quiet else contextlib.nullcontext()):
+        strategy.start()
+        sub = strategy.subscription
+        started = time.perf_counter()
+        for received_ns, frame in records:
+            clock.wait_until(received_ns)
+            kws.handle_message(frame)
+        if threaded:
+            deadline = time.perf_counter() + DRAIN_TIMEOUT
+            while sub.delivered + sub.dropped < kws.message_count and time.perf_counter() < deadline:
+                time.sleep(0.001)
+        seconds = time.perf_counter() - started
+        strategy.stop()
+
+    signals = pd.DataFrame(rows, columns=SIGNAL_COLUMNS)
+    return ReplayReport(messages=kws.message_count, seconds=seconds, speed=speed, threaded=threaded,
+                        max_lag=clock.max_lag, latency=np.array(latency), signals=signals)
+
+
+def compare_signals(actual: pd.DataFrame, expected: pd.DataFrame) -> pd.DataFrame:
+    """回傳訊號序列不同的列 (空的 DataFrame 表示完全相同)；比對 open_time / kind / status / position。"""
+    keys = ['open_time', 'kind', 'status', 'position']
+    a = actual[keys].reset_index(drop=True)
+    e = expected[keys].reset_index(drop=True)
+    n = max(len(a), len(e))
+    a, e = a.reindex(range(n)), e.reindex(range(n))
+    diff = ~((a == e) | (a.isna() & e.isna())).all(axis=1)
+    return pd.concat({"actual": a[diff], "expected": e[diff]}, axis=1)
+
+
+def record(symbol: str, interval: str, seconds: float, output: str) -> int:
+    """連線 Binance，把 seconds 秒內收到的原始訊息錄到 output。"""
+    with TickRecorder(output) as recorder:
+        kws = KlineWebSocket(symbol, interval, dfs={}, bus=BarBus(), preload=False, gap_fill=False,
+                             ws_factory=recording_factory(recorder))
+        kws.start()
+        time.sleep(seconds)
+        kws.stop()
+        for t in kws.threads:
+            t.join(timeout=5)
+        return recorder.count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record and replay raw kline websocket frames")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("record", help="record live frames from Binance")
+    p.add_argument("--symbol", default="solusdt")
+    p.add_argument("--interval", default="1s")
+    p.add_argument("--seconds", type=float, default=600)
+    p.add_argument("--output", required=True)
+
+    p = sub.add_parser("synthetic", help="write an offline recording from a synthetic random walk")
+    p.add_argument("--bars", type=int, default=5000)
+    p.add_argument("--updates-per-bar", type=int, default=4)
+    p.add_argument("--symbol", default="solusdt")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--output", required=True)
+
+    p = sub.add_parser("replay", help="replay a recording into KlineWebSocket / StrategyThread")
+    p.add_argument("path")
+    p.add_argument("--speed", type=float, default=0, help="1 = real time, N = N times faster, 0 = as fast as possible")
+    p.add_argument("--threaded", action="store_true", help="use the threaded BarBus like the live setup")
+    p.add_argument("--coalesce-ms", type=float, default=0)
+    p.add_argument("--warmup", default=None, help="history loaded before replay (benchmarks.datasets spec)")
+    p.add_argument("--signals", default=None, help="write the signal sequence to this CSV")
+    p.add_argument("--expect", default=None, help="compare the signal sequence with an earlier CSV")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        n = record(args.symbol, args.interval, args.seconds, args.output)
+        print(f"已錄製 {n} 筆訊息：{args.output}")
+    elif args.command == "synthetic":
+        n = write_records(args.output, synthetic_records(args.bars, symbol=args.symbol,
+                                                         updates_per_bar=args.updates_per_bar, seed=args.seed))
+        print(f"已產生 {n} 筆訊息：{args.output}")
+    else:
+        warmup = None
+        if args.warmup:
+            from rpa_qt.benchmarks.datasets import load_recorded
+            warmup = load_recorded(args.warmup)
+        report = replay(args.path, speed=args.speed, threaded=args.threaded, coalesce_ms=args.coalesce_ms,
+                        warmup=warmup)
+        print(report.summary())
+        if args.signals:
+            report.signals.to_csv(args.signals, index=False)
+            print(f"訊號序列已輸出：{args.signals}")
+        if args.expect:
+            diff = compare_signals(report.signals, pd.read_csv(args.expect))
+            if len(diff):
+                print(f"訊號序列與 {args.expect} 有 {len(diff)} 列不同：")
+                print(diff.head(20).to_string())
+                sys.exit(1)
+            print(f"訊號序列與 {args.expect} 相同")
+
+
+if __name__ == '__main__':
+    main()
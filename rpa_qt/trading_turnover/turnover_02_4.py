@@ -4,130 +4,62 @@ import pandas as pd
 from datetime import datetime
 from dash import Dash, dcc, html, Output, Input, State
 import plotly.graph_objs as go
-import websocket
 import time  # For graceful shutdown (optional, but good for explicit closes)
 
+from rpa_qt.price_utils.binance_stream import BinanceStreamManager
+
 # =======================
 # 全域設定 - Global Configuration
 # =======================
 DEFAULT_SYMBOL = "SOLUSDT"
 DEFAULT_INTERVAL = "1s"
 INTERVAL_OPTIONS = ["1s", "5s", "15s", "30s", "1m", "5m", "15m", "30m", "1h", "4h", "1d"]
+MAX_BARS = 1000  # 每個 interval 最多保留的 K 棒數 - Ring buffer capacity per interval
 
-# 儲存不同時間間隔的 K 線資料 - Stores K-line data for different time intervals
+# 儲存不同時間間隔的 K 線資料 (KlineRingBuffer) - Stores K-line ring buffers for different time intervals
 dfs = {}
-# 即時價格 - Latest real-time price
-latest_price = None
-
-# Threading locks for safe access to shared data
-data_lock = threading.Lock()
-# Stores active WebSocketApp instances and their threads, keyed by (symbol, interval) tuple
+# Threading locks for safe access to shared data (reentrant: update_charts calls start_ws_thread while holding it)
+data_lock = threading.RLock()
+# Active (symbol, interval) subscriptions and their ring buffers
 active_wss = {}
+# 所有 (symbol, interval) 共用的 combined-stream 連線 - One multiplexed connection for all subscriptions
+stream_manager = BinanceStreamManager(capacity=MAX_BARS)
 
 
 # =======================
 # WebSocket 函式 - WebSocket Functions
 # =======================
-def run_ws(symbol, interval):
-    """
-    Creates a WebSocketApp instance for a given symbol and interval.
-    The on_message, on_error, and on_close handlers are defined within.
-    """
-    url = f"wss://stream.binance.com:9443/ws/{symbol.lower()}@kline_{interval}"
-
-    def on_message(ws, message):
-        """
-        Callback function executed when a new message is received from the WebSocket.
-        Parses K-line data and updates the global `dfs` and `latest_price`.
-        """
-        nonlocal interval  # Access interval from the enclosing scope
-        global latest_price
-
-        data = json.loads(message)
-        k = data["k"]
-        ts = datetime.fromtimestamp(k["t"] / 1000.0)  # Convert timestamp to datetime object
-
-        # Create a new DataFrame row for the incoming K-line data
-        new_row = pd.DataFrame({
-            "open": [float(k["o"])],
-            "high": [float(k["h"])],
-            "low": [float(k["l"])],
-            "close": [float(k["c"])],
-            "volume": [float(k["v"])],
-        }, index=[ts])
-
-        with data_lock:
-            # Update the global latest_price. For simplicity, any WS can update it.
-            # If a specific interval's price is desired, this logic would need refinement.
-            latest_price = float(k["c"])
-
-            # Ensure the DataFrame for the current interval exists
-            if interval not in dfs:
-                dfs[interval] = pd.DataFrame(columns=["open", "high", "low", "close", "volume"])
-
-            # Efficiently update or append K-line data
-            if ts in dfs[interval].index:
-                # If the timestamp already exists (e.g., the last K-line is still forming), update it
-                dfs[interval].loc[ts] = new_row.loc[ts]
-            else:
-                # If it's a new timestamp, append the new row and sort by index
-                dfs[interval] = pd.concat([dfs[interval], new_row]).sort_index()
-                # Optionally, limit the DataFrame size to manage memory for high-frequency data
-                if len(dfs[interval]) > 1000:  # Keep only the last 1000 data points
-                    dfs[interval] = dfs[interval].iloc[-1000:]
-
-    def on_error(ws, error):
-        """Callback function for WebSocket errors."""
-        print(f"WebSocket {symbol} {interval} 錯誤 (Error):", error)
-
-    def on_close(ws, close_status_code, close_msg):
-        """Callback function when WebSocket connection is closed."""
-        print(f"WebSocket {symbol} {interval} 關閉 (Closed)")
-        # Clean up the active_wss dictionary when a WebSocket closes
-        with data_lock:
-            if (symbol, interval) in active_wss:
-                del active_wss[(symbol, interval)]
-
-    # Create and return the WebSocketApp instance
-    ws_app = websocket.WebSocketApp(url, on_message=on_message, on_error=on_error, on_close=on_close)
-    return ws_app
-
-
 def start_ws_thread(symbol, interval):
     """
-    Starts a new WebSocket connection in a separate daemon thread for a given symbol and interval.
-    Stores the WebSocketApp instance and its thread in `active_wss`.
+    Subscribes the K-line stream for a given symbol and interval on the shared combined-stream connection.
+    Instead of one socket and one thread per (symbol, interval), BinanceStreamManager multiplexes every
+    stream on a single connection and writes the updates into the interval's KlineRingBuffer.
     """
-    # Check if a WebSocket for this (symbol, interval) is already running
     with data_lock:
+        # Check if this (symbol, interval) is already subscribed
         if (symbol, interval) in active_wss:
             print(f"WebSocket for {symbol} {interval} is already running. Skipping start.")
             return
-
-    ws_app = run_ws(symbol, interval)
-    # Start the WebSocket in a daemon thread so it terminates when the main program exits
-    thread = threading.Thread(target=ws_app.run_forever, daemon=True)
-    with data_lock:
-        active_wss[(symbol, interval)] = {"ws_app": ws_app, "thread": thread}
-    thread.start()
+        dfs[interval] = stream_manager.subscribe(symbol, interval)
+        active_wss[(symbol, interval)] = dfs[interval]
     print(f"Started WebSocket for {symbol} {interval}")
 
 
 def stop_ws_thread(symbol, interval):
     """
-    Stops an active WebSocket connection for a given symbol and interval.
-    Closes the WebSocketApp and removes its data from `dfs`.
+    Unsubscribes the K-line stream for a given symbol and interval (the shared connection stays open).
+    Removes its data from `dfs`.
     """
-    if (symbol, interval) in active_wss:
-        ws_info = active_wss[(symbol, interval)]
-        ws_info["ws_app"].close()  # Gracefully close the WebSocket connection
-        print(f"Stopped WebSocket for {symbol} {interval}")
-        # Remove data associated with the stopped interval to free up memory
-        with data_lock:
+    with data_lock:
+        if (symbol, interval) in active_wss:
+            stream_manager.unsubscribe(symbol, interval)
+            del active_wss[(symbol, interval)]
+            print(f"Stopped WebSocket for {symbol} {interval}")
+            # Remove data associated with the stopped interval to free up memory
             if interval in dfs:
                 del dfs[interval]
-    else:
-        print(f"WebSocket for {symbol} {interval} was not found or already stopped.")
+        else:
+            print(f"WebSocket for {symbol} {interval} was not found or already stopped.")
 
 
 # =======================
@@ -225,8 +157,6 @@ def update_charts(n, current_interval1, current_interval2, prev_interval1, prev_
     Callback function to update the K-line charts, symbol title, price display,
     and current time. It also manages WebSocket connections based on dropdown selections.
     """
-    global latest_price
-
     # --- WebSocket Connection Management ---
     # Check if interval1 has changed and manage its WebSocket connection
     if current_interval1 != prev_interval1:
@@ -258,7 +188,7 @@ def update_charts(n, current_interval1, current_interval2, prev_interval1, prev_
             # Check if the interval is valid and data exists
             if interval_to_plot and interval_to_plot in dfs and not dfs[interval_to_plot].empty:
                 # Get the latest 500 data points for display
-                df_disp = dfs[interval_to_plot].iloc[-500:].copy()  # Operate on a copy for safety
+                df_disp = dfs[interval_to_plot].snapshot(last=500)  # Operate on a copy for safety
                 ind = compute_indicators(df_disp)  # Compute indicators
 
                 # Add Candlestick trace
@@ -316,8 +246,8 @@ def update_charts(n, current_interval1, current_interval2, prev_interval1, prev_
 
     # Update display elements
     symbol_title = DEFAULT_SYMBOL
-    with data_lock:  # Acquire lock to read latest_price
-        price_display = f"{latest_price:.2f}" if latest_price is not None else "N/A"
+    latest_price = stream_manager.get_latest_price(DEFAULT_SYMBOL)
+    price_display = f"{latest_price:.2f}" if latest_price is not None else "N/A"
     time_display = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     return fig1, fig2, symbol_title, price_display, time_display
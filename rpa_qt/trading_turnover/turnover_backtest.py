@@ -0,0 +1,137 @@
+"""
+strategy.Strategy.decide (EMA 排列 + 量能，分 5N / 1N 加碼，最多 30N，5% 停損 + 3% 移動停損) 的歷史回測
+
+decide() 是給即時行情逐筆呼叫的，這裡把同一套規則移到共用回測引擎 (rpa_qt.backtest.engine)：
+* EMA20/60/120 (ewm adjust=False) 與 20 根平均量以 pandas 一次算好，與 IndicatorState 的增量結果相同
+* 量能狀態、多空排列、黃金 / 死亡交叉 (decide 裡的 row.ema20.shift(1) 在單列上無法運作，這裡改用前一根的 EMA)
+  與每根 K 棒的下單單位數都在 prepare() 以向量運算決定，on_bar 只處理部位與停損
+* 1N = capital / unit 的名目金額；反向訊號先減碼 (decide 是把反向訊號當成加碼重算均價)，減到 0 以下則平倉後反手
+* 手續費預設為 engine.CRYPTO (taker)
+
+執行：
+    python -m rpa_qt.trading_turnover.turnover_backtest --symbol SOLUSDT --interval 1h --start 2024-01-01
+"""
+import argparse
+import json
+
+import numpy as np
+import pandas as pd
+
+from rpa_qt.backtest.engine import BacktestResult, Bars, Broker, CRYPTO, FeeModel, run_backtest, Strategy
+from rpa_qt.indicators.incremental import EMA_SPANS, VOLUME_WINDOW
+
+MAX_UNITS = 30
+
+
+def add_indicators(df: pd.DataFrame) -> pd.DataFrame:
+    """ema20 / ema60 / ema120 與 avg_vol，定義與 IndicatorState 相同。"""
+    df = df.copy()
+    for span in EMA_SPANS:
+        df[f"ema{span}"] = df["close"].ewm(span=span, adjust=False).mean()
+    df["avg_vol"] = df["volume"].rolling(VOLUME_WINDOW, min_periods=1).mean()
+    return df
+
+
+class TurnoverStrategy(Strategy):
+    def __init__(self, capital: float = 100000, unit: int = 100, max_units: int = MAX_UNITS,
+                 stop_loss_pct: float = 0.05, trailing_stop_pct: float = 0.03):
+        self.unit_notional = capital / unit  # 1N 的名目金額
+        self.max_units = max_units
+        self.stop_loss_pct = stop_loss_pct
+        self.trailing_stop_pct = trailing_stop_pct
+
+    def prepare(self, bars: Bars, broker: Broker):
+        ema20, ema60, ema120 = bars.array("ema20"), bars.array("ema60"), bars.array("ema120")
+        vol, avg_vol = bars.array("volume"), bars.array("avg_vol")
+        prev20 = np.concatenate([[np.nan], ema20[:-1]])
+        prev60 = np.concatenate([[np.nan], ema60[:-1]])
+
+        high = vol > 1.5 * avg_vol
+        low = ~high & (vol < 0.8 * avg_vol)
+        normal = ~high & ~low
+        bull = (ema20 > ema60) & (ema60 > ema120)
+        bear = (ema20 < ema60) & (ema60 < ema120)
+        golden = ~bull & ~bear & (ema20 > ema60) & (prev20 <= prev60)
+        death = ~bull & ~bear & (ema20 < ema60) & (prev20 >= prev60)
+        # 帶號的單位數：正為買、負為賣 (多空決策表)
+        self.signal = np.select([bull & high, bull & normal, bear & high, bear & normal, golden & ~low, death & ~low],
+                                [5, 1, -5, -1, 1, -1], 0).tolist()
+        self.close = bars.list("close")
+        self.units = 0      # 目前部位 (N，帶號)
+        self.extreme = 0.0  # 多單為進場後最高價、空單為最低價
+
+    def _trade(self, i: int, broker: Broker, units: int, price: float):
+        qty = abs(units) * self.unit_notional / price
+        comment = f"{'BUY' if units > 0 else 'SELL'} {abs(units)}N"
+        if self.units == 0 or (self.units > 0) == (units > 0):
+            if self.units == 0:
+                self.extreme = price
+            broker.fill(i, qty if units > 0 else -qty, price, comment=comment)
+            self.units += units
+        elif abs(units) < abs(self.units):
+            # 反向訊號：依單位比例減碼
+            broker.fill(i, -broker.position * abs(units) / abs(self.units), price, comment=comment)
+            self.units += units
+        else:
+            remaining = units + self.units
+            broker.close(i, price, comment=comment)
+            self.units = 0
+            if remaining:
+                self._trade(i, broker, remaining, price)
+
+    def on_bar(self, i: int, broker: Broker):
+        close = self.close[i]
+        units = self.signal[i]
+
+        # ----------- 資金控管：最多 max_units -----------
+        if units and abs(self.units) + abs(units) <= self.max_units:
+            self._trade(i, broker, units, close)
+
+        # ----------- 停損 / 移動停損 -----------
+        if self.units > 0:
+            self.extreme = max(self.extreme, close)
+            if close <= broker.avg_price * (1 - self.stop_loss_pct) or \
+                    close <= self.extreme * (1 - self.trailing_stop_pct):
+                broker.close(i, close, action="stop", comment="stop")
+                self.units = 0
+        elif self.units < 0:
+            self.extreme = min(self.extreme, close)
+            if close >= broker.avg_price * (1 + self.stop_loss_pct) or \
+                    close >= self.extreme * (1 + self.trailing_stop_pct):
+                broker.close(i, close, action="stop", comment="stop")
+                self.units = 0
+
+
+def backtest(df: pd.DataFrame, capital: float = 100000, unit: int = 100, fees: FeeModel = CRYPTO,
+             **kwargs) -> BacktestResult:
+    """
+    :param df: K 棒 (index 為時間，欄位 open / high / low / close / volume)
+    :param kwargs: TurnoverStrategy 的其他參數 (max_units、stop_loss_pct、trailing_stop_pct)
+    """
+    strategy = TurnoverStrategy(capital=capital, unit=unit, **kwargs)
+    return run_backtest(add_indicators(df), strategy, initial_cash=capital, fees=fees)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Turnover strategy backtest (Binance klines)")
+    parser.add_argument("--symbol", default="SOLUSDT")
+    parser.add_argument("--interval", default="1h")
+    parser.add_argument("--start", default="2024-01-01")
+    parser.add_argument("--end", default=None)
+    parser.add_argument("--capital", type=float, default=100000)
+    parser.add_argument("--output", default="turnover_backtest")
+    args = parser.parse_args()
+
+    from rpa_qt.price_utils.kline_history import KlineHistory  # 經由本機快取
+
+    df = KlineHistory().fetch(args.symbol, args.interval, args.start, args.end)
+    result = backtest(df, capital=args.capital)
+    print(json.dumps(result.metrics, indent=2, default=str))
+    result.trades.to_csv(f"{args.output}_trades.csv", index=False)
+    result.round_trips.to_csv(f"{args.output}_round_trips.csv", index=False)
+    result.equity.to_csv(f"{args.output}_equity.csv")
+    print(f"結果已輸出：{args.output}_*.csv")
+
+
+if __name__ == "__main__":
+    main()
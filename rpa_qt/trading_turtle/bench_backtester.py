@@ -0,0 +1,284 @@
+"""
+turtle_02.Backtester.run micro-benchmark
+
+原本的 run 每根 K 棒都建一個 pd.Series、呼叫 6 次以上 df.iloc[i][...]，TurtleStrategy 也一直重算
+sum(q for _, q in self.units)。新版一次取出 NumPy 陣列、on_bar 只收 float / bool，部位數量與 VWAP 用累計值。
+
+這裡保留原本的逐列版本 (LoopTurtleStrategy / run_loop) 作為對照，用隨機漫步的 4h K 棒 (含加碼、最小步長)
+確認兩者的權益曲線與交易紀錄相同，再比較執行時間。
+
+Backtester 改用共用回測引擎 (rpa_qt.backtest.engine) 之後：
+* 權益改由 Broker 的現金 / 成本累計，與原版只差浮點捨入，所以比對改為 rtol=1e-9
+* 原版空單的損益與市值用了多單的正負號 ((avg - price) * -qty)，引擎已修正，只比對不做空的設定
+
+執行：
+    python -m rpa_qt.trading_turtle.bench_backtester
+"""
+import time
+from dataclasses import asdict
+
+import numpy as np
+import pandas as pd
+
+from rpa_qt.trading_turtle.turtle_02 import apply_qty_filters, Backtester, BacktestConfig, StrategyConfig, Trade
+
+
+class LoopTurtleStrategy:
+    """原本的 TurtleStrategy (部位由 self.units 逐次加總、自己記錄權益)，作為對照。"""
+
+    def __init__(self, sconf: StrategyConfig, bconf: BacktestConfig):
+        self.s = sconf
+        self.b = bconf
+        self.equity = bconf.initial_capital
+        self.position_side = None
+        self.units = []
+        self.entry_source = None
+        self.stop_price = None
+        self.add_levels = []
+        self.trades = []
+        self.equity_curve = []
+        self.last_20d_result = {'long': None, 'short': None}
+
+    def unit_qty(self, equity: float, N: float, price: float) -> float:
+        if N <= 0 or price <= 0:
+            return 0.0
+        raw_qty = equity * (self.s.risk_pct / 100.0) / (self.s.atr_stop_mult * N * self.s.contract_mult)
+        qty = apply_qty_filters(raw_qty, self.s.min_qty, self.s.step_size)
+        if self.s.min_notional > 0 and qty * price < self.s.min_notional:
+            return 0.0
+        return qty
+
+    def can_add_unit(self) -> bool:
+        return len(self.units) < self.s.max_units
+
+    def within_leverage(self, add_qty: float, price: float) -> bool:
+        notional_after = self.current_notional(price) + abs(add_qty) * price
+        return notional_after <= self.equity * self.s.leverage + 1e-9
+
+    def current_notional(self, price: float) -> float:
+        qty = sum(q for _, q in self.units)
+        return abs(qty) * price
+
+    def execute_fill(self, ts: pd.Timestamp, side: str, action: str, price: float, qty: float, taker: bool = True, comment: str = ''):
+        if qty <= 0:
+            return
+
+        slip = price * (self.s.slippage_bps / 10_000.0)
+        fill_price = price + slip if (side == 'long' and (action in ('entry','add'))) else price - slip if (side == 'short' and (action in ('entry','add'))) else price
+        fee_rate = self.s.taker_fee if taker else self.s.maker_fee
+        fee = abs(qty) * fill_price * fee_rate
+
+        # Update position/equity for entries/exits
+        if action in ('entry','add'):
+            # open/increase
+            if self.position_side is None:
+                self.position_side = side
+            assert self.position_side == side, "Direction conflict"
+            self.units.append((fill_price, qty))
+            # set/adjust stop from the most recent unit entry
+            if side == 'long':
+                self.stop_price = fill_price - self.s.atr_stop_mult * self.current_N  # set below last entry
+            else:
+                self.stop_price = fill_price + self.s.atr_stop_mult * self.current_N
+            # set (or refresh) add levels
+            base = self.units[0][0]  # first unit entry price
+            n = self.current_N
+            step = self.s.add_step_n * n
+            if side == 'long':
+                self.add_levels = [base + step * i for i in range(1, self.s.max_units)]
+            else:
+                self.add_levels = [base - step * i for i in range(1, self.s.max_units)]
+            # pay fee immediately
+            self.equity -= fee
+        elif action in ('exit','stop'):
+            # close all
+            pos_qty = sum(q for _, q in self.units)
+            avg_px = sum(p*q for p, q in self.units) / pos_qty if pos_qty != 0 else 0.0
+            pnl = (fill_price - avg_px) * pos_qty if self.position_side == 'long' else (avg_px - fill_price) * (-pos_qty)
+            self.equity += pnl
+            self.equity -= fee
+            # determine win/loss for 20d skip rule if the entry came from 20d
+            if self.entry_source in ('20d_long','20d_short'):
+                dir_key = 'long' if 'long' in self.entry_source else 'short'
+                self.last_20d_result[dir_key] = 'win' if pnl > 0 else 'loss'
+            # reset position
+            self.position_side = None
+            self.units.clear()
+            self.stop_price = None
+            self.add_levels = []
+            self.entry_source = None
+
+        self.trades.append(Trade(ts, side, action, float(fill_price), float(qty), float(fee), float(slip), comment))
+
+    # ---------- Per-bar update ----------
+    def on_bar(self, i: int, row: pd.Series, signals: dict, N: float, price: float, high: float, low: float, exit_levels: dict):
+        ts = row.name
+        self.current_N = N  # cache for stop calc
+
+        # Record equity mark-to-market
+        if self.position_side is None:
+            self.equity_curve.append((ts, self.equity))
+        else:
+            pos_qty = sum(q for _, q in self.units)
+            avg_px = sum(p*q for p, q in self.units) / pos_qty if pos_qty != 0 else 0.0
+            mtm = (price - avg_px) * pos_qty if self.position_side == 'long' else (avg_px - price) * (-pos_qty)
+            self.equity_curve.append((ts, self.equity + mtm))
+
+        # Exit logic (channel-based)
+        if self.position_side == 'long':
+            if price < exit_levels['exit_long']:
+                self.execute_fill(ts, 'long', 'exit', price, sum(q for _, q in self.units), True, 'Channel exit')
+                return  # after exit, skip adds/stops this bar
+        elif self.position_side == 'short':
+            if price > exit_levels['exit_short']:
+                self.execute_fill(ts, 'short', 'exit', price, sum(q for _, q in self.units), True, 'Channel exit')
+                return
+
+        # Stop (2N from most recent unit entry)
+        if self.position_side is not None and self.stop_price is not None:
+            if self.position_side == 'long' and low <= self.stop_price:
+                self.execute_fill(ts, 'long', 'stop', self.stop_price, sum(q for _, q in self.units), True, '2N stop')
+                return
+            if self.position_side == 'short' and high >= self.stop_price:
+                self.execute_fill(ts, 'short', 'stop', self.stop_price, sum(q for _, q in self.units), True, '2N stop')
+                return
+
+        # Add units
+        if self.position_side == 'long' and self.can_add_unit() and len(self.add_levels) > 0:
+            next_level = self.add_levels[len(self.units)-1] if len(self.units) < self.s.max_units else None
+            if next_level is not None and high >= next_level:
+                qty_unit = self.unit_qty(self.equity, N, price)
+                if qty_unit > 0 and self.within_leverage(qty_unit, price):
+                    self.execute_fill(ts, 'long', 'add', next_level, qty_unit, True, f'Add @{self.s.add_step_n}N')
+        elif self.position_side == 'short' and self.can_add_unit() and len(self.add_levels) > 0:
+            next_level = self.add_levels[len(self.units)-1] if len(self.units) < self.s.max_units else None
+            if next_level is not None and low <= next_level:
+                qty_unit = self.unit_qty(self.equity, N, price)
+                if qty_unit > 0 and self.within_leverage(qty_unit, price):
+                    self.execute_fill(ts, 'short', 'add', next_level, qty_unit, True, f'Add @{self.s.add_step_n}N')
+
+        # Entry logic
+        def allow_20d(direction: str) -> bool:
+            if not self.s.skip_20d_after_win:
+                return True
+            last = self.last_20d_result[direction]
+            # Take 20d breakout only if last 20d trade (same direction) was a LOSS or None
+            return (last is None) or (last == 'loss')
+
+        took_signal = False
+        if self.position_side is None:
+            if self.s.use_system1 and signals['long_20d'] and allow_20d('long'):
+                qty = self.unit_qty(self.equity, N, price)
+                if qty > 0 and self.within_leverage(qty, price):
+                    self.entry_source = '20d_long'
+                    self.execute_fill(ts, 'long', 'entry', price, qty, True, '20d breakout')
+                    took_signal = True
+            elif self.s.use_system2 and signals['long_55d']:
+                qty = self.unit_qty(self.equity, N, price)
+                if qty > 0 and self.within_leverage(qty, price):
+                    self.entry_source = '55d_long'
+                    self.execute_fill(ts, 'long', 'entry', price, qty, True, '55d breakout')
+                    took_signal = True
+
+            if not took_signal and self.b.allow_short:
+                if self.s.use_system1 and signals['short_20d'] and allow_20d('short'):
+                    qty = self.unit_qty(self.equity, N, price)
+                    if qty > 0 and self.within_leverage(qty, price):
+                        self.entry_source = '20d_short'
+                        self.execute_fill(ts, 'short', 'entry', price, qty, True, '20d breakdown')
+                        took_signal = True
+                elif self.s.use_system2 and signals['short_55d']:
+                    qty = self.unit_qty(self.equity, N, price)
+                    if qty > 0 and self.within_leverage(qty, price):
+                        self.entry_source = '55d_short'
+                        self.execute_fill(ts, 'short', 'entry', price, qty, True, '55d breakdown')
+                        took_signal = True
+
+
+def run_loop(bt: Backtester):
+    """原本的 Backtester.run (不含績效計算)。"""
+    strat = LoopTurtleStrategy(bt.s, bt.b)
+    price_col = bt.b.price_col
+
+    for i, row in enumerate(bt.df.itertuples(index=False), start=0):
+        # Build row Series with index timestamp
+        ts = bt.df.index[i]
+        srow = pd.Series({
+            'open': getattr(row, 'open'),
+            'high': getattr(row, 'high'),
+            'low': getattr(row, 'low'),
+            'close': getattr(row, 'close'),
+            'volume': getattr(row, 'volume')
+        }, name=ts)
+        price = srow[price_col]
+        N = float(bt.df.iloc[i]['N'])
+
+        signals = {
+            'long_20d': price > float(bt.df.iloc[i]['h20']),
+            'short_20d': price < float(bt.df.iloc[i]['l20']),
+            'long_55d': price > float(bt.df.iloc[i]['h55']),
+            'short_55d': price < float(bt.df.iloc[i]['l55']),
+        }
+        exits = {
+            'exit_long': float(bt.df.iloc[i]['x10']),
+            'exit_short': float(bt.df.iloc[i]['x20']),
+        }
+        strat.on_bar(i, srow, signals, N, price, float(srow['high']), float(srow['low']), exits)
+
+    eq = pd.DataFrame(strat.equity_curve, columns=['timestamp', 'equity']).set_index('timestamp')
+    trades = pd.DataFrame([asdict(t) for t in strat.trades])
+    return eq, trades
+
+
+def make_ohlcv(n: int, seed: int) -> pd.DataFrame:
+    """隨機漫步 4h K 棒，波動會隨時間變化，讓突破、加碼、停損都會出現。"""
+    rng = np.random.default_rng(seed)
+    vol = 0.01 + 0.02 * np.abs(np.sin(np.arange(n) / 500.0))
+    close = 100 * np.exp(np.cumsum(rng.normal(0, vol)))
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, 1, n) * vol)
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, 1, n) * vol)
+    return pd.DataFrame({'open': open_, 'high': high, 'low': low, 'close': close,
+                         'volume': rng.integers(100, 10_000, n)},
+                        index=pd.date_range('2018-01-01', periods=n, freq='4h'))
+
+
+def configs():
+    yield StrategyConfig(), BacktestConfig(allow_short=False)
+    yield StrategyConfig(leverage=3.0), BacktestConfig(allow_short=False)
+    yield StrategyConfig(leverage=3.0, step_size=0.01, min_qty=0.01, skip_20d_after_win=False), \
+        BacktestConfig(allow_short=False)
+    yield StrategyConfig(use_system1=False, max_units=6, add_step_n=0.25), BacktestConfig(allow_short=False)
+
+
+def check_identical(trials: int = 20):
+    n_trades = 0
+    for seed in range(trials):
+        df = make_ohlcv(3000, seed)
+        for sconf, bconf in configs():
+            bt = Backtester(df, sconf, bconf)
+            eq, trades, _ = bt.run()
+            eq_loop, trades_loop = run_loop(bt)
+            pd.testing.assert_frame_equal(eq, eq_loop, check_exact=False, rtol=1e-9)
+            pd.testing.assert_frame_equal(trades, trades_loop, check_exact=False, rtol=1e-9)
+            n_trades += len(trades)
+    print(f"{trials} 組隨機價格 x {len(list(configs()))} 組設定 ({n_trades} 筆成交)：權益曲線與交易紀錄與原版相同")
+
+
+def bench(fn, *args, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+if __name__ == '__main__':
+    check_identical()
+
+    for n in (1_000, 10_000, 50_000):  # 50k 根 4h K 棒 ≈ 23 年
+        bt = Backtester(make_ohlcv(n, seed=n), StrategyConfig(leverage=3.0), BacktestConfig(allow_short=False))
+        t_loop = bench(run_loop, bt)
+        t_arr = bench(bt.run)
+        print(f"n={n:6d}  run: loop {t_loop * 1e3:9.1f} ms / arrays {t_arr * 1e3:7.1f} ms ({t_loop / t_arr:5.0f}x)")
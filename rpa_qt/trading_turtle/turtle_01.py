@@ -4,6 +4,8 @@ import yfinance as yf
 import matplotlib.pyplot as plt
 from typing import List, Dict, Tuple
 
+from rpa_qt.backtest.engine import Bars, Broker, FeeModel, run_backtest, Strategy
+
 plt.style.use('seaborn-v0_8')  # you can change later
 
 # ---------- 基本參數（可調） ----------
@@ -43,6 +45,102 @@ def n_unit(df: pd.DataFrame, period: int = 20) -> pd.Series:
     return atr(df, period)
 
 # ---------- 回測主體 ----------
+class TurtleBreakoutStrategy(Strategy):
+    """
+    turtle_backtest 的進出場規則，跑在共用回測引擎上 (rpa_qt.backtest.engine)。
+    每根 K 棒的順序：10 日低點出場 (出場後當天不再動作) -> 20 日高點突破進場 / 金字塔加碼 -> 2N 停損。
+    部位大小以當根開盤前的市值權益 (前一根部位 * 今日收盤 + 現金) 計算。
+    """
+
+    def __init__(self, entry_breakout: int, exit_breakout: int, atr_period: int, risk_per_trade: float,
+                 max_units: int, pyramid_add: float, slippage: float):
+        self.entry_breakout = entry_breakout
+        self.exit_breakout = exit_breakout
+        self.atr_period = atr_period
+        self.risk_per_trade = risk_per_trade
+        self.max_units = max_units
+        self.pyramid_add = pyramid_add
+        self.slippage = slippage
+
+    def prepare(self, bars: Bars, broker: Broker):
+        df = bars.df
+        self.close, self.high, self.low = bars.list('close'), bars.list('high'), bars.list('low')
+        self.N = n_unit(df, period=self.atr_period).tolist()
+        # shift(1) 防止 look-ahead
+        self.entry_trigger = df['high'].rolling(window=self.entry_breakout, min_periods=1).max().shift(1).tolist()
+        self.exit_trigger = df['low'].rolling(window=self.exit_breakout, min_periods=1).min().shift(1).tolist()
+        self.dates = bars.index
+        self.trades = []
+        self.entry_price = 0.0
+        self.last_pyramid_price = None
+        self.units_added = 0
+
+    def _log(self, i: int, kind: str, price: float, shares: int, broker: Broker, close: float = None):
+        trade = {'date': self.dates[i], 'type': kind, 'price': price, 'shares': shares}
+        if close is None:
+            trade['equity_after'] = broker.cash
+        else:
+            trade['units'] = self.units_added
+            trade['equity_after'] = broker.equity(close)
+        self.trades.append(trade)
+
+    def on_bar(self, i: int, broker: Broker):
+        close, high, low, N = self.close[i], self.high[i], self.low[i], self.N[i]
+        entry_trigger = self.entry_trigger[i]
+        equity = broker.equity(close)  # market-to-market，成交前
+
+        # --- Exit check (10-day low) ---
+        if broker.position > 0 and low <= self.exit_trigger[i]:
+            sell_price = min(self.exit_trigger[i], close)  # 以 exit_trigger 為主，簡化假設
+            shares = int(broker.position)
+            broker.close(i, sell_price, action='exit', comment='EXIT')
+            self._log(i, 'EXIT', sell_price, shares, broker)
+            self.entry_price = 0.0
+            self.units_added = 0
+            self.last_pyramid_price = None
+            return
+
+        # --- Entry check (20-day high breakout) ---
+        if broker.position == 0:
+            if not np.isnan(entry_trigger) and high >= entry_trigger:
+                if N <= 0 or np.isnan(N):
+                    return
+                # 簡化：每單位承擔 N 美元風險 -> 股數 = dollar_risk / N
+                shares_per_unit = int(self.risk_per_trade * equity / N)
+                if shares_per_unit <= 0:
+                    return
+                buy_price = max(entry_trigger, close) + self.slippage
+                if broker.cash >= broker.buy_cost(buy_price, shares_per_unit):
+                    broker.buy(i, buy_price, shares_per_unit, action='entry', comment='ENTRY')
+                    self.entry_price = buy_price
+                    self.last_pyramid_price = buy_price
+                    self.units_added = 1
+                    self._log(i, 'ENTRY', buy_price, shares_per_unit, broker, close)
+        else:
+            # pyramid：價格上漲到 last_pyramid_price + pyramid_add * N 且未超過 max_units
+            if self.units_added < self.max_units and not np.isnan(N) \
+                    and high >= self.last_pyramid_price + self.pyramid_add * N:
+                shares_per_unit = int(self.risk_per_trade * equity / N)
+                if shares_per_unit > 0:
+                    buy_price = self.last_pyramid_price + self.pyramid_add * N + self.slippage
+                    if broker.cash >= broker.buy_cost(buy_price, shares_per_unit):
+                        broker.buy(i, buy_price, shares_per_unit, action='add', comment='PYRAMID')
+                        self.units_added += 1
+                        self.last_pyramid_price = buy_price
+                        self._log(i, 'PYRAMID', buy_price, shares_per_unit, broker, close)
+
+        # --- 強制止損：最早進場的 entry_price - 2*N，若當日低點觸及則全部出場 ---
+        if broker.position > 0:
+            stop_price = self.entry_price - 2 * N if self.entry_price and not np.isnan(N) else None
+            if stop_price and low <= stop_price:
+                sell_price = max(stop_price, close)
+                shares = int(broker.position)
+                broker.close(i, sell_price, action='stop', comment='STOP_LOSS')
+                self._log(i, 'STOP_LOSS', sell_price, shares, broker)
+                self.units_added = 0
+                self.last_pyramid_price = None
+
+
 def turtle_backtest(df: pd.DataFrame,
                     entry_breakout: int = ENTRY_BREAKOUT,
                     exit_breakout: int = EXIT_BREAKOUT,
@@ -52,119 +150,23 @@ def turtle_backtest(df: pd.DataFrame,
                     pyramid_add: float = Pyramid_ADD,
                     start_capital: float = START_CAPITAL,
                     slippage: float = SLIPPAGE,
-                    commission: float = COMMISSION) -> Dict:
+                    commission: float = COMMISSION,
+                    fees: FeeModel = None) -> Dict:
     """
     回傳 dict 包含：trade log, equity series, performance summary
     假設每次以「N」計算每單位的頭寸大小：
         position_size = floor( (risk_per_trade * equity) / (N * dollar_risk_per_share) )
     這裡我們把 dollar_risk_per_share = N（ATR），也就是把每股風險當成 N 美元（近似）。
+    commission 為每筆固定費用；fees 可改傳 FeeModel (例如 engine.TW_STOCK)。
+    另外附上共用引擎的 round_trips 與 metrics。
     """
-    df = df.copy().assign(date=df.index)
-    df['N'] = n_unit(df, period=atr_period)
-    df['highest_entry'] = df['high'].rolling(window=entry_breakout, min_periods=1).max().shift(1)  # 防止 look-ahead
-    df['lowest_exit']  = df['low'].rolling(window=exit_breakout, min_periods=1).min().shift(1)
-
-    equity = start_capital
-    cash = start_capital
-    position = 0            # 持股張數（股數）
-    entry_price = 0.0
-    unit_size_shares = 0
-    trades = []
-    equity_curve = []
-
-    last_pyramid_price = None
-    units_added = 0
-
-    for i in range(len(df)):
-        row = df.iloc[i]
-        date = row['date']
-        close = row['close']
-        high = row['high']
-        low = row['low']
-        N = row['N']
-        entry_trigger = row['highest_entry']
-        exit_trigger = row['lowest_exit']
-
-        # record equity (market-to-market)
-        mkt_val = position * close
-        equity = cash + mkt_val
-        equity_curve.append({'date': date, 'equity': equity, 'cash': cash, 'position': position, 'price': close})
-
-        # --- Exit check (10-day low) ---
-        if position > 0:
-            # 若當日低於 exit_trigger，則以 exit_trigger 賣出 (或以當日 low 賣出以保守)
-            if low <= exit_trigger:
-                sell_price = min(exit_trigger, close)  # 以 exit_trigger 為主，簡化假設
-                proceeds = position * sell_price - commission
-                cash += proceeds
-                trades.append({
-                    'date': date, 'type': 'EXIT', 'price': sell_price, 'shares': position, 'equity_after': cash
-                })
-                position = 0
-                entry_price = 0.0
-                units_added = 0
-                last_pyramid_price = None
-                # continue to next day after exit
-                continue
-
-        # --- Entry check (20-day high breakout) ---
-        if position == 0:
-            # 當日若高於 entry_trigger，進場一個 unit（基於 N 計算股數）
-            if not np.isnan(entry_trigger) and high >= entry_trigger:
-                # 計算每 unit 的股數：以風險資金與N計算
-                dollar_risk = risk_per_trade * equity    # 每筆單位風險金額
-                if N <= 0 or np.isnan(N):
-                    continue
-                shares_per_unit = int((dollar_risk / N))  # 簡化：每單位承擔 N 美元風險 -> 股數 = dollar_risk / N
-                if shares_per_unit <= 0:
-                    continue
-                # 進場買一 unit（以 entry_trigger 或 close 決價）
-                buy_price = max(entry_trigger, close) + slippage
-                cost = shares_per_unit * buy_price + commission
-                if cash >= cost:
-                    cash -= cost
-                    position += shares_per_unit
-                    entry_price = buy_price
-                    last_pyramid_price = buy_price
-                    units_added = 1
-                    trades.append({
-                        'date': date, 'type': 'ENTRY', 'price': buy_price, 'shares': shares_per_unit, 'units': units_added, 'equity_after': cash + position*close
-                    })
-        else:
-            # 若已有頭寸，檢查 pyramid 加倉條件：價格上漲到 last_pyramid_price + pyramid_add * N 且未超過 max_units
-            if units_added < max_units and (not np.isnan(N)) and high >= (last_pyramid_price + pyramid_add * N):
-                shares_per_unit = int((risk_per_trade * equity) / N)
-                if shares_per_unit > 0:
-                    buy_price = last_pyramid_price + pyramid_add * N + slippage
-                    cost = shares_per_unit * buy_price + commission
-                    if cash >= cost:
-                        cash -= cost
-                        position += shares_per_unit
-                        units_added += 1
-                        last_pyramid_price = buy_price
-                        trades.append({
-                            'date': date, 'type': 'PYRAMID', 'price': buy_price, 'shares': shares_per_unit, 'units': units_added, 'equity_after': cash + position*close
-                        })
-
-        # --- 強制止損 (若當日低到 entry_price - 2*N 等) ---
-        # Turtle 常用止損：每單位的初始止損為 entry_price - 2*N
-        # 這段做一個簡化檢查：若 low <= any unit stop, 出場全部
-        if position > 0:
-            # 計算目前最緊的止損（以最早進場的止損為代表）：entry_price - 2*N
-            stop_price = entry_price - 2 * N if entry_price and (not np.isnan(N)) else None
-            if stop_price and low <= stop_price:
-                sell_price = max(stop_price, close)
-                proceeds = position * sell_price - commission
-                cash += proceeds
-                trades.append({
-                    'date': date, 'type': 'STOP_LOSS', 'price': sell_price, 'shares': position, 'equity_after': cash
-                })
-                position = 0
-                units_added = 0
-                last_pyramid_price = None
-
-    equity_df = pd.DataFrame(equity_curve).set_index('date')
-    trades_df = pd.DataFrame(trades)
+    strategy = TurtleBreakoutStrategy(entry_breakout, exit_breakout, atr_period, risk_per_trade, max_units,
+                                      pyramid_add, slippage)
+    result = run_backtest(df, strategy, initial_cash=start_capital, fees=fees or FeeModel(per_order=commission),
+                          price_col='close', mark='before')
+    equity_df = result.equity[['equity', 'cash', 'position']].assign(price=df['close'].to_numpy())
+    equity_df = equity_df.rename_axis('date')
+    trades_df = pd.DataFrame(strategy.trades)
     # 簡單績效
     if len(equity_df) > 0:
         returns = equity_df['equity'].pct_change().fillna(0)
@@ -181,7 +183,9 @@ def turtle_backtest(df: pd.DataFrame,
         'annual_return': annual_return,
         'sharpe': sharpe,
         'trades': trades_df,
-        'equity_curve': equity_df
+        'equity_curve': equity_df,
+        'round_trips': result.round_trips,
+        'metrics': result.metrics,
     }
     return perf
 
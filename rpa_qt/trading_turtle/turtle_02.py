@@ -70,7 +70,7 @@ import sys
 import json
 import time
 import argparse
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, fields
 from typing import Optional, List, Dict, Tuple
 
 import numpy as np
@@ -85,6 +85,9 @@ except Exception:
 # Matplotlib only for saving plots
 import matplotlib.pyplot as plt
 
+from rpa_qt.backtest.engine import Bars, Broker, compute_metrics, FeeModel, run_backtest, Strategy
+from rpa_qt.backtest.trades_summary import round_trips
+
 # -----------------------------
 # Utility Helpers
 # -----------------------------
@@ -190,27 +193,42 @@ class Trade:
     slippage: float
     comment: str
 
+TRADE_COLUMNS = [f.name for f in fields(Trade)]
+PERIODS_PER_YEAR = 365  # per-bar returns annualized like the original daily-crypto metrics
+
 # -----------------------------
 # Strategy Engine (event-driven)
 # -----------------------------
 
-class TurtleStrategy:
+class TurtleStrategy(Strategy):
+    """
+    Turtle rules as a callback strategy for the shared backtest engine (rpa_qt.backtest.engine).
+    Cash, position and fees live in the engine's Broker; sizing uses its realized equity
+    (initial capital + realized PnL - fees), the mark-to-market equity curve is built by the engine.
+    """
+
     def __init__(self, sconf: StrategyConfig, bconf: BacktestConfig):
         self.s = sconf
         self.b = bconf
+        self.broker: Optional[Broker] = None
         self.reset()
 
     def reset(self):
-        self.equity = self.b.initial_capital
         self.position_side: Optional[str] = None  # 'long' or 'short'
         self.units: List[Tuple[float, float]] = []  # list of (entry_price, qty) per unit
+        self.entry_source: Optional[str] = None
         self.stop_price: Optional[float] = None
         self.add_levels: List[float] = []
         self.trades: List[Trade] = []
-        self.equity_curve: List[Tuple[pd.Timestamp, float]] = []
+        self.current_N = 0.0
         # For skip-after-win rule (20d system)
         self.last_20d_result: Dict[str, Optional[str]] = {'long': None, 'short': None}  # 'win','loss',None
 
+    @property
+    def equity(self) -> float:
+        """Realized equity used for sizing and the leverage cap."""
+        return self.broker.realized_equity
+
     # ---------- Sizing helpers ----------
     def unit_qty(self, equity: float, N: float, price: float) -> float:
         if N <= 0 or price <= 0:
@@ -230,29 +248,49 @@ class TurtleStrategy:
         return len(self.units) < self.s.max_units
 
     def current_notional(self, price: float) -> float:
-        qty = sum(q for _, q in self.units)
-        return abs(qty) * price
+        return abs(self.broker.position) * price
+
+    def avg_price(self) -> float:
+        return self.broker.avg_price
 
     def within_leverage(self, add_qty: float, price: float) -> bool:
         notional_after = self.current_notional(price) + abs(add_qty) * price
         return notional_after <= self.equity * self.s.leverage + 1e-9
 
+    # ---------- Engine callbacks ----------
+    def prepare(self, bars: Bars, broker: Broker):
+        self.broker = broker
+        self.reset()
+        self.index = bars.index
+        # Contiguous columns once; on_bar only touches Python floats/bools
+        price = bars.array(self.b.price_col)
+        self.N = bars.list('N')
+        self.price = price.tolist()
+        self.high = bars.list('high')
+        self.low = bars.list('low')
+        self.long_20d = (price > bars.array('h20')).tolist()
+        self.short_20d = (price < bars.array('l20')).tolist()
+        self.long_55d = (price > bars.array('h55')).tolist()
+        self.short_55d = (price < bars.array('l55')).tolist()
+        self.exit_long = bars.list('x10')
+        self.exit_short = bars.list('x20')
+
     # ---------- Order execution (backtest fill model) ----------
-    def execute_fill(self, ts: pd.Timestamp, side: str, action: str, price: float, qty: float, taker: bool = True, comment: str = ''):
+    def execute_fill(self, i: int, side: str, action: str, price: float, qty: float, taker: bool = True, comment: str = ''):
         if qty <= 0:
             return
 
+        opening = action in ('entry', 'add')
         slip = price * (self.s.slippage_bps / 10_000.0)
-        fill_price = price + slip if (side == 'long' and (action in ('entry','add'))) else price - slip if (side == 'short' and (action in ('entry','add'))) else price
-        fee_rate = self.s.taker_fee if taker else self.s.maker_fee
-        fee = abs(qty) * fill_price * fee_rate
+        fill_price = price + slip if (side == 'long' and opening) else price - slip if (side == 'short' and opening) else price
+        broker = self.broker
 
-        # Update position/equity for entries/exits
-        if action in ('entry','add'):
+        if opening:
             # open/increase
             if self.position_side is None:
                 self.position_side = side
             assert self.position_side == side, "Direction conflict"
+            fee = broker.fill(i, qty if side == 'long' else -qty, fill_price, action, comment, maker=not taker)
             self.units.append((fill_price, qty))
             # set/adjust stop from the most recent unit entry
             if side == 'long':
@@ -261,21 +299,15 @@ class TurtleStrategy:
                 self.stop_price = fill_price + self.s.atr_stop_mult * self.current_N
             # set (or refresh) add levels
             base = self.units[0][0]  # first unit entry price
-            n = self.current_N
-            step = self.s.add_step_n * n
+            step = self.s.add_step_n * self.current_N
             if side == 'long':
-                self.add_levels = [base + step * i for i in range(1, self.s.max_units)]
+                self.add_levels = [base + step * k for k in range(1, self.s.max_units)]
             else:
-                self.add_levels = [base - step * i for i in range(1, self.s.max_units)]
-            # pay fee immediately
-            self.equity -= fee
-        elif action in ('exit','stop'):
-            # close all
-            pos_qty = sum(q for _, q in self.units)
-            avg_px = sum(p*q for p, q in self.units) / pos_qty if pos_qty != 0 else 0.0
-            pnl = (fill_price - avg_px) * pos_qty if self.position_side == 'long' else (avg_px - fill_price) * (-pos_qty)
-            self.equity += pnl
-            self.equity -= fee
+                self.add_levels = [base - step * k for k in range(1, self.s.max_units)]
+        else:
+            # close all; signed position makes the PnL correct for both sides
+            pnl = (fill_price - broker.avg_price) * broker.position
+            fee = broker.close(i, fill_price, action, comment, maker=not taker)
             # determine win/loss for 20d skip rule if the entry came from 20d
             if self.entry_source in ('20d_long','20d_short'):
                 dir_key = 'long' if 'long' in self.entry_source else 'short'
@@ -287,39 +319,30 @@ class TurtleStrategy:
             self.add_levels = []
             self.entry_source = None
 
-        self.trades.append(Trade(ts, side, action, float(fill_price), float(qty), float(fee), float(slip), comment))
+        self.trades.append(Trade(self.index[i], side, action, float(fill_price), float(qty), float(fee), float(slip), comment))
 
     # ---------- Per-bar update ----------
-    def on_bar(self, i: int, row: pd.Series, signals: Dict[str, bool], N: float, price: float, high: float, low: float, exit_levels: Dict[str, float]):
-        ts = row.name
+    def on_bar(self, i: int, broker: Broker):
+        N, price, high, low = self.N[i], self.price[i], self.high[i], self.low[i]
         self.current_N = N  # cache for stop calc
 
-        # Record equity mark-to-market
-        if self.position_side is None:
-            self.equity_curve.append((ts, self.equity))
-        else:
-            pos_qty = sum(q for _, q in self.units)
-            avg_px = sum(p*q for p, q in self.units) / pos_qty if pos_qty != 0 else 0.0
-            mtm = (price - avg_px) * pos_qty if self.position_side == 'long' else (avg_px - price) * (-pos_qty)
-            self.equity_curve.append((ts, self.equity + mtm))
-
         # Exit logic (channel-based)
         if self.position_side == 'long':
-            if price < exit_levels['exit_long']:
-                self.execute_fill(ts, 'long', 'exit', price, sum(q for _, q in self.units), True, 'Channel exit')
+            if price < self.exit_long[i]:
+                self.execute_fill(i, 'long', 'exit', price, broker.position, True, 'Channel exit')
                 return  # after exit, skip adds/stops this bar
         elif self.position_side == 'short':
-            if price > exit_levels['exit_short']:
-                self.execute_fill(ts, 'short', 'exit', price, sum(q for _, q in self.units), True, 'Channel exit')
+            if price > self.exit_short[i]:
+                self.execute_fill(i, 'short', 'exit', price, -broker.position, True, 'Channel exit')
                 return
 
         # Stop (2N from most recent unit entry)
         if self.position_side is not None and self.stop_price is not None:
             if self.position_side == 'long' and low <= self.stop_price:
-                self.execute_fill(ts, 'long', 'stop', self.stop_price, sum(q for _, q in self.units), True, '2N stop')
+                self.execute_fill(i, 'long', 'stop', self.stop_price, broker.position, True, '2N stop')
                 return
             if self.position_side == 'short' and high >= self.stop_price:
-                self.execute_fill(ts, 'short', 'stop', self.stop_price, sum(q for _, q in self.units), True, '2N stop')
+                self.execute_fill(i, 'short', 'stop', self.stop_price, -broker.position, True, '2N stop')
                 return
 
         # Add units
@@ -328,13 +351,13 @@ class TurtleStrategy:
             if next_level is not None and high >= next_level:
                 qty_unit = self.unit_qty(self.equity, N, price)
                 if qty_unit > 0 and self.within_leverage(qty_unit, price):
-                    self.execute_fill(ts, 'long', 'add', next_level, qty_unit, True, f'Add @{self.s.add_step_n}N')
+                    self.execute_fill(i, 'long', 'add', next_level, qty_unit, True, f'Add @{self.s.add_step_n}N')
         elif self.position_side == 'short' and self.can_add_unit() and len(self.add_levels) > 0:
             next_level = self.add_levels[len(self.units)-1] if len(self.units) < self.s.max_units else None
             if next_level is not None and low <= next_level:
                 qty_unit = self.unit_qty(self.equity, N, price)
                 if qty_unit > 0 and self.within_leverage(qty_unit, price):
-                    self.execute_fill(ts, 'short', 'add', next_level, qty_unit, True, f'Add @{self.s.add_step_n}N')
+                    self.execute_fill(i, 'short', 'add', next_level, qty_unit, True, f'Add @{self.s.add_step_n}N')
 
         # Entry logic
         def allow_20d(direction: str) -> bool:
@@ -346,31 +369,31 @@ class TurtleStrategy:
 
         took_signal = False
         if self.position_side is None:
-            if self.s.use_system1 and signals['long_20d'] and allow_20d('long'):
+            if self.s.use_system1 and self.long_20d[i] and allow_20d('long'):
                 qty = self.unit_qty(self.equity, N, price)
                 if qty > 0 and self.within_leverage(qty, price):
                     self.entry_source = '20d_long'
-                    self.execute_fill(ts, 'long', 'entry', price, qty, True, '20d breakout')
+                    self.execute_fill(i, 'long', 'entry', price, qty, True, '20d breakout')
                     took_signal = True
-            elif self.s.use_system2 and signals['long_55d']:
+            elif self.s.use_system2 and self.long_55d[i]:
                 qty = self.unit_qty(self.equity, N, price)
                 if qty > 0 and self.within_leverage(qty, price):
                     self.entry_source = '55d_long'
-                    self.execute_fill(ts, 'long', 'entry', price, qty, True, '55d breakout')
+                    self.execute_fill(i, 'long', 'entry', price, qty, True, '55d breakout')
                     took_signal = True
 
             if not took_signal and self.b.allow_short:
-                if self.s.use_system1 and signals['short_20d'] and allow_20d('short'):
+                if self.s.use_system1 and self.short_20d[i] and allow_20d('short'):
                     qty = self.unit_qty(self.equity, N, price)
                     if qty > 0 and self.within_leverage(qty, price):
                         self.entry_source = '20d_short'
-                        self.execute_fill(ts, 'short', 'entry', price, qty, True, '20d breakdown')
+                        self.execute_fill(i, 'short', 'entry', price, qty, True, '20d breakdown')
                         took_signal = True
-                elif self.s.use_system2 and signals['short_55d']:
+                elif self.s.use_system2 and self.short_55d[i]:
                     qty = self.unit_qty(self.equity, N, price)
                     if qty > 0 and self.within_leverage(qty, price):
                         self.entry_source = '55d_short'
-                        self.execute_fill(ts, 'short', 'entry', price, qty, True, '55d breakdown')
+                        self.execute_fill(i, 'short', 'entry', price, qty, True, '55d breakdown')
                         took_signal = True
 
 # -----------------------------
@@ -395,112 +418,29 @@ class Backtester:
         df['x20'] = donchian_high(df, self.s.len_exit2, self.s.exclude_current_bar)
         self.df = df.dropna().copy()  # drop warmup
 
+    def fee_model(self) -> FeeModel:
+        return FeeModel(rate=self.s.taker_fee, maker_rate=self.s.maker_fee)
+
     def run(self) -> Tuple[pd.DataFrame, pd.DataFrame, Dict[str, float]]:
         strat = TurtleStrategy(self.s, self.b)
-        price_col = self.b.price_col
-
-        for i, row in enumerate(self.df.itertuples(index=False), start=0):
-            # Build row Series with index timestamp
-            ts = self.df.index[i]
-            srow = pd.Series({
-                'open': getattr(row, 'open'),
-                'high': getattr(row, 'high'),
-                'low': getattr(row, 'low'),
-                'close': getattr(row, 'close'),
-                'volume': getattr(row, 'volume')
-            }, name=ts)
-            price = srow[price_col]
-            N = float(self.df.iloc[i]['N'])
-
-            signals = {
-                'long_20d': price > float(self.df.iloc[i]['h20']),
-                'short_20d': price < float(self.df.iloc[i]['l20']),
-                'long_55d': price > float(self.df.iloc[i]['h55']),
-                'short_55d': price < float(self.df.iloc[i]['l55']),
-            }
-            exits = {
-                'exit_long': float(self.df.iloc[i]['x10']),
-                'exit_short': float(self.df.iloc[i]['x20']),
-            }
-            strat.on_bar(i, srow, signals, N, price, float(srow['high']), float(srow['low']), exits)
+        # Equity is marked at the bar's price before that bar's fills (mark='before')
+        result = run_backtest(self.df, strat, initial_cash=self.b.initial_capital, fees=self.fee_model(),
+                              price_col=self.b.price_col, mark='before', periods_per_year=PERIODS_PER_YEAR)
 
         # Build outputs
-        eq = pd.DataFrame(strat.equity_curve, columns=['timestamp','equity']).set_index('timestamp')
-        trades = pd.DataFrame([asdict(t) for t in strat.trades])
-
-        # Metrics
-        metrics = self.compute_metrics(eq['equity'], trades)
-        return eq, trades, metrics
-
-    def compute_metrics(self, equity: pd.Series, trades: pd.DataFrame) -> Dict[str, float]:
-        ret = equity.pct_change().fillna(0.0)
-        # convert to per-period return; approximate daily if timeframe >= daily; otherwise still fine
-        cagr = (equity.iloc[-1] / equity.iloc[0]) ** (365.0 / max((equity.index[-1] - equity.index[0]).days, 1)) - 1.0
-        sharpe = (ret.mean() / (ret.std() + 1e-12)) * math.sqrt(365) if ret.std() > 0 else 0.0
-        downside = ret[ret < 0].std()
-        sortino = (ret.mean() / (downside + 1e-12)) * math.sqrt(365) if downside > 0 else 0.0
-        dd = (equity / equity.cummax() - 1.0).min()
-        max_dd = float(dd)
-        # trade stats
-        closed = trades[trades['action'].isin(['exit','stop'])].copy()
-        num_trades = int(len(closed))
-        wins = 0
-        profit_sum = 0.0
-        loss_sum = 0.0
-        if num_trades > 0:
-            # compute PnL per round-trip via comments on exit rows by matching to prior entries
-            # Simpler: approximate by diff in equity between exit fills (not perfect but OK for aggregate stats)
-            closed_equity = equity.loc[closed['timestamp'].values].values if len(equity) and len(closed) else np.array([])
-            # fallback
-            wins = int((closed['comment'].str.contains('win', case=False, na=False)).sum())  # unused
-        # Profit factor via trade-by-trade reconstruction
-        # We'll do rough calculation using fees and price differences:
-        pf_profit = 0.0
-        pf_loss = 0.0
-        # Reconstruct trades by grouping between 'entry' and 'exit/stop'
-        pos_side = None
-        pos_qty = 0.0
-        avg_px = 0.0
-        for _, tr in trades.iterrows():
-            if tr['action'] in ('entry','add'):
-                if pos_qty == 0.0:
-                    pos_side = tr['side']
-                    pos_qty = tr['qty']
-                    avg_px = tr['price']
-                else:
-                    # update VWAP
-                    new_qty = pos_qty + tr['qty']
-                    avg_px = (avg_px * pos_qty + tr['price'] * tr['qty']) / new_qty
-                    pos_qty = new_qty
-            elif tr['action'] in ('exit','stop'):
-                if pos_qty != 0.0 and pos_side is not None:
-                    pnl = (tr['price'] - avg_px) * pos_qty if pos_side == 'long' else (avg_px - tr['price']) * pos_qty
-                    pnl -= tr['fee']  # fees on exit
-                    # estimate entry/add fees too by summing previous fees in the trade window
-                    # (approximate: add last few fees)
-                    # For simplicity in PF: split by sign
-                    if pnl >= 0:
-                        pf_profit += pnl
-                        wins += 1
-                    else:
-                        pf_loss += -pnl
-                    pos_side = None
-                    pos_qty = 0.0
-                    avg_px = 0.0
-        win_rate = wins / num_trades if num_trades > 0 else 0.0
-        profit_factor = (pf_profit / pf_loss) if pf_loss > 0 else float('inf') if pf_profit > 0 else 0.0
-
-        return {
-            'CAGR': float(cagr),
-            'Sharpe': float(sharpe),
-            'Sortino': float(sortino),
-            'MaxDrawdown': float(max_dd),
-            'NumTrades': num_trades,
-            'WinRate': float(win_rate),
-            'ProfitFactor': float(profit_factor),
-            'FinalEquity': float(equity.iloc[-1]),
-            'Return': float(equity.iloc[-1] / equity.iloc[0] - 1.0),
-        }
+        eq = pd.DataFrame({'equity': result.equity['equity'].to_numpy()},
+                          index=pd.DatetimeIndex(self.df.index, name='timestamp', freq=None))
+        trades = pd.DataFrame([vars(t) for t in strat.trades], columns=TRADE_COLUMNS)
+        return eq, trades, result.metrics
+
+    def trades_summary(self, trades: pd.DataFrame) -> pd.DataFrame:
+        """One row per round trip (VWAP, PnL after all fees, hold time, MAE/MFE on this backtest's bars)."""
+        return round_trips(trades, self.df)
+
+    @staticmethod
+    def compute_metrics(equity: pd.Series, trades: pd.DataFrame) -> Dict[str, float]:
+        """Shared engine metrics; crypto trades 24/7 so returns are annualized with 365 periods."""
+        return compute_metrics(equity, trades, periods_per_year=PERIODS_PER_YEAR)
 
 # -----------------------------
 # Data Loader (CSV or CCXT)
@@ -614,11 +554,13 @@ def main():
     out_dir.mkdir(parents=True, exist_ok=True)
     eq_path = out_dir / 'equity_curve.csv'
     tr_path = out_dir / 'trades.csv'
+    rt_path = out_dir / 'round_trips.csv'
     price_fig = out_dir / 'price_with_trades.png'
     eq_fig = out_dir / 'equity_curve.png'
 
     eq.to_csv(eq_path)
     trades.to_csv(tr_path, index=False)
+    bt.trades_summary(trades).to_csv(rt_path, index=False)
 
     # Plot
     plot_price_with_trades(df.loc[eq.index], trades, str(price_fig))
@@ -628,6 +570,7 @@ def main():
     print(json.dumps(metrics, indent=2))
     print(f'Saved: {eq_path}')
     print(f'Saved: {tr_path}')
+    print(f'Saved: {rt_path}')
     print(f'Saved: {price_fig}')
     print(f'Saved: {eq_fig}')
 
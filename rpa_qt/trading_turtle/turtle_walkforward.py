@@ -0,0 +1,306 @@
+"""
+海龜系統 (turtle_02) 的 Walk-forward 參數最佳化
+
+turtle_02.main() 只跑一組 StrategyConfig。這裡把歷史切成滾動的 in-sample / out-of-sample 視窗：
+* 每個視窗在 in-sample 區間評估一組參數網格 (或從網格隨機抽樣)，依 objective (預設 Sharpe) 選出最佳參數，
+  再拿這組參數跑緊接著的 out-of-sample 區間；視窗每次往後移 oos_bars 根。
+* 所有 (視窗, 參數) 的回測丟進 ProcessPoolExecutor。OHLCV 陣列只放一份在 shared memory，
+  worker 直接掛上來唯讀使用，不必 pickle 整個 DataFrame。
+* Donchian 通道與 Wilder ATR 在每個 worker 內以 (種類, 長度, 視窗) 為 key 快取：同一視窗的各組參數
+  只要長度相同就共用，不會每個候選都重算。
+* 每個區間前面多取 warmup 根 K 棒讓指標暖機，回測本身從區間第一根開始，
+  所以同一視窗的所有候選都在完全相同的 K 棒上比較。
+* 各視窗的 out-of-sample 權益以報酬率串接 (上一段的期末權益當作下一段的起點)；
+  每段結束時未平倉部位以最後一根的市值計算，不另扣出場手續費。
+
+執行：
+    python -m rpa_qt.trading_turtle.turtle_walkforward --csv ./solusdt_4h.csv --is_bars 1500 --oos_bars 500
+輸出 (./outputs)：walkforward_windows.csv、walkforward_equity.csv、walkforward_trades.csv
+"""
+import argparse
+import itertools
+import json
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, replace
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from rpa_qt.trading_turtle.turtle_02 import (Backtester, BacktestConfig, donchian_high, donchian_low,
+                                             ensure_datetime_index, fetch_ccxt_ohlcv, load_csv, StrategyConfig,
+                                             TRADE_COLUMNS, wilder_atr)
+
+OHLCV = ['open', 'high', 'low', 'close', 'volume']
+DEFAULT_GRID = {
+    'len_entry1': [20, 30],
+    'len_exit1': [10, 15],
+    'len_entry2': [55],
+    'atr_len': [14, 20],
+    'max_units': [2, 4],
+    'risk_pct': [0.5, 1.0],
+}
+OBJECTIVE = 'Sharpe'
+
+# worker 端掛上的 shared memory、基本設定與指標快取 (每個 process 一份)
+_worker = {}
+
+
+class IndicatorCache:
+    """
+    以 (種類, 長度, 是否排除當根, start, stop) 快取指標陣列，資料為 values[OHLCV 欄位, 列] 的 [start, stop) 區段。
+    Donchian 只和前 length 根有關，Wilder ATR 則和起算點有關，所以 key 一律包含區段。
+    """
+
+    def __init__(self, values: np.ndarray):
+        self.values = values
+        self._memo: Dict[tuple, np.ndarray] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, kind: str, length: int, start: int, stop: int, exclude_current: bool = True) -> np.ndarray:
+        key = (kind, length, exclude_current, start, stop)
+        cached = self._memo.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+        high, low, close = (pd.Series(self.values[OHLCV.index(c), start:stop]) for c in ('high', 'low', 'close'))
+        frame = pd.DataFrame({'high': high, 'low': low, 'close': close})
+        if kind == 'atr':
+            out = wilder_atr(frame, length)
+        elif kind == 'high':
+            out = donchian_high(frame, length, exclude_current)
+        elif kind == 'low':
+            out = donchian_low(frame, length, exclude_current)
+        else:
+            raise ValueError(f"unknown indicator: {kind}")
+        self._memo[key] = out.to_numpy()
+        return self._memo[key]
+
+
+def indicator_specs(sconf: StrategyConfig) -> Dict[str, Tuple[str, int]]:
+    """Backtester.prepare_indicators 的欄位 -> (種類, 長度)"""
+    return {
+        'N': ('atr', sconf.atr_len),
+        'h20': ('high', sconf.len_entry1),
+        'l20': ('low', sconf.len_entry1),
+        'h55': ('high', sconf.len_entry2),
+        'l55': ('low', sconf.len_entry2),
+        'x10': ('low', sconf.len_exit1),
+        'x20': ('high', sconf.len_exit2),
+    }
+
+
+class WindowBacktester(Backtester):
+    """指標由 IndicatorCache 提供、並去掉前 warmup 根的 Backtester (回測邏輯完全相同)。"""
+
+    def __init__(self, df: pd.DataFrame, sconf: StrategyConfig, bconf: BacktestConfig,
+                 cache: IndicatorCache, start: int, warmup: int):
+        self.cache = cache
+        self.start = start
+        self.warmup = warmup
+        super().__init__(df, sconf, bconf)
+
+    def prepare_indicators(self):
+        df = self.df
+        stop = self.start + len(df)
+        for col, (kind, length) in indicator_specs(self.s).items():
+            df[col] = self.cache.get(kind, length, self.start, stop, self.s.exclude_current_bar)
+        self.df = df.iloc[self.warmup:].dropna().copy()
+
+
+def walk_forward_windows(n_bars: int, is_bars: int, oos_bars: int, warmup: int,
+                         step: Optional[int] = None) -> List[Tuple[int, int, int]]:
+    """
+    :return: [(is_start, oos_start, oos_stop), ...]，in-sample 為 [is_start, oos_start)、
+             out-of-sample 為 [oos_start, oos_stop)；in-sample 之前保留 warmup 根做指標暖機
+    """
+    step = step or oos_bars  # step < oos_bars 會讓 out-of-sample 重疊，walk_forward 固定用 oos_bars
+    windows = []
+    is_start = warmup
+    while is_start + is_bars + oos_bars <= n_bars:
+        windows.append((is_start, is_start + is_bars, is_start + is_bars + oos_bars))
+        is_start += step
+    return windows
+
+
+def grid_candidates(grid: Dict[str, List], n_random: Optional[int] = None, seed: int = 0) -> List[Dict]:
+    """參數網格的所有組合；指定 n_random 時改為隨機抽樣 (不重複) n_random 組。"""
+    keys = list(grid)
+    combos = [dict(zip(keys, combo)) for combo in itertools.product(*(grid[k] for k in keys))]
+    if n_random is not None and n_random < len(combos):
+        combos = random.Random(seed).sample(combos, n_random)
+    return combos
+
+
+def required_warmup(base: StrategyConfig, candidates: List[Dict]) -> int:
+    """所有候選中最長的通道 / ATR 長度 (+1 根給排除當根的 shift)。"""
+    lengths = []
+    for params in candidates:
+        sconf = replace(base, **params)
+        lengths += [length for _, length in indicator_specs(sconf).values()]
+    return max(lengths) + 1
+
+
+def run_segment(values: np.ndarray, dates: np.ndarray, cache: IndicatorCache, start: int, stop: int,
+                warmup: int, sconf: StrategyConfig, bconf: BacktestConfig):
+    """回測 [start, stop) 區段，前 warmup 根只用來計算指標。回傳 Backtester.run() 的 (eq, trades, metrics)。"""
+    first = start - warmup
+    df = pd.DataFrame(values[:, first:stop].T, columns=OHLCV, index=pd.DatetimeIndex(dates[first:stop]))
+    return WindowBacktester(df, sconf, bconf, cache, first, warmup).run()
+
+
+def _init_worker(shm_name: str, shape, dates: np.ndarray, sconf: StrategyConfig, bconf: BacktestConfig):
+    # 這塊記憶體由主程式建立與釋放 (unlink)，worker 只是掛上來讀取
+    shm = shared_memory.SharedMemory(name=shm_name)
+    values = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    values.flags.writeable = False
+    _worker.update(shm=shm, values=values, dates=dates, sconf=sconf, bconf=bconf,
+                   cache=IndicatorCache(values))
+
+
+def _evaluate_in_worker(task: Dict) -> Dict:
+    sconf = replace(_worker['sconf'], **task['params'])
+    eq, trades, metrics = run_segment(_worker['values'], _worker['dates'], _worker['cache'], task['start'],
+                                      task['stop'], task['warmup'], sconf, _worker['bconf'])
+    result = {**task, 'metrics': metrics}
+    if task.get('keep_curve'):
+        result.update(equity=eq['equity'], trades=trades)
+    return result
+
+
+def _score(metrics: Dict, objective: str) -> float:
+    value = metrics.get(objective, float('nan'))
+    return value if np.isfinite(value) else float('-inf')
+
+
+def walk_forward(df: pd.DataFrame, sconf: StrategyConfig = None, bconf: BacktestConfig = None,
+                 grid: Dict[str, List] = None, is_bars: int = 1500, oos_bars: int = 500,
+                 n_random: int = None, objective: str = OBJECTIVE, max_workers: int = None, seed: int = 0):
+    """
+    :param df: OHLCV (timestamp 欄或 DatetimeIndex，欄位 open/high/low/close/volume)
+    :param grid: StrategyConfig 欄位 -> 候選值，預設 DEFAULT_GRID
+    :param n_random: 指定時每個視窗只評估隨機抽樣的 n_random 組 (同一份抽樣用於所有視窗)
+    :param objective: compute_metrics 的欄位，越大越好
+    :return: (windows, equity, trades, metrics)
+             windows：每個視窗一列 (區間、最佳參數、in-sample objective、out-of-sample 的 compute_metrics)
+             equity：串接後的 out-of-sample 權益 (pd.Series)
+             trades：所有 out-of-sample 成交
+             metrics：串接後權益的 compute_metrics
+    """
+    sconf = sconf or StrategyConfig()
+    bconf = bconf or BacktestConfig()
+    grid = grid or DEFAULT_GRID
+    df = ensure_datetime_index(df.copy())
+    values = np.ascontiguousarray(df[OHLCV].to_numpy(dtype=np.float64).T)
+    dates = df.index.values
+
+    candidates = grid_candidates(grid, n_random, seed)
+    warmup = required_warmup(sconf, candidates)
+    windows = walk_forward_windows(values.shape[1], is_bars, oos_bars, warmup)
+    if not windows:
+        raise ValueError(f"資料只有 {values.shape[1]} 根，不足 warmup {warmup} + in-sample {is_bars} "
+                         f"+ out-of-sample {oos_bars}")
+    print(f"{values.shape[1]} 根 K 棒，{len(windows)} 個視窗 x {len(candidates)} 組參數，warmup {warmup} 根")
+
+    shm = shared_memory.SharedMemory(create=True, size=values.nbytes)
+    try:
+        np.ndarray(values.shape, dtype=np.float64, buffer=shm.buf)[:] = values
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(shm.name, values.shape, dates, sconf, bconf)) as pool:
+            # in-sample：所有 (視窗, 參數)
+            tasks = [{'window': w, 'start': is_start, 'stop': oos_start, 'warmup': warmup, 'params': params}
+                     for w, (is_start, oos_start, _) in enumerate(windows) for params in candidates]
+            best: Dict[int, Dict] = {}
+            for result in pool.map(_evaluate_in_worker, tasks, chunksize=max(1, len(candidates) // 4)):
+                w = result['window']
+                if w not in best or _score(result['metrics'], objective) > _score(best[w]['metrics'], objective):
+                    best[w] = result
+            # out-of-sample：每個視窗用 in-sample 最佳參數
+            oos_tasks = [{'window': w, 'start': oos_start, 'stop': oos_stop, 'warmup': warmup,
+                          'params': best[w]['params'], 'keep_curve': True}
+                         for w, (_, oos_start, oos_stop) in enumerate(windows)]
+            oos_results = list(pool.map(_evaluate_in_worker, oos_tasks))
+    finally:
+        shm.close()
+        shm.unlink()
+
+    rows, segments, trade_frames = [], [], []
+    level = bconf.initial_capital
+    for (is_start, oos_start, oos_stop), result in zip(windows, oos_results):
+        w = result['window']
+        rows.append({
+            'window': w,
+            'is_start': df.index[is_start], 'is_end': df.index[oos_start - 1],
+            'oos_start': df.index[oos_start], 'oos_end': df.index[oos_stop - 1],
+            **best[w]['params'],
+            f'is_{objective}': best[w]['metrics'][objective],
+            **{f'oos_{k}': v for k, v in result['metrics'].items()},
+        })
+        # 以報酬率串接：本段權益依上一段期末權益等比例縮放
+        segment = result['equity'] / bconf.initial_capital * level
+        level = float(segment.iloc[-1])
+        segments.append(segment)
+        trade_frames.append(result['trades'].assign(window=w))
+
+    equity = pd.concat(segments)
+    trades = pd.concat(trade_frames, ignore_index=True) if trade_frames else pd.DataFrame(columns=TRADE_COLUMNS)
+    return pd.DataFrame(rows), equity, trades, Backtester.compute_metrics(equity, trades)
+
+
+# -----------------------------
+# CLI
+# -----------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Turtle walk-forward optimization")
+    parser.add_argument('--exchange', default='binance')
+    parser.add_argument('--symbol', default='SOL/USDT')
+    parser.add_argument('--timeframe', default='4h')
+    parser.add_argument('--limit', type=int, default=3000)
+    parser.add_argument('--csv', default=None, help='Path to CSV (timestamp,open,high,low,close,volume)')
+    parser.add_argument('--initial', type=float, default=100000.0)
+    parser.add_argument('--leverage', type=float, default=3.0)
+    parser.add_argument('--allow_short', action='store_true', help='Enable shorts (perp).')
+    parser.add_argument('--is_bars', type=int, default=1500)
+    parser.add_argument('--oos_bars', type=int, default=500)
+    parser.add_argument('--n_random', type=int, default=None, help='Random search: candidates per window')
+    parser.add_argument('--objective', default=OBJECTIVE)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', default='./outputs')
+    args = parser.parse_args()
+
+    if args.csv:
+        df = load_csv(args.csv)
+    else:
+        df = fetch_ccxt_ohlcv(args.exchange, args.symbol, args.timeframe, args.limit)
+
+    sconf = StrategyConfig(leverage=args.leverage)
+    bconf = BacktestConfig(initial_capital=args.initial, allow_short=args.allow_short, save_dir=args.output)
+
+    started = time.perf_counter()
+    windows, equity, trades, metrics = walk_forward(df, sconf, bconf, is_bars=args.is_bars, oos_bars=args.oos_bars,
+                                                    n_random=args.n_random, objective=args.objective,
+                                                    max_workers=args.workers)
+    print(f"完成，耗時 {time.perf_counter() - started:.1f}s")
+    print(windows.to_string(index=False))
+
+    out_dir = Path(args.output)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    windows.to_csv(out_dir / 'walkforward_windows.csv', index=False)
+    equity.to_frame('equity').to_csv(out_dir / 'walkforward_equity.csv')
+    trades.to_csv(out_dir / 'walkforward_trades.csv', index=False)
+
+    print(json.dumps({'base_config': asdict(sconf), 'oos_metrics': metrics}, indent=2))
+    print(f"Saved: {out_dir / 'walkforward_windows.csv'}")
+    print(f"Saved: {out_dir / 'walkforward_equity.csv'}")
+    print(f"Saved: {out_dir / 'walkforward_trades.csv'}")
+
+
+if __name__ == '__main__':
+    main()